@@ -0,0 +1,356 @@
+import io
+import os
+import random
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List, Sequence, Tuple, Union
+
+BufferLike = Union[bytes, bytearray, memoryview]
+
+WAV_HEADER_SIZE = 44
+
+# Fala máxima por turno (o buffer de cada sessão não passa disso) e o que fazer quando ela estoura
+AUDIO_MAX_UTTERANCE_SECONDS = float(os.getenv("AUDIO_MAX_UTTERANCE_SECONDS", "30"))
+AUDIO_OVERFLOW_POLICY = os.getenv("AUDIO_OVERFLOW_POLICY", "endpoint")
+OVERFLOW_POLICIES = ("endpoint", "drop_oldest", "reject")
+PCM_BYTES_PER_SECOND = 16000 * 2  # 16 kHz mono int16
+
+
+def wav_header(data_size: int, sample_rate: int = 16000, channels: int = 1, sample_width: int = 2) -> bytes:
+    """Cabeçalho RIFF/WAVE (PCM) de 44 bytes para `data_size` bytes de áudio."""
+    byte_rate = sample_rate * channels * sample_width
+    block_align = channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, byte_rate, block_align, sample_width * 8,
+        b"data", data_size,
+    )
+
+
+class WavStream(io.RawIOBase):
+    """
+    Arquivo WAV somente-leitura montado sobre o cabeçalho e memoryviews do PCM,
+    sem concatenar nem copiar o áudio. Pode ser passado direto como `file` para
+    a API de transcrição (quem lê copia os bytes uma única vez, no envio).
+    """
+
+    def __init__(self, parts: Sequence[BufferLike], name: str = "audio.wav"):
+        super().__init__()
+        self._parts = [memoryview(p).cast("B") for p in parts]
+        self._size = sum(p.nbytes for p in self._parts)
+        self._pos = 0
+        self.name = name
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def __len__(self) -> int:
+        return self._size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"whence inválido: {whence}")
+        if pos < 0:
+            raise ValueError("posição negativa")
+        self._pos = pos
+        return pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        out = memoryview(buffer).cast("B")
+        written = 0
+        part_start = 0
+        for part in self._parts:
+            part_end = part_start + part.nbytes
+            if self._pos < part_end and written < out.nbytes:
+                offset = self._pos - part_start
+                n = min(part.nbytes - offset, out.nbytes - written)
+                out[written:written + n] = part[offset:offset + n]
+                written += n
+                self._pos += n
+            part_start = part_end
+        return written
+
+    def close(self):
+        for part in self._parts:
+            part.release()
+        self._parts = []
+        super().close()
+
+
+def pcm_to_wav_stream(pcm: Union[BufferLike, Iterable[BufferLike]], sample_rate: int = 16000, channels: int = 1, sample_width: int = 2) -> WavStream:
+    """
+    Enquadra PCM cru como WAV em memória. `pcm` pode ser um buffer único ou uma
+    sequência de buffers (ex.: as duas metades de um ring buffer).
+    """
+    parts = [pcm] if isinstance(pcm, (bytes, bytearray, memoryview)) else list(pcm)
+    data_size = sum(memoryview(p).nbytes for p in parts)
+    header = wav_header(data_size, sample_rate, channels, sample_width)
+    return WavStream([header, *parts])
+
+
+class PcmRingBuffer:
+    """
+    Buffer circular de capacidade fixa para o PCM de uma fala. A memória é
+    reservada uma vez e nunca cresce. views() devolve o conteúdo em ordem, como
+    uma ou duas memoryviews, sem copiar (pcm_to_wav_stream aceita as duas).
+
+    Quando a escrita passa da capacidade:
+      - drop_oldest: sobrescreve o início da fala (fica o áudio mais recente);
+      - reject e endpoint: recusam o excesso. Com endpoint, quem chama
+        encerra a fala e escreve o resto em outro buffer (ver UtteranceBuffers).
+
+    write() devolve (bytes do chunk aceitos, bytes descartados): os do início
+    da fala sobrescritos (drop_oldest) ou os recusados (reject). O resto
+    recusado com endpoint não conta como descartado: fica com quem chama.
+    """
+
+    def __init__(self, capacity: int, policy: str = "drop_oldest"):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Política de estouro do buffer de áudio desconhecida: {policy}")
+        # Múltiplo do tamanho da amostra: descartar o início nunca desalinha o int16
+        self.capacity = max(2, capacity - capacity % 2)
+        self.policy = policy
+        self._data = bytearray(self.capacity)
+        self._view = memoryview(self._data)
+        self._start = 0
+        self._size = 0
+        # Bytes da fala atual já descartados do início (drop_oldest): posição absoluta de _start
+        self._head_offset = 0
+        self.overflowed = False
+        self.high_water = 0
+        self.dropped_bytes = 0
+        self.rejected_bytes = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bytes__(self) -> bytes:
+        return b"".join(self.views())
+
+    @property
+    def free(self) -> int:
+        return self.capacity - self._size
+
+    @property
+    def reserved_bytes(self) -> int:
+        return self.capacity
+
+    @property
+    def start_offset(self) -> int:
+        """Posição (em bytes desde o início da fala) do byte mais antigo ainda no buffer."""
+        return self._head_offset
+
+    @property
+    def end_offset(self) -> int:
+        return self._head_offset + self._size
+
+    def write(self, chunk: BufferLike) -> Tuple[int, int]:
+        data = memoryview(chunk).cast("B")
+        n = data.nbytes
+        discarded = 0
+        if n > self.free:
+            self.overflowed = True
+            if self.policy == "drop_oldest":
+                if n >= self.capacity:
+                    discarded = self._size + n - self.capacity
+                    data = data[n - self.capacity:]
+                    self._start = self._size = 0
+                else:
+                    discarded = n - self.free
+                    discarded += discarded % 2
+                    self._start = (self._start + discarded) % self.capacity
+                    self._size -= discarded
+                self.dropped_bytes += discarded
+                self._head_offset += discarded
+            else:
+                accepted = self.free
+                if self.policy == "reject":
+                    discarded = n - accepted
+                    self.rejected_bytes += discarded
+                data = data[:accepted]
+                n = accepted
+        end = (self._start + self._size) % self.capacity
+        first = min(data.nbytes, self.capacity - end)
+        self._view[end:end + first] = data[:first]
+        if first < data.nbytes:
+            self._view[:data.nbytes - first] = data[first:]
+        self._size += data.nbytes
+        self.high_water = max(self.high_water, self._size)
+        return n, discarded
+
+    def views(self, start: int = None, end: int = None) -> List[memoryview]:
+        """
+        Conteúdo em ordem, sem cópia; `start`/`end` são posições desde o início
+        da fala (ver start_offset/end_offset). As views devem ser liberadas
+        (release) antes do clear().
+        """
+        start = self._head_offset if start is None else max(start, self._head_offset)
+        end = self.end_offset if end is None else min(end, self.end_offset)
+        if end <= start:
+            return []
+        first = (self._start + start - self._head_offset) % self.capacity
+        n = end - start
+        if first + n <= self.capacity:
+            return [self._view[first:first + n]]
+        return [self._view[first:], self._view[:first + n - self.capacity]]
+
+    def clear(self):
+        self._start = self._size = self._head_offset = 0
+        self.overflowed = False
+
+
+def pcm_views(buffer, start: int = None, end: int = None) -> List[memoryview]:
+    """PCM de um turno (ou um trecho dele) como memoryviews: aceita PcmRingBuffer ou um buffer comum (bytearray)."""
+    if isinstance(buffer, PcmRingBuffer):
+        return buffer.views(start, end)
+    view = memoryview(buffer)
+    if start is None and end is None:
+        return [view]
+    part = view[start:end]
+    view.release()
+    return [part]
+
+
+class UtteranceBuffers:
+    """
+    Os buffers de fala de uma sessão. `active` recebe o áudio; take() entrega
+    ao turno o buffer com a fala encerrada e põe no lugar um buffer livre. O
+    turno limpa o buffer (clear) ao terminar, e ele volta a ser o reserva. Em
+    regime, a sessão usa dois buffers, o que limita a memória a
+    2 × AUDIO_MAX_UTTERANCE_SECONDS de PCM.
+    """
+
+    def __init__(self, max_seconds: float = AUDIO_MAX_UTTERANCE_SECONDS, policy: str = AUDIO_OVERFLOW_POLICY,
+                 bytes_per_second: int = PCM_BYTES_PER_SECOND, on_reserve: Callable[[int], None] = None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Política de estouro do buffer de áudio desconhecida: {policy}")
+        self.policy = policy
+        self.max_seconds = max_seconds
+        self.capacity = int(max_seconds * bytes_per_second)
+        self.on_reserve = on_reserve
+        self._buffers: List[PcmRingBuffer] = []
+        self.active = self._new_buffer()
+        self.turns = 0
+        self.overflows = 0
+        self.discarded_bytes = 0
+
+    def _new_buffer(self) -> PcmRingBuffer:
+        buffer = PcmRingBuffer(self.capacity, self.policy)
+        self._buffers.append(buffer)
+        if self.on_reserve is not None:
+            self.on_reserve(buffer.reserved_bytes)
+        return buffer
+
+    def __len__(self) -> int:
+        return len(self.active)
+
+    def write(self, chunk: BufferLike) -> Tuple[int, int]:
+        """(aceitos, descartados), como PcmRingBuffer.write."""
+        was_overflowed = self.active.overflowed
+        accepted, discarded = self.active.write(chunk)
+        if self.active.overflowed and not was_overflowed:
+            self.overflows += 1
+        return accepted, discarded
+
+    def discard(self, nbytes: int):
+        """Excesso de uma fala com endpoint que não pôde virar turno (já há um em andamento)."""
+        self.discarded_bytes += nbytes
+
+    def take(self) -> PcmRingBuffer:
+        turn_buffer = self.active
+        # Um buffer vazio está livre: o turno que o usou já terminou (ou nunca leu nada)
+        spare = next((b for b in self._buffers if b is not turn_buffer and not len(b)), None)
+        self.active = spare if spare is not None else self._new_buffer()
+        self.active.clear()
+        self.turns += 1
+        return turn_buffer
+
+    @property
+    def reserved_bytes(self) -> int:
+        return sum(b.reserved_bytes for b in self._buffers)
+
+    def close(self):
+        if self.on_reserve is not None:
+            self.on_reserve(-self.reserved_bytes)
+        self._buffers = []
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "max_seconds": self.max_seconds,
+            "buffers": len(self._buffers),
+            "reserved_bytes": self.reserved_bytes,
+            "high_water_bytes": max((b.high_water for b in self._buffers), default=0),
+            "overflows": self.overflows,
+            "dropped_bytes": sum(b.dropped_bytes for b in self._buffers),
+            "rejected_bytes": sum(b.rejected_bytes for b in self._buffers) + self.discarded_bytes,
+        }
+
+
+class DebugAudioRecorder:
+    """
+    Gravação opcional de turnos para depuração: salva só uma amostra dos turnos
+    (`sample_rate` entre 0 e 1) em `directory`, apagando os arquivos mais antigos
+    quando o total passa de `max_bytes`. Desligada por padrão.
+    """
+
+    def __init__(self, directory: Path, sample_rate: float = 0.0, max_bytes: int = 50 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "DebugAudioRecorder":
+        return cls(
+            directory=Path(os.getenv("AUDIO_DEBUG_DIR", Path(__file__).parent / "debug_audio")),
+            sample_rate=float(os.getenv("AUDIO_DEBUG_SAMPLE_RATE", "0")),
+            max_bytes=int(os.getenv("AUDIO_DEBUG_MAX_BYTES", str(50 * 1024 * 1024))),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 and self.max_bytes > 0
+
+    def should_record(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    def record(self, wav: WavStream, label: str = "turn") -> Path:
+        """Grava o WAV (lendo do início) e aplica a rotação por tamanho."""
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"{label}_{time.time_ns()}.wav"
+            position = wav.tell()
+            wav.seek(0)
+            with open(path, "wb") as f:
+                while True:
+                    chunk = wav.read(64 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            wav.seek(position)
+            self._rotate()
+            return path
+
+    def _rotate(self):
+        files = sorted(self.directory.glob("*.wav"), key=lambda p: p.stat().st_mtime_ns)
+        total = sum(p.stat().st_size for p in files)
+        while files and total > self.max_bytes:
+            oldest = files.pop(0)
+            total -= oldest.stat().st_size
+            oldest.unlink(missing_ok=True)
@@ -0,0 +1,264 @@
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+# Cache de áudio do TTS (nível 1): sempre ligado, limitado em bytes
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "")  # vazio = só em memória
+TTS_CACHE_MAX_DISK_BYTES = int(os.getenv("TTS_CACHE_MAX_DISK_BYTES", str(512 * 1024 * 1024)))
+
+# Cache semântico de respostas (nível 2): opt-in
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+
+
+def normalize_tts_text(text: str) -> str:
+    """Mesma fala, mesma chave: normaliza Unicode e espaços (não mexe em caixa nem pontuação, que mudam a prosódia)."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def tts_cache_key(text: str, voice_id: str, model_id: str, output_format: str) -> str:
+    """Chave por conteúdo: sha256 de (texto normalizado, voz, modelo, formato)."""
+    material = "\x1f".join((normalize_tts_text(text), voice_id, model_id, output_format))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """
+    Cache LRU de áudio sintetizado, limitado pelo total de bytes em memória e
+    compartilhado por todas as sessões do processo. Com `directory`, cada
+    entrada também é gravada em disco (escrita atômica) e sobrevive a
+    reinícios; o disco é podado pelos arquivos menos usados recentemente.
+    Os métodos de disco são síncronos: chame-os via asyncio.to_thread.
+    """
+
+    def __init__(self, max_bytes: int = TTS_CACHE_MAX_BYTES, directory: str = None,
+                 max_disk_bytes: int = TTS_CACHE_MAX_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory else None
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_served = 0
+        self.bytes_stored = 0
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "TTSCache":
+        return cls(TTS_CACHE_MAX_BYTES, TTS_CACHE_DIR or None, TTS_CACHE_MAX_DISK_BYTES)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.audio"
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Consulta só a memória (não bloqueia)."""
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is None:
+                if not self.directory:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_served += len(audio)
+            return audio
+
+    def load(self, key: str) -> Optional[bytes]:
+        """Consulta o disco depois de um `get` sem sucesso; promove a entrada para a memória."""
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            audio = path.read_bytes()
+            os.utime(path)  # marca como usado recentemente para a poda
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+            self.bytes_served += len(audio)
+        self._remember(key, audio)
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        if not audio or len(audio) > self.max_bytes:
+            return
+        self._remember(key, audio)
+        with self._lock:
+            self.bytes_stored += len(audio)
+
+    def persist(self, key: str, audio: bytes):
+        """Grava a entrada em disco (tmp + os.replace) e poda o diretório."""
+        if not self.directory or not audio:
+            return
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(audio)
+        os.replace(tmp_path, path)
+        self._prune_disk()
+
+    def _remember(self, key: str, audio: bytes):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self._entries[key] = audio
+            self.bytes += len(audio)
+            while self.bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def _prune_disk(self):
+        files = []
+        for path in self.directory.glob("*.audio"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes_served": self.bytes_served,
+                "bytes_stored": self.bytes_stored,
+                "persistent": self.directory is not None,
+            }
+
+
+def document_id(doc) -> str:
+    """ID estável de um documento recuperado: o id do docstore ou, na falta dele, o hash de fonte + conteúdo."""
+    doc_id = getattr(doc, "id", None)
+    if doc_id:
+        return str(doc_id)
+    source = (getattr(doc, "metadata", None) or {}).get("source", "")
+    return hashlib.sha1(f"{source}\x1f{doc.page_content}".encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    Cache de respostas do LLM por similaridade: uma pergunta reaproveita a
+    resposta de outra quando os documentos recuperados são os mesmos e a
+    similaridade de cosseno entre os embeddings das perguntas passa de
+    `threshold`. Entradas expiram após `ttl_seconds`; acima de `max_entries`
+    sai a mais antiga. Thread-safe e compartilhado entre as sessões.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # doc_ids -> OrderedDict[id_entrada, (embedding normalizado, resposta, criado_em)]
+        self._buckets = {}
+        self._order: "OrderedDict[int, tuple]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.bytes_served = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["SemanticAnswerCache"]:
+        return cls() if ANSWER_CACHE_ENABLED else None
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, entry_id: int):
+        doc_key = self._order.pop(entry_id)
+        bucket = self._buckets[doc_key]
+        del bucket[entry_id]
+        if not bucket:
+            del self._buckets[doc_key]
+
+    def lookup(self, embedding, doc_ids: Sequence[str]) -> Optional[str]:
+        query = self._normalize(embedding)
+        doc_key = tuple(doc_ids)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(doc_key, {})
+            stale = [entry_id for entry_id, (_, _, created) in bucket.items() if now - created > self.ttl_seconds]
+            for entry_id in stale:
+                self._drop(entry_id)
+            self.expired += len(stale)
+            bucket = self._buckets.get(doc_key)
+            if bucket:
+                entries = list(bucket.values())
+                similarities = np.stack([vector for vector, _, _ in entries]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    answer = entries[best][1]
+                    self.hits += 1
+                    self.bytes_served += len(answer.encode("utf-8"))
+                    return answer
+            self.misses += 1
+            return None
+
+    def store(self, embedding, doc_ids: Sequence[str], answer: str):
+        if not answer:
+            return
+        doc_key = tuple(doc_ids)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._buckets.setdefault(doc_key, {})[entry_id] = (self._normalize(embedding), answer, time.monotonic())
+            self._order[entry_id] = doc_key
+            while len(self._order) > self.max_entries:
+                self._drop(next(iter(self._order)))
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._order),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "bytes_served": self.bytes_served,
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+            }
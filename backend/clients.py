@@ -0,0 +1,177 @@
+import asyncio
+import os
+import random
+import sys
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, TypeVar
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+
+T = TypeVar("T")
+
+# Pool HTTP compartilhado por todas as sessões (STT + LLM usam o mesmo cliente)
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY_SECONDS", "30"))
+OPENAI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", "5"))
+
+# Limites por provedor: quantos turnos simultâneos cada etapa aceita
+STT_CONCURRENCY = int(os.getenv("STT_CONCURRENCY", "32"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "32"))
+STT_TIMEOUT_SECONDS = float(os.getenv("STT_TIMEOUT_SECONDS", "20"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+
+PROVIDER_MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", "2"))
+PROVIDER_RETRY_BASE_DELAY_SECONDS = float(os.getenv("PROVIDER_RETRY_BASE_DELAY_SECONDS", "0.25"))
+PROVIDER_RETRY_MAX_DELAY_SECONDS = float(os.getenv("PROVIDER_RETRY_MAX_DELAY_SECONDS", "4"))
+
+
+def create_http_client(max_connections: int = None, max_keepalive_connections: int = None) -> "httpx.AsyncClient":
+    """Cliente httpx assíncrono com pool de conexões ajustado para o tráfego do agente."""
+    import httpx
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections or OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=max_keepalive_connections or OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        # Timeouts totais ficam a cargo do ProviderLimiter; aqui só o connect/pool.
+        timeout=httpx.Timeout(None, connect=OPENAI_CONNECT_TIMEOUT_SECONDS),
+    )
+
+
+def create_openai_client(api_key: str, base_url: str = None, http_client: "httpx.AsyncClient" = None) -> "AsyncOpenAI":
+    """
+    AsyncOpenAI sobre o pool compartilhado. As retries do SDK ficam desligadas:
+    quem decide retry/backoff é o ProviderLimiter de cada etapa.
+    """
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url or os.getenv("OPENAI_BASE_URL") or None,
+        http_client=http_client or create_http_client(),
+        max_retries=0,
+    )
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    # Sem o SDK carregado, o erro não pode ter vindo da OpenAI (e não vale importá-lo só para checar)
+    openai = sys.modules.get("openai")
+    if openai is None:
+        return False
+    if isinstance(exc, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code >= 500
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Backoff exponencial com "full jitter"."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+class ProviderLimiter:
+    """
+    Limita a concorrência de uma etapa (STT, LLM, ...) e aplica timeout por
+    chamada e retries com backoff + jitter. O semáforo não fica preso durante a
+    espera do backoff, então retries não reduzem a vazão das outras sessões.
+    """
+
+    def __init__(self, name: str, concurrency: int, timeout: float, max_retries: int = PROVIDER_MAX_RETRIES,
+                 base_delay: float = PROVIDER_RETRY_BASE_DELAY_SECONDS, max_delay: float = PROVIDER_RETRY_MAX_DELAY_SECONDS):
+        self.name = name
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _enter(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _exit(self):
+        self.in_flight -= 1
+
+    async def _retry_or_raise(self, attempt: int, exc: BaseException):
+        if isinstance(exc, asyncio.TimeoutError):
+            self.timeouts += 1
+        if attempt >= self.max_retries or not is_retryable(exc):
+            self.failures += 1
+            raise exc
+        self.retries += 1
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+        print(f"WARN: {self.name}: tentativa {attempt + 1} falhou ({type(exc).__name__}: {exc}). Nova tentativa em {delay:.2f}s.")
+        await asyncio.sleep(delay)
+
+    async def call(self, request: Callable[[], Awaitable[T]]) -> T:
+        """Executa `request()` (uma fábrica de corrotinas, chamada a cada tentativa)."""
+        self.calls += 1
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    self._enter()
+                    try:
+                        return await asyncio.wait_for(request(), self.timeout)
+                    finally:
+                        self._exit()
+            except Exception as e:
+                await self._retry_or_raise(attempt, e)
+                attempt += 1
+
+    async def stream(self, open_stream: Callable[[], Awaitable[AsyncIterator[T]]]) -> AsyncIterator[T]:
+        """
+        Versão para respostas em streaming: o timeout e as retries valem para a
+        abertura do stream; a vaga no semáforo fica ocupada até o stream terminar.
+        """
+        self.calls += 1
+        attempt = 0
+        while True:
+            await self._semaphore.acquire()
+            self._enter()
+            try:
+                stream = await asyncio.wait_for(open_stream(), self.timeout)
+                break
+            except BaseException as e:
+                self._exit()
+                self._semaphore.release()
+                if not isinstance(e, Exception):
+                    raise  # cancelamento
+                await self._retry_or_raise(attempt, e)
+                attempt += 1
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            try:
+                # aclose() nos async generators dos provedores, close() no stream do SDK
+                close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+                if close is not None:
+                    await close()
+            finally:
+                self._exit()
+                self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "concurrency": self.concurrency,
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+        }
@@ -0,0 +1,383 @@
+"""
+Build incremental do índice FAISS do RAG.
+
+Em vez de reembeddar o corpus inteiro a cada atualização do catálogo, guarda
+junto do índice:
+  * manifest.json: hash de cada arquivo .txt -> IDs dos chunks dele no FAISS,
+    dentro da pasta da versão (publicado junto com o índice que descreve);
+  * embedding_cache.npz: embedding de cada chunk, pela hash do conteúdo.
+Só arquivos novos ou alterados são divididos de novo; só chunks cujo conteúdo
+não está no cache vão para a API de embeddings (em lotes concorrentes, com
+backoff compartilhado quando a API responde 429); vetores de arquivos
+alterados ou removidos saem do índice.
+
+    python -m backend.index_builder [--data-dir data] [--index-path backend/faiss_index] [--dry-run]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+
+from backend import rag
+from backend.clients import backoff_delay, is_retryable
+from backend.vector_store import is_mapped_store, load_mapped_store
+
+MANIFEST_FILENAME = "manifest.json"
+EMBEDDING_CACHE_FILENAME = "embedding_cache.npz"
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source: str, position: int, content_hash: str) -> str:
+    """ID do chunk no docstore: muda se o arquivo, a posição ou o conteúdo mudarem."""
+    return sha256_text(f"{source}\x1f{position}\x1f{content_hash}")[:32]
+
+
+def embedding_model_name(embeddings) -> str:
+    return str(getattr(embeddings, "model", None) or type(embeddings).__name__)
+
+
+@dataclass
+class Chunk:
+    id: str
+    source: str
+    text: str
+    content_hash: str
+
+
+@dataclass
+class BuildPlan:
+    """O que um build faria: calculado sem chamar a API de embeddings."""
+    added_files: List[str] = field(default_factory=list)
+    changed_files: List[str] = field(default_factory=list)
+    removed_files: List[str] = field(default_factory=list)
+    unchanged_files: List[str] = field(default_factory=list)
+    new_chunks: List[Chunk] = field(default_factory=list)
+    stale_chunk_ids: List[str] = field(default_factory=list)
+    chunks_to_embed: int = 0
+    chunks_from_cache: int = 0
+    file_hashes: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added_files or self.changed_files or self.removed_files)
+
+    def summary(self) -> dict:
+        return {
+            "added_files": len(self.added_files),
+            "changed_files": len(self.changed_files),
+            "removed_files": len(self.removed_files),
+            "unchanged_files": len(self.unchanged_files),
+            "new_chunks": len(self.new_chunks),
+            "stale_vectors": len(self.stale_chunk_ids),
+            "chunks_to_embed": self.chunks_to_embed,
+            "chunks_from_cache": self.chunks_from_cache,
+        }
+
+
+class EmbeddingCache:
+    """Embeddings por hash do conteúdo do chunk, persistidos num .npz (escrita atômica)."""
+
+    def __init__(self, path: Path, model: str):
+        self.path = Path(path)
+        self.model = model
+        self._vectors: Dict[str, np.ndarray] = {}
+        self.load()
+
+    def load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model"]) != self.model:
+                    print(f"[RAG] Cache de embeddings de outro modelo ({data['model']}); ignorando.")
+                    return
+                self._vectors = dict(zip(data["keys"].tolist(), data["vectors"]))
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, content_hash: str) -> bool:
+        return content_hash in self._vectors
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def get(self, content_hash: str) -> np.ndarray:
+        return self._vectors[content_hash]
+
+    def put(self, content_hash: str, vector):
+        self._vectors[content_hash] = np.asarray(vector, dtype=np.float32)
+
+    def retain(self, content_hashes):
+        """Descarta embeddings de chunks que não existem mais no corpus."""
+        keep = set(content_hashes)
+        self._vectors = {key: value for key, value in self._vectors.items() if key in keep}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        keys = list(self._vectors)
+        vectors = np.stack([self._vectors[k] for k in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+        tmp_path = self.path.with_name(self.path.name + ".tmp.npz")
+        np.savez(tmp_path, keys=np.array(keys, dtype=str), vectors=vectors, model=np.array(self.model))
+        os.replace(tmp_path, self.path)
+
+
+def load_manifest(index_path: Path) -> dict:
+    """Manifesto da versão publicada (ou o da raiz, de índices anteriores às versões)."""
+    for path in (rag.published_dir(index_path) / MANIFEST_FILENAME, Path(index_path) / MANIFEST_FILENAME):
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            continue
+    return {"files": {}}
+
+
+def dump_manifest(manifest: dict) -> str:
+    return json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def scan_corpus(data_dir: Path) -> Dict[str, str]:
+    """Arquivos .txt do corpus (caminho relativo -> texto)."""
+    data_dir = Path(data_dir)
+    return {
+        txt_file.relative_to(data_dir).as_posix(): txt_file.read_text(encoding="utf-8", errors="ignore")
+        for txt_file in sorted(data_dir.rglob("*.txt"))
+    }
+
+
+def split_file(source: str, text: str, splitter) -> List[Chunk]:
+    chunks = []
+    for position, piece in enumerate(splitter.split_text(text)):
+        content_hash = sha256_text(piece)
+        chunks.append(Chunk(chunk_id(source, position, content_hash), source, piece, content_hash))
+    return chunks
+
+
+def plan_build(data_dir: Path, manifest: dict, cache: EmbeddingCache, full: bool = False) -> BuildPlan:
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    previous = {} if full else manifest.get("files", {})
+    corpus = scan_corpus(data_dir)
+    plan = BuildPlan()
+
+    pending_hashes = set()
+    for source, text in corpus.items():
+        file_hash = sha256_text(text)
+        plan.file_hashes[source] = file_hash
+        entry = previous.get(source)
+        if entry is not None and entry["sha256"] == file_hash:
+            plan.unchanged_files.append(source)
+            continue
+        (plan.changed_files if entry is not None else plan.added_files).append(source)
+        if entry is not None:
+            plan.stale_chunk_ids.extend(entry["chunk_ids"])
+        for chunk in split_file(source, text, splitter):
+            plan.new_chunks.append(chunk)
+            if chunk.content_hash in cache:
+                plan.chunks_from_cache += 1
+            elif chunk.content_hash not in pending_hashes:
+                pending_hashes.add(chunk.content_hash)
+    plan.chunks_to_embed = len(pending_hashes)
+
+    for source, entry in previous.items():
+        if source not in corpus:
+            plan.removed_files.append(source)
+            plan.stale_chunk_ids.extend(entry["chunk_ids"])
+    return plan
+
+
+def _retry_after_seconds(exc: BaseException):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_rate_limited(exc: BaseException) -> bool:
+    return getattr(exc, "status_code", None) == 429 or type(exc).__name__ == "RateLimitError"
+
+
+async def embed_in_batches(texts: Sequence[str], embed_documents: Callable[[List[str]], List[List[float]]],
+                           batch_size: int = EMBEDDING_BATCH_SIZE, concurrency: int = EMBEDDING_CONCURRENCY,
+                           max_retries: int = EMBEDDING_MAX_RETRIES, base_delay: float = 0.5,
+                           max_delay: float = 30.0) -> List[List[float]]:
+    """
+    Embeddings de `texts` em lotes de `batch_size`, até `concurrency` lotes ao
+    mesmo tempo (cada um numa thread, já que `embed_documents` é síncrono).
+    Quando um lote leva 429, todos os lotes esperam o mesmo intervalo
+    (retry-after da API ou backoff com jitter) antes da próxima chamada.
+    """
+    batches = [list(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+    results: List[List[List[float]]] = [None] * len(batches)
+    slots = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    cooldown_until = 0.0
+
+    async def run(index: int, batch: List[str]):
+        nonlocal cooldown_until
+        attempt = 0
+        while True:
+            async with slots:
+                wait = cooldown_until - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                try:
+                    results[index] = await asyncio.to_thread(embed_documents, batch)
+                    return
+                except Exception as e:
+                    rate_limited = _is_rate_limited(e)
+                    if attempt >= max_retries or not (rate_limited or is_retryable(e)):
+                        raise
+                    delay = _retry_after_seconds(e) or backoff_delay(attempt, base_delay, max_delay)
+                    if rate_limited:
+                        cooldown_until = max(cooldown_until, loop.time() + delay)
+                    print(f"WARN: Lote de embeddings {index} falhou ({type(e).__name__}); nova tentativa em {delay:.2f}s.")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    await asyncio.gather(*(run(i, batch) for i, batch in enumerate(batches)))
+    return [vector for batch in results for vector in batch]
+
+
+def _load_store(index_path: Path, embeddings, cache: EmbeddingCache = None):
+    index_path = rag.published_dir(index_path)
+    if is_mapped_store(index_path):
+        return _store_from_mapped(index_path, embeddings, cache)
+    if not (Path(index_path) / "index.faiss").exists():
+        return None
+    return FAISS.load_local(str(index_path), embeddings, allow_dangerous_deserialization=True)
+
+
+def _store_from_mapped(index_path: Path, embeddings, cache: EmbeddingCache = None):
+    """
+    FAISS em memória com os chunks do formato nativo, para o build incremental
+    alterar. Os vetores exatos vêm do cache de embeddings (o índice nativo
+    pode estar quantizado); se faltar algum, o build reconstrói tudo.
+    """
+    mapped = load_mapped_store(index_path, embeddings)
+    text_embeddings, metadatas, ids = [], [], []
+    for position in range(len(mapped)):
+        doc = mapped.document(position)
+        content_hash = sha256_text(doc.page_content)
+        if cache is None or content_hash not in cache:
+            return None
+        text_embeddings.append((doc.page_content, cache.get(content_hash).tolist()))
+        metadatas.append(doc.metadata)
+        ids.append(doc.id)
+    if not ids:
+        return None
+    return FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+
+
+async def build_index_incremental(data_dir: Path, index_path: Path, embeddings=None, dry_run: bool = False,
+                                  full: bool = False, batch_size: int = EMBEDDING_BATCH_SIZE,
+                                  concurrency: int = EMBEDDING_CONCURRENCY) -> BuildPlan:
+    """Atualiza o índice em `index_path` a partir dos .txt de `data_dir`. Retorna o plano executado."""
+    embeddings = embeddings or rag.get_embeddings()
+    index_path = Path(index_path)
+    manifest = load_manifest(index_path)
+    model = embedding_model_name(embeddings)
+    if manifest.get("embedding_model") not in (None, model):
+        print(f"[RAG] Modelo de embeddings mudou ({manifest['embedding_model']} -> {model}); reconstruindo tudo.")
+        full = True
+    cache = EmbeddingCache(index_path / EMBEDDING_CACHE_FILENAME, model)
+    store = None if full else _load_store(index_path, embeddings, cache)
+    if store is None:
+        full = True
+    plan = plan_build(data_dir, manifest, cache, full=full)
+    if dry_run or not (plan.has_changes or full):
+        return plan
+
+    started = time.perf_counter()
+    missing = list(dict.fromkeys(c.content_hash for c in plan.new_chunks if c.content_hash not in cache))
+    texts_by_hash = {c.content_hash: c.text for c in plan.new_chunks}
+    if missing:
+        vectors = await embed_in_batches([texts_by_hash[h] for h in missing], embeddings.embed_documents,
+                                         batch_size=batch_size, concurrency=concurrency)
+        for content_hash, vector in zip(missing, vectors):
+            cache.put(content_hash, vector)
+
+    if store is not None and plan.stale_chunk_ids:
+        indexed_ids = set(store.index_to_docstore_id.values())
+        stale_ids = [i for i in plan.stale_chunk_ids if i in indexed_ids]
+        if stale_ids:
+            store.delete(stale_ids)
+
+    if plan.new_chunks:
+        text_embeddings = [(c.text, cache.get(c.content_hash).tolist()) for c in plan.new_chunks]
+        metadatas = [{"source": c.source} for c in plan.new_chunks]
+        ids = [c.id for c in plan.new_chunks]
+        if store is None:
+            store = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+        else:
+            store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+
+    # Manifesto do corpus atual (arquivos inalterados mantêm seus chunks)
+    files = {source: manifest["files"][source] for source in plan.unchanged_files}
+    for chunk in plan.new_chunks:
+        files.setdefault(chunk.source, {"sha256": plan.file_hashes[chunk.source], "chunk_ids": []})
+        files[chunk.source]["chunk_ids"].append(chunk.id)
+    for source in plan.added_files + plan.changed_files:
+        files.setdefault(source, {"sha256": plan.file_hashes[source], "chunk_ids": []})
+
+    # Índice e manifesto saem na mesma versão: uma queda antes do VERSION não
+    # deixa um manifesto de um build descrevendo o índice de outro. Sem store
+    # (corpus vazio) nada é publicado e a versão anterior continua coerente.
+    if store is not None:
+        rag.save_index(store, index_path,
+                       extra_files={MANIFEST_FILENAME: dump_manifest({"embedding_model": model, "files": files})})
+        legacy_manifest = index_path / MANIFEST_FILENAME
+        if legacy_manifest.exists():
+            legacy_manifest.unlink()
+
+    # O cache só é podado depois da publicação: até lá, a versão anterior ainda pode precisar dele
+    all_chunk_hashes = {c.content_hash for c in plan.new_chunks}
+    if store is not None:
+        all_chunk_hashes.update(sha256_text(doc.page_content) for doc in store.docstore._dict.values())
+    cache.retain(all_chunk_hashes)
+    cache.save()
+    print(f"[RAG] Índice atualizado em {index_path}: {plan.summary()} ({time.perf_counter() - started:.1f}s)")
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=str(Path(rag.__file__).parent / "data"))
+    parser.add_argument("--index-path", default=str(rag.INDEX_PATH))
+    parser.add_argument("--dry-run", action="store_true", help="só mostra quantos chunks seriam reembeddados")
+    parser.add_argument("--full", action="store_true", help="ignora o manifesto e reconstrói o índice")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=EMBEDDING_CONCURRENCY)
+    args = parser.parse_args()
+
+    plan = asyncio.run(build_index_incremental(
+        Path(args.data_dir), Path(args.index_path), dry_run=args.dry_run, full=args.full,
+        batch_size=args.batch_size, concurrency=args.concurrency,
+    ))
+    summary = plan.summary()
+    prefix = "[dry-run] " if args.dry_run else ""
+    print(f"{prefix}Arquivos: {summary['added_files']} novos, {summary['changed_files']} alterados, "
+          f"{summary['removed_files']} removidos, {summary['unchanged_files']} inalterados")
+    print(f"{prefix}Chunks: {summary['new_chunks']} a indexar, {summary['chunks_to_embed']} a reembeddar, "
+          f"{summary['chunks_from_cache']} do cache; {summary['stale_vectors']} vetores a remover")
+
+
+if __name__ == "__main__":
+    main()
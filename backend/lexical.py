@@ -0,0 +1,198 @@
+"""
+Índice lexical (BM25) do catálogo, para termos exatos que o embedding trata
+mal: diâmetros ("3.5mm"), códigos de produto e nomes de linha ("Linha Zero").
+
+É construído junto com o FAISS (rag.save_index) a partir dos chunks do
+docstore e gravado ao lado dele num .npz só com arrays (sem pickle):
+
+  terms     vocabulário ordenado (busca por np.searchsorted)
+  offsets   início das postings de cada termo (CSR, len = termos + 1)
+  postings  posição do chunk em doc_keys, ordenada dentro de cada termo
+  weights   peso BM25 já calculado de cada posting (idf * tf saturado)
+  doc_keys  ID do chunk no docstore do FAISS
+
+Consultar é somar fatias de `weights`: não há chamada de rede nem recálculo.
+"""
+import os
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+LEXICAL_INDEX_FILENAME = "lexical_index.npz"
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Termo "forte": tem dígito (medida, código) ou aparece em poucos chunks
+LEXICAL_STRONG_MAX_DF_FRACTION = float(os.getenv("LEXICAL_STRONG_MAX_DF_FRACTION", "0.1"))
+# Atalho lexical: fração mínima dos termos da consulta que existem no catálogo
+LEXICAL_FAST_PATH_MIN_COVERAGE = float(os.getenv("LEXICAL_FAST_PATH_MIN_COVERAGE", "0.6"))
+
+STOPWORDS = frozenset("""
+a o as os um uma uns umas de da do das dos em na no nas nos ao aos e ou que se por para pra com sem
+sobre ate como mais menos muito ja nao sim eu voce voces ele ela eles elas nos me te lhe meu minha seu sua
+isso isto esse essa este esta aquele aquela tem ter tenho temos qual quais quanto quantos quando onde
+ser sao foi era vai vou pode posso gostaria queria saber
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+_DECIMAL_COMMA_RE = re.compile(r"(\d),(\d)")
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sem acentos e com vírgula decimal virando ponto ("3,5" == "3.5")."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _DECIMAL_COMMA_RE.sub(r"\1.\2", stripped)
+
+
+def tokenize(text: str) -> List[str]:
+    """"Implante 3,5mm da Linha Zero" -> ["implante", "3.5", "mm", "linha", "zero"]."""
+    tokens = []
+    for token in _TOKEN_RE.findall(normalize(text)):
+        # Separa número de unidade colados ("3.5mm" -> "3.5", "mm"), como na fala transcrita
+        match = re.fullmatch(r"([0-9]+(?:\.[0-9]+)*)([a-z]+)", token)
+        parts = match.groups() if match else (token,)
+        tokens.extend(part for part in parts if part not in STOPWORDS)
+    return tokens
+
+
+@dataclass
+class LexicalResult:
+    hits: List[Tuple[str, float]] = field(default_factory=list)  # (ID do chunk, score BM25)
+    confident: bool = False
+
+
+class LexicalIndex:
+    def __init__(self, terms: np.ndarray, offsets: np.ndarray, postings: np.ndarray, weights: np.ndarray,
+                 doc_keys: np.ndarray):
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.weights = weights
+        self.doc_keys = doc_keys
+
+    @property
+    def doc_count(self) -> int:
+        return len(self.doc_keys)
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[str, str]]) -> "LexicalIndex":
+        """`documents`: pares (ID do chunk no docstore, texto)."""
+        doc_keys, term_counts = [], []
+        for key, text in documents:
+            doc_keys.append(key)
+            term_counts.append(Counter(tokenize(text)))
+        lengths = np.array([sum(c.values()) for c in term_counts], dtype=np.float64)
+        avg_length = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+
+        postings_by_term = {}
+        for doc, counts in enumerate(term_counts):
+            for term, tf in counts.items():
+                postings_by_term.setdefault(term, []).append((doc, tf))
+
+        terms = sorted(postings_by_term)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        postings, weights = [], []
+        n_docs = len(doc_keys)
+        for i, term in enumerate(terms):
+            entries = postings_by_term[term]
+            docs = np.array([doc for doc, _ in entries], dtype=np.int32)
+            tfs = np.array([tf for _, tf in entries], dtype=np.float64)
+            idf = np.log(1.0 + (n_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths[docs] / avg_length)
+            postings.append(docs)
+            weights.append((idf * tfs * (BM25_K1 + 1.0) / (tfs + norm)).astype(np.float32))
+            offsets[i + 1] = offsets[i] + len(entries)
+
+        return cls(
+            terms=np.array(terms, dtype=str),
+            offsets=offsets,
+            postings=np.concatenate(postings) if postings else np.zeros(0, dtype=np.int32),
+            weights=np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32),
+            doc_keys=np.array(doc_keys, dtype=str),
+        )
+
+    @classmethod
+    def from_store(cls, store) -> "LexicalIndex":
+        """Índice dos chunks do docstore de um FAISS do LangChain."""
+        return cls.build((key, doc.page_content) for key, doc in store.docstore._dict.items())
+
+    def save(self, directory: Path):
+        path = Path(directory) / LEXICAL_INDEX_FILENAME
+        tmp_path = path.with_name(path.name + ".tmp.npz")
+        np.savez(tmp_path, terms=self.terms, offsets=self.offsets, postings=self.postings, weights=self.weights,
+                 doc_keys=self.doc_keys)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["LexicalIndex"]:
+        """None se o índice foi publicado sem a parte lexical (versões antigas)."""
+        try:
+            with np.load(Path(directory) / LEXICAL_INDEX_FILENAME, allow_pickle=False) as data:
+                return cls(data["terms"], data["offsets"], data["postings"], data["weights"], data["doc_keys"])
+        except FileNotFoundError:
+            return None
+
+    def _term_ids(self, tokens: List[str]) -> List[int]:
+        ids = []
+        for token in dict.fromkeys(tokens):
+            i = int(np.searchsorted(self.terms, token))
+            if i < len(self.terms) and self.terms[i] == token:
+                ids.append(i)
+        return ids
+
+    def _is_strong(self, term_id: int) -> bool:
+        df = self.offsets[term_id + 1] - self.offsets[term_id]
+        term = str(self.terms[term_id])
+        return any(ch.isdigit() for ch in term) or df <= max(1, LEXICAL_STRONG_MAX_DF_FRACTION * self.doc_count)
+
+    def _contains(self, term_id: int, doc: int) -> bool:
+        docs = self.postings[self.offsets[term_id]:self.offsets[term_id + 1]]
+        i = np.searchsorted(docs, doc)
+        return i < len(docs) and docs[i] == doc
+
+    def search(self, text: str, k: int = 3) -> LexicalResult:
+        """
+        Top-k por BM25. `confident` (atalho sem embedding) quando a maior parte
+        dos termos da consulta existe no catálogo, algum deles é forte e só o
+        primeiro resultado contém todos eles.
+        """
+        tokens = list(dict.fromkeys(tokenize(text)))
+        term_ids = self._term_ids(tokens)
+        if not term_ids or not self.doc_count:
+            return LexicalResult()
+        scores = np.zeros(self.doc_count, dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            scores[self.postings[start:end]] += self.weights[start:end]
+        k = min(k, self.doc_count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        top = top[scores[top] > 0]
+        hits = [(str(self.doc_keys[doc]), float(scores[doc])) for doc in top]
+
+        def covers_all(doc) -> bool:
+            return all(self._contains(t, int(doc)) for t in term_ids)
+
+        confident = (
+            len(term_ids) >= LEXICAL_FAST_PATH_MIN_COVERAGE * len(tokens)
+            and any(self._is_strong(t) for t in term_ids)
+            and covers_all(top[0])
+            and not any(covers_all(doc) for doc in top[1:])
+        )
+        return LexicalResult(hits, confident)
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[str]:
+    """Funde listas ordenadas de IDs: score = soma de 1 / (k + posição)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda key: -scores[key])
@@ -7,51 +7,157 @@ load_dotenv(dotenv_path=dotenv_path)
 
 import asyncio
 import json
-from io import BytesIO
+import threading
 import time
 import traceback
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, status
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.websockets import WebSocketState
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
-from backend.rag import query_index
-from pydub import AudioSegment
-
-# --- ElevenLabs Imports e Configuração ---
-from elevenlabs.client import AsyncElevenLabs
-from elevenlabs.types import Voice, VoiceSettings
+from backend.clients import LLM_CONCURRENCY, LLM_TIMEOUT_SECONDS, STT_CONCURRENCY, STT_TIMEOUT_SECONDS, ProviderLimiter
+from backend import metrics
+from backend.cache import SemanticAnswerCache, TTSCache, document_id, tts_cache_key
+from backend.memory import MEMORY_SUMMARY_MAX_TOKENS, ConversationMemory, warm_up_tokenizer
+from backend.partial_stt import STT_PARTIAL_ENABLED, IncrementalTranscriber
+from backend.protocol import PROTOCOL_VERSION, FramedWebSocket, negotiate_codec
+from backend.providers import LLM_SUMMARY_MODEL, create_llm_provider, create_stt_provider, create_tts_provider
+from backend.rag import get_retriever, query_index, query_index_with_embedding
+from backend.session_io import WS_CLOSE_FLUSH_SECONDS, SessionIdle, SessionIO, wait_written
+from backend.sessions import ResumableSession, create_session_store, restore_memory
+from backend.streaming import aclose_quietly, segment_text_stream, stream_segments_audio
+from backend.vad import END_OF_SPEECH, StreamingEndpointer
+from backend.audio import DebugAudioRecorder, UtteranceBuffers, WavStream, pcm_to_wav_stream, pcm_views
+
+# Provedores de cada etapa (backend/providers): escolhidos por STT_PROVIDER, LLM_PROVIDER e TTS_PROVIDER.
+# Criados no primeiro uso ou no aquecimento do lifespan: importar este módulo não carrega nenhum SDK.
+stt_provider = None
+llm_provider = None
+summary_llm_provider = None
+tts_provider = None
+_providers_lock = threading.Lock()
+
+def get_stt_provider():
+    global stt_provider
+    if stt_provider is None:
+        with _providers_lock:
+            if stt_provider is None:
+                stt_provider = create_stt_provider()
+    return stt_provider
+
+def get_llm_provider():
+    global llm_provider
+    if llm_provider is None:
+        with _providers_lock:
+            if llm_provider is None:
+                llm_provider = create_llm_provider()
+    return llm_provider
+
+def get_summary_llm_provider():
+    global summary_llm_provider
+    if summary_llm_provider is None:
+        with _providers_lock:
+            if summary_llm_provider is None:
+                summary_llm_provider = create_llm_provider(model=LLM_SUMMARY_MODEL)
+    return summary_llm_provider
+
+def get_tts_provider():
+    global tts_provider
+    if tts_provider is None:
+        with _providers_lock:
+            if tts_provider is None:
+                tts_provider = create_tts_provider()
+    return tts_provider
+
+# Sessões retomáveis (backend/sessions.py): SESSION_STORE=memory no processo, redis entre workers
+session_store = None
+
+def get_session_store():
+    global session_store
+    if session_store is None:
+        session_store = create_session_store()
+    return session_store
+
+# Cache de áudio por conteúdo (texto normalizado + voz + modelo + formato), compartilhado entre sessões
+tts_cache = TTSCache.from_env()
+
+async def synthesize_tts_stream(text: str):
+    """Gera os chunks MP3 do provedor de TTS à medida que chegam (ou o áudio já em cache)."""
+    provider = get_tts_provider()
+    cache_key = tts_cache_key(text, provider.voice_id, provider.model_id, provider.output_format)
+    cached_audio = tts_cache.get(cache_key)
+    if cached_audio is None and tts_cache.directory:
+        cached_audio = await asyncio.to_thread(tts_cache.load, cache_key)
+    if cached_audio is not None:
+        yield cached_audio
+        return
 
-ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
-elevenlabs_client = None
-if ELEVENLABS_API_KEY:
+    audio_generator = provider.synthesize_stream(text)
+    chunks = []
+    started_at = time.perf_counter()
     try:
-        elevenlabs_client = AsyncElevenLabs(api_key=ELEVENLABS_API_KEY)
-        print("DEBUG TTS: Cliente AsyncElevenLabs inicializado com sucesso.")
-    except Exception as e:
-        print(f"ERROR: Erro ao inicializar cliente AsyncElevenLabs: {e}")
-else:
-    print("AVISO: ELEVENLABS_API_KEY não definida. O TTS ElevenLabs não funcionará.")
+        async for chunk in audio_generator:
+            if not chunks:
+                metrics.observe_first("tts_first_byte", time.perf_counter() - started_at)
+            chunks.append(chunk)
+            yield chunk
+    finally:
+        await aclose_quietly(audio_generator)
+    # Só chega aqui se a síntese terminou (cancelamento/erro não grava áudio parcial)
+    metrics.observe("tts", time.perf_counter() - started_at)
+    audio = b"".join(chunks)
+    tts_cache.put(cache_key, audio)
+    if tts_cache.directory and audio:
+        try:
+            await asyncio.to_thread(tts_cache.persist, cache_key, audio)
+        except OSError as e:
+            print(f"WARN: Não foi possível gravar o áudio em cache no disco: {e}")
 
 async def synthesize_tts(text: str) -> bytes:
-    if not elevenlabs_client:
-        print("ERROR: Cliente ElevenLabs não inicializado ou API Key ausente.")
-        return b""
     try:
-        audio_generator = elevenlabs_client.text_to_speech.convert(
-            voice_id="21m00Tcm4TlvDq8ikWAM",
-            output_format="mp3_44100_128",
-            text=text,
-            model_id="eleven_multilingual_v2",
-        )
-        all_audio_bytes = b""
-        async for chunk in audio_generator:
-            all_audio_bytes += chunk
-        return all_audio_bytes
+        chunks = [chunk async for chunk in synthesize_tts_stream(text)]
+        return b"".join(chunks)
     except Exception as e:
-        print(f"ERROR: Erro ao gerar áudio com ElevenLabs: {e}. Detalhes: {e.response.text if hasattr(e, 'response') and hasattr(e.response, 'text') else 'N/A'}")
+        print(f"ERROR: Erro ao gerar áudio com o TTS ({get_tts_provider().name}): {e}. Detalhes: {e.response.text if hasattr(e, 'response') and hasattr(e.response, 'text') else 'N/A'}")
         return b""
 
-tapp = FastAPI()
+# Aquecimento em background, depois que a porta já está aberta: os SDKs, os
+# clientes dos provedores, o tokenizer da memória e o índice do RAG saem do
+# caminho do primeiro turno.
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1").lower() in ("1", "true", "yes")
+
+# Estado exposto em GET /ready
+readiness = {"providers": False, "tokenizer": False, "index": False, "errors": {}}
+
+def _warm_providers():
+    for get_provider in (get_stt_provider, get_llm_provider, get_summary_llm_provider, get_tts_provider):
+        get_provider()
+
+async def warm_up():
+    started_at = time.perf_counter()
+    # O tokenizer (tiktoken) pode baixar o vocabulário: numa thread, não dentro do primeiro prompt_history()
+    for name, warm in (("providers", _warm_providers), ("tokenizer", warm_up_tokenizer),
+                       ("index", lambda: get_retriever().get_store())):
+        try:
+            await asyncio.to_thread(warm)
+            readiness[name] = True
+        except Exception as e:
+            readiness["errors"][name] = str(e)
+            print(f"ERROR: Falha ao aquecer '{name}': {e}")
+    print(f"INFO: Aquecimento concluído em {(time.perf_counter() - started_at) * 1000:.0f} ms "
+          f"(provedores: {readiness['providers']}, tokenizer: {readiness['tokenizer']}, índice: {readiness['index']}).")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up_task = asyncio.create_task(warm_up()) if WARMUP_ON_STARTUP else None
+    yield
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+        await asyncio.wait({warm_up_task})
+    if session_store is not None:
+        await session_store.aclose()
+
+tapp = FastAPI(lifespan=lifespan)
 
 tapp.add_middleware(
     CORSMiddleware,
@@ -61,68 +167,97 @@ tapp.add_middleware(
     allow_headers=["*"],
 )
 
-OPENAI_KEY = os.getenv("OPENAI_KEY")
-if not OPENAI_KEY:
-    raise ValueError("Defina OPENAI_KEY no .env antes de iniciar o servidor")
-client = OpenAI(api_key=OPENAI_KEY)
+# Concorrência, timeout e retries por provedor (configuráveis por variáveis de ambiente)
+stt_limiter = ProviderLimiter("stt", STT_CONCURRENCY, STT_TIMEOUT_SECONDS)
+llm_limiter = ProviderLimiter("llm", LLM_CONCURRENCY, LLM_TIMEOUT_SECONDS)
 
-# Função para converter PCM RAW para WAV
-def convert_pcm_to_wav(pcm_bytes: bytes, sample_rate: int = 16000, channels: int = 1, sample_width: int = 2) -> bytes:
-    try:
-        current_time_ms = int(time.time() * 1000)
-        output_raw_filename = f"received_audio_raw_{current_time_ms}.bin"
-        with open(output_raw_filename, "wb") as f:
-            f.write(pcm_bytes)
-        print(f"INFO DEBUG: Áudio PCM RAW recebido salvo como {output_raw_filename}")
-    except Exception as e:
-        print(f"WARN DEBUG: Não foi possível salvar received_audio_raw.bin: {e}")
+# Gravação de áudio para depuração: só quando AUDIO_DEBUG_SAMPLE_RATE > 0
+debug_audio_recorder = DebugAudioRecorder.from_env()
+
+# Função para enquadrar PCM RAW como WAV (em memória, sem cópia do áudio)
+def convert_pcm_to_wav(pcm_bytes, sample_rate: int = 16000, channels: int = 1, sample_width: int = 2) -> WavStream:
     try:
-        audio = AudioSegment(
-            data=pcm_bytes,
-            sample_width=sample_width,
-            frame_rate=sample_rate,
-            channels=channels
-        )
-        wav_io = BytesIO()
-        audio.export(wav_io, format="wav")
-        wav_io.seek(0)
-        
-        output_wav_filename = f"converted_audio_{current_time_ms}.wav"
-        with open(output_wav_filename, "wb") as f:
-            f.write(wav_io.getvalue())
-        print(f"INFO DEBUG: Áudio WAV convertido salvo como {output_wav_filename}")
-        
-        return wav_io.read()
+        return pcm_to_wav_stream(pcm_bytes, sample_rate, channels, sample_width)
     except Exception as e:
         print(f"ERROR: Erro ao converter PCM RAW para WAV: {e}")
-        print("INFO DEBUG: Por favor, verifique 'received_audio_raw_*.bin' e tente reproduzir como RAW 16kHz mono.")
         raise
 
-async def transcribe_bytes(data: bytes) -> str:
+async def transcribe_bytes(data) -> str:
+    audio_file = None
     try:
-        wav_bytes = await asyncio.to_thread(convert_pcm_to_wav, data)
+        with metrics.span("wav"):
+            audio_file = convert_pcm_to_wav(data)
         
-        audio_file = BytesIO(wav_bytes)
-        audio_file.name = "audio.wav"
+        if debug_audio_recorder.should_record():
+            try:
+                saved_path = await asyncio.to_thread(debug_audio_recorder.record, audio_file)
+                print(f"INFO DEBUG: Áudio do turno salvo como {saved_path}")
+            except Exception as e:
+                print(f"WARN DEBUG: Não foi possível salvar o áudio de depuração: {e}")
         
-        response = await asyncio.to_thread(
-            client.audio.transcriptions.create,
-            model="whisper-1",
-            file=audio_file,
-            response_format="text"
-        )
+        async def request():
+            audio_file.seek(0)  # cada tentativa reenvia o arquivo desde o início
+            return await get_stt_provider().transcribe(audio_file)
+
+        with metrics.span("stt"):
+            response = await stt_limiter.call(request)
         return response
     except Exception as e:
-        print(f"ERROR: Erro na transcrição com Whisper: {e}")
+        print(f"ERROR: Erro na transcrição ({get_stt_provider().name}): {e}")
         raise
+    finally:
+        # Libera as views sobre o buffer da sessão
+        if audio_file is not None:
+            audio_file.close()
+
+async def transcribe_partial(data) -> str:
+    """Janela da transcrição incremental: mesmo provedor e limitador do STT, medida à parte do turno (stt_partial)."""
+    audio_file = convert_pcm_to_wav(data)
+    started_at = time.perf_counter()
+    try:
+        async def request():
+            audio_file.seek(0)
+            return await get_stt_provider().transcribe(audio_file)
 
-async def chat_rag(username: str, messages: list) -> str:
-    user_query = messages[-1]["content"]
-
-    docs = query_index(user_query)
-    context = "\n\n".join(d.page_content for d in docs)
+        text = await stt_limiter.call(request)
+        metrics.stage_seconds.labels("stt_partial").observe(time.perf_counter() - started_at)
+        return text
+    finally:
+        audio_file.close()
+
+# Modos de resposta por sessão: "batch" (texto completo -> TTS completo -> envio)
+# ou "stream" (LLM em streaming -> sentenças -> TTS por sentença -> chunks de áudio).
+TTS_MODES = ("batch", "stream")
+DEFAULT_TTS_MODE = os.getenv("TTS_MODE", "batch")
+
+# Cache semântico de respostas (opt-in: ANSWER_CACHE_ENABLED=1); None quando desligado
+answer_cache = SemanticAnswerCache.from_env()
+
+async def retrieve_context(user_query: str):
+    """Documentos do RAG para a consulta e, com o cache semântico ligado, o embedding dela."""
+    # A busca (embedding da consulta + FAISS) é síncrona; não bloqueia o event loop.
+    with metrics.span("rag"):
+        if answer_cache is None:
+            return await asyncio.to_thread(query_index, user_query), None
+        return await asyncio.to_thread(query_index_with_embedding, user_query)
+
+def cached_answer(username: str, docs: list, query_embedding):
+    if answer_cache is None or query_embedding is None:
+        return None
+    answer = answer_cache.lookup(query_embedding, [document_id(d) for d in docs])
+    if answer is not None:
+        print(f"INFO: Resposta para {username} servida pelo cache semântico.")
+    return answer
+
+def remember_answer(username: str, docs: list, query_embedding, answer: str):
+    # Respostas com o nome do cliente não servem para outras sessões
+    if answer_cache is None or query_embedding is None or not answer or (username and username in answer):
+        return
+    answer_cache.store(query_embedding, [document_id(d) for d in docs], answer)
 
-    system_message_content = f"""
+# Prefixo estável do prompt: o mesmo texto em todos os turnos e sessões, para o
+# cache de prompt do provedor. O que muda a cada turno (contexto do RAG) vai no fim.
+SYSTEM_PROMPT = """
     Você é um agente de voz SDR (Sales Development Representative) da empresa MEDENS, especializado em produtos e serviços de implantodontia.
     Seu objetivo principal é qualificar o cliente, engajá-lo em uma conversa útil e direcioná-lo para uma oportunidade de vendas de produtos da MEDENS.
 
@@ -147,47 +282,188 @@ async def chat_rag(username: str, messages: list) -> str:
 
     """
 
-    openai_messages = [{"role": "system", "content": system_message_content}]
+MEMORY_SUMMARY_PROMPT = (
+    "Você resume conversas de um agente SDR da MEDENS com um cliente. Atualize o resumo com as novas mensagens, "
+    "em português e em poucas frases: dados do cliente, necessidades, produtos citados, objeções e próximos passos "
+    "combinados. Não invente nada que não esteja nas mensagens."
+)
+
+async def summarize_history(previous_summary: str, messages: list) -> str:
+    """Resumidor da ConversationMemory: funde o resumo anterior com as mensagens que saem da janela."""
+    transcript = "\n".join(f"{'Cliente' if m['role'] == 'user' else 'Agente'}: {m['content']}" for m in messages)
+    summary = await llm_limiter.call(lambda: get_summary_llm_provider().complete(
+        [
+            {"role": "system", "content": MEMORY_SUMMARY_PROMPT},
+            {"role": "user", "content": f"Resumo atual:\n{previous_summary or '(vazio)'}\n\nNovas mensagens:\n{transcript}"},
+        ],
+        max_tokens=MEMORY_SUMMARY_MAX_TOKENS,
+    ))
+    return summary or previous_summary
+
+async def build_chat_messages(username: str, messages: list, docs: list = None) -> list:
+    if docs is None:
+        docs, _ = await retrieve_context(messages[-1]["content"])
+    context = "\n\n".join(d.page_content for d in docs)
+
+    # system fixo -> resumo (muda só quando é refeito) -> histórico (só cresce no fim) -> contexto do turno
+    openai_messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if isinstance(messages, ConversationMemory):
+        openai_messages.extend(messages.prompt_history())
+    else:
+        openai_messages.extend(messages)
 
     if context:
         openai_messages.append({"role": "system", "content": f"Informações relevantes para esta consulta (contexto RAG):\n{context}\n\nUse estas informações para complementar suas respostas de forma direta e concisa, SE forem pertinentes à pergunta atual do cliente e ao histórico. Não cite o 'Contexto MEDENS' explicitamente na sua fala."})
 
-    openai_messages.extend(messages)
+    return openai_messages
 
-    response = await asyncio.to_thread(
-        client.chat.completions.create,
-        model="gpt-4o-mini",
-        messages=openai_messages
-    )
-    return response.choices[-1].message.content
+async def chat_rag(username: str, messages: list) -> str:
+    docs, query_embedding = await retrieve_context(messages[-1]["content"])
+    answer = cached_answer(username, docs, query_embedding)
+    if answer is not None:
+        return answer
+    openai_messages = await build_chat_messages(username, messages, docs)
+    with metrics.span("llm"):
+        answer = await llm_limiter.call(lambda: get_llm_provider().complete(openai_messages))
+    remember_answer(username, docs, query_embedding, answer)
+    return answer
+
+async def chat_rag_stream(username: str, messages: list):
+    """Mesma consulta de chat_rag, mas gera os deltas de texto conforme chegam."""
+    docs, query_embedding = await retrieve_context(messages[-1]["content"])
+    answer = cached_answer(username, docs, query_embedding)
+    if answer is not None:
+        yield answer
+        return
+    openai_messages = await build_chat_messages(username, messages, docs)
+    started_at = time.perf_counter()
+    deltas = llm_limiter.stream(lambda: get_llm_provider().open_stream(openai_messages))
+    parts = []
+    try:
+        async for delta in deltas:
+            if not parts:
+                metrics.observe_first("llm_first_token", time.perf_counter() - started_at)
+            parts.append(delta)
+            yield delta
+    finally:
+        await aclose_quietly(deltas)
+    metrics.observe("llm", time.perf_counter() - started_at)
+    remember_answer(username, docs, query_embedding, "".join(parts))
+
+
+async def send_reply_audio(ws_ref, audio: bytes, turn_started_at: float):
+    """
+    Envia áudio da resposta medindo ws_send e first_audio na escrita da
+    WebSocket. Com SessionIO o envio só entra na fila, e quem mede é o escritor;
+    o turno espera o último frame sair (trace.last_write) antes de fechar o trace.
+    """
+    if isinstance(ws_ref, SessionIO):
+        trace = metrics.current_trace()
+        written = await ws_ref.send_bytes(audio, trace=trace)
+        if trace is not None:
+            trace.last_write = written
+        return
+    with metrics.span("ws_send"):
+        await ws_ref.send_bytes(audio)
+    metrics.observe_first("first_audio", time.perf_counter() - turn_started_at)
+
+
+async def stream_reply(user_id_ref: str, conversation_history_ref: list, ws_ref: WebSocket, turn_started_at: float, spoken_segments: list = None) -> str:
+    """
+    Modo "stream": cada sentença do LLM vai para o TTS assim que termina e os
+    chunks de áudio são enviados ao WebSocket em ordem. Ao fim de cada sentença
+    o cliente recebe {"type": "audio_segment_end"} para poder tocá-la, e a
+    sentença entra em `spoken_segments` (o que o agente de fato falou).
+    """
+    first_audio_at = None
+    reply_parts = []
+    spoken_segments = spoken_segments if spoken_segments is not None else []
+
+    async def deltas():
+        stream = chat_rag_stream(user_id_ref, conversation_history_ref)
+        try:
+            async for delta in stream:
+                reply_parts.append(delta)
+                yield delta
+        finally:
+            await aclose_quietly(stream)
+
+    async def on_audio(segment_index: int, chunk: bytes):
+        nonlocal first_audio_at
+        if first_audio_at is None:
+            first_audio_at = time.perf_counter()
+            print(f"INFO: Primeiro áudio para {user_id_ref} pronto em {(first_audio_at - turn_started_at) * 1000:.0f} ms (modo stream).")
+        if ws_ref.client_state == WebSocketState.CONNECTED:
+            await send_reply_audio(ws_ref, chunk, turn_started_at)
+
+    async def on_segment_end(segment_index: int, text: str):
+        spoken_segments.append(text)
+        if ws_ref.client_state == WebSocketState.CONNECTED:
+            await ws_ref.send_text(json.dumps({"type": "audio_segment_end", "segment": segment_index}))
+
+    await stream_segments_audio(segment_text_stream(deltas()), synthesize_tts_stream, on_audio, on_segment_end)
+
+    reply = "".join(reply_parts)
+    if ws_ref.client_state == WebSocketState.CONNECTED:
+        await ws_ref.send_text(f"Agente: {reply}")
+        await ws_ref.send_text(json.dumps({"type": "audio_end"}))
+    return reply
 
 
 # --- FUNÇÃO DE LÓGICA DE TURNO (GLOBAL) ---
-async def handle_user_turn_logic(audio_buffer_ref: bytearray, user_id_ref: str, conversation_history_ref: list, ws_ref: WebSocket, set_is_processing_flag_callback):
+async def handle_user_turn_logic(audio_buffer_ref, user_id_ref: str, conversation_history_ref: list, ws_ref: WebSocket, set_is_processing_flag_callback, tts_mode: str = "batch", turn_state: dict = None):
     
+    turn_started_at = time.perf_counter()
+    # Spans por etapa deste turno (STT, RAG, LLM, TTS, envio): ver backend/metrics.py
+    trace = metrics.start_turn_trace()
+    # Preenchido por ws_voice no barge-in: {"played_segments": n} informado pelo cliente
+    turn_state = turn_state if turn_state is not None else {}
+    # Transcrição incremental (backend/partial_stt.py): as janelas da fala já estão transcrevendo
+    transcriber = turn_state.get("transcriber")
+    # Trechos da resposta cujo áudio já foi entregue ao cliente
+    spoken_segments = []
+    reply = None
     MIN_AUDIO_BUFFER_FOR_PROCESSING = 16000 # 1 segundo de áudio (16kHz * 1 canal * 2 bytes/sample)
     
     if ws_ref.client_state != WebSocketState.CONNECTED:
         print(f"INFO: handle_user_turn_logic chamado, mas WS para {user_id_ref} não está conectado. Abortando.")
+        if transcriber is not None:
+            transcriber.close()
+        audio_buffer_ref.clear()
+        trace.finish("disconnected")
         set_is_processing_flag_callback(False)
         return
 
-    current_turn_audio = bytes(audio_buffer_ref)
-    audio_buffer_ref.clear() 
-
-    if not current_turn_audio or len(current_turn_audio) < MIN_AUDIO_BUFFER_FOR_PROCESSING:
+    # O buffer pertence a este turno (ws_voice já passou a usar outro): lê sem copiar.
+    # Um PcmRingBuffer pode devolver duas views (o conteúdo dá a volta no anel).
+    current_turn_audio = pcm_views(audio_buffer_ref)
+    trace.audio_bytes = sum(view.nbytes for view in current_turn_audio)
+    metrics.turn_audio_bytes.labels(tts_mode).observe(trace.audio_bytes)
+
+    if trace.audio_bytes < MIN_AUDIO_BUFFER_FOR_PROCESSING:
+        if transcriber is not None:
+            transcriber.close()
+        for view in current_turn_audio:
+            view.release()
+        audio_buffer_ref.clear()
         print(f"INFO: Nenhuma fala significativa ou buffer muito pequeno para {user_id_ref}. Ignorando.")
         if ws_ref.client_state == WebSocketState.CONNECTED:
             try:
                 await ws_ref.send_text("Agente: Desculpe, não consegui te ouvir. Pode repetir?")
             except RuntimeError as send_error:
                 print(f"ERROR: Erro ao enviar mensagem de erro para {user_id_ref}: {send_error}")
+        trace.finish("too_short")
         set_is_processing_flag_callback(False)
         return
 
-    print(f"INFO: Processando {len(current_turn_audio)} bytes de áudio de {user_id_ref}.")
+    print(f"INFO: Processando {trace.audio_bytes} bytes de áudio de {user_id_ref}.")
     try:
-        user_text = await transcribe_bytes(current_turn_audio)
+        if transcriber is not None:
+            # Só a cauda da fala ainda falta transcrever
+            user_text = await transcriber.finish(audio_buffer_ref, transcribe_bytes)
+            print(f"INFO: Transcrição incremental de {user_id_ref}: {transcriber.stats()}")
+        else:
+            user_text = await transcribe_bytes(current_turn_audio)
         
         if user_text.strip():
             print(f"INFO: Transcrição: {user_text}")
@@ -199,34 +475,61 @@ async def handle_user_turn_logic(audio_buffer_ref: bytearray, user_id_ref: str,
             
             conversation_history_ref.append({"role": "user", "content": user_text})
 
-            reply = await chat_rag(user_id_ref, conversation_history_ref)
-            print(f"INFO: Agente: {reply}")
+            if tts_mode == "stream":
+                reply = await stream_reply(user_id_ref, conversation_history_ref, ws_ref, turn_started_at, spoken_segments)
+                print(f"INFO: Agente: {reply}")
+                conversation_history_ref.append({"role": "assistant", "content": reply})
+                turn_state["reply_history_index"] = len(conversation_history_ref) - 1
+                turn_state["spoken_segments"] = spoken_segments
+                return
+
+            generated_reply = await chat_rag(user_id_ref, conversation_history_ref)
+            print(f"INFO: Agente: {generated_reply}")
             if ws_ref.client_state == WebSocketState.CONNECTED:
                 try:
-                    await ws_ref.send_text(f"Agente: {reply}")
+                    await ws_ref.send_text(f"Agente: {generated_reply}")
                 except RuntimeError as send_error:
                     print(f"ERROR: Erro ao enviar resposta de texto para {user_id_ref}: {send_error}")
-            
-            conversation_history_ref.append({"role": "assistant", "content": reply})
 
-            audio = await synthesize_tts(reply)
+            audio = await synthesize_tts(generated_reply)
             if ws_ref.client_state == WebSocketState.CONNECTED:
                 try:
-                    await ws_ref.send_bytes(audio)
+                    await send_reply_audio(ws_ref, audio, turn_started_at)
+                    spoken_segments.append(generated_reply)
                 except RuntimeError as send_error:
                     print(f"ERROR: Erro ao enviar áudio de resposta para {user_id_ref}: {send_error}")
+
+            # Só entra no histórico depois de enviado: um barge-in antes disso descarta a resposta
+            reply = generated_reply
+            conversation_history_ref.append({"role": "assistant", "content": reply})
+            turn_state["reply_history_index"] = len(conversation_history_ref) - 1
+            turn_state["spoken_segments"] = spoken_segments
+            print(f"INFO: Primeiro áudio para {user_id_ref} em {(time.perf_counter() - turn_started_at) * 1000:.0f} ms (modo batch).")
             print(f"INFO: Áudio de resposta enviado para {user_id_ref}.")
             
         else: # Transcrição vazia, mas buffer não era pequeno
             print(f"INFO: Fala detectada, mas transcrição vazia para {user_id_ref}. Pode ser ruído.")
+            trace.outcome = "empty"
             if ws_ref.client_state == WebSocketState.CONNECTED:
                 try:
                     await ws_ref.send_text("Agente: Não entendi. Você pode repetir, por favor?")
                 except RuntimeError as send_error:
                     print(f"ERROR: Erro ao enviar mensagem de repetição para {user_id_ref}: {send_error}")
                 
+    except asyncio.CancelledError:
+        # Barge-in (ou desconexão): o histórico recebe só o que o cliente ouviu
+        played_segments = turn_state.get("played_segments")
+        said = spoken_segments if played_segments is None else spoken_segments[:played_segments]
+        if reply is None and said:
+            conversation_history_ref.append({"role": "assistant", "content": " ".join(said)})
+            turn_state["reply_history_index"] = len(conversation_history_ref) - 1
+            turn_state["spoken_segments"] = said
+        print(f"INFO: Turno de {user_id_ref} cancelado; {len(said)} trecho(s) da resposta registrados no histórico.")
+        trace.outcome = "cancelled"
+        raise
     except Exception as e:
         print(f"ERROR: Erro durante processamento da fala: {e}")
+        trace.outcome = "error"
         traceback.print_exc()
         if ws_ref.client_state == WebSocketState.CONNECTED:
             try:
@@ -234,97 +537,323 @@ async def handle_user_turn_logic(audio_buffer_ref: bytearray, user_id_ref: str,
             except RuntimeError as send_error:
                 print(f"ERROR: Erro ao enviar mensagem de erro de processamento para {user_id_ref}: {send_error}")
     finally:
+        if trace.last_write is not None and trace.outcome != "cancelled":
+            # ws_send/first_audio vêm do escritor da SessionIO: o trace só fecha com o último áudio enviado
+            if not await wait_written(trace.last_write):
+                print(f"WARN: Último áudio do turno de {user_id_ref} não foi enviado em {WS_CLOSE_FLUSH_SECONDS}s; trace fechado sem ele.")
+        trace.finish()
+        print(f"INFO: Etapas do turno de {user_id_ref} ({trace.outcome}): {trace.format()}")
+        if isinstance(conversation_history_ref, ConversationMemory):
+            # Resume as mensagens antigas enquanto o cliente ouve a resposta e fala de novo
+            conversation_history_ref.schedule_summary()
+        if transcriber is not None:
+            transcriber.close()
+        for view in current_turn_audio:
+            view.release()
+        # Devolve o buffer à sessão (volta a ser o reserva de UtteranceBuffers)
+        audio_buffer_ref.clear()
         set_is_processing_flag_callback(False)
         print(f"INFO: Processamento do turno de {user_id_ref} concluído/finalizado. 'is_processing_turn' resetado para False.")
 
 
+def trim_reply_to_played(conversation_history: list, turn_state: dict, played_segments: int) -> bool:
+    """
+    Barge-in depois que o turno já terminou no servidor: o cliente ainda estava
+    tocando a resposta. Reduz a última resposta no histórico aos trechos que o
+    cliente chegou a tocar (ou a remove, se nenhum foi tocado).
+    """
+    index = turn_state.get("reply_history_index")
+    segments = turn_state.get("spoken_segments") or []
+    if index is None or index >= len(conversation_history) or played_segments >= len(segments):
+        return False
+    if played_segments <= 0:
+        del conversation_history[index]
+    else:
+        conversation_history[index] = {"role": "assistant", "content": " ".join(segments[:played_segments])}
+    turn_state["reply_history_index"] = None
+    return True
+
+
+@tapp.get("/metrics")
+async def prometheus_metrics():
+    """Histogramas de latência por etapa do turno, no formato texto do Prometheus."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@tapp.get("/ready")
+async def ready():
+    """200 quando os clientes dos provedores, o tokenizer e o índice do RAG estão carregados; 503 enquanto aquecem."""
+    is_ready = readiness["providers"] and readiness["tokenizer"] and readiness["index"]
+    return JSONResponse({"ready": is_ready, **readiness}, status_code=200 if is_ready else 503)
+
+
+@tapp.get("/cache/stats")
+async def cache_stats():
+    """Contadores dos caches de áudio (TTS) e de respostas (semântico)."""
+    return {
+        "tts": tts_cache.stats(),
+        "answers": answer_cache.stats() if answer_cache is not None else {"enabled": False},
+    }
+
+
+# Endpointing no servidor (backend/vad.py): opcional, por sessão (?server_vad=1) ou global
+DEFAULT_SERVER_VAD = os.getenv("SERVER_VAD", "0").lower() in ("1", "true", "yes")
+# Barge-in: fala contínua mínima (VAD no servidor) para interromper o agente
+BARGE_IN_MIN_SPEECH_MS = int(os.getenv("BARGE_IN_MIN_SPEECH_MS", "250"))
+BARGE_IN_CANCEL_TIMEOUT_SECONDS = 1.0
+
 @tapp.websocket("/ws/voice")
-async def ws_voice(ws: WebSocket, username: str = Query(None)):
+async def ws_voice(ws: WebSocket, username: str = Query(None), tts_mode: str = Query(None), server_vad: str = Query(None),
+                   protocol: int = Query(None), codecs: str = Query(None), session: str = Query(None),
+                   partial_stt: str = Query(None)):
     await ws.accept()
     user_id = username or "Desconhecido"
-    print(f"INFO: WS aberto por {user_id}")
-
-    conversation_history = []
-    audio_buffer = bytearray()
+    session_tts_mode = tts_mode if tts_mode in TTS_MODES else DEFAULT_TTS_MODE
+    use_server_vad = server_vad.lower() in ("1", "true", "yes") if server_vad is not None else DEFAULT_SERVER_VAD
+    endpointer = StreamingEndpointer() if use_server_vad else None
+    use_partial_stt = partial_stt.lower() in ("1", "true", "yes") if partial_stt is not None else STT_PARTIAL_ENABLED
+    # Os turnos criados a partir desta task registram seus traces nesta sessão
+    session_stats = metrics.start_session(user_id)
+    # protocol=1: frames binários tipados (backend/protocol.py); sem ele, PCM cru e texto como antes
+    framed = FramedWebSocket(ws, negotiate_codec(codecs)) if protocol == PROTOCOL_VERSION else None
+    is_processing_turn = False
+    # Leitor, escritor e vigia da conexão (backend/session_io.py): tudo o que o servidor envia passa pela
+    # fila de `channel`, e o loop abaixo consome as mensagens do cliente com channel.receive()
+    channel = SessionIO(ws, framed, name=user_id, is_busy=lambda: is_processing_turn).start()
+    print(f"INFO: WS aberto por {user_id} (modo de resposta: {session_tts_mode}, VAD no servidor: {use_server_vad}, "
+          f"uplink: {framed.uplink_codec if framed else 'pcm16 cru'}, STT incremental: {use_partial_stt})")
+    if framed is not None:
+        await channel.send_json(framed.hello())
+
+    # Histórico com orçamento de tokens: mensagens antigas viram um resumo feito entre os turnos
+    conversation_history = ConversationMemory(summarizer=summarize_history)
+    # session=new|<token>: o estado é gravado na store e pode ser retomado por outra conexão (qualquer worker)
+    resumable = None
+    if session is not None:
+        try:
+            resumable, restored = await ResumableSession.open(get_session_store(), session, user_id)
+        except Exception as e:
+            print(f"ERROR: Store de sessões indisponível; sessão de {user_id} não será retomável: {e}")
+            restored = None
+        if restored is not None:
+            restore_memory(conversation_history, restored)
+            if tts_mode not in TTS_MODES and restored.tts_mode in TTS_MODES:
+                session_tts_mode = restored.tts_mode
+            print(f"INFO: Sessão de {user_id} retomada ({len(conversation_history)} mensagens, "
+                  f"resumo: {bool(conversation_history.summary)}, modo de resposta: {session_tts_mode}).")
+        if resumable is not None:
+            await channel.send_text(json.dumps(resumable.announcement(conversation_history)))
+    # PCM da fala atual em buffers de tamanho fixo (AUDIO_MAX_UTTERANCE_SECONDS): a memória da sessão não cresce
+    audio_buffers = UtteranceBuffers(on_reserve=metrics.audio_buffer_bytes.inc)
+    overflow_notified = False
+
+    async def send_partial_transcript(text: str):
+        if channel.client_state == WebSocketState.CONNECTED:
+            await channel.send_text(json.dumps({"type": "partial_transcript", "text": text}))
+
+    def new_transcriber():
+        """Uma por fala: transcreve janelas da fala em andamento e manda a legenda provisória."""
+        return IncrementalTranscriber(transcribe_partial, send_partial_transcript) if use_partial_stt else None
+
+    transcriber = new_transcriber()
     
-    is_processing_turn = False 
+    # Turno em andamento (para o barge-in) e o estado do último turno iniciado
+    turn_task = None
+    turn_state = {}
     
     def set_processing_flag(value: bool):
         nonlocal is_processing_turn
         is_processing_turn = value
+        if not value and resumable is not None:
+            resumable.schedule_save(conversation_history, session_tts_mode)
+
+    def start_turn():
+        nonlocal is_processing_turn, turn_task, turn_state, overflow_notified, transcriber
+        is_processing_turn = True
+        overflow_notified = False
+        if endpointer is not None:
+            endpointer.reset_utterance()
+        # O turno herda a transcrição incremental desta fala; a próxima fala começa outra
+        turn_state = {"transcriber": transcriber} if transcriber is not None else {}
+        transcriber = new_transcriber()
+        if framed is not None:
+            framed.next_turn()
+        turn_task = asyncio.create_task(
+            handle_user_turn_logic(
+                audio_buffers.take(), user_id, conversation_history, channel, set_processing_flag, session_tts_mode,
+                turn_state=turn_state,
+            )
+        )
 
-    RECEIVE_TIMEOUT_SECONDS = 0.1 
+    async def on_audio_overflow(chunk, accepted: int, discarded: int):
+        """
+        A fala passou de AUDIO_MAX_UTTERANCE_SECONDS: aplica a política e avisa o
+        cliente uma vez por fala. `discarded`: bytes que o buffer de fato descartou.
+        """
+        nonlocal overflow_notified
+        rest = len(chunk) - accepted
+        if audio_buffers.policy == "endpoint" and not is_processing_turn:
+            print(f"INFO: Fala de {user_id} chegou a {audio_buffers.max_seconds:.0f}s; encerrando o turno automaticamente.")
+            await channel.send_text(json.dumps({"type": "end_of_speech_detected", "reason": "max_utterance"}))
+            start_turn()
+            if rest:
+                audio_buffers.write(memoryview(chunk)[accepted:])
+            return
+        if audio_buffers.policy == "endpoint":
+            # Já há um turno em andamento: o excesso não tem para onde ir
+            audio_buffers.discard(rest)
+            discarded += rest
+        if discarded:
+            metrics.audio_overflow_bytes.inc(audio_buffers.policy, discarded)
+        if not overflow_notified:
+            overflow_notified = True
+            print(f"WARN: Fala de {user_id} passou de {audio_buffers.max_seconds:.0f}s (política: {audio_buffers.policy}).")
+            await channel.send_text(json.dumps({"type": "audio_overflow", "policy": audio_buffers.policy,
+                                                "max_seconds": audio_buffers.max_seconds}))
+
+    async def cancel_turn(played_segments: int = None) -> bool:
+        """Barge-in: cancela o turno em andamento (STT/LLM/TTS) e pede ao cliente que descarte o áudio na fila."""
+        if turn_task is None or turn_task.done():
+            return False
+        if played_segments is not None:
+            turn_state["played_segments"] = played_segments
+        turn_task.cancel()
+        done, _ = await asyncio.wait({turn_task}, timeout=BARGE_IN_CANCEL_TIMEOUT_SECONDS)
+        if not done:
+            print(f"WARN: Turno de {user_id} não terminou {BARGE_IN_CANCEL_TIMEOUT_SECONDS}s após o cancelamento.")
+        if channel.client_state == WebSocketState.CONNECTED:
+            await channel.send_text(json.dumps({"type": "cancel"}))
+        return True
 
     try:
         while True: # Loop contínuo para a sessão WebSocket
             try:
-                message = await asyncio.wait_for(ws.receive(), timeout=RECEIVE_TIMEOUT_SECONDS)
+                # Espera na fila do leitor: uma sessão ociosa não acorda o event loop
+                message = await channel.receive()
                 
                 if "bytes" in message:
                     chunk = message["bytes"]
-                    if not is_processing_turn:
-                        audio_buffer.extend(chunk)
-                    else:
-                        pass
+                    # Áudio que chega durante um turno também é guardado: é o início da próxima fala
+                    accepted, discarded = audio_buffers.write(chunk)
+                    if audio_buffers.active.overflowed:
+                        await on_audio_overflow(chunk, accepted, discarded)
+                    if transcriber is not None:
+                        transcriber.feed(audio_buffers.active)
+                    if endpointer is not None:
+                        for event, at_ms in endpointer.feed(chunk):
+                            if event == END_OF_SPEECH and not is_processing_turn:
+                                print(f"INFO: Fim de fala detectado pelo servidor para {user_id} ({at_ms} ms de áudio).")
+                                await channel.send_text(json.dumps({"type": "end_of_speech_detected"}))
+                                start_turn()
+                        if is_processing_turn and endpointer.in_speech and endpointer.speech_ms >= BARGE_IN_MIN_SPEECH_MS:
+                            print(f"INFO: Barge-in detectado pelo servidor para {user_id} ({endpointer.speech_ms} ms de fala).")
+                            await cancel_turn()
                         
                 elif "text" in message:
                     try:
                         parsed_text = json.loads(message["text"])
                         
-                        if parsed_text.get("type") == "end_of_speech" or parsed_text.get("type") == "end_of_speech_button":
+                        if parsed_text.get("type") == "end_of_speech" and endpointer is not None:
+                            # Com VAD no servidor, o fim de fala automático do navegador é ignorado
+                            print(f"INFO: Sinal 'end_of_speech' do cliente ignorado para {user_id} (VAD no servidor ativo).")
+
+                        elif parsed_text.get("type") == "end_of_speech" or parsed_text.get("type") == "end_of_speech_button":
                             print(f"INFO: Sinal de fim de fala ('{parsed_text.get('type')}') recebido para {user_id}.")
                             
                             if not is_processing_turn:
-                                is_processing_turn = True
-                                asyncio.create_task(
-                                    handle_user_turn_logic(
-                                        audio_buffer, user_id, conversation_history, ws, set_processing_flag
-                                    )
-                                )
-                                audio_buffer = bytearray() 
+                                start_turn()
                             else:
                                 print(f"INFO: Sinal de fim de fala ignorado para {user_id}, pois já estamos processando um turno.")
                             
+                        elif parsed_text.get("type") == "barge_in":
+                            # O cliente detectou fala enquanto o agente respondia/falava
+                            played_segments = parsed_text.get("played_segments")
+                            print(f"INFO: Barge-in de {user_id} (trechos tocados: {played_segments}).")
+                            if not await cancel_turn(played_segments) and played_segments is not None:
+                                if trim_reply_to_played(conversation_history, turn_state, played_segments):
+                                    print(f"INFO: Resposta anterior de {user_id} reduzida a {played_segments} trecho(s) no histórico.")
+                                    if resumable is not None:
+                                        resumable.schedule_save(conversation_history, session_tts_mode)
+
+                        elif parsed_text.get("type") == "playback_stopped":
+                            # Resposta ao 'cancel' do servidor: quanto da resposta o cliente tocou
+                            played_segments = parsed_text.get("played_segments")
+                            if not is_processing_turn and played_segments is not None:
+                                if trim_reply_to_played(conversation_history, turn_state, played_segments) and resumable is not None:
+                                    resumable.schedule_save(conversation_history, session_tts_mode)
+
+                        elif parsed_text.get("type") == "set_tts_mode":
+                            requested_mode = parsed_text.get("mode")
+                            if requested_mode in TTS_MODES:
+                                session_tts_mode = requested_mode
+                                print(f"INFO: Modo de resposta de {user_id} alterado para '{session_tts_mode}'.")
+                            else:
+                                print(f"INFO: Modo de resposta inválido recebido de {user_id}: {requested_mode}")
+
                         elif parsed_text.get("type") == "end_of_session":
                             print(f"INFO: Sinal de fim de sessão recebido para {user_id}. Encerrando loop.")
+                            if resumable is not None:
+                                await resumable.end()
                             break 
                                     
                         else:
                             print(f"INFO: Mensagem de texto JSON desconhecida recebida para {user_id}: {parsed_text}")
-                            if ws.client_state == WebSocketState.CONNECTED:
-                                await ws.send_text(f"Servidor: {message['text']}")
+                            if channel.client_state == WebSocketState.CONNECTED:
+                                await channel.send_text(f"Servidor: {message['text']}")
 
                     except json.JSONDecodeError:
                         print(f"INFO: Mensagem de texto não JSON (malformada) recebida para {user_id}: {message['text']}")
-                        if ws.client_state == WebSocketState.CONNECTED:
-                            await ws.send_text(f"Servidor: {message['text']}")
+                        if channel.client_state == WebSocketState.CONNECTED:
+                            await channel.send_text(f"Servidor: {message['text']}")
                 else: # Se o tipo de mensagem não for bytes nem texto
                     print(f"DEBUG BACKEND: Mensagem de tipo inesperado ou de controle recebida: {message.get('type')}")
                 
-            except asyncio.TimeoutError:
-                pass 
-                
             except WebSocketDisconnect:
                 print(f"INFO: WS desconectado por {user_id}")
                 break 
+            except SessionIdle:
+                print(f"INFO: Sessão de {user_id} sem atividade por {channel.idle_timeout:.0f}s; encerrando.")
+                break
             except Exception as e:
                 print(f"ERROR: Erro inesperado no loop do WebSocket para {user_id}: {e}")
-                if ws.client_state == WebSocketState.CONNECTED:
+                if channel.client_state == WebSocketState.CONNECTED:
                     try:
-                        await ws.send_text("Agente: Desculpe, um erro inesperado ocorreu. Por favor, reinicie a conversa.")
+                        await channel.send_text("Agente: Desculpe, um erro inesperado ocorreu. Por favor, reinicie a conversa.")
                     except RuntimeError as send_error:
                         print(f"ERROR: Erro ao enviar mensagem de erro final para {user_id}: {send_error}")
                 break 
 
     finally:
+        # Cliente saiu no meio de um turno: não há mais para quem responder
+        if turn_task is not None and not turn_task.done():
+            turn_task.cancel()
+            await asyncio.wait({turn_task}, timeout=BARGE_IN_CANCEL_TIMEOUT_SECONDS)
         # Processa áudio restante ao finalizar a conexão (se não estiver processando)
-        if audio_buffer and not is_processing_turn:
+        if transcriber is not None:
+            transcriber.close()
+        if len(audio_buffers) and not is_processing_turn:
             print(f"INFO: Processando áudio restante no buffer ao fechar conexão para {user_id}.")
-            await handle_user_turn_logic(audio_buffer, user_id, conversation_history, ws, set_processing_flag)
+            await handle_user_turn_logic(audio_buffers.take(), user_id, conversation_history, channel, set_processing_flag, session_tts_mode)
+        print(f"INFO: Buffers de áudio de {user_id}: {audio_buffers.stats()}")
+        audio_buffers.close()
         
+        if resumable is not None:
+            # Estado final (inclui o que o turno cancelado chegou a tocar) para uma reconexão retomar
+            await resumable.aclose(conversation_history, session_tts_mode)
+            print(f"INFO: Sessão retomável de {user_id}: {resumable.stats()}")
+        await conversation_history.aclose()
+        metrics.sessions_total.inc(session_tts_mode)
+        print(f"INFO: {session_stats.format_summary()}")
+        print(f"INFO: Memória da conversa de {user_id}: {conversation_history.stats()}")
+        if framed is not None:
+            print(f"INFO: Protocolo binário de {user_id}: {framed.stats()}")
+        # O que ainda está na fila de envio sai antes do close
+        await channel.aclose()
+        print(f"INFO: E/S da WebSocket de {user_id}: {channel.stats()}")
         print(f"INFO: Conexão WebSocket para {user_id} finalizada.")
         if ws.client_state == WebSocketState.CONNECTED:
             try:
-                await ws.close()
+                # O cliente distingue o fechamento por inatividade pelo motivo
+                await ws.close(reason="idle" if channel.idle_closed else None)
             except RuntimeError as close_error:
                 print(f"ERROR: Erro ao fechar WebSocket para {user_id}: {close_error}")
\ No newline at end of file
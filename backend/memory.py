@@ -0,0 +1,190 @@
+"""
+Memória da conversa com orçamento de tokens.
+
+ConversationMemory é a própria lista do histórico ({"role", "content"}):
+append, del e atribuição por índice continuam funcionando como antes (o
+barge-in corta a última resposta por índice). Por cima da lista ela guarda:
+
+  - a contagem de tokens de cada mensagem, calculada uma vez e reutilizada;
+  - um resumo corrido das mensagens antigas, gerado em background entre os
+    turnos (schedule_summary), que substitui essas mensagens no prompt.
+
+prompt_history() devolve [resumo] + mensagens recentes dentro do orçamento.
+Enquanto um resumo não fica pronto, as mensagens mais antigas da janela são
+descartadas do prompt para não estourar o orçamento.
+"""
+import asyncio
+import math
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Orçamento de tokens do histórico no prompt (resumo + mensagens recentes)
+MEMORY_MAX_HISTORY_TOKENS = int(os.getenv("MEMORY_MAX_HISTORY_TOKENS", "2000"))
+# O resumo começa quando o histórico passa desta fração do orçamento (folga para o próximo turno)
+MEMORY_SUMMARY_TRIGGER_FRACTION = float(os.getenv("MEMORY_SUMMARY_TRIGGER_FRACTION", "0.8"))
+# Ao resumir, as mensagens recentes ficam com no máximo esta fração do orçamento
+MEMORY_RECENT_FRACTION = float(os.getenv("MEMORY_RECENT_FRACTION", "0.5"))
+# Mensagens mais recentes que nunca entram no resumo (2 turnos)
+MEMORY_MIN_RECENT_MESSAGES = int(os.getenv("MEMORY_MIN_RECENT_MESSAGES", "4"))
+MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "300"))
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")  # gpt-4o / gpt-4o-mini
+
+# Tokens extras por mensagem no formato de chat (papel e separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_PREFIX = "Resumo da conversa até aqui (turnos anteriores):\n"
+
+Summarizer = Callable[[str, List[dict]], Awaitable[str]]
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """tiktoken é opcional e baixa o vocabulário na primeira vez; sem ele, usa a estimativa por caracteres."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            print(f"WARN: tiktoken indisponível ({e}); contando tokens por estimativa (~4 caracteres por token).")
+    return _encoding
+
+
+def warm_up_tokenizer():
+    """Carrega o vocabulário (baixado na primeira vez) fora do event loop: chamado no aquecimento do servidor."""
+    _get_encoding()
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+def message_tokens(message: dict) -> int:
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def summary_message(summary: str) -> dict:
+    return {"role": "system", "content": SUMMARY_PREFIX + summary}
+
+
+class ConversationMemory(list):
+    def __init__(self, messages=(), summarizer: Optional[Summarizer] = None,
+                 max_tokens: int = MEMORY_MAX_HISTORY_TOKENS, trigger_fraction: float = MEMORY_SUMMARY_TRIGGER_FRACTION,
+                 recent_fraction: float = MEMORY_RECENT_FRACTION, min_recent_messages: int = MEMORY_MIN_RECENT_MESSAGES):
+        super().__init__(messages)
+        self.summarizer = summarizer
+        self.max_tokens = max_tokens
+        self.trigger_fraction = trigger_fraction
+        self.recent_fraction = recent_fraction
+        self.min_recent_messages = min_recent_messages
+        self.summary = ""
+        self.summary_tokens = 0
+        # Mensagens [0, summarized_count) estão representadas pelo resumo
+        self.summarized_count = 0
+        self.summaries = 0
+        self._token_cache: Dict[Tuple[str, str], int] = {}
+        self._summary_task: Optional[asyncio.Task] = None
+
+    def tokens_of(self, message: dict) -> int:
+        # Chave pelo conteúdo: uma resposta cortada pelo barge-in vira outra entrada
+        key = (message.get("role", ""), message.get("content") or "")
+        tokens = self._token_cache.get(key)
+        if tokens is None:
+            tokens = self._token_cache[key] = message_tokens(message)
+        return tokens
+
+    def recent_messages(self) -> list:
+        return self[self.summarized_count:]
+
+    def history_tokens(self) -> int:
+        """Tokens do histórico como iria ao prompt sem corte (resumo + mensagens não resumidas)."""
+        return self.summary_tokens + sum(self.tokens_of(m) for m in self.recent_messages())
+
+    def prompt_history(self) -> list:
+        recent = self.recent_messages()
+        budget = self.max_tokens - self.summary_tokens
+        kept, used = [], 0
+        # Do mais novo para o mais antigo; a última mensagem (a pergunta atual) sempre entra
+        for message in reversed(recent):
+            tokens = self.tokens_of(message)
+            if kept and used + tokens > budget:
+                break
+            kept.append(message)
+            used += tokens
+        kept.reverse()
+        if len(kept) < len(recent):
+            print(f"WARN: Histórico acima do orçamento de {self.max_tokens} tokens; "
+                  f"{len(recent) - len(kept)} mensagem(ns) antigas fora do prompt até o próximo resumo.")
+        return ([summary_message(self.summary)] if self.summary else []) + kept
+
+    def summary_split(self) -> int:
+        """Índice até onde resumir (exclusivo), ou summarized_count se o histórico ainda não chegou ao gatilho."""
+        if self.history_tokens() <= self.max_tokens * self.trigger_fraction:
+            return self.summarized_count
+        recent_budget = self.max_tokens * self.recent_fraction
+        split = len(self) - self.min_recent_messages
+        used = sum(self.tokens_of(m) for m in self[max(split, self.summarized_count):])
+        # Mantém na janela o máximo de mensagens recentes que couber em recent_budget
+        while split > self.summarized_count and used + self.tokens_of(self[split - 1]) <= recent_budget:
+            split -= 1
+            used += self.tokens_of(self[split])
+        return max(split, self.summarized_count)
+
+    def needs_summary(self) -> bool:
+        return self.summarizer is not None and self.summary_split() > self.summarized_count
+
+    async def summarize(self) -> bool:
+        split = self.summary_split()
+        if self.summarizer is None or split <= self.summarized_count:
+            return False
+        folded = list(self[self.summarized_count:split])
+        summary = (await self.summarizer(self.summary, folded)).strip()
+        # Durante o await só entram mensagens no fim da lista; o prefixo resumido não muda
+        for message in folded:
+            self._token_cache.pop((message.get("role", ""), message.get("content") or ""), None)
+        self.summary = summary
+        self.summary_tokens = message_tokens(summary_message(summary)) if summary else 0
+        self.summarized_count = split
+        self.summaries += 1
+        return True
+
+    def schedule_summary(self) -> Optional[asyncio.Task]:
+        """Chamado ao fim de um turno: resume em background enquanto o cliente fala de novo."""
+        if self._summary_task is not None and not self._summary_task.done():
+            return self._summary_task
+        if not self.needs_summary():
+            return None
+        self._summary_task = asyncio.create_task(self._summarize_in_background())
+        return self._summary_task
+
+    async def _summarize_in_background(self):
+        try:
+            await self.summarize()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Sem resumo o prompt só fica mais curto (corte por orçamento); tenta de novo no próximo turno
+            print(f"ERROR: Falha ao resumir o histórico da conversa: {e}")
+
+    async def wait_summary(self):
+        if self._summary_task is not None:
+            await asyncio.gather(self._summary_task, return_exceptions=True)
+
+    async def aclose(self):
+        if self._summary_task is not None and not self._summary_task.done():
+            self._summary_task.cancel()
+            await asyncio.gather(self._summary_task, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "messages": len(self),
+            "summarized_messages": self.summarized_count,
+            "summaries": self.summaries,
+            "summary_tokens": self.summary_tokens,
+            "history_tokens": self.history_tokens(),
+        }
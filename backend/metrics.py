@@ -0,0 +1,291 @@
+"""
+Métricas de latência por etapa do turno de voz, sem dependências externas.
+
+Cada turno tem um TurnTrace (guardado num ContextVar, então as tasks criadas
+durante o turno, como as sínteses paralelas do modo stream, enxergam o mesmo
+trace). As etapas são medidas com `span("stt")` / `observe("tts_first_byte", s)`
+e vão para histogramas de buckets fixos, expostos em formato texto do
+Prometheus por `render_prometheus()`. Fora de um turno as medições ainda
+entram nos histogramas, só não são atribuídas a nenhum turno.
+
+Os histogramas são atualizados só a partir do event loop (sem lock).
+"""
+import asyncio
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence
+
+# Etapas medidas em cada turno (rótulo "stage" dos histogramas)
+STAGES = (
+    "wav", "stt", "rag", "llm_first_token", "llm", "tts_first_byte", "tts", "ws_send",
+    "first_audio", "turn",
+)
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+BYTES_BUCKETS = (8000, 16000, 32000, 64000, 128000, 256000, 512000, 1024000, 2048000)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimativa pelo limite superior do bucket (suficiente para relatórios)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            running += count
+            if running >= target:
+                return bound
+        return float("inf")
+
+
+class HistogramVec:
+    """Família de histogramas com um rótulo (ex.: stage="stt")."""
+
+    def __init__(self, name: str, documentation: str, label: str, buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._children: Dict[str, Histogram] = {}
+
+    def labels(self, value: str) -> Histogram:
+        child = self._children.get(value)
+        if child is None:
+            child = self._children[value] = Histogram(self.buckets)
+        return child
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for value, child in sorted(self._children.items()):
+            running = 0
+            for bound, count in zip(child.buckets + (float("inf"),), child.counts):
+                running += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{le}"}} {running}')
+            lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {child.sum!r}')
+            lines.append(f'{self.name}_count{{{self.label}="{value}"}} {child.count}')
+        return lines
+
+
+class CounterVec:
+    def __init__(self, name: str, documentation: str, label: str):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._values: Dict[str, float] = {}
+
+    def inc(self, value: str, amount: float = 1):
+        self._values[value] = self._values.get(value, 0) + amount
+
+    def get(self, value: str) -> float:
+        return self._values.get(value, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines += [f'{self.name}{{{self.label}="{value}"}} {count}' for value, count in sorted(self._values.items())]
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def get(self) -> float:
+        return self.value
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {self.value}"]
+
+
+stage_seconds = HistogramVec("voice_stage_seconds", "Duração de cada etapa do turno de voz.", "stage", SECONDS_BUCKETS)
+turn_audio_bytes = HistogramVec("voice_turn_audio_bytes", "Bytes de PCM acumulados por turno.", "mode", BYTES_BUCKETS)
+turns_total = CounterVec("voice_turns_total", "Turnos processados, por resultado.", "outcome")
+sessions_total = CounterVec("voice_sessions_total", "Sessões WebSocket encerradas.", "tts_mode")
+event_loop_lag = HistogramVec("event_loop_lag_seconds", "Atraso do event loop em acordar de um sleep.", "loop", LAG_BUCKETS)
+audio_buffer_bytes = Gauge("voice_audio_buffer_bytes", "Memória reservada para o PCM das sessões abertas (ring buffers).")
+audio_overflow_bytes = CounterVec("voice_audio_overflow_bytes_total", "Bytes de PCM além do limite de fala, por política.",
+                                  "policy")
+
+_METRICS = (stage_seconds, turn_audio_bytes, turns_total, sessions_total, event_loop_lag, audio_buffer_bytes,
+            audio_overflow_bytes)
+
+
+async def monitor_event_loop_lag(interval: float = 0.05, on_sample=None, loop_name: str = "main"):
+    """
+    Dorme `interval` segundos repetidamente e registra quanto o loop atrasou
+    para acordar: é o tempo que callbacks prontos esperam por CPU do loop.
+    """
+    histogram = event_loop_lag.labels(loop_name)
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - start - interval)
+        histogram.observe(lag)
+        if on_sample is not None:
+            on_sample(lag)
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in _METRICS:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+class SessionStats:
+    """Acumula os traces dos turnos de uma sessão para o resumo logado na desconexão."""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.started_at = time.perf_counter()
+        self.turns = 0
+        self.outcomes: Dict[str, int] = {}
+        self.audio_bytes = 0
+        self.stage_totals: Dict[str, float] = {}
+        self.stage_max: Dict[str, float] = {}
+        self.stage_turns: Dict[str, int] = {}
+
+    def add(self, trace: "TurnTrace"):
+        self.turns += 1
+        self.outcomes[trace.outcome] = self.outcomes.get(trace.outcome, 0) + 1
+        self.audio_bytes += trace.audio_bytes
+        for stage, seconds in trace.stages.items():
+            self.stage_totals[stage] = self.stage_totals.get(stage, 0.0) + seconds
+            self.stage_max[stage] = max(self.stage_max.get(stage, 0.0), seconds)
+            self.stage_turns[stage] = self.stage_turns.get(stage, 0) + 1
+
+    def summary(self) -> dict:
+        return {
+            "user": self.user_id,
+            "duration_seconds": round(time.perf_counter() - self.started_at, 3),
+            "turns": self.turns,
+            "outcomes": dict(self.outcomes),
+            "audio_bytes": self.audio_bytes,
+            "stages_ms": {
+                stage: {
+                    "mean": round(self.stage_totals[stage] / self.stage_turns[stage] * 1000, 1),
+                    "max": round(self.stage_max[stage] * 1000, 1),
+                }
+                for stage in STAGES if stage in self.stage_totals
+            },
+        }
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        stages = " | ".join(f"{stage} {v['mean']:.0f}/{v['max']:.0f} ms" for stage, v in summary["stages_ms"].items())
+        return (f"Resumo da sessão de {self.user_id}: {summary['turns']} turno(s) em {summary['duration_seconds']:.0f}s, "
+                f"{summary['audio_bytes']} bytes de áudio, resultados {summary['outcomes']}. "
+                f"Etapas (média/máx por turno): {stages or 'nenhuma'}")
+
+
+class TurnTrace:
+    """
+    Spans de um turno: tempo total por etapa (somado se a etapa se repete,
+    como ws_send). `last_write` é o future do último áudio ainda na fila da
+    SessionIO, cujo escritor mede ws_send/first_audio: o turno espera por ele
+    antes de finish().
+    """
+
+    __slots__ = ("started_at", "stages", "audio_bytes", "outcome", "session", "last_write")
+
+    def __init__(self, session: Optional[SessionStats] = None):
+        self.started_at = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.audio_bytes = 0
+        self.outcome = "ok"
+        self.session = session
+        self.last_write = None
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def finish(self, outcome: str = None):
+        if outcome:
+            self.outcome = outcome
+        turn_seconds = time.perf_counter() - self.started_at
+        self.stages["turn"] = turn_seconds
+        stage_seconds.labels("turn").observe(turn_seconds)
+        turns_total.inc(self.outcome)
+        if self.session is not None:
+            self.session.add(self)
+
+    def format(self) -> str:
+        return " | ".join(f"{stage} {self.stages[stage] * 1000:.0f} ms" for stage in STAGES if stage in self.stages)
+
+
+_current_trace: ContextVar[Optional[TurnTrace]] = ContextVar("turn_trace", default=None)
+_current_session: ContextVar[Optional[SessionStats]] = ContextVar("session_stats", default=None)
+
+
+def start_session(user_id: str) -> SessionStats:
+    """Chamado pela task da conexão: os turnos criados a partir dela herdam a sessão."""
+    session = SessionStats(user_id)
+    _current_session.set(session)
+    return session
+
+
+def start_turn_trace() -> TurnTrace:
+    """Abre o trace do turno na task atual (handle_user_turn_logic roda numa task própria)."""
+    trace = TurnTrace(_current_session.get())
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[TurnTrace]:
+    return _current_trace.get()
+
+
+def observe(stage: str, seconds: float, trace: Optional[TurnTrace] = None):
+    """`trace` explícito para medições fora da task do turno (ex.: o escritor da WebSocket)."""
+    stage_seconds.labels(stage).observe(seconds)
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+def observe_first(stage: str, seconds: float, trace: Optional[TurnTrace] = None):
+    """Como observe(), mas só a primeira ocorrência no turno conta (ex.: primeiro áudio)."""
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        if stage in trace.stages:
+            return
+        trace.add(stage, seconds)
+    stage_seconds.labels(stage).observe(seconds)
+
+
+class span:
+    """`with span("stt"): ...` mede o bloco (classe em vez de @contextmanager: é o caminho quente)."""
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.start)
+        return False
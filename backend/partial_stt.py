@@ -0,0 +1,202 @@
+"""
+Transcrição incremental: enquanto o usuário ainda fala, janelas sobrepostas
+do áudio são transcritas em background, e as hipóteses parciais são costuradas
+e enviadas ao cliente como legenda provisória. No fim da fala só falta
+transcrever a cauda, o trecho depois da última janela somado à sobreposição.
+Assim o tempo do STT sobre a fala inteira sai do caminho crítico.
+
+    STT_PARTIAL                   0 | 1: liga por padrão (o cliente também pode pedir com partial_stt=1)
+    STT_PARTIAL_WINDOW_SECONDS    tamanho de cada janela (falas mais curtas vão direto para o STT no fim)
+    STT_PARTIAL_OVERLAP_SECONDS   sobreposição entre janelas consecutivas (e entre a última janela e a cauda)
+    STT_PARTIAL_MAX_WINDOWS       limite de janelas por fala: depois dele, o resto vai inteiro na cauda
+    STT_PARTIAL_MAX_IN_FLIGHT     janelas transcrevendo ao mesmo tempo por sessão
+
+Custo: cada janela reenvia `overlap` segundos já enviados na anterior, de
+modo que o áudio cobrado fica perto de janela / (janela - sobreposição) vezes
+a duração da fala. stats() informa o total enviado.
+"""
+import asyncio
+import os
+import re
+from typing import Awaitable, Callable, List, Optional
+
+from backend.audio import PCM_BYTES_PER_SECOND, pcm_views
+
+STT_PARTIAL_ENABLED = os.getenv("STT_PARTIAL", "0").lower() in ("1", "true", "yes")
+STT_PARTIAL_WINDOW_SECONDS = float(os.getenv("STT_PARTIAL_WINDOW_SECONDS", "5"))
+STT_PARTIAL_OVERLAP_SECONDS = float(os.getenv("STT_PARTIAL_OVERLAP_SECONDS", "1"))
+STT_PARTIAL_MAX_WINDOWS = int(os.getenv("STT_PARTIAL_MAX_WINDOWS", "12"))
+STT_PARTIAL_MAX_IN_FLIGHT = int(os.getenv("STT_PARTIAL_MAX_IN_FLIGHT", "1"))
+
+# Quantas palavras no máximo procurar repetidas na emenda de duas janelas
+STITCH_MAX_OVERLAP_WORDS = 12
+
+Transcribe = Callable[[object], Awaitable[str]]
+
+_PUNCTUATION_RE = re.compile(r"[^\w]+")
+
+
+def _normalize(word: str) -> str:
+    return _PUNCTUATION_RE.sub("", word.lower())
+
+
+def stitch_transcripts(previous: str, new: str, max_overlap_words: int = STITCH_MAX_OVERLAP_WORDS) -> str:
+    """
+    Emenda o texto de uma janela no texto acumulado, removendo as palavras
+    repetidas da sobreposição. A comparação ignora caixa e pontuação. A
+    palavra cortada na borda de cada janela pode vir diferente nos dois lados
+    e é pulada (vale a versão de dentro da janela).
+    """
+    previous_words, new_words = previous.split(), new.split()
+    if not previous_words or not new_words:
+        return " ".join(previous_words + new_words)
+    prev_norm = [_normalize(w) for w in previous_words]
+    new_norm = [_normalize(w) for w in new_words]
+    for k in range(min(max_overlap_words, len(prev_norm), len(new_norm)), 0, -1):
+        for skip_prev, skip_new in ((0, 0), (1, 0), (0, 1), (1, 1)):
+            # Emendas de uma palavra só valem sem pular nada (senão qualquer palavra comum casaria)
+            if k == 1 and (skip_prev or skip_new):
+                continue
+            end = len(prev_norm) - skip_prev
+            if end - k < 0 or skip_new + k > len(new_norm):
+                continue
+            if prev_norm[end - k:end] == new_norm[skip_new:skip_new + k]:
+                return " ".join(previous_words[:end] + new_words[skip_new + k:])
+    return " ".join(previous_words + new_words)
+
+
+class IncrementalTranscriber:
+    """
+    Transcrição incremental de uma fala. O ws_voice chama feed() a cada chunk
+    escrito no buffer da fala e, no fim da fala, o turno chama finish() com o
+    mesmo buffer. Janelas são copiadas do buffer ao serem enviadas (o buffer
+    continua recebendo áudio); a cauda é lida sem cópia.
+    """
+
+    def __init__(self, transcribe: Transcribe, on_partial: Callable[[str], Awaitable[None]] = None,
+                 window_seconds: float = STT_PARTIAL_WINDOW_SECONDS, overlap_seconds: float = STT_PARTIAL_OVERLAP_SECONDS,
+                 max_windows: int = STT_PARTIAL_MAX_WINDOWS, max_in_flight: int = STT_PARTIAL_MAX_IN_FLIGHT,
+                 bytes_per_second: int = PCM_BYTES_PER_SECOND):
+        if not 0 <= overlap_seconds < window_seconds:
+            raise ValueError("A sobreposição precisa ser menor que a janela da transcrição incremental")
+        self.transcribe = transcribe
+        self.on_partial = on_partial
+        self.bytes_per_second = bytes_per_second
+        self.window_bytes = self._align(window_seconds * bytes_per_second)
+        self.overlap_bytes = self._align(overlap_seconds * bytes_per_second)
+        self.max_windows = max_windows
+        self.max_in_flight = max(1, max_in_flight)
+        # Janela i cobre [starts[i], starts[i] + window_bytes)
+        self._starts: List[int] = []
+        self._tasks: List[asyncio.Task] = []
+        self._texts: List[Optional[str]] = []
+        self._stitched = ""
+        self._stitched_windows = 0
+        self.failed = False
+        self.sent_bytes = 0
+        self.tail_bytes = 0
+
+    @staticmethod
+    def _align(nbytes: float) -> int:
+        nbytes = int(nbytes)
+        return nbytes - nbytes % 2
+
+    def _next_start(self) -> int:
+        if not self._starts:
+            return 0
+        return self._starts[-1] + self.window_bytes - self.overlap_bytes
+
+    @property
+    def windows(self) -> int:
+        return len(self._starts)
+
+    @property
+    def partial_text(self) -> str:
+        return self._stitched
+
+    def feed(self, buffer):
+        """Dispara as janelas que já estão completas no buffer (chamado a cada chunk de áudio)."""
+        if self.failed:
+            return
+        in_flight = sum(1 for t in self._tasks if not t.done())
+        while len(self._starts) < self.max_windows and in_flight < self.max_in_flight:
+            start = max(self._next_start(), buffer.start_offset)
+            if buffer.end_offset < start + self.window_bytes:
+                return
+            window = b"".join(pcm_views(buffer, start, start + self.window_bytes))
+            self._starts.append(start)
+            self._texts.append(None)
+            self.sent_bytes += len(window)
+            self._tasks.append(asyncio.create_task(self._transcribe_window(len(self._starts) - 1, window)))
+            in_flight += 1
+
+    async def _transcribe_window(self, index: int, window: bytes):
+        try:
+            self._texts[index] = (await self.transcribe(window)).strip()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Sem essa janela a costura não fecha: o fim da fala transcreve tudo de uma vez
+            self.failed = True
+            print(f"WARN: Janela {index} da transcrição incremental falhou ({e}); o fim da fala usará o áudio inteiro.")
+            return
+        advanced = False
+        while self._stitched_windows < len(self._texts) and self._texts[self._stitched_windows] is not None:
+            self._stitched = stitch_transcripts(self._stitched, self._texts[self._stitched_windows])
+            self._stitched_windows += 1
+            advanced = True
+        if advanced and self.on_partial is not None and not self.failed:
+            try:
+                await self.on_partial(self._stitched)
+            except Exception as e:
+                print(f"WARN: Falha ao enviar a legenda provisória: {e}")
+
+    async def finish(self, buffer, transcribe_tail: Transcribe = None) -> str:
+        """
+        Fim da fala: transcreve a cauda enquanto as janelas ainda em andamento
+        terminam, e devolve o texto costurado. Sem janelas (fala curta) ou se
+        alguma falhou, é uma transcrição única da fala inteira.
+        """
+        transcribe_tail = transcribe_tail or self.transcribe
+        tail_task = None
+        try:
+            end = buffer.end_offset if hasattr(buffer, "end_offset") else len(buffer)
+            if self._starts and end > self._starts[-1] + self.window_bytes:
+                # A cauda começa a transcrever já, junto com as janelas que ainda não voltaram
+                tail_start = self._next_start()
+                self.tail_bytes = end - tail_start
+                tail_task = asyncio.create_task(self._transcribe_range(buffer, tail_start, end, transcribe_tail))
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            if self.failed or not self._starts:
+                self.tail_bytes = end
+                return (await self._transcribe_range(buffer, None, end, transcribe_tail)).strip()
+            tail = (await tail_task).strip() if tail_task is not None else ""
+            return stitch_transcripts(self._stitched, tail)
+        finally:
+            if tail_task is not None and not tail_task.done():
+                tail_task.cancel()
+                await asyncio.gather(tail_task, return_exceptions=True)
+            self.close()
+
+    async def _transcribe_range(self, buffer, start, end, transcribe: Transcribe) -> str:
+        views = pcm_views(buffer, start, end)
+        try:
+            return await transcribe(views)
+        finally:
+            for view in views:
+                view.release()
+
+    def close(self):
+        """Cancela as janelas pendentes (barge-in, desconexão ou fim do turno)."""
+        for task in self._tasks:
+            if not task.done():
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "windows": len(self._starts),
+            "sent_seconds": round(self.sent_bytes / self.bytes_per_second, 2),
+            "tail_seconds": round(self.tail_bytes / self.bytes_per_second, 2),
+            "failed": self.failed,
+        }
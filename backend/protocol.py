@@ -0,0 +1,335 @@
+"""
+Protocolo binário versionado do /ws/voice (opt-in com ?protocol=1).
+
+Sem o parâmetro, a sessão continua no modo antigo: PCM 16 bits cru em frames
+binários, controle em JSON de texto e respostas como "Agente: ...".
+
+No protocolo 1, toda mensagem é um frame binário com cabeçalho de 14 bytes
+(big-endian) seguido do payload:
+
+    versão  u8   PROTOCOL_VERSION
+    tipo    u8   FRAME_AUDIO | FRAME_CONTROL | FRAME_TRANSCRIPT | FRAME_REPLY | FRAME_TEXT
+    flags   u8   reservado (0)
+    codec   u8   CODEC_* do payload de áudio (0 nos outros tipos)
+    seq     u32  contador por direção, começa em 0
+    turno   u16  turno a que o frame pertence (o servidor numera os turnos)
+    ts      u32  ms desde o início da sessão de quem enviou
+
+FRAME_CONTROL leva o mesmo JSON do modo antigo ({"type": "end_of_speech"},
+{"type": "cancel"}, ...); TRANSCRIPT/REPLY/TEXT levam texto UTF-8 sem os
+prefixos "Você:"/"Agente:". O codec do uplink é negociado por ?codecs=opus,mulaw
+(ordem de preferência): o servidor responde com um CONTROL {"type": "hello"}
+com o codec escolhido, mas decodifica cada frame pelo codec do próprio
+cabeçalho. O downlink vai em frames FRAME_AUDIO com codec CODEC_MP3.
+"""
+import json
+import struct
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+PROTOCOL_VERSION = 1
+
+HEADER = struct.Struct("!BBBBIHI")
+HEADER_SIZE = HEADER.size
+
+FRAME_AUDIO = 1
+FRAME_CONTROL = 2
+FRAME_TRANSCRIPT = 3
+FRAME_REPLY = 4
+FRAME_TEXT = 5
+FRAME_TYPES = (FRAME_AUDIO, FRAME_CONTROL, FRAME_TRANSCRIPT, FRAME_REPLY, FRAME_TEXT)
+
+CODEC_NONE = 0
+CODEC_PCM16 = 1
+CODEC_MULAW = 2
+CODEC_OPUS = 3
+CODEC_MP3 = 4
+CODEC_NAMES = {CODEC_PCM16: "pcm16", CODEC_MULAW: "mulaw", CODEC_OPUS: "opus", CODEC_MP3: "mp3"}
+CODECS_BY_NAME = {name: codec for codec, name in CODEC_NAMES.items()}
+
+SAMPLE_RATE = 16000
+# Opus: pacotes de 20 ms (o encoder do cliente usa o mesmo tamanho)
+OPUS_FRAME_SAMPLES = SAMPLE_RATE // 50
+
+try:
+    import opuslib
+except ImportError:  # Opus é opcional: sem a libopus o uplink negocia mu-law ou PCM
+    opuslib = None
+
+# Erros dos decoders com payload corrompido; decode_incoming os converte em ProtocolError
+CODEC_ERRORS = (opuslib.OpusError,) if opuslib is not None else ()
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+@dataclass
+class Frame:
+    type: int
+    payload: bytes
+    codec: int = CODEC_NONE
+    seq: int = 0
+    turn_id: int = 0
+    timestamp_ms: int = 0
+    flags: int = 0
+
+
+def encode_frame(frame: Frame) -> bytes:
+    header = HEADER.pack(PROTOCOL_VERSION, frame.type, frame.flags, frame.codec, frame.seq & 0xFFFFFFFF,
+                         frame.turn_id & 0xFFFF, frame.timestamp_ms & 0xFFFFFFFF)
+    return header + bytes(frame.payload)
+
+
+def decode_frame(data) -> Frame:
+    data = memoryview(data)
+    if len(data) < HEADER_SIZE:
+        raise ProtocolError(f"Frame com {len(data)} bytes, menor que o cabeçalho ({HEADER_SIZE})")
+    version, frame_type, flags, codec, seq, turn_id, timestamp_ms = HEADER.unpack_from(data)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Versão de protocolo não suportada: {version}")
+    if frame_type not in FRAME_TYPES:
+        raise ProtocolError(f"Tipo de frame desconhecido: {frame_type}")
+    return Frame(frame_type, data[HEADER_SIZE:], codec, seq, turn_id, timestamp_ms, flags)
+
+
+# --- mu-law (G.711): 8 bits por amostra, metade da banda do PCM 16 bits ---
+
+MULAW_BIAS = 0x84
+MULAW_CLIP = 32635
+
+
+def _build_mulaw_decode_table() -> np.ndarray:
+    codes = ~np.arange(256, dtype=np.uint8)
+    sign = codes & 0x80
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = ((mantissa.astype(np.int32) << 3) + MULAW_BIAS) << exponent
+    return np.where(sign != 0, MULAW_BIAS - magnitude, magnitude - MULAW_BIAS).astype(np.int16)
+
+
+MULAW_DECODE_TABLE = _build_mulaw_decode_table()
+
+
+def mulaw_encode(pcm) -> bytes:
+    samples = np.frombuffer(pcm, dtype="<i2").astype(np.int32)
+    sign = np.where(samples < 0, 0x80, 0x00)
+    magnitude = np.minimum(np.abs(samples), MULAW_CLIP) + MULAW_BIAS
+    exponent = np.clip(np.floor(np.log2(magnitude)).astype(np.int32) - 7, 0, 7)
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa)).astype(np.uint8).tobytes()
+
+
+def mulaw_decode(data) -> bytes:
+    return MULAW_DECODE_TABLE[np.frombuffer(data, dtype=np.uint8)].astype("<i2").tobytes()
+
+
+# --- Decodificadores incrementais do uplink (um por sessão e codec) ---
+
+class PcmDecoder:
+    def decode(self, payload) -> bytes:
+        if len(payload) % 2:
+            raise ProtocolError("Payload PCM 16 bits com número ímpar de bytes")
+        return bytes(payload)
+
+
+class MulawDecoder:
+    def decode(self, payload) -> bytes:
+        return mulaw_decode(payload)
+
+
+class OpusDecoder:
+    """Cada frame de áudio é um pacote Opus (o decoder guarda o estado entre pacotes)."""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        if opuslib is None:
+            raise ProtocolError("Codec opus indisponível (instale opuslib e a libopus)")
+        self._decoder = opuslib.Decoder(sample_rate, 1)
+
+    def decode(self, payload) -> bytes:
+        # frame_size máximo de um pacote Opus (120 ms)
+        return self._decoder.decode(bytes(payload), SAMPLE_RATE * 120 // 1000)
+
+
+_DECODERS = {CODEC_PCM16: PcmDecoder, CODEC_MULAW: MulawDecoder, CODEC_OPUS: OpusDecoder}
+
+
+def supported_uplink_codecs() -> List[str]:
+    codecs = ["mulaw", "pcm16"]
+    return (["opus"] if opuslib is not None else []) + codecs
+
+
+def negotiate_codec(requested: Optional[str]) -> str:
+    """Primeiro codec da lista do cliente (separada por vírgulas) que o servidor decodifica; pcm16 se nenhum."""
+    supported = supported_uplink_codecs()
+    for name in (requested or "").split(","):
+        if name.strip() in supported:
+            return name.strip()
+    return "pcm16"
+
+
+# --- Encoders (clientes Python, testes e benchmarks; o navegador tem os seus) ---
+
+class MulawEncoder:
+    codec = CODEC_MULAW
+
+    def encode(self, pcm) -> List[bytes]:
+        return [mulaw_encode(pcm)]
+
+
+class PcmEncoder:
+    codec = CODEC_PCM16
+
+    def encode(self, pcm) -> List[bytes]:
+        return [bytes(pcm)]
+
+
+class OpusEncoder:
+    """Agrupa o PCM em pacotes de 20 ms; sobra menor que um pacote fica para a próxima chamada."""
+
+    codec = CODEC_OPUS
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, bitrate: int = 24000):
+        if opuslib is None:
+            raise ProtocolError("Codec opus indisponível (instale opuslib e a libopus)")
+        self._encoder = opuslib.Encoder(sample_rate, 1, opuslib.APPLICATION_VOIP)
+        self._encoder.bitrate = bitrate
+        self._pending = bytearray()
+
+    def encode(self, pcm) -> List[bytes]:
+        self._pending.extend(pcm)
+        packet_bytes = OPUS_FRAME_SAMPLES * 2
+        packets = []
+        while len(self._pending) >= packet_bytes:
+            packets.append(self._encoder.encode(bytes(self._pending[:packet_bytes]), OPUS_FRAME_SAMPLES))
+            del self._pending[:packet_bytes]
+        return packets
+
+
+_ENCODERS = {"pcm16": PcmEncoder, "mulaw": MulawEncoder, "opus": OpusEncoder}
+
+
+def make_encoder(codec_name: str):
+    return _ENCODERS[codec_name]()
+
+
+class FrameSequence:
+    """Numeração e relógio de uma direção do canal."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.next_seq = 0
+
+    def frame(self, frame_type: int, payload: bytes, codec: int = CODEC_NONE, turn_id: int = 0) -> bytes:
+        seq = self.next_seq
+        self.next_seq += 1
+        timestamp_ms = int((time.monotonic() - self.started_at) * 1000)
+        return encode_frame(Frame(frame_type, payload, codec, seq, turn_id, timestamp_ms))
+
+
+class FramedWebSocket:
+    """
+    Adapta a WebSocket do Starlette ao protocolo 1 mantendo a interface usada
+    pelo resto do backend (send_text, send_bytes, client_state): o código dos
+    turnos continua mandando "Agente: ..." e bytes de MP3, e aqui isso vira
+    frames tipados. No sentido inverso, decode_incoming() transforma um frame
+    recebido na mesma mensagem do modo antigo ({"bytes": pcm} ou {"text": json}).
+    """
+
+    def __init__(self, ws, uplink_codec: str = "pcm16"):
+        self.ws = ws
+        self.uplink_codec = uplink_codec
+        self.turn_id = 0
+        self._out = FrameSequence()
+        self._decoders: Dict[int, object] = {}
+        self._expected_seq = None
+        self.frames_in = 0
+        self.frames_lost = 0
+        self.wire_bytes_in = 0
+        self.pcm_bytes_in = 0
+
+    @property
+    def client_state(self):
+        return self.ws.client_state
+
+    def hello(self) -> dict:
+        return {"type": "hello", "version": PROTOCOL_VERSION, "codec": self.uplink_codec, "downlink": "mp3",
+                "codecs": supported_uplink_codecs()}
+
+    def next_turn(self) -> int:
+        self.turn_id = (self.turn_id + 1) & 0xFFFF
+        return self.turn_id
+
+    async def send_frame(self, frame_type: int, payload: bytes, codec: int = CODEC_NONE):
+        await self.ws.send_bytes(self._out.frame(frame_type, payload, codec, self.turn_id))
+
+    def frame_audio(self, data: bytes) -> bytes:
+        """Frame de áudio pronto para envio (numerado agora: envie na mesma ordem em que foi montado)."""
+        return self._out.frame(FRAME_AUDIO, data, CODEC_MP3, self.turn_id)
+
+    def frame_text(self, text: str) -> bytes:
+        """Frame do texto no formato antigo ("{...}", "Você: ...", "Agente: ..." ou texto livre)."""
+        if text.startswith("{"):
+            frame_type, body = FRAME_CONTROL, text
+        elif text.startswith("Você: "):
+            frame_type, body = FRAME_TRANSCRIPT, text[len("Você: "):]
+        elif text.startswith("Agente: "):
+            frame_type, body = FRAME_REPLY, text[len("Agente: "):]
+        else:
+            frame_type, body = FRAME_TEXT, text
+        return self._out.frame(frame_type, body.encode("utf-8"), CODEC_NONE, self.turn_id)
+
+    async def send_bytes(self, data: bytes):
+        await self.ws.send_bytes(self.frame_audio(data))
+
+    async def send_json(self, payload: dict):
+        await self.send_frame(FRAME_CONTROL, json.dumps(payload).encode("utf-8"))
+
+    async def send_text(self, text: str):
+        await self.ws.send_bytes(self.frame_text(text))
+
+    async def close(self, *args, **kwargs):
+        await self.ws.close(*args, **kwargs)
+
+    def _decoder(self, codec: int):
+        decoder = self._decoders.get(codec)
+        if decoder is None:
+            decoder_class = _DECODERS.get(codec)
+            if decoder_class is None:
+                raise ProtocolError(f"Codec de uplink desconhecido: {codec}")
+            decoder = self._decoders[codec] = decoder_class()
+        return decoder
+
+    def decode_incoming(self, data) -> dict:
+        frame = decode_frame(data)
+        self.frames_in += 1
+        self.wire_bytes_in += len(data)
+        if self._expected_seq is not None and frame.seq != self._expected_seq:
+            self.frames_lost += max(0, (frame.seq - self._expected_seq) & 0xFFFFFFFF)
+        self._expected_seq = (frame.seq + 1) & 0xFFFFFFFF
+        if frame.type == FRAME_AUDIO:
+            decoder = self._decoder(frame.codec)
+            try:
+                pcm = decoder.decode(frame.payload)
+            except CODEC_ERRORS as e:
+                raise ProtocolError(f"Pacote {CODEC_NAMES.get(frame.codec, frame.codec)} inválido: {e}") from e
+            self.pcm_bytes_in += len(pcm)
+            return {"bytes": pcm}
+        if frame.type == FRAME_CONTROL:
+            try:
+                return {"text": bytes(frame.payload).decode("utf-8")}
+            except UnicodeDecodeError as e:
+                raise ProtocolError(f"Frame de controle não é UTF-8: {e}") from e
+        raise ProtocolError(f"Frame do tipo {frame.type} não é aceito no uplink")
+
+    def stats(self) -> dict:
+        return {
+            "codec": self.uplink_codec,
+            "frames_in": self.frames_in,
+            "frames_lost": self.frames_lost,
+            "wire_bytes_in": self.wire_bytes_in,
+            "pcm_bytes_in": self.pcm_bytes_in,
+        }
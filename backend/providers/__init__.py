@@ -0,0 +1,142 @@
+"""
+Provedores de cada etapa do turno, escolhidos por variáveis de ambiente em
+cada deploy (o código do pipeline só conhece as interfaces de base.py):
+
+    STT_PROVIDER         openai | fake          modelo: STT_MODEL
+    LLM_PROVIDER         openai | fake          modelos: LLM_MODEL e LLM_SUMMARY_MODEL (resumo da memória)
+    TTS_PROVIDER         elevenlabs | fake      ELEVENLABS_VOICE_ID, ELEVENLABS_MODEL_ID, ELEVENLABS_OUTPUT_FORMAT
+    EMBEDDINGS_PROVIDER  openai | fake          modelo: EMBEDDINGS_MODEL
+
+Os fakes (backend/providers/fake.py) rodam no processo, com latência
+configurável por FAKE_*_MS. Nenhum SDK é importado junto com este pacote: cada
+create_* importa só o do provedor escolhido, no momento em que é chamado.
+"""
+import os
+import threading
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+dotenv_path = Path(__file__).parent.parent / '.env'
+load_dotenv(dotenv_path=dotenv_path)
+
+from backend.providers.base import LLMProvider, STTProvider, TTSProvider
+from backend.providers.fake import FakeLLM, FakeSTT, FakeTTS, LatencyModel
+
+# Interfaces e fakes reexportados (testes e benchmarks importam daqui) + as fábricas
+__all__ = [
+    "LLMProvider", "STTProvider", "TTSProvider",
+    "FakeLLM", "FakeSTT", "FakeTTS", "LatencyModel", "FakeEmbeddings", "UnavailableEmbeddings",
+    "openai_client", "create_stt_provider", "create_llm_provider", "create_tts_provider", "create_embeddings",
+]
+
+STT_PROVIDER = os.getenv("STT_PROVIDER", "openai")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+TTS_PROVIDER = os.getenv("TTS_PROVIDER", "elevenlabs")
+EMBEDDINGS_PROVIDER = os.getenv("EMBEDDINGS_PROVIDER", "openai")
+
+STT_MODEL = os.getenv("STT_MODEL", "whisper-1")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+# O resumo da memória roda fora do caminho crítico: pode usar um modelo mais barato
+LLM_SUMMARY_MODEL = os.getenv("LLM_SUMMARY_MODEL", LLM_MODEL)
+EMBEDDINGS_MODEL = os.getenv("EMBEDDINGS_MODEL", "text-embedding-ada-002")
+
+ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
+ELEVENLABS_MODEL_ID = os.getenv("ELEVENLABS_MODEL_ID", "eleven_multilingual_v2")
+ELEVENLABS_OUTPUT_FORMAT = os.getenv("ELEVENLABS_OUTPUT_FORMAT", "mp3_44100_128")
+
+_openai_client = None
+_openai_client_lock = threading.Lock()  # o aquecimento do servidor cria os provedores numa thread
+
+# Dependem do LangChain: importados só quando pedidos (ver __getattr__)
+_LAZY_EXPORTS = {"FakeEmbeddings", "UnavailableEmbeddings"}
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        from backend.providers import embeddings
+
+        return getattr(embeddings, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def openai_client():
+    """AsyncOpenAI compartilhado (um único pool HTTP para STT e LLM)."""
+    global _openai_client
+    with _openai_client_lock:
+        if _openai_client is None:
+            from backend.clients import create_openai_client
+
+            openai_key = os.getenv("OPENAI_KEY")
+            if not openai_key:
+                raise ValueError("Defina OPENAI_KEY no .env antes de iniciar o servidor (ou use STT_PROVIDER/LLM_PROVIDER=fake)")
+            _openai_client = create_openai_client(openai_key)
+    return _openai_client
+
+
+def _unknown(stage: str, name: str):
+    return ValueError(f"Provedor de {stage} desconhecido: {name}")
+
+
+def create_stt_provider(name: str = None) -> STTProvider:
+    name = name or STT_PROVIDER
+    if name == "fake":
+        return FakeSTT()
+    if name == "openai":
+        from backend.providers.openai_api import OpenAISTT
+
+        return OpenAISTT(openai_client(), STT_MODEL)
+    raise _unknown("STT", name)
+
+
+def create_llm_provider(name: str = None, model: str = None) -> LLMProvider:
+    name = name or LLM_PROVIDER
+    if name == "fake":
+        return FakeLLM(model=model or "fake")
+    if name == "openai":
+        from backend.providers.openai_api import OpenAIChat
+
+        return OpenAIChat(openai_client(), model or LLM_MODEL)
+    raise _unknown("LLM", name)
+
+
+def create_tts_provider(name: str = None) -> TTSProvider:
+    name = name or TTS_PROVIDER
+    if name == "fake":
+        return FakeTTS()
+    if name == "elevenlabs":
+        from elevenlabs.client import AsyncElevenLabs
+
+        from backend.providers.elevenlabs_api import ElevenLabsTTS
+
+        client = None
+        api_key = os.getenv("ELEVENLABS_API_KEY")
+        if api_key:
+            try:
+                # ELEVENLABS_BASE_URL permite apontar para um servidor local (ex.: benchmarks/load_test.py)
+                client = AsyncElevenLabs(api_key=api_key, base_url=os.getenv("ELEVENLABS_BASE_URL") or None)
+                print("DEBUG TTS: Cliente AsyncElevenLabs inicializado com sucesso.")
+            except Exception as e:
+                print(f"ERROR: Erro ao inicializar cliente AsyncElevenLabs: {e}")
+        else:
+            print("AVISO: ELEVENLABS_API_KEY não definida. O TTS ElevenLabs não funcionará.")
+        return ElevenLabsTTS(client, ELEVENLABS_VOICE_ID, ELEVENLABS_MODEL_ID, ELEVENLABS_OUTPUT_FORMAT)
+    raise _unknown("TTS", name)
+
+
+def create_embeddings(name: str = None):
+    """Embeddings no formato do LangChain (é o que o FAISS recebe)."""
+    from backend.providers.embeddings import FakeEmbeddings, UnavailableEmbeddings
+
+    name = name or EMBEDDINGS_PROVIDER
+    if name == "fake":
+        return FakeEmbeddings()
+    if name == "openai":
+        openai_key = os.getenv("OPENAI_KEY")
+        if not openai_key:
+            print("AVISO: OPENAI_KEY não definida. O RAG não funcionará até ela ser configurada.")
+            return UnavailableEmbeddings("Defina OPENAI_KEY no arquivo .env antes de usar o RAG")
+        from langchain_openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(openai_api_key=openai_key, model=EMBEDDINGS_MODEL)
+    raise _unknown("embeddings", name)
@@ -0,0 +1,45 @@
+from typing import AsyncIterator, List
+
+
+class STTProvider:
+    """Transcrição de um turno inteiro."""
+
+    name = "stt"
+
+    async def transcribe(self, audio_file) -> str:
+        """`audio_file`: WAV em memória (WavStream) já posicionado no início."""
+        raise NotImplementedError
+
+
+class LLMProvider:
+    """Chat completions no formato de mensagens da OpenAI ({"role", "content"})."""
+
+    name = "llm"
+    model = None
+
+    async def complete(self, messages: List[dict], max_tokens: int = None) -> str:
+        raise NotImplementedError
+
+    async def open_stream(self, messages: List[dict]) -> AsyncIterator[str]:
+        """
+        Abre a resposta em streaming e devolve um async iterator dos deltas de
+        texto. Abrir é o que o ProviderLimiter limita por timeout/retries; o
+        iterador deve fechar a conexão no aclose().
+        """
+        raise NotImplementedError
+
+
+class TTSProvider:
+    """
+    Síntese em streaming (chunks de MP3). voice_id, model_id e output_format
+    identificam o áudio gerado e entram na chave do cache de TTS.
+    """
+
+    name = "tts"
+    voice_id = None
+    model_id = None
+    output_format = "mp3_44100_128"
+
+    def synthesize_stream(self, text: str) -> AsyncIterator[bytes]:
+        raise NotImplementedError
+
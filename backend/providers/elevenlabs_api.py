@@ -0,0 +1,31 @@
+from typing import AsyncIterator
+
+from backend.providers.base import TTSProvider
+from backend.streaming import aclose_quietly
+
+
+class ElevenLabsTTS(TTSProvider):
+    name = "elevenlabs"
+
+    def __init__(self, client, voice_id: str, model_id: str = "eleven_multilingual_v2",
+                 output_format: str = "mp3_44100_128"):
+        self.client = client
+        self.voice_id = voice_id
+        self.model_id = model_id
+        self.output_format = output_format
+
+    async def synthesize_stream(self, text: str) -> AsyncIterator[bytes]:
+        if not self.client:
+            print("ERROR: Cliente ElevenLabs não inicializado ou API Key ausente.")
+            return
+        audio_generator = self.client.text_to_speech.convert(
+            voice_id=self.voice_id,
+            output_format=self.output_format,
+            text=text,
+            model_id=self.model_id,
+        )
+        try:
+            async for chunk in audio_generator:
+                yield chunk
+        finally:
+            await aclose_quietly(audio_generator)
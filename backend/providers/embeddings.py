@@ -0,0 +1,64 @@
+"""
+Embeddings que não dependem de SDK de provedor. Ficam fora de fake.py/base.py
+porque herdam do Embeddings do LangChain, que só é importado quando o RAG é
+usado de fato.
+"""
+import hashlib
+import os
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from backend.providers.fake import LatencyModel
+
+FAKE_EMBEDDINGS_MS = float(os.getenv("FAKE_EMBEDDINGS_MS", "0"))
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Vetor normalizado de trigramas de caracteres (hash em `dim` posições):
+    textos parecidos ficam próximos, como num embedding de verdade. A latência
+    é por consulta (embed_query), que é a chamada feita a cada turno.
+    """
+
+    def __init__(self, dim: int = 512, latency: LatencyModel = None):
+        self.dim = dim
+        self.latency = latency or LatencyModel("fixed", FAKE_EMBEDDINGS_MS)
+        self.calls = 0
+        self.busy_seconds = 0.0
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        padded = f"  {text.lower()}  "
+        for i in range(len(padded) - 2):
+            digest = hashlib.blake2b(padded[i:i + 3].encode("utf-8"), digest_size=4).digest()
+            vector[int.from_bytes(digest, "little") % self.dim] += 1.0
+        return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        delay = self.latency.sample_seconds()
+        if delay > 0:
+            self.busy_seconds += delay
+            time.sleep(delay)  # a busca do RAG já roda numa thread (asyncio.to_thread)
+        return self._embed(text)
+
+
+class UnavailableEmbeddings(Embeddings):
+    """
+    Embeddings de um provedor sem credenciais: o import do RAG não falha, e o
+    erro aparece na primeira busca ou build do índice.
+    """
+
+    def __init__(self, reason: str):
+        self.reason = reason
+
+    def embed_documents(self, texts):
+        raise ValueError(self.reason)
+
+    def embed_query(self, text):
+        raise ValueError(self.reason)
@@ -0,0 +1,167 @@
+"""
+Provedores falsos, no próprio processo: respostas determinísticas e latência
+configurável, sem rede nem custo. Servem para CI, para benchmarks e para medir
+quanto do turno é custo do próprio pipeline (com latência 0, tudo o que sobra é
+overhead nosso).
+
+Cada fake soma em `busy_seconds` o tempo que passou "esperando o provedor".
+"""
+import asyncio
+import hashlib
+import os
+import random
+import re
+from typing import AsyncIterator, List
+
+from backend.audio import WAV_HEADER_SIZE
+from backend.providers.base import LLMProvider, STTProvider, TTSProvider
+
+FAKE_TRANSCRIPT = os.getenv("FAKE_TRANSCRIPT", "Quais implantes vocês têm?")
+FAKE_REPLY = os.getenv("FAKE_REPLY", "Temos a Linha Zero e a Linha Slim. Posso te enviar o catálogo?")
+FAKE_STT_MS = float(os.getenv("FAKE_STT_MS", "0"))
+# Como no Whisper, o tempo de transcrição cresce com a duração do áudio
+FAKE_STT_MS_PER_AUDIO_SECOND = float(os.getenv("FAKE_STT_MS_PER_AUDIO_SECOND", "0"))
+FAKE_LLM_FIRST_TOKEN_MS = float(os.getenv("FAKE_LLM_FIRST_TOKEN_MS", "0"))
+FAKE_LLM_MS_PER_TOKEN = float(os.getenv("FAKE_LLM_MS_PER_TOKEN", "0"))
+FAKE_TTS_FIRST_BYTE_MS = float(os.getenv("FAKE_TTS_FIRST_BYTE_MS", "0"))
+FAKE_TTS_MS_PER_CHAR = float(os.getenv("FAKE_TTS_MS_PER_CHAR", "0"))
+
+# ~128 kbps de MP3 para ~15 caracteres falados por segundo
+FAKE_TTS_BYTES_PER_CHAR = 1000
+FAKE_TTS_CHUNK_BYTES = 4096
+
+_TOKEN_RE = re.compile(r"\S+\s*")
+
+
+class LatencyModel:
+    """Distribuição de latência (ms): "fixed", "uniform" (média ± spread) ou "lognormal" (mediana, sigma=spread/mean)."""
+
+    def __init__(self, kind: str = "fixed", mean_ms: float = 0.0, spread_ms: float = 0.0, seed: int = None):
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Distribuição de latência desconhecida: {kind}")
+        self.kind = kind
+        self.mean_ms = mean_ms
+        self.spread_ms = spread_ms
+        # Com seed, a sequência de latências se repete entre execuções
+        self._random = random.Random(seed) if seed is not None else random
+
+    def sample_seconds(self) -> float:
+        if self.kind == "fixed" or self.mean_ms <= 0:
+            value = self.mean_ms
+        elif self.kind == "uniform":
+            value = self._random.uniform(self.mean_ms - self.spread_ms, self.mean_ms + self.spread_ms)
+        else:
+            value = self._random.lognormvariate(0, self.spread_ms / self.mean_ms) * self.mean_ms
+        return max(0.0, value) / 1000.0
+
+
+class _Busy:
+    """Conta chamadas e o tempo simulado de provedor."""
+
+    def __init__(self):
+        self.calls = 0
+        self.busy_seconds = 0.0
+
+    async def _wait(self, seconds: float):
+        if seconds > 0:
+            self.busy_seconds += seconds
+            await asyncio.sleep(seconds)
+
+
+class FakeSTT(STTProvider, _Busy):
+    """Latência fixa (`latency`) mais `ms_per_audio_second` por segundo de áudio (WAV 16 kHz mono)."""
+
+    name = "fake"
+
+    def __init__(self, transcript: str = None, latency: LatencyModel = None, ms_per_audio_second: float = None):
+        super().__init__()
+        self.transcript = transcript if transcript is not None else FAKE_TRANSCRIPT
+        self.latency = latency or LatencyModel("fixed", FAKE_STT_MS)
+        self.ms_per_audio_second = FAKE_STT_MS_PER_AUDIO_SECOND if ms_per_audio_second is None else ms_per_audio_second
+        self.audio_seconds = 0.0
+
+    def transcript_for(self, audio_file) -> str:
+        """Subclasses podem derivar o texto do áudio (ex.: benchmarks da transcrição incremental)."""
+        return self.transcript
+
+    async def transcribe(self, audio_file) -> str:
+        self.calls += 1
+        size = len(audio_file) if hasattr(audio_file, "__len__") else 0  # WavStream sabe o próprio tamanho
+        seconds = max(0, size - WAV_HEADER_SIZE) / (16000 * 2)
+        self.audio_seconds += seconds
+        await self._wait(self.latency.sample_seconds() + seconds * self.ms_per_audio_second / 1000.0)
+        return self.transcript_for(audio_file)
+
+
+class FakeLLM(LLMProvider, _Busy):
+    """Devolve sempre `reply`, palavra a palavra no streaming."""
+
+    name = "fake"
+
+    def __init__(self, reply: str = None, first_token: LatencyModel = None, ms_per_token: float = None,
+                 model: str = "fake"):
+        super().__init__()
+        self.reply = reply if reply is not None else FAKE_REPLY
+        self.first_token = first_token or LatencyModel("fixed", FAKE_LLM_FIRST_TOKEN_MS)
+        self.ms_per_token = FAKE_LLM_MS_PER_TOKEN if ms_per_token is None else ms_per_token
+        self.model = model
+        self.last_messages = None
+
+    def _tokens(self) -> List[str]:
+        return _TOKEN_RE.findall(self.reply)
+
+    async def complete(self, messages: List[dict], max_tokens: int = None) -> str:
+        self.calls += 1
+        self.last_messages = messages
+        tokens = self._tokens()[:max_tokens] if max_tokens else self._tokens()
+        await self._wait(self.first_token.sample_seconds() + len(tokens) * self.ms_per_token / 1000.0)
+        return "".join(tokens)
+
+    async def open_stream(self, messages: List[dict]) -> AsyncIterator[str]:
+        self.calls += 1
+        self.last_messages = messages
+        await self._wait(self.first_token.sample_seconds())
+        return self._deltas()
+
+    async def _deltas(self):
+        for i, token in enumerate(self._tokens()):
+            if i:
+                await self._wait(self.ms_per_token / 1000.0)
+            yield token
+
+
+class FakeTTS(TTSProvider, _Busy):
+    """
+    "MP3" determinístico (cabeçalho ID3 + bytes derivados do texto), com
+    tamanho e tempo de síntese proporcionais ao texto.
+    """
+
+    name = "fake"
+    voice_id = "fake"
+    model_id = "fake"
+
+    def __init__(self, first_byte: LatencyModel = None, ms_per_char: float = None,
+                 bytes_per_char: int = FAKE_TTS_BYTES_PER_CHAR, chunk_bytes: int = FAKE_TTS_CHUNK_BYTES):
+        super().__init__()
+        self.first_byte = first_byte or LatencyModel("fixed", FAKE_TTS_FIRST_BYTE_MS)
+        self.ms_per_char = FAKE_TTS_MS_PER_CHAR if ms_per_char is None else ms_per_char
+        self.bytes_per_char = bytes_per_char
+        self.chunk_bytes = chunk_bytes
+
+    def render(self, text: str) -> bytes:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        size = max(len(text), 1) * self.bytes_per_char
+        return (b"ID3" + digest * (size // len(digest) + 1))[:size]
+
+    async def synthesize_stream(self, text: str) -> AsyncIterator[bytes]:
+        self.calls += 1
+        audio = self.render(text)
+        chunks = range(0, len(audio), self.chunk_bytes)
+        # O tempo de síntese do texto é distribuído entre os chunks
+        per_chunk = len(text) * self.ms_per_char / 1000.0 / max(len(chunks), 1)
+        await self._wait(self.first_byte.sample_seconds())
+        for i, start in enumerate(chunks):
+            if i:
+                await self._wait(per_chunk)
+            yield audio[start:start + self.chunk_bytes]
+
@@ -0,0 +1,47 @@
+from typing import AsyncIterator, List
+
+from backend.providers.base import LLMProvider, STTProvider
+
+
+class OpenAISTT(STTProvider):
+    name = "openai"
+
+    def __init__(self, client, model: str = "whisper-1"):
+        self.client = client
+        self.model = model
+
+    async def transcribe(self, audio_file) -> str:
+        return await self.client.audio.transcriptions.create(
+            model=self.model,
+            file=audio_file,
+            response_format="text"
+        )
+
+
+class OpenAIChat(LLMProvider):
+    name = "openai"
+
+    def __init__(self, client, model: str = "gpt-4o-mini"):
+        self.client = client
+        self.model = model
+
+    async def complete(self, messages: List[dict], max_tokens: int = None) -> str:
+        kwargs = {"max_tokens": max_tokens} if max_tokens else {}
+        response = await self.client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+        return response.choices[-1].message.content
+
+    async def open_stream(self, messages: List[dict]) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(model=self.model, messages=messages, stream=True)
+        return self._deltas(stream)
+
+    @staticmethod
+    async def _deltas(stream):
+        try:
+            async for event in stream:
+                if event.choices and event.choices[0].delta.content:
+                    yield event.choices[0].delta.content
+        finally:
+            # Fecha a resposta HTTP mesmo se o consumidor parar no meio (barge-in)
+            close = getattr(stream, "close", None)
+            if close is not None:
+                await close()
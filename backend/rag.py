@@ -1,68 +1,395 @@
 import os
+import shutil
+import threading
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 
 dotenv_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=dotenv_path)
 
-# LangChain imports
-from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
+from backend.lexical import LEXICAL_INDEX_FILENAME, LexicalIndex, reciprocal_rank_fusion
+from backend.providers import create_embeddings
+from backend.vector_store import STORE_FILENAMES, VECTORS_FILENAME, is_mapped_store, load_mapped_store, resolve_kind
 
-# Carrega variáveis de ambiente do arquivo .env
-OPENAI_KEY = os.getenv("OPENAI_KEY")
-if not OPENAI_KEY:
-    raise ValueError("Defina OPENAI_KEY no arquivo .env antes de usar o RAG")
+# Provedor de embeddings (EMBEDDINGS_PROVIDER), criado no primeiro uso: o LangChain
+# e o SDK só são importados quando o RAG é usado (ou aquecido no startup).
+# Sem OPENAI_KEY o erro só aparece ao usar o RAG.
+embeddings = None
+_embeddings_lock = threading.Lock()
 
-# Inicializa embeddings com a chave válida
-embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_KEY)
+
+def get_embeddings():
+    global embeddings
+    if embeddings is None:
+        with _embeddings_lock:
+            if embeddings is None:
+                embeddings = create_embeddings()
+    return embeddings
 
 # Caminho padrão do índice FAISS
 INDEX_PATH = Path(__file__).parent / "faiss_index"
 
+# Arquivo gravado por build_index ao final de cada build; é o sinal de hot-reload.
+VERSION_FILENAME = "VERSION"
+# Cada build publicado fica inteiro na sua pasta, VERSIONS_DIRNAME/<versão>; o VERSION
+# nomeia a pasta atual. Índices antigos (arquivos soltos em index_path) continuam lidos.
+VERSIONS_DIRNAME = "versions"
+# Versões anteriores mantidas depois de publicar: um worker pode estar carregando a anterior
+KEEP_PREVIOUS_VERSIONS = 1
+
+# Formato gravado por save_index: "langchain" (FAISS.save_local, docstore em pickle) ou "mapped"
+# (backend/vector_store.py: sem pickle, lido por mmap). Sem a variável, mantém o formato já publicado.
+INDEX_FORMATS = ("langchain", "mapped")
+RAG_INDEX_FORMAT = os.getenv("RAG_INDEX_FORMAT")
+LANGCHAIN_FILENAMES = ("index.faiss", "index.pkl")
+
+# Intervalo mínimo (s) entre verificações de nova versão do índice em disco.
+RELOAD_CHECK_INTERVAL_SECONDS = float(os.getenv("RAG_RELOAD_CHECK_SECONDS", "1.0"))
+
+# "hybrid" (BM25 + vetores com RRF, e atalho só-lexical para termos exatos), "vector" ou "lexical"
+RETRIEVAL_MODES = ("hybrid", "vector", "lexical")
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+# Candidatos de cada lista (k * N) antes da fusão
+HYBRID_CANDIDATES_MULTIPLIER = int(os.getenv("RAG_HYBRID_CANDIDATES_MULTIPLIER", "4"))
+RRF_K = 60
+
+
+def _write_version_file(index_dir: Path, version: str):
+    """Aponta atomicamente o VERSION de `index_dir` para `version`."""
+    tmp_file = index_dir / f"{VERSION_FILENAME}.tmp"
+    tmp_file.write_text(version, encoding="utf-8")
+    os.replace(tmp_file, index_dir / VERSION_FILENAME)
+
+
+def version_dir(index_path: Path, version: str = None) -> Path:
+    """Pasta dos arquivos de `version`; a própria `index_path` no layout antigo (arquivos soltos)."""
+    index_path = Path(index_path)
+    if version:
+        candidate = index_path / VERSIONS_DIRNAME / version
+        if candidate.is_dir():
+            return candidate
+    return index_path
+
+
+def published_dir(index_path: Path) -> Path:
+    """Pasta da versão publicada em `index_path` (resolve o VERSION primeiro)."""
+    try:
+        version = (Path(index_path) / VERSION_FILENAME).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        version = None
+    return version_dir(index_path, version)
+
+
+def _prune_versions(index_path: Path, current: str, keep: int = KEEP_PREVIOUS_VERSIONS):
+    """Apaga versões além das `keep` anteriores à atual, pastas de staging órfãs e os arquivos do layout antigo."""
+    versions_dir = index_path / VERSIONS_DIRNAME
+    older = sorted((d for d in versions_dir.iterdir() if d.is_dir() and d.name != current and d.name.isdigit()),
+                   key=lambda d: int(d.name), reverse=True)
+    for stale in older[keep:] + [d for d in versions_dir.iterdir() if d.name.endswith(".staging")]:
+        shutil.rmtree(stale, ignore_errors=True)
+    # Arquivos soltos do layout antigo contam como a versão mais velha
+    if len(older) >= keep:
+        for name in LANGCHAIN_FILENAMES + STORE_FILENAMES + (LEXICAL_INDEX_FILENAME,):
+            (index_path / name).unlink(missing_ok=True)
 
-def build_index(data_dir="data", index_path: Path = None): # Mude o tipo para Path
+
+def build_index(data_dir="data", index_path: Path = None, full: bool = False): # Mude o tipo para Path
     """
-    Lê todos os arquivos .txt em `data_dir`, indexa em FAISS e salva em `index_path`.
-    Se `index_path` for None, usa o INDEX_PATH global.
+    Indexa os arquivos .txt em `data_dir` em FAISS e salva em `index_path`.
+    Se `index_path` for None, usa o INDEX_PATH global. O build é incremental
+    (ver backend/index_builder.py): só arquivos novos ou alterados são
+    reembeddados; `full=True` reconstrói tudo.
     """
+    import asyncio
+    from backend.index_builder import build_index_incremental
+
     # Garante que data_dir também seja um caminho absoluto se necessário
     abs_data_dir = Path(__file__).parent / data_dir
 
     # O index_path aqui já deve ser absoluto ou se tornará o INDEX_PATH global
-    final_index_path = index_path if index_path else INDEX_PATH
+    final_index_path = Path(index_path) if index_path else INDEX_PATH
 
-    docs = []
-    for txt_file in abs_data_dir.rglob("*.txt"):
-        text = txt_file.read_text(encoding="utf-8", errors="ignore")
-        docs.append(Document(page_content=text, metadata={"source": str(txt_file)}))
+    asyncio.run(build_index_incremental(abs_data_dir, final_index_path, get_embeddings(), full=full))
+    print(f"[RAG] Índice salvo em: {final_index_path}")
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    chunks = splitter.split_documents(docs)
 
-    store = FAISS.from_documents(chunks, embeddings)
-    store.save_local(str(final_index_path)) # Salva usando o caminho absoluto
-    print(f"[RAG] Índice salvo em: {final_index_path}")
+def save_index(store, index_path: Path, index_format: str = None, kind: str = None, extra_files: dict = None):
+    """
+    Salva `store` (FAISS do LangChain) em `index_path` sem expor arquivos pela
+    metade aos leitores: grava a versão inteira (FAISS + índice lexical) numa
+    pasta de staging, renomeia a pasta para VERSIONS_DIRNAME/<versão> e só
+    então aponta o VERSION para ela, numa única troca atômica que dispara o
+    hot-reload nos workers. `index_format`/`kind` escolhem o formato em disco
+    (ver RAG_INDEX_FORMAT e backend/vector_store.py). `extra_files` (nome ->
+    texto) vão na mesma pasta, publicados junto com o índice (ex.: o manifesto
+    do build incremental).
+    """
+    final_index_path = Path(index_path)
+    current_dir = published_dir(final_index_path)
+    index_format = index_format or RAG_INDEX_FORMAT or ("mapped" if is_mapped_store(current_dir) else "langchain")
+    if index_format not in INDEX_FORMATS:
+        raise ValueError(f"Formato de índice desconhecido: {index_format} (use um de {INDEX_FORMATS})")
+    version = str(time.time_ns())
+    versions_dir = final_index_path / VERSIONS_DIRNAME
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    staging_dir = versions_dir / f"{version}.staging"
+    if index_format == "mapped":
+        from backend.vector_store import write_from_langchain
+
+        write_from_langchain(store, staging_dir, kind=resolve_kind(current_dir, kind))
+    else:
+        store.save_local(str(staging_dir))
+    # O índice lexical é derivado do docstore: publicado junto, nunca fica de outra versão
+    LexicalIndex.from_store(store).save(staging_dir)
+    for name, text in (extra_files or {}).items():
+        (staging_dir / name).write_text(text, encoding="utf-8")
+    os.replace(staging_dir, versions_dir / version)
+    _write_version_file(final_index_path, version)
+    _prune_versions(final_index_path, version)
+    return version
 
 
 def load_index(index_path: Path = None): # Mude o tipo para Path
     """
-    Carrega o índice FAISS de `index_path` (ou do INDEX_PATH se None), permitindo deserialização perigosa.
+    Carrega o índice de `index_path` (ou do INDEX_PATH se None). No formato
+    nativo (backend/vector_store.py) só mapeia os arquivos; no do LangChain,
+    permite deserialização perigosa.
     """
-    # O caminho de carga também deve ser absoluto
-    path_to_load = index_path if index_path else INDEX_PATH
+    # O caminho de carga também deve ser absoluto; com VERSION, a pasta da versão publicada
+    path_to_load = published_dir(index_path if index_path else INDEX_PATH)
+    if is_mapped_store(path_to_load):
+        return load_mapped_store(Path(path_to_load), get_embeddings())
+
+    from langchain_community.vectorstores import FAISS
+
     return FAISS.load_local(
         str(path_to_load), # Passa o caminho absoluto como string
-        embeddings,
+        get_embeddings(),
         allow_dangerous_deserialization=True
     )
 
 
+class IndexRetriever:
+    """
+    Mantém o índice FAISS (e o lexical, se publicado) carregado uma única vez
+    por processo e compartilhado entre todas as sessões. Quando build_index
+    publica uma nova versão, o índice novo é carregado e trocado
+    atomicamente; consultas em andamento continuam usando a referência antiga
+    até terminarem.
+    """
+
+    def __init__(self, index_path: Path = None, reload_check_interval: float = RELOAD_CHECK_INTERVAL_SECONDS,
+                 mode: str = None):
+        self.index_path = Path(index_path) if index_path else INDEX_PATH
+        self.reload_check_interval = reload_check_interval
+        self.mode = mode or RETRIEVAL_MODE
+        if self.mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Modo de busca desconhecido: {self.mode} (use um de {RETRIEVAL_MODES})")
+        # (store, version, lexical) trocados juntos numa única atribuição
+        self._current = (None, None, None)
+        self._reload_lock = threading.Lock()
+        self._last_check = 0.0
+        self._stats_lock = threading.Lock()
+        self._loads = 0
+        self._last_load_seconds = 0.0
+        self._total_load_seconds = 0.0
+        self._queries = 0
+        self._total_query_seconds = 0.0
+        self._max_query_seconds = 0.0
+        self._embedding_calls = 0
+        # IDs do índice lexical sem documento no docstore (índice lexical de outro build)
+        self._missing_docs = 0
+        self._warned_missing_version = None
+        self._lexical_fast_path = 0
+
+    def _disk_version(self):
+        """Versão publicada em disco (arquivo VERSION ou, em índices antigos, mtime do arquivo de vetores)."""
+        try:
+            return (self.index_path / VERSION_FILENAME).read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            for name in ("index.faiss", VECTORS_FILENAME):
+                try:
+                    return str((self.index_path / name).stat().st_mtime_ns)
+                except FileNotFoundError:
+                    pass
+            return None
+
+    def _index_size_bytes(self) -> int:
+        try:
+            return sum(f.stat().st_size for f in version_dir(self.index_path, self._current[1]).iterdir() if f.is_file())
+        except FileNotFoundError:
+            return 0
+
+    def _load(self, version):
+        start = time.perf_counter()
+        # FAISS e lexical da mesma pasta de versão, mesmo que outra seja publicada durante a carga
+        directory = version_dir(self.index_path, version)
+        store = load_index(directory)
+        lexical = LexicalIndex.load(directory)
+        elapsed = time.perf_counter() - start
+        self._current = (store, version, lexical)
+        with self._stats_lock:
+            self._loads += 1
+            self._last_load_seconds = elapsed
+            self._total_load_seconds += elapsed
+        print(f"[RAG] Índice carregado de {self.index_path} (versão {version}) em {elapsed * 1000:.1f} ms")
+        return store
+
+    def get_store(self):
+        """Retorna o store atual, recarregando-o se houver uma versão nova em disco."""
+        return self._get_current()[0]
+
+    def _get_current(self):
+        """(store, versão, índice lexical ou None) atuais, recarregando se houver versão nova em disco."""
+        current = self._current
+        store, version, _ = current
+        now = time.monotonic()
+        if store is not None and now - self._last_check < self.reload_check_interval:
+            return current
+        self._last_check = now
+
+        disk_version = self._disk_version()
+        if store is not None and disk_version == version:
+            return current
+
+        if store is None:
+            # Primeira carga: todos precisam esperar pelo índice.
+            with self._reload_lock:
+                if self._current[0] is None:
+                    self._load(self._disk_version())
+                return self._current
+
+        # Recarga: se outra thread já está recarregando, segue com o índice antigo.
+        if not self._reload_lock.acquire(blocking=False):
+            return current
+        try:
+            version = self._current[1]
+            if disk_version != version:
+                try:
+                    self._load(disk_version)
+                except Exception as e:
+                    print(f"ERROR: Falha ao recarregar índice de {self.index_path}: {e}. Mantendo versão {version}.")
+            return self._current
+        finally:
+            self._reload_lock.release()
+
+    def query(self, text: str, k: int = 3):
+        return self._retrieve(text, k, need_embedding=False)[0]
+
+    def query_with_embedding(self, text: str, k: int = 3):
+        """Como query(), mas devolve também o embedding da consulta (usado pelo cache semântico)."""
+        return self._retrieve(text, k, need_embedding=True)
+
+    def _retrieve(self, text: str, k: int, need_embedding: bool):
+        store, _, lexical = self._get_current()
+        if self.mode == "vector":
+            lexical = None
+        start = time.perf_counter()
+        query_embedding = None
+        if lexical is None:
+            docs, query_embedding = self._vector_search(store, text, k)
+        else:
+            result = lexical.search(text, k * HYBRID_CANDIDATES_MULTIPLIER)
+            lexical_ids = [key for key, _ in result.hits]
+            if self.mode == "lexical" or (result.confident and not need_embedding):
+                # Termos exatos com vencedor claro: nenhuma chamada de embedding
+                docs = list(self._docs_by_id(store, lexical_ids[:k]).values())
+                if self.mode == "hybrid":
+                    with self._stats_lock:
+                        self._lexical_fast_path += 1
+            else:
+                vector_docs, query_embedding = self._vector_search(store, text, k * HYBRID_CANDIDATES_MULTIPLIER)
+                by_id = {doc.id: doc for doc in vector_docs}
+                fused = reciprocal_rank_fusion([list(by_id), lexical_ids], k=RRF_K)[:k]
+                by_id.update(self._docs_by_id(store, [key for key in fused if key not in by_id]))
+                docs = [by_id[key] for key in fused if key in by_id]
+            if need_embedding and query_embedding is None:
+                query_embedding = self._embed(store, text)
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self._queries += 1
+            self._total_query_seconds += elapsed
+            self._max_query_seconds = max(self._max_query_seconds, elapsed)
+        return docs, query_embedding
+
+    def _embed(self, store, text: str):
+        with self._stats_lock:
+            self._embedding_calls += 1
+        return store.embedding_function.embed_query(text)
+
+    def _vector_search(self, store, text: str, k: int):
+        query_embedding = self._embed(store, text)
+        return store.similarity_search_by_vector(query_embedding, k=k), query_embedding
+
+    def _docs_by_id(self, store, ids) -> dict:
+        """ID -> documento, na ordem de `ids`. IDs ausentes do docstore ficam de fora (e são contados)."""
+        found = {}
+        for key in ids:
+            doc = store.docstore.search(key)
+            # search() devolve uma string de erro para IDs ausentes
+            if not isinstance(doc, str):
+                found[key] = doc
+        missing = len(ids) - len(found)
+        if missing:
+            version = self._current[1]
+            with self._stats_lock:
+                self._missing_docs += missing
+                warn = self._warned_missing_version != version
+                self._warned_missing_version = version
+            if warn:
+                print(f"WARN: Índice lexical da versão {version} tem IDs ausentes do docstore; ignorando-os nas buscas.")
+        return found
+
+    def stats(self) -> dict:
+        store, version, lexical = self._current
+        with self._stats_lock:
+            return {
+                "index_path": str(self.index_path),
+                "version": version,
+                "loaded": store is not None,
+                "vectors": store.index.ntotal if store is not None else 0,
+                "index_format": (f"mapped:{store.kind}" if hasattr(store, "kind") else "langchain") if store is not None else None,
+                "index_size_bytes": self._index_size_bytes(),
+                "loads": self._loads,
+                "last_load_seconds": self._last_load_seconds,
+                "total_load_seconds": self._total_load_seconds,
+                "queries": self._queries,
+                "avg_query_seconds": self._total_query_seconds / self._queries if self._queries else 0.0,
+                "max_query_seconds": self._max_query_seconds,
+                "mode": self.mode,
+                "lexical_terms": len(lexical.terms) if lexical is not None else 0,
+                "lexical_fast_path": self._lexical_fast_path,
+                "embedding_calls": self._embedding_calls,
+                "missing_docs": self._missing_docs,
+            }
+
+
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
+
+def get_retriever(index_path: Path = None) -> IndexRetriever:
+    """Retorna o IndexRetriever compartilhado do processo para `index_path`."""
+    key = str(Path(index_path) if index_path else INDEX_PATH)
+    retriever = _retrievers.get(key)
+    if retriever is None:
+        with _retrievers_lock:
+            retriever = _retrievers.get(key)
+            if retriever is None:
+                retriever = IndexRetriever(Path(key))
+                _retrievers[key] = retriever
+    return retriever
+
+
 def query_index(text: str, k: int = 3, index_path: Path = None): # Mude o tipo para Path
     """
     Retorna os k documentos mais similares ao `text`, usando o índice especificado.
+    O índice é carregado uma vez por processo (ver IndexRetriever).
     """
-    store = load_index(index_path)
-    return store.similarity_search(text, k=k)
+    return get_retriever(index_path).query(text, k=k)
+
+
+def query_index_with_embedding(text: str, k: int = 3, index_path: Path = None):
+    """Como query_index, mas retorna (documentos, embedding da consulta)."""
+    return get_retriever(index_path).query_with_embedding(text, k=k)
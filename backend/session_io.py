@@ -0,0 +1,265 @@
+"""
+E/S de uma sessão do /ws/voice em tasks separadas, ligadas por filas limitadas:
+
+  leitor       ws.receive() em loop (decodificando os frames do protocolo 1) ->
+               fila de entrada (WS_RECEIVE_QUEUE_SIZE mensagens). Com a fila
+               cheia o leitor espera, e o TCP segura o cliente.
+  processador  o loop do ws_voice, que consome a fila com receive() (VAD,
+               buffers, controle, turnos).
+  escritor     a única task que chama ws.send_*. Turnos, legendas, controle e
+               keepalive entram numa fila (WS_SEND_QUEUE_SIZE) e saem na ordem
+               em que foram enfileirados: envios de tasks diferentes não se
+               intercalam. Fila cheia: quem envia espera (o TTS em streaming
+               anda no ritmo da rede).
+  vigia        dorme até o próximo prazo. Manda {"type": "keepalive"} quando
+               nada foi enviado há WS_KEEPALIVE_SECONDS e encerra a sessão sem
+               mensagens do cliente nem turno em andamento há
+               WS_IDLE_TIMEOUT_SECONDS (0 desliga cada um).
+
+Uma sessão ociosa não acorda o event loop: o leitor e o escritor esperam em
+filas, e o vigia só acorda nos prazos.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Callable, Optional
+
+from fastapi import WebSocketDisconnect
+from starlette.websockets import WebSocketState
+
+from backend import metrics
+from backend.protocol import ProtocolError
+
+WS_RECEIVE_QUEUE_SIZE = int(os.getenv("WS_RECEIVE_QUEUE_SIZE", "64"))
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "128"))
+WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "300"))
+WS_KEEPALIVE_SECONDS = float(os.getenv("WS_KEEPALIVE_SECONDS", "25"))
+# Tempo máximo para o escritor esvaziar a fila no fim da sessão (e para um turno esperar seu último áudio sair)
+WS_CLOSE_FLUSH_SECONDS = 2.0
+# Intervalo mínimo entre duas voltas do vigia (limitado pelos próprios prazos, se menores)
+WATCHDOG_MIN_SLEEP_SECONDS = 1.0
+
+
+class SessionIdle(Exception):
+    """Sem mensagens do cliente nem turno em andamento por WS_IDLE_TIMEOUT_SECONDS."""
+
+
+def _resolve(written: Optional[asyncio.Future], sent: bool):
+    if written is not None and not written.done():
+        written.set_result(sent)
+
+
+async def wait_written(written: Optional[asyncio.Future], timeout: float = WS_CLOSE_FLUSH_SECONDS) -> bool:
+    """Espera o escritor gravar ou descartar um frame de send_bytes(..., trace=...). False se não saiu a tempo."""
+    if written is None:
+        return True
+    try:
+        return await asyncio.wait_for(asyncio.shield(written), timeout)
+    except asyncio.TimeoutError:
+        return False
+
+
+class SessionIO:
+    """
+    Leitor, escritor e vigia de uma WebSocket. Tem a interface que os turnos
+    já usam (send_text, send_bytes, client_state); com `framed`, os envios
+    viram frames do protocolo 1 no momento em que entram na fila, então a
+    numeração e o turno de cada frame seguem a ordem de envio.
+    """
+
+    def __init__(self, ws, framed=None, name: str = "", is_busy: Callable[[], bool] = None,
+                 receive_queue_size: int = WS_RECEIVE_QUEUE_SIZE, send_queue_size: int = WS_SEND_QUEUE_SIZE,
+                 idle_timeout: float = WS_IDLE_TIMEOUT_SECONDS, keepalive: float = WS_KEEPALIVE_SECONDS):
+        self.ws = ws
+        self.framed = framed
+        self.name = name
+        self.is_busy = is_busy or (lambda: False)
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self._min_sleep = min([WATCHDOG_MIN_SLEEP_SECONDS] + [t for t in (idle_timeout, keepalive) if t > 0])
+        self._inbound = asyncio.Queue(receive_queue_size)
+        self._outbound = asyncio.Queue(send_queue_size)
+        self._reader_task = None
+        self._writer_task = None
+        self._watchdog_task = None
+        # Escritor encerrado (erro de envio ou aclose): novos envios falham
+        self._closed = False
+        self.send_error = None
+        self.last_activity = self.last_sent = time.monotonic()
+        self.messages_in = 0
+        self.messages_out = 0
+        self.bytes_out = 0
+        self.keepalives = 0
+        self.max_inbound = 0
+        self.max_outbound = 0
+        self.idle_closed = False
+
+    def start(self):
+        self._reader_task = asyncio.create_task(self._reader())
+        self._writer_task = asyncio.create_task(self._writer())
+        if self.idle_timeout > 0 or self.keepalive > 0:
+            self._watchdog_task = asyncio.create_task(self._watchdog())
+        return self
+
+    @property
+    def client_state(self):
+        return WebSocketState.DISCONNECTED if self._closed else self.ws.client_state
+
+    async def receive(self) -> dict:
+        """Próxima mensagem do cliente; WebSocketDisconnect na desconexão, SessionIdle por ociosidade."""
+        message = await self._inbound.get()
+        # Frames do protocolo 1 chegam já decodificados, sem "type"
+        message_type = message.get("type")
+        if message_type == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        if message_type == "session.idle":
+            raise SessionIdle()
+        return message
+
+    async def send_text(self, text: str):
+        if self.framed is not None:
+            await self._enqueue("bytes", self.framed.frame_text(text))
+        else:
+            await self._enqueue("text", text)
+
+    async def send_bytes(self, data: bytes, trace: metrics.TurnTrace = None) -> Optional[asyncio.Future]:
+        """
+        Com `trace` (áudio de uma resposta), o escritor mede no turno o ws_send
+        e o first_audio da escrita na WebSocket, não o tempo de entrar na fila.
+        Nesse caso devolve um future resolvido quando o frame sai (True) ou é
+        descartado (False): o turno espera por ele antes de fechar o trace.
+        """
+        written = asyncio.get_running_loop().create_future() if trace is not None else None
+        if self.framed is not None:
+            await self._enqueue("bytes", self.framed.frame_audio(data), trace, written)
+        else:
+            await self._enqueue("bytes", data, trace, written)
+        return written
+
+    async def send_json(self, payload: dict):
+        await self.send_text(json.dumps(payload))
+
+    async def _enqueue(self, kind: str, payload, trace: metrics.TurnTrace = None, written: asyncio.Future = None):
+        if self._closed:
+            raise RuntimeError(f"WebSocket de {self.name} fechada: {self.send_error or 'sessão encerrada'}")
+        await self._outbound.put((kind, payload, trace, written))
+        self.max_outbound = max(self.max_outbound, self._outbound.qsize())
+
+    async def _reader(self):
+        try:
+            while True:
+                message = await self.ws.receive()
+                self.last_activity = time.monotonic()
+                if message["type"] == "websocket.disconnect":
+                    await self._inbound.put(message)
+                    return
+                if self.framed is not None and message.get("bytes") is not None:
+                    try:
+                        # Frame do protocolo 1 -> mesma mensagem do modo antigo (PCM decodificado ou JSON)
+                        message = self.framed.decode_incoming(message["bytes"])
+                    except ProtocolError as e:
+                        print(f"WARN: Frame inválido de {self.name} descartado: {e}")
+                        continue
+                self.messages_in += 1
+                await self._inbound.put(message)
+                self.max_inbound = max(self.max_inbound, self._inbound.qsize())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"WARN: Leitura da WebSocket de {self.name} falhou: {e}")
+            await self._inbound.put({"type": "websocket.disconnect", "code": 1006})
+
+    def _discard_outbound(self):
+        while not self._outbound.empty():
+            _, _, _, written = self._outbound.get_nowait()
+            _resolve(written, False)
+
+    async def _writer(self):
+        while True:
+            kind, payload, trace, written = await self._outbound.get()
+            if kind is None:
+                return
+            started = time.perf_counter()
+            try:
+                if kind == "bytes":
+                    await self.ws.send_bytes(payload)
+                else:
+                    await self.ws.send_text(payload)
+            except Exception as e:
+                self._closed = True
+                self.send_error = e
+                print(f"WARN: Envio para {self.name} falhou; descartando {self._outbound.qsize()} mensagem(ns): {e}")
+                _resolve(written, False)
+                # Libera quem está esperando vaga na fila (os próximos envios já falham)
+                self._discard_outbound()
+                return
+            if trace is not None:
+                written_at = time.perf_counter()
+                metrics.observe("ws_send", written_at - started, trace)
+                metrics.observe_first("first_audio", written_at - trace.started_at, trace)
+            _resolve(written, True)
+            self.last_sent = time.monotonic()
+            self.messages_out += 1
+            self.bytes_out += len(payload)
+
+    async def _watchdog(self):
+        while True:
+            deadlines = []
+            if self.keepalive > 0:
+                deadlines.append(self.last_sent + self.keepalive)
+            if self.idle_timeout > 0:
+                deadlines.append(self.last_activity + self.idle_timeout)
+            await asyncio.sleep(max(min(deadlines) - time.monotonic(), self._min_sleep))
+            now = time.monotonic()
+            if self.idle_timeout > 0 and self.is_busy():
+                # O agente ainda está respondendo: o cliente só está ouvindo
+                self.last_activity = now
+            if self.idle_timeout > 0 and now - self.last_activity >= self.idle_timeout:
+                self.idle_closed = True
+                try:
+                    self._inbound.put_nowait({"type": "session.idle"})
+                except asyncio.QueueFull:
+                    pass
+                return
+            if self.keepalive > 0 and now - self.last_sent >= self.keepalive:
+                try:
+                    await self.send_json({"type": "keepalive"})
+                except RuntimeError:
+                    return
+                self.keepalives += 1
+                # Conta como envio já ao entrar na fila (o escritor atualiza de novo ao enviar)
+                self.last_sent = now
+
+    async def aclose(self):
+        """Para o leitor e o vigia e espera o escritor esvaziar a fila (até WS_CLOSE_FLUSH_SECONDS)."""
+        for task in (self._reader_task, self._watchdog_task):
+            if task is not None:
+                task.cancel()
+        writer = self._writer_task
+        if writer is not None and not writer.done():
+            async def flush():
+                await self._outbound.put((None, None, None, None))
+                await writer
+
+            try:
+                await asyncio.wait_for(flush(), WS_CLOSE_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                # wait_for já cancelou o escritor junto com o flush
+                print(f"WARN: Fila de envio de {self.name} não esvaziou em {WS_CLOSE_FLUSH_SECONDS}s; descartando.")
+        self._closed = True
+        self._discard_outbound()
+        await asyncio.gather(*(t for t in (self._reader_task, self._writer_task, self._watchdog_task) if t is not None),
+                             return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "messages_in": self.messages_in,
+            "messages_out": self.messages_out,
+            "bytes_out": self.bytes_out,
+            "keepalives": self.keepalives,
+            "max_inbound_queue": self.max_inbound,
+            "max_outbound_queue": self.max_outbound,
+            "idle_closed": self.idle_closed,
+            "send_error": str(self.send_error) if self.send_error else None,
+        }
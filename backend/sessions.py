@@ -0,0 +1,391 @@
+"""
+Sessões retomáveis do /ws/voice, guardadas fora do processo do worker.
+
+O cliente que conecta com `session=new` (ou com um token) recebe
+{"type": "session", "token": ..., "resumed": ...}. Se a conexão cair, ele
+reconecta com `session=<token>` em qualquer worker, e a conversa continua do
+mesmo ponto. Isso vale para o histórico e o resumo da memória e para o modo de
+resposta.
+
+    SESSION_STORE       memory (padrão, só no processo) | redis (compartilhado entre workers/nós)
+    SESSION_STORE_URL   redis://host:6379/0 (requer o pacote `redis`)
+    SESSION_TTL_SECONDS tempo até uma sessão sem atividade expirar
+
+Não entram na sessão o áudio ainda não processado e o turno em andamento.
+Quando a conexão cai, o turno é cancelado e o histórico só recebe o que o
+cliente ouviu, como no barge-in.
+
+Formato (dump_session): 1 byte de formato + JSON compacto com só o que vai ao
+prompt (resumo + mensagens ainda não resumidas). Acima de
+SESSION_COMPRESS_MIN_BYTES, o JSON é comprimido com zlib.
+
+Cada gravação incrementa a revisão da sessão. Quem retoma uma sessão grava
+uma revisão nova logo ao abrir. Assim uma conexão antiga, que só percebe a
+queda depois, não sobrescreve o estado da conexão nova: ela vê uma revisão
+maior na store e para de gravar. A comparação e a escrita são uma operação só
+da store (compare_and_put), atômica mesmo com as conexões em processos ou nós
+diferentes.
+"""
+import asyncio
+import json
+import math
+import os
+import secrets
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from backend.memory import ConversationMemory, message_tokens, summary_message
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "redis://localhost:6379/0")
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_COMPRESS_MIN_BYTES = int(os.getenv("SESSION_COMPRESS_MIN_BYTES", "1024"))
+# Limite da store em memória (as mais antigas saem primeiro)
+SESSION_MEMORY_MAX_SESSIONS = int(os.getenv("SESSION_MEMORY_MAX_SESSIONS", "10000"))
+SESSION_KEY_PREFIX = os.getenv("SESSION_KEY_PREFIX", "voice:session:")
+
+SESSION_FORMAT_VERSION = 1
+# Retomadas simultâneas do mesmo token: quantas vezes reler a sessão antes de desistir
+SESSION_RESUME_ATTEMPTS = 3
+_FORMAT_JSON = b"j"
+_FORMAT_ZLIB = b"z"
+_ROLE_CODES = {"user": "u", "assistant": "a", "system": "s"}
+_ROLES = {code: role for role, code in _ROLE_CODES.items()}
+
+
+class SessionFormatError(ValueError):
+    pass
+
+
+@dataclass
+class SessionState:
+    user_id: str
+    tts_mode: str = "batch"
+    summary: str = ""
+    messages: List[dict] = field(default_factory=list)
+    revision: int = 0
+    updated_at: float = 0.0
+
+
+def new_session_token() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def state_from_memory(memory: ConversationMemory, user_id: str, tts_mode: str, revision: int = 0) -> SessionState:
+    """Só o que vai ao prompt: as mensagens já resumidas estão no resumo."""
+    messages = [{"role": m["role"], "content": m.get("content") or ""} for m in memory.recent_messages()]
+    return SessionState(user_id, tts_mode, memory.summary, messages, revision, time.time())
+
+
+def restore_memory(memory: ConversationMemory, state: SessionState) -> ConversationMemory:
+    memory[:] = state.messages
+    memory.summary = state.summary
+    memory.summary_tokens = message_tokens(summary_message(state.summary)) if state.summary else 0
+    memory.summarized_count = 0
+    return memory
+
+
+def dump_session(state: SessionState, compress_min_bytes: int = SESSION_COMPRESS_MIN_BYTES) -> bytes:
+    payload = {
+        "v": SESSION_FORMAT_VERSION,
+        "u": state.user_id,
+        "m": state.tts_mode,
+        "s": state.summary,
+        "h": [[_ROLE_CODES.get(m["role"], m["role"]), m["content"]] for m in state.messages],
+        "r": state.revision,
+        "t": round(state.updated_at, 3),
+    }
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(data) >= compress_min_bytes:
+        return _FORMAT_ZLIB + zlib.compress(data, 6)
+    return _FORMAT_JSON + data
+
+
+def load_session(data: bytes) -> SessionState:
+    data = bytes(data)
+    kind, body = data[:1], data[1:]
+    try:
+        if kind == _FORMAT_ZLIB:
+            body = zlib.decompress(body)
+        elif kind != _FORMAT_JSON:
+            raise SessionFormatError(f"formato de sessão desconhecido: {kind!r}")
+        payload = json.loads(body)
+    except (zlib.error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise SessionFormatError(f"sessão corrompida: {e}") from e
+    if payload.get("v") != SESSION_FORMAT_VERSION:
+        raise SessionFormatError(f"versão de sessão não suportada: {payload.get('v')}")
+    messages = [{"role": _ROLES.get(role, role), "content": content} for role, content in payload["h"]]
+    return SessionState(payload["u"], payload["m"], payload["s"], messages, payload["r"], payload["t"])
+
+
+class SessionStore:
+    """Bytes por token, com TTL. As implementações só guardam; o formato é de dump_session/load_session."""
+
+    name = "session-store"
+
+    async def get(self, token: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def put(self, token: str, data: bytes, ttl_seconds: float = SESSION_TTL_SECONDS):
+        raise NotImplementedError
+
+    async def compare_and_put(self, token: str, data: bytes, revision: int,
+                              ttl_seconds: float = SESSION_TTL_SECONDS) -> bool:
+        """Grava `data` com `revision` só se a revisão guardada for menor, numa operação atômica. False se não gravou."""
+        raise NotImplementedError
+
+    async def delete(self, token: str):
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class InMemorySessionStore(SessionStore):
+    """Só no processo: sobrevive a reconexões no mesmo worker (não a reinícios nem a outro worker)."""
+
+    name = "memory"
+
+    def __init__(self, max_sessions: int = SESSION_MEMORY_MAX_SESSIONS, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, bytes, Optional[int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def _drop(self, token: str):
+        _, data, _ = self._entries.pop(token)
+        self.bytes -= len(data)
+
+    def _live_entry(self, token: str):
+        entry = self._entries.get(token)
+        if entry is not None and entry[0] <= self.clock():
+            self._drop(token)
+            self.expired += 1
+            return None
+        return entry
+
+    def _put(self, token: str, data: bytes, ttl_seconds: float, revision: Optional[int]):
+        if token in self._entries:
+            self._drop(token)
+        self._entries[token] = (self.clock() + ttl_seconds, bytes(data), revision)
+        self.bytes += len(data)
+        while len(self._entries) > self.max_sessions:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def get(self, token: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._live_entry(token)
+            return entry[1] if entry is not None else None
+
+    async def put(self, token: str, data: bytes, ttl_seconds: float = SESSION_TTL_SECONDS):
+        with self._lock:
+            self._put(token, data, ttl_seconds, None)
+
+    async def compare_and_put(self, token: str, data: bytes, revision: int,
+                              ttl_seconds: float = SESSION_TTL_SECONDS) -> bool:
+        with self._lock:
+            entry = self._live_entry(token)
+            if entry is not None and entry[2] is not None and entry[2] >= revision:
+                return False
+            self._put(token, data, ttl_seconds, revision)
+            return True
+
+    async def delete(self, token: str):
+        with self._lock:
+            if token in self._entries:
+                self._drop(token)
+
+    def stats(self) -> dict:
+        return {"store": self.name, "sessions": len(self._entries), "bytes": self.bytes,
+                "expired": self.expired, "evictions": self.evictions}
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Store compartilhada entre workers e nós. `client` é um cliente assíncrono
+    com a interface do redis.asyncio.Redis (get, set com `ex`, delete, eval);
+    o TTL fica a cargo do Redis. A revisão de cada sessão fica numa chave ao
+    lado (<chave>:rev), com o mesmo TTL, e o compare_and_put é um script Lua:
+    o Redis o executa inteiro, sem outro comando no meio.
+    """
+
+    name = "redis"
+    REVISION_SUFFIX = ":rev"
+    COMPARE_AND_PUT_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[2]) or '-1')
+if current >= tonumber(ARGV[2]) then
+  return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+    def __init__(self, client, prefix: str = SESSION_KEY_PREFIX):
+        self.client = client
+        self.prefix = prefix
+        self.gets = 0
+        self.hits = 0
+        self.puts = 0
+        self.conflicts = 0
+        self.bytes_written = 0
+
+    async def get(self, token: str) -> Optional[bytes]:
+        self.gets += 1
+        data = await self.client.get(self.prefix + token)
+        if data is not None:
+            self.hits += 1
+        return data
+
+    async def put(self, token: str, data: bytes, ttl_seconds: float = SESSION_TTL_SECONDS):
+        self.puts += 1
+        self.bytes_written += len(data)
+        await self.client.set(self.prefix + token, bytes(data), ex=max(1, math.ceil(ttl_seconds)))
+
+    async def compare_and_put(self, token: str, data: bytes, revision: int,
+                              ttl_seconds: float = SESSION_TTL_SECONDS) -> bool:
+        key = self.prefix + token
+        stored = await self.client.eval(self.COMPARE_AND_PUT_SCRIPT, 2, key, key + self.REVISION_SUFFIX,
+                                        bytes(data), revision, max(1, math.ceil(ttl_seconds)))
+        if not stored:
+            self.conflicts += 1
+            return False
+        self.puts += 1
+        self.bytes_written += len(data)
+        return True
+
+    async def delete(self, token: str):
+        key = self.prefix + token
+        await self.client.delete(key, key + self.REVISION_SUFFIX)
+
+    async def aclose(self):
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+
+    def stats(self) -> dict:
+        return {"store": self.name, "gets": self.gets, "hits": self.hits, "puts": self.puts,
+                "conflicts": self.conflicts, "bytes_written": self.bytes_written}
+
+
+def create_session_store(name: str = None, url: str = None) -> SessionStore:
+    name = name or SESSION_STORE
+    if name == "memory":
+        return InMemorySessionStore()
+    if name == "redis":
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as e:
+            raise ValueError("SESSION_STORE=redis requer o pacote `redis` (pip install redis)") from e
+        return RedisSessionStore(redis_asyncio.from_url(url or SESSION_STORE_URL))
+    raise ValueError(f"Store de sessões desconhecida: {name}")
+
+
+class ResumableSession:
+    """Uma sessão aberta por uma conexão: grava o estado após cada turno e ao desconectar."""
+
+    def __init__(self, store: SessionStore, token: str, user_id: str, revision: int = 0,
+                 ttl_seconds: float = SESSION_TTL_SECONDS):
+        self.store = store
+        self.token = token
+        self.user_id = user_id
+        self.revision = revision
+        self.ttl_seconds = ttl_seconds
+        self.resumed = False
+        # Outra conexão retomou a sessão: esta não grava mais
+        self.superseded = False
+        # Fim de sessão pedido pelo cliente: o estado foi apagado
+        self.ended = False
+        self.saves = 0
+        self.last_size = 0
+        self._lock = asyncio.Lock()
+        self._tasks = set()
+
+    @classmethod
+    async def open(cls, store: SessionStore, requested: str, user_id: str,
+                   ttl_seconds: float = SESSION_TTL_SECONDS) -> Tuple["ResumableSession", Optional[SessionState]]:
+        """`requested`: "new" ou o token de uma sessão anterior. Token expirado, inválido ou de outro usuário abre uma nova."""
+        if requested and requested != "new":
+            for _ in range(SESSION_RESUME_ATTEMPTS):
+                state = None
+                try:
+                    data = await store.get(requested)
+                    state = load_session(data) if data is not None else None
+                except SessionFormatError as e:
+                    print(f"WARN: Sessão {requested[:8]}… ignorada: {e}")
+                if state is None:
+                    break
+                if state.user_id != user_id:
+                    print(f"WARN: Sessão {requested[:8]}… pertence a outro usuário; abrindo uma nova para {user_id}.")
+                    break
+                session = cls(store, requested, user_id, state.revision + 1, ttl_seconds)
+                session.resumed = True
+                # Assume a sessão: uma conexão antiga que ainda grave vai ver a revisão nova e parar
+                state.revision = session.revision
+                state.updated_at = time.time()
+                if await store.compare_and_put(requested, dump_session(state), session.revision, ttl_seconds):
+                    return session, state
+                # Outra conexão retomou o mesmo token entre a leitura e a escrita: relê o estado dela
+        return cls(store, new_session_token(), user_id, 0, ttl_seconds), None
+
+    def announcement(self, memory: ConversationMemory) -> dict:
+        return {"type": "session", "token": self.token, "resumed": self.resumed, "messages": len(memory),
+                "has_summary": bool(memory.summary)}
+
+    async def save(self, memory: ConversationMemory, tts_mode: str) -> bool:
+        async with self._lock:
+            if self.ended or self.superseded:
+                return False
+            try:
+                data = dump_session(state_from_memory(memory, self.user_id, tts_mode, self.revision + 1))
+                stored = await self.store.compare_and_put(self.token, data, self.revision + 1, self.ttl_seconds)
+            except Exception as e:
+                # Sem gravar, a sessão só deixa de ser retomável; a conversa em si continua
+                print(f"ERROR: Falha ao gravar a sessão de {self.user_id}: {e}")
+                return False
+            if not stored:
+                self.superseded = True
+                print(f"INFO: Sessão {self.token[:8]}… retomada por outra conexão; esta não grava mais.")
+                return False
+            self.revision += 1
+            self.saves += 1
+            self.last_size = len(data)
+            return True
+
+    def schedule_save(self, memory: ConversationMemory, tts_mode: str) -> asyncio.Task:
+        """Para callbacks síncronos (fim de turno): grava em background, uma gravação por vez."""
+        task = asyncio.create_task(self.save(memory, tts_mode))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def end(self):
+        """Fim de sessão pedido pelo cliente: nada para retomar."""
+        async with self._lock:
+            self.ended = True
+            if not self.superseded:
+                try:
+                    await self.store.delete(self.token)
+                except Exception as e:
+                    print(f"ERROR: Falha ao apagar a sessão de {self.user_id}: {e}")
+
+    async def aclose(self, memory: ConversationMemory, tts_mode: str):
+        """Ao desconectar: espera as gravações pendentes e grava o estado final."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.save(memory, tts_mode)
+
+    def stats(self) -> dict:
+        return {"token": self.token[:8], "resumed": self.resumed, "revision": self.revision, "saves": self.saves,
+                "bytes": self.last_size, "superseded": self.superseded, "ended": self.ended}
@@ -0,0 +1,146 @@
+import asyncio
+import re
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+# Fim de sentença: pontuação forte seguida de espaço (não quebra "3.5mm").
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s")
+# Fim de oração: usado só quando o segmento já está longo demais.
+_CLAUSE_END = re.compile(r"[,;:]\s")
+
+
+class SentenceSegmenter:
+    """
+    Acumula os deltas de texto do LLM e devolve segmentos (sentenças ou,
+    se a sentença for longa demais, orações) prontos para enviar ao TTS.
+    """
+
+    def __init__(self, min_chars: int = 12, max_chars: int = 160):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        self._buffer += delta
+        segments = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            segment = self._buffer[:cut].strip()
+            self._buffer = self._buffer[cut:]
+            if segment:
+                segments.append(segment)
+        return segments
+
+    def flush(self) -> Optional[str]:
+        segment = self._buffer.strip()
+        self._buffer = ""
+        return segment or None
+
+    def _find_cut(self) -> Optional[int]:
+        for match in _SENTENCE_END.finditer(self._buffer):
+            if match.end() >= self.min_chars:
+                return match.end()
+        if len(self._buffer) > self.max_chars:
+            cut = None
+            for match in _CLAUSE_END.finditer(self._buffer, 0, self.max_chars):
+                if match.end() >= self.min_chars:
+                    cut = match.end()
+            if cut is None:
+                # Sem pontuação: corta no último espaço antes do limite.
+                space = self._buffer.rfind(" ", self.min_chars, self.max_chars)
+                cut = space + 1 if space > 0 else self.max_chars
+            return cut
+        return None
+
+
+async def aclose_quietly(stream):
+    """Fecha um async generator (e a requisição HTTP por trás dele) sem esperar o GC."""
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+async def segment_text_stream(deltas: AsyncIterator[str], segmenter: SentenceSegmenter = None) -> AsyncIterator[str]:
+    """Transforma um stream de deltas de texto num stream de segmentos."""
+    segmenter = segmenter or SentenceSegmenter()
+    try:
+        async for delta in deltas:
+            for segment in segmenter.feed(delta):
+                yield segment
+    finally:
+        await aclose_quietly(deltas)
+    tail = segmenter.flush()
+    if tail:
+        yield tail
+
+
+_SEGMENT_DONE = object()
+
+
+async def stream_segments_audio(
+    segments: AsyncIterator[str],
+    synthesize: Callable[[str], AsyncIterator[bytes]],
+    on_audio: Callable[[int, bytes], Awaitable[None]],
+    on_segment_end: Callable[[int, str], Awaitable[None]] = None,
+    max_parallel_segments: int = 2,
+) -> List[str]:
+    """
+    Envia cada segmento ao TTS assim que ele fica pronto e repassa os chunks de
+    áudio na ordem dos segmentos. Até `max_parallel_segments` sínteses rodam ao
+    mesmo tempo; os chunks de segmentos adiantados ficam em fila até a vez deles.
+    Retorna a lista de segmentos cujo áudio foi totalmente entregue. Se a tarefa
+    for cancelada (barge-in), o LLM e as sínteses em andamento são encerrados.
+    """
+    slots = asyncio.Semaphore(max_parallel_segments)
+    pending: "asyncio.Queue" = asyncio.Queue()
+    tasks = []
+
+    async def render(text: str, out: asyncio.Queue):
+        audio = synthesize(text)
+        try:
+            async for chunk in audio:
+                if chunk:
+                    await out.put(chunk)
+        finally:
+            await aclose_quietly(audio)
+            await out.put(_SEGMENT_DONE)
+            slots.release()
+
+    async def produce():
+        try:
+            async for text in segments:
+                await slots.acquire()
+                out: asyncio.Queue = asyncio.Queue()
+                tasks.append(asyncio.create_task(render(text, out)))
+                await pending.put((text, out))
+        finally:
+            await aclose_quietly(segments)
+            await pending.put(None)
+
+    producer = asyncio.create_task(produce())
+    delivered = []
+    try:
+        index = 0
+        while True:
+            item = await pending.get()
+            if item is None:
+                break
+            text, out = item
+            while True:
+                chunk = await out.get()
+                if chunk is _SEGMENT_DONE:
+                    break
+                await on_audio(index, chunk)
+            delivered.append(text)
+            if on_segment_end:
+                await on_segment_end(index, text)
+            index += 1
+        await producer
+        for task in tasks:
+            await task  # propaga erros de síntese
+    finally:
+        for task in [producer, *tasks]:
+            if not task.done():
+                task.cancel()
+    return delivered
@@ -1,42 +1,27 @@
-import os
-from pathlib import Path
-from dotenv import load_dotenv
+import threading
 
-dotenv_path = Path(__file__).parent / '.env'
-load_dotenv(dotenv_path=dotenv_path)
+from backend.providers import create_tts_provider
 
-from elevenlabs.client import AsyncElevenLabs
-from elevenlabs.types import Voice, VoiceSettings
+# Mesmo provedor (e voz) do agente: TTS_PROVIDER e ELEVENLABS_* em backend/providers.
+# Criado na primeira síntese: importar este módulo não carrega o SDK nem exige as credenciais.
+tts_provider = None
+_provider_lock = threading.Lock()
 
-ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 
-elevenlabs_client = None
-if ELEVENLABS_API_KEY:
-    try:
-        elevenlabs_client = AsyncElevenLabs(api_key=ELEVENLABS_API_KEY)
-        print("DEBUG TTS: Cliente AsyncElevenLabs inicializado com sucesso.")
-    except Exception as e:
-        print(f"ERROR: Erro ao inicializar cliente AsyncElevenLabs: {e}")
-else:
-    print("AVISO: ELEVENLABS_API_KEY não definida. O TTS ElevenLabs não funcionará.")
+def get_tts_provider():
+    global tts_provider
+    if tts_provider is None:
+        with _provider_lock:
+            if tts_provider is None:
+                tts_provider = create_tts_provider()
+    return tts_provider
+
 
 async def synthesize_tts(text: str) -> bytes:
-    if not elevenlabs_client:
-        print("ERROR: Cliente ElevenLabs não inicializado. Verifique a API Key.")
-        return b""
-    
+    """Síntese avulsa, fora do WebSocket (sem o cache de TTS do servidor)."""
+    provider = get_tts_provider()
     try:
-        audio_bytes = elevenlabs_client.text_to_speech.convert(
-            voice_id="GnDrTQvdzZ7wqAKfLzVQ",
-            output_format="mp3_44100_128",
-            text=text,
-            model_id="eleven_multilingual_v2",
-        )
-        all_audio_bytes = b""
-        async for chunk in audio_bytes:
-            all_audio_bytes += chunk
-            
-        return all_audio_bytes
+        return b"".join([chunk async for chunk in provider.synthesize_stream(text)])
     except Exception as e:
-        print(f"ERROR: Erro ao gerar áudio com ElevenLabs: {e}")
+        print(f"ERROR: Erro ao gerar áudio com o TTS ({provider.name}): {e}")
         return b""
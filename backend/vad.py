@@ -0,0 +1,173 @@
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+SPEECH_START = "speech_start"
+END_OF_SPEECH = "end_of_speech"
+
+# Configuração padrão do endpointer do servidor (sobrescrevível por ambiente)
+SERVER_VAD_TRAILING_SILENCE_MS = int(os.getenv("SERVER_VAD_TRAILING_SILENCE_MS", "300"))
+SERVER_VAD_MARGIN_DB = float(os.getenv("SERVER_VAD_MARGIN_DB", "8"))
+
+
+class StreamingEndpointer:
+    """
+    Detector incremental de início/fim de fala sobre PCM int16 mono.
+
+    Para cada frame (10 ms por padrão) calcula, de forma vetorizada com NumPy,
+    a energia em dBFS (suavizada em 30 ms) e a taxa de cruzamentos por zero. Um
+    frame é "voz" quando a energia fica `margin_db` acima do piso de ruído e a
+    ZCR é baixa (ruído branco/chiado tem ZCR alta). O piso de ruído é adaptativo:
+    um percentil baixo da energia dos frames fora de fala numa janela deslizante,
+    então acompanha mudanças no ruído ambiente sem ser contaminado pela fala.
+
+    `feed()` devolve eventos (tipo, instante_em_ms):
+      * SPEECH_START depois de `min_speech_ms` de voz contínua;
+      * END_OF_SPEECH depois de `trailing_silence_ms` sem voz, se a fala durou
+        ao menos `min_utterance_ms` com algum trecho contínuo de voz de
+        `min_voiced_run_ms` (estalos e ruídos curtos são descartados), ou quando
+        a fala passa de `max_utterance_ms`.
+    Pausas curtas dentro da fala (até `hangover_ms`) não zeram a contagem de voz.
+    """
+
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = 10,
+                 trailing_silence_ms: int = SERVER_VAD_TRAILING_SILENCE_MS,
+                 min_speech_ms: int = 60, min_utterance_ms: int = 200, min_voiced_run_ms: int = 100,
+                 hangover_ms: int = 80,
+                 margin_db: float = SERVER_VAD_MARGIN_DB, absolute_threshold_db: float = -55.0,
+                 zcr_max: float = 0.4, noise_window_ms: int = 2000, noise_percentile: float = 20.0,
+                 calibration_ms: int = 200, max_utterance_ms: int = 30000):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.trailing_silence_ms = trailing_silence_ms
+        self.margin_db = margin_db
+        self.absolute_threshold_db = absolute_threshold_db
+        self.zcr_max = zcr_max
+        self.noise_percentile = noise_percentile
+        self._trailing_frames = max(1, trailing_silence_ms // frame_ms)
+        self._min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self._min_utterance_frames = max(1, min_utterance_ms // frame_ms)
+        self._min_voiced_run_frames = max(1, min_voiced_run_ms // frame_ms)
+        self._hangover_frames = hangover_ms // frame_ms
+        self._calibration_frames = calibration_ms // frame_ms
+        self._max_utterance_frames = max_utterance_ms // frame_ms
+        self._noise_window = np.full(max(1, noise_window_ms // frame_ms), np.inf, dtype=np.float32)
+        self.reset_stream()
+
+    def reset_stream(self):
+        """Zera todo o estado (nova sessão)."""
+        self._remainder = b""
+        self._frame_index = 0
+        self._noise_window.fill(np.inf)
+        self._noise_writes = 0
+        self._noise_floor_db = self.absolute_threshold_db
+        self._energy_tail = np.full(2, 1e-10)
+        self.reset_utterance()
+
+    def reset_utterance(self):
+        """Descarta a fala em andamento (ex.: o turno foi disparado por outro meio)."""
+        self.in_speech = False
+        self._speech_run = 0
+        self._gap_run = 0
+        self._utterance_frames = 0
+        self._silence_run = 0
+        self._voiced_run = 0
+        self._longest_voiced_run = 0
+
+    @property
+    def noise_floor_db(self) -> float:
+        return self._noise_floor_db
+
+    @property
+    def speech_ms(self) -> int:
+        """Duração da fala em andamento (0 fora de fala); usada para decidir o barge-in."""
+        return self._utterance_frames * self.frame_ms if self.in_speech else 0
+
+    @property
+    def elapsed_ms(self) -> int:
+        return self._frame_index * self.frame_ms
+
+    def frame_features(self, samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Energia (dBFS) e ZCR de cada frame; `samples` tem formato (n_frames, frame_samples)."""
+        x = samples.astype(np.float32) / 32768.0
+        energy_db = 10.0 * np.log10(np.mean(x * x, axis=1) + 1e-10)
+        signs = np.signbit(x)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame_samples - 1)
+        return energy_db, zcr
+
+    def feed(self, pcm: bytes) -> List[Tuple[str, int]]:
+        data = self._remainder + bytes(pcm) if self._remainder else bytes(pcm)
+        frame_bytes = self.frame_samples * 2
+        n_frames = len(data) // frame_bytes
+        self._remainder = data[n_frames * frame_bytes:]
+        if n_frames == 0:
+            return []
+
+        samples = np.frombuffer(data, dtype="<i2", count=n_frames * self.frame_samples).reshape(n_frames, self.frame_samples)
+        energy_db, zcr = self.frame_features(samples)
+
+        # Suaviza a energia em 3 frames (30 ms): reduz a variância do ruído de fundo
+        linear = np.concatenate((self._energy_tail, 10.0 ** (energy_db / 10.0)))
+        smoothed_db = 10.0 * np.log10(np.convolve(linear, np.ones(3) / 3, mode="valid") + 1e-10)
+        self._energy_tail = linear[-2:]
+
+        threshold = max(self.absolute_threshold_db, self._noise_floor_db + self.margin_db)
+        is_voice = (smoothed_db > threshold) & (zcr < self.zcr_max)
+
+        events = []
+        in_speech_mask = np.zeros(n_frames, dtype=bool)
+        for i, voice in enumerate(is_voice.tolist()):
+            self._frame_index += 1
+            if self._frame_index <= self._calibration_frames:
+                continue
+            in_speech_mask[i] = self.in_speech or voice
+            event = self._step(voice)
+            if event:
+                events.append((event, self.elapsed_ms))
+
+        # Piso de ruído: percentil baixo da energia dos frames fora de fala numa
+        # janela deslizante. Recalculado uma vez por chunk, não por frame, para
+        # manter baixo o custo por sessão.
+        background = smoothed_db[~in_speech_mask][-self._noise_window.size:]
+        if background.size:
+            window = self._noise_window
+            positions = (self._noise_writes + np.arange(background.size)) % window.size
+            window[positions] = background
+            self._noise_writes += background.size
+            self._noise_floor_db = float(np.percentile(window[:min(self._noise_writes, window.size)], self.noise_percentile))
+        return events
+
+    def _step(self, is_voice: bool):
+        if is_voice:
+            self._silence_run = 0
+            self._gap_run = 0
+            self._speech_run += 1
+            self._voiced_run += 1
+            self._longest_voiced_run = max(self._longest_voiced_run, self._voiced_run)
+            if self.in_speech:
+                self._utterance_frames += 1
+                if self._utterance_frames >= self._max_utterance_frames:
+                    self.reset_utterance()
+                    return END_OF_SPEECH
+            elif self._speech_run >= self._min_speech_frames:
+                self.in_speech = True
+                self._utterance_frames = self._speech_run
+                return SPEECH_START
+            return None
+
+        # Frame sem voz
+        self._voiced_run = 0
+        self._gap_run += 1
+        if self._gap_run > self._hangover_frames:
+            self._speech_run = 0
+        if not self.in_speech:
+            return None
+        self._silence_run += 1
+        if self._silence_run >= self._trailing_frames:
+            long_enough = (self._utterance_frames >= self._min_utterance_frames
+                           and self._longest_voiced_run >= self._min_voiced_run_frames)
+            self.reset_utterance()
+            return END_OF_SPEECH if long_enough else None
+        return None
@@ -0,0 +1,311 @@
+"""
+Formato nativo do índice do RAG, lido por mmap e sem pickle.
+
+O FAISS.save_local do LangChain grava o docstore com pickle. Para carregar,
+é preciso allow_dangerous_deserialization=True, e cada worker fica com uma
+cópia inteira em RAM. Aqui o índice vira arquivos planos, abertos por mmap:
+
+  vectors.faiss       índice FAISS (flat, sq8, ivf_sq8 ou ivf_pq) lido com IO_FLAG_MMAP_IFC
+  chunks.bin          texto dos chunks em UTF-8, concatenado
+  chunk_offsets.npy   início de cada chunk em chunks.bin (int64, len = chunks + 1)
+  chunk_ids.npy       ID de cada chunk no docstore, na ordem dos vetores (bytes de largura fixa)
+  chunk_id_order.npy  permutação que ordena chunk_ids (busca por ID com np.searchsorted)
+  chunk_metadata.npy  índice de cada chunk na lista de metadados distintos de store.json
+  store.json          versão do formato, tipo do índice, métrica, dimensão e metadados distintos
+
+Carregar só mapeia os arquivos; as páginas entram na memória conforme as
+buscas as tocam e ficam no page cache, compartilhadas por todos os workers.
+Tipos do índice (RAG_INDEX_KIND):
+
+  flat     vetores float32, busca exata (o mesmo resultado do índice do LangChain)
+  sq8      um byte por dimensão (4x menor), recall perto de 1
+  ivf_sq8  sq8 com listas invertidas: só RAG_IVF_NPROBE listas são varridas por busca
+  ivf_pq   product quantization (RAG_PQ_M bytes por vetor), para catálogos muito grandes
+
+Para converter um índice existente (o load do LangChain ainda usa pickle:
+converta só índices gerados por você):
+
+    python -m backend.vector_store --src backend/faiss_index --dst backend/faiss_index --kind sq8
+"""
+import argparse
+import json
+import math
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+STORE_FORMAT_VERSION = 1
+STORE_META_FILENAME = "store.json"
+VECTORS_FILENAME = "vectors.faiss"
+CHUNKS_FILENAME = "chunks.bin"
+CHUNK_OFFSETS_FILENAME = "chunk_offsets.npy"
+CHUNK_IDS_FILENAME = "chunk_ids.npy"
+CHUNK_ID_ORDER_FILENAME = "chunk_id_order.npy"
+CHUNK_METADATA_FILENAME = "chunk_metadata.npy"
+STORE_FILENAMES = (VECTORS_FILENAME, CHUNKS_FILENAME, CHUNK_OFFSETS_FILENAME, CHUNK_IDS_FILENAME,
+                   CHUNK_ID_ORDER_FILENAME, CHUNK_METADATA_FILENAME, STORE_META_FILENAME)
+
+INDEX_KINDS = ("flat", "sq8", "ivf_sq8", "ivf_pq")
+# Sem RAG_INDEX_KIND, um rebuild mantém o tipo do índice publicado (e um índice novo é flat)
+RAG_INDEX_KIND = os.getenv("RAG_INDEX_KIND")
+RAG_IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "16"))
+# Bytes por vetor no ivf_pq (0: dimensão / 16, ajustado para um divisor da dimensão)
+RAG_PQ_M = int(os.getenv("RAG_PQ_M", "0"))
+# Abaixo disso o treino do IVF/PQ não tem amostras suficientes: o índice fica sq8
+IVF_MIN_VECTORS = 10_000
+
+
+class StoreFormatError(ValueError):
+    """Diretório sem o formato nativo ou de uma versão que este código não lê."""
+
+
+def is_mapped_store(directory: Path) -> bool:
+    return (Path(directory) / STORE_META_FILENAME).exists()
+
+
+def resolve_kind(directory: Path, kind: str = None) -> str:
+    """Tipo do índice a gravar: o pedido, o de RAG_INDEX_KIND, o do índice já publicado ou flat."""
+    if kind or RAG_INDEX_KIND:
+        return kind or RAG_INDEX_KIND
+    try:
+        meta = json.loads((Path(directory) / STORE_META_FILENAME).read_text(encoding="utf-8"))
+        return meta.get("requested_kind") or meta["kind"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return "flat"
+
+
+def _pq_m(dim: int) -> int:
+    m = RAG_PQ_M or max(1, dim // 16)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def build_faiss_index(vectors: np.ndarray, kind: str, metric: str):
+    """Índice FAISS do tipo `kind` com os vetores (float32, uma linha por chunk) já adicionados."""
+    import faiss
+
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Tipo de índice desconhecido: {kind} (use um de {INDEX_KINDS})")
+    n, dim = vectors.shape
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+    if kind.startswith("ivf") and n < IVF_MIN_VECTORS:
+        print(f"AVISO: {n} vetores são poucos para treinar o {kind}; usando sq8.")
+        kind = "sq8"
+    if kind == "flat":
+        index = faiss.IndexFlatIP(dim) if metric == "ip" else faiss.IndexFlatL2(dim)
+    elif kind == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss_metric)
+    else:
+        nlist = int(min(max(4 * math.sqrt(n), 16), n // 39))
+        quantizer = faiss.IndexFlatIP(dim) if metric == "ip" else faiss.IndexFlatL2(dim)
+        if kind == "ivf_sq8":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, faiss.ScalarQuantizer.QT_8bit, faiss_metric)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim), 8, faiss_metric)
+    if not index.is_trained and n:
+        index.train(vectors)
+    if n:
+        index.add(vectors)
+    return index, kind
+
+
+def write_mapped_store(directory: Path, vectors: np.ndarray, ids: List[str], texts: List[str], metadatas: List[dict],
+                       kind: str = "flat", metric: str = "l2", normalize_L2: bool = False,
+                       embedding_model: str = None) -> dict:
+    """Grava o formato nativo em `directory` (rag.save_index cuida da publicação atômica)."""
+    import faiss
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if len(ids) != len(vectors) or len(texts) != len(vectors) or len(metadatas) != len(vectors):
+        raise ValueError("Vetores, IDs, textos e metadados precisam ter o mesmo tamanho")
+    if normalize_L2 and len(vectors):
+        faiss.normalize_L2(vectors)
+    index, built_kind = build_faiss_index(vectors, kind, metric)
+    faiss.write_index(index, str(directory / VECTORS_FILENAME))
+
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    with open(directory / CHUNKS_FILENAME, "wb") as f:
+        for data in encoded:
+            f.write(data)
+    np.save(directory / CHUNK_OFFSETS_FILENAME, offsets)
+
+    id_bytes = np.array([str(key).encode("utf-8") for key in ids], dtype=bytes)
+    if id_bytes.dtype.itemsize == 0:
+        id_bytes = id_bytes.astype("S1")
+    np.save(directory / CHUNK_IDS_FILENAME, id_bytes)
+    np.save(directory / CHUNK_ID_ORDER_FILENAME, np.argsort(id_bytes, kind="stable").astype(np.int64))
+
+    # Metadados se repetem (um "source" por arquivo): só os distintos vão para o JSON
+    distinct, positions = [], {}
+    metadata_ids = np.zeros(len(metadatas), dtype=np.int32)
+    for i, metadata in enumerate(metadatas):
+        key = json.dumps(metadata or {}, sort_keys=True, ensure_ascii=False)
+        if key not in positions:
+            positions[key] = len(distinct)
+            distinct.append(metadata or {})
+        metadata_ids[i] = positions[key]
+    np.save(directory / CHUNK_METADATA_FILENAME, metadata_ids)
+
+    meta = {
+        "format_version": STORE_FORMAT_VERSION,
+        "kind": built_kind,
+        "requested_kind": kind,
+        "metric": metric,
+        "normalize_L2": normalize_L2,
+        "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        "chunks": len(ids),
+        "embedding_model": embedding_model,
+        "metadatas": distinct,
+    }
+    (directory / STORE_META_FILENAME).write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+    return meta
+
+
+def write_from_langchain(store, directory: Path, kind: str = "flat") -> dict:
+    """Converte um FAISS do LangChain (em memória) para o formato nativo, sem reembeddar nada."""
+    from langchain_community.vectorstores.utils import DistanceStrategy
+
+    n = store.index.ntotal
+    # O LangChain usa IndexFlat: a reconstrução devolve os vetores exatos
+    vectors = store.index.reconstruct_n(0, n) if n else np.zeros((0, store.index.d), dtype=np.float32)
+    ids = [store.index_to_docstore_id[i] for i in range(n)]
+    docs = [store.docstore.search(key) for key in ids]
+    metric = "ip" if store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT else "l2"
+    return write_mapped_store(
+        directory, vectors, ids, [doc.page_content for doc in docs], [doc.metadata for doc in docs], kind=kind,
+        metric=metric, normalize_L2=bool(getattr(store, "_normalize_L2", False)),
+        embedding_model=getattr(store.embedding_function, "model", None),
+    )
+
+
+class MappedDocstore:
+    """Docstore somente leitura sobre os arquivos mapeados, com a interface usada do InMemoryDocstore."""
+
+    def __init__(self, store: "MappedVectorStore"):
+        self._store = store
+
+    def search(self, key: str):
+        position = self._store.position_of(key)
+        if position is None:
+            # Mesmo contrato do InMemoryDocstore: string de erro para IDs ausentes
+            return f"ID {key} not found."
+        return self._store.document(position)
+
+
+class MappedVectorStore:
+    """
+    Índice nativo aberto por mmap. Expõe o que o IndexRetriever usa do FAISS
+    do LangChain: `index`, `docstore.search`, `embedding_function` e
+    similarity_search_by_vector.
+    """
+
+    def __init__(self, directory: Path, embedding_function=None, nprobe: int = RAG_IVF_NPROBE):
+        import faiss
+
+        self.directory = Path(directory)
+        try:
+            self.meta = json.loads((self.directory / STORE_META_FILENAME).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise StoreFormatError(f"{self.directory} não tem {STORE_META_FILENAME}") from None
+        if self.meta.get("format_version") != STORE_FORMAT_VERSION:
+            raise StoreFormatError(f"Versão do formato não suportada: {self.meta.get('format_version')}")
+        self.embedding_function = embedding_function
+        self.index = faiss.read_index(str(self.directory / VECTORS_FILENAME),
+                                      faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        if self.meta["kind"].startswith("ivf"):
+            faiss.extract_index_ivf(self.index).nprobe = nprobe
+        self._offsets = np.load(self.directory / CHUNK_OFFSETS_FILENAME, mmap_mode="r")
+        self._ids = np.load(self.directory / CHUNK_IDS_FILENAME, mmap_mode="r")
+        self._id_order = np.load(self.directory / CHUNK_ID_ORDER_FILENAME, mmap_mode="r")
+        self._metadata_ids = np.load(self.directory / CHUNK_METADATA_FILENAME, mmap_mode="r")
+        # np.memmap não aceita arquivo vazio (índice sem chunks)
+        chunks_path = self.directory / CHUNKS_FILENAME
+        self._text = np.memmap(chunks_path, dtype=np.uint8, mode="r") if chunks_path.stat().st_size else b""
+        self._metadatas = self.meta["metadatas"]
+        self.docstore = MappedDocstore(self)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def kind(self) -> str:
+        return self.meta["kind"]
+
+    def position_of(self, key: str) -> Optional[int]:
+        target = np.bytes_(str(key).encode("utf-8"))
+        i = int(np.searchsorted(self._ids, target, sorter=self._id_order))
+        if i < len(self._id_order):
+            position = int(self._id_order[i])
+            if self._ids[position] == target:
+                return position
+        return None
+
+    def text(self, position: int) -> str:
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return bytes(self._text[start:end]).decode("utf-8")
+
+    def document(self, position: int):
+        from langchain_core.documents import Document
+
+        return Document(
+            id=self._ids[position].decode("utf-8"),
+            page_content=self.text(position),
+            metadata=dict(self._metadatas[int(self._metadata_ids[position])]),
+        )
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, **kwargs):
+        import faiss
+
+        query = np.asarray([embedding], dtype=np.float32)
+        if self.meta["normalize_L2"]:
+            faiss.normalize_L2(query)
+        scores, positions = self.index.search(query, min(k, max(len(self), 1)))
+        return [(self.document(int(p)), float(s)) for p, s in zip(positions[0], scores[0]) if p >= 0]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k, **kwargs)
+
+    def iter_documents(self):
+        """(ID, texto) de todos os chunks, na ordem dos vetores (para o índice lexical)."""
+        for position in range(len(self)):
+            yield self._ids[position].decode("utf-8"), self.text(position)
+
+
+def load_mapped_store(directory: Path, embedding_function=None) -> MappedVectorStore:
+    return MappedVectorStore(directory, embedding_function)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--src", required=True, help="diretório do índice do LangChain (index.faiss + index.pkl)")
+    parser.add_argument("--dst", help="destino (padrão: o próprio --src, substituindo o formato antigo)")
+    parser.add_argument("--kind", choices=INDEX_KINDS, default=RAG_INDEX_KIND or "flat")
+    args = parser.parse_args()
+
+    from langchain_community.vectorstores import FAISS
+
+    from backend import rag
+
+    src = Path(args.src)
+    dst = Path(args.dst) if args.dst else src
+    store = FAISS.load_local(str(rag.published_dir(src)), rag.get_embeddings(), allow_dangerous_deserialization=True)
+    version = rag.save_index(store, dst, index_format="mapped", kind=args.kind)
+    published = rag.version_dir(dst, version)
+    meta = json.loads((published / STORE_META_FILENAME).read_text(encoding="utf-8"))
+    size = sum((published / name).stat().st_size for name in STORE_FILENAMES)
+    print(f"[RAG] {meta['chunks']} chunks convertidos para {dst} ({meta['kind']}, {size / 2 ** 20:.1f} MiB, "
+          f"versão {version})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Memória e custo de escrita do áudio das sessões: o bytearray sem limite (o
+buffer antigo do ws_voice) contra os ring buffers de tamanho fixo
+(UtteranceBuffers). Cada sessão simula um cliente que manda frames de 20 ms
+e nunca envia end_of_speech, o pior caso para o buffer antigo.
+
+A cada minuto simulado, o relatório mostra o RSS do processo (ou a memória
+rastreada pelo tracemalloc, com --tracemalloc, que deixa as escritas mais
+lentas). Com os ring buffers ela fica estável; com o bytearray, cresce cerca
+de 1,9 MB por sessão por minuto.
+
+    python -m benchmarks.bench_audio_buffers --sessions 500 --minutes 10 --policy endpoint
+    python -m benchmarks.bench_audio_buffers --sessions 50 --minutes 3 --legacy
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+from backend.audio import AUDIO_MAX_UTTERANCE_SECONDS, OVERFLOW_POLICIES, PCM_BYTES_PER_SECOND, UtteranceBuffers
+
+
+class LegacyBuffers:
+    """O buffer antigo: um bytearray por sessão, que só esvazia no fim da fala."""
+
+    def __init__(self):
+        self.active = bytearray()
+
+    def write(self, chunk):
+        self.active.extend(chunk)
+        return len(chunk), 0
+
+
+def rss_bytes() -> int:
+    """RSS atual (Linux); 0 onde /proc não existe."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def write_frame(buffers, frame: bytes):
+    accepted, _ = buffers.write(frame)
+    if isinstance(buffers, UtteranceBuffers) and buffers.active.overflowed and buffers.policy == "endpoint":
+        # Como o ws_voice: a fala vira turno, e o turno devolve o buffer ao terminar
+        turn = buffers.take()
+        buffers.write(memoryview(frame)[accepted:])
+        turn.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--minutes", type=float, default=10.0)
+    parser.add_argument("--frame-ms", type=int, default=20)
+    parser.add_argument("--max-seconds", type=float, default=AUDIO_MAX_UTTERANCE_SECONDS, help="fala máxima por turno")
+    parser.add_argument("--policy", choices=OVERFLOW_POLICIES, default="endpoint")
+    parser.add_argument("--legacy", action="store_true", help="usa o bytearray sem limite (cuidado com a memória)")
+    parser.add_argument("--tracemalloc", action="store_true", help="mede a memória alocada em vez do RSS")
+    args = parser.parse_args()
+
+    frame = bytes(PCM_BYTES_PER_SECOND * args.frame_ms // 1000)
+    frames_per_minute = 60_000 // args.frame_ms
+    if args.tracemalloc:
+        tracemalloc.start()
+    baseline = 0 if args.tracemalloc else rss_bytes()
+    if args.legacy:
+        sessions = [LegacyBuffers() for _ in range(args.sessions)]
+        label = "bytearray sem limite"
+    else:
+        sessions = [UtteranceBuffers(max_seconds=args.max_seconds, policy=args.policy) for _ in range(args.sessions)]
+        label = f"UtteranceBuffers ({args.policy}, fala máxima {args.max_seconds:.0f}s)"
+    print(f"{label}: {args.sessions} sessões, frames de {args.frame_ms} ms")
+    print(f"{'minuto':>6} {'tracemalloc' if args.tracemalloc else 'RSS (+início)':>13} {'por sessão':>12} {'µs/frame':>9}")
+
+    total_frames = int(args.minutes * frames_per_minute)
+    written = 0
+    while written < total_frames:
+        batch = min(frames_per_minute, total_frames - written)
+        started = time.perf_counter()
+        for _ in range(batch):
+            for buffers in sessions:
+                write_frame(buffers, frame)
+        elapsed = time.perf_counter() - started
+        written += batch
+        current = (tracemalloc.get_traced_memory()[0] if args.tracemalloc else rss_bytes()) - baseline
+        print(f"{written / frames_per_minute:>6.1f} {current / 2 ** 20:>10.1f} MiB {current / args.sessions / 1024:>8.1f} KiB "
+              f"{elapsed / (batch * args.sessions) * 1e6:>8.2f}")
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    if not args.legacy:
+        stats = [s.stats() for s in sessions]
+        print(f"\nReservado: {sum(s['reserved_bytes'] for s in stats) / 2 ** 20:.1f} MiB "
+              f"({max(s['buffers'] for s in stats)} buffer(s) por sessão no máximo); "
+              f"descartado: {sum(s['dropped_bytes'] + s['rejected_bytes'] for s in stats) / 2 ** 20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
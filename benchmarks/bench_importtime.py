@@ -0,0 +1,115 @@
+"""
+Tempo de import (cold start) de um módulo do backend, medido com
+`python -X importtime` num processo novo a cada repetição.
+
+Mostra o tempo total do import e o tempo de parede do processo. Também lista
+os módulos mais pesados (tempo próprio e acumulado) e quais dependências
+pesadas entraram junto: o SDK da OpenAI, o da ElevenLabs, o LangChain e o
+FAISS. Essas deveriam chegar só no aquecimento em background do lifespan ou no
+primeiro uso. Com `--json` a saída é um registro único para comparar entre
+versões. `--budget-ms` faz o comando sair com código 1 quando a mediana passa
+do orçamento (para o CI).
+
+    python -m benchmarks.bench_importtime [--module backend.main] [--repeat 5] [--top 15]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Dependências que não deveriam ser importadas com o servidor
+HEAVY_MODULES = ("openai", "httpx", "elevenlabs", "langchain_core", "langchain_community", "langchain_openai",
+                 "faiss", "tiktoken")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def parse_importtime(stderr: str) -> list:
+    """Linhas do -X importtime -> [(módulo, self_us, cumulative_us, profundidade)]."""
+    rows = []
+    for line in stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def measure_once(module: str) -> dict:
+    env = dict(os.environ)
+    # Uma chave qualquer: o import não pode depender de credenciais, só o uso
+    env.setdefault("OPENAI_KEY", "bench")
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=300)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} falhou:\n{result.stderr[-2000:]}")
+    rows = parse_importtime(result.stderr)
+    top_level = [r for r in rows if r[3] == 0]
+    imported = {r[0] for r in rows}
+    return {
+        "wall_ms": wall * 1000,
+        "import_ms": sum(r[2] for r in top_level) / 1000,
+        "module_ms": next((r[2] / 1000 for r in rows if r[0] == module), 0.0),
+        "modules": len(rows),
+        "heavy": sorted(m for m in HEAVY_MODULES if m in imported),
+        "rows": rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="módulos mais pesados a listar")
+    parser.add_argument("--json", action="store_true", help="imprime um único registro JSON")
+    parser.add_argument("--budget-ms", type=float, default=None, help="sai com código 1 se a mediana passar disto")
+    args = parser.parse_args()
+
+    runs = [measure_once(args.module) for _ in range(args.repeat)]
+    summary = {
+        "module": args.module,
+        "python": sys.version.split()[0],
+        "repeat": args.repeat,
+        "wall_ms_p50": statistics.median(r["wall_ms"] for r in runs),
+        "import_ms_p50": statistics.median(r["import_ms"] for r in runs),
+        "module_ms_p50": statistics.median(r["module_ms"] for r in runs),
+        "modules": runs[-1]["modules"],
+        "heavy_imported": runs[-1]["heavy"],
+    }
+    # Os mais pesados vêm da última execução (caches de bytecode já quentes)
+    rows = runs[-1]["rows"]
+    top_cumulative = sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]
+    top_self = sorted(rows, key=lambda r: r[1], reverse=True)[:args.top]
+
+    if args.json:
+        summary["top_self"] = [{"module": r[0], "self_ms": r[1] / 1000} for r in top_self]
+        print(json.dumps(summary, ensure_ascii=False))
+    else:
+        print(f"import {args.module} (Python {summary['python']}, {args.repeat} processos, mediana)")
+        print(f"  processo: {summary['wall_ms_p50']:.0f} ms | imports: {summary['import_ms_p50']:.0f} ms | "
+              f"{args.module}: {summary['module_ms_p50']:.0f} ms | {summary['modules']} módulos")
+        print(f"  dependências pesadas importadas: {', '.join(summary['heavy_imported']) or 'nenhuma'}")
+        print(f"\n{'acumulado':>10} {'próprio':>9}  módulo")
+        for name, self_us, cumulative_us, depth in top_cumulative:
+            print(f"{cumulative_us / 1000:>8.1f}ms {self_us / 1000:>7.1f}ms  {'  ' * depth}{name}")
+        print(f"\n{'próprio':>10}  módulo (maior tempo próprio)")
+        for name, self_us, _, _ in top_self:
+            print(f"{self_us / 1000:>8.1f}ms  {name}")
+
+    if args.budget_ms is not None and summary["import_ms_p50"] > args.budget_ms:
+        print(f"ERROR: import de {args.module} levou {summary['import_ms_p50']:.0f} ms "
+              f"(orçamento: {args.budget_ms:.0f} ms)", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Tamanho do prompt e latência do LLM por turno: histórico completo (lista)
+contra a ConversationMemory (orçamento de tokens + resumo corrido), com o
+chat_rag de verdade apontando para o FakeProviderServer. O LLM falso cobra
+`--prompt-ms-per-kchar` por 1000 caracteres de prompt, como o prefill de um
+modelo real; o resumo é esperado antes da próxima pergunta, como se o
+cliente estivesse falando.
+
+    python -m benchmarks.bench_memory --turns 40 --budget 800
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.fake_server import FakeProviderServer, LatencyModel
+from benchmarks.load_server import build_demo_index, configure_environment
+
+QUESTIONS = (
+    "Quais implantes vocês têm para rebordo fino?",
+    "E a Linha Zero, vem em quais diâmetros?",
+    "O kit cirúrgico acompanha torquímetro?",
+    "Vocês têm pilar angulado para a Linha Zero?",
+    "Como funciona a condição comercial para clínicas?",
+)
+REPLY = ("A Linha Slim tem implantes de dois vírgula nove milímetros, indicados para rebordos finos e regiões "
+         "anteriores. Posso te enviar o catálogo completo e agendar uma conversa com um consultor da Médens?")
+
+
+async def run_conversation(main, memory_module, turns: int, budget, server) -> list:
+    if budget is None:
+        history = []
+    else:
+        history = memory_module.ConversationMemory(summarizer=main.summarize_history, max_tokens=budget)
+    rows = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"{QUESTIONS[turn % len(QUESTIONS)]} (pergunta {turn + 1})"})
+        prompt = await main.build_chat_messages("bench", history)
+        prompt_tokens = sum(memory_module.message_tokens(m) for m in prompt)
+        started = time.perf_counter()
+        reply = await main.chat_rag("bench", history)
+        rows.append((turn + 1, prompt_tokens, server.prompt_chars[-1], (time.perf_counter() - started) * 1000))
+        history.append({"role": "assistant", "content": reply})
+        if budget is not None:
+            history.schedule_summary()
+            await history.wait_summary()
+    return rows
+
+
+async def compare(main, memory_module, turns: int, budget: int, server):
+    # Um único event loop: o pool de conexões do cliente OpenAI fica preso ao loop que o usou
+    full = await run_conversation(main, memory_module, turns, None, server)
+    budgeted = await run_conversation(main, memory_module, turns, budget, server)
+    return full, budgeted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--budget", type=int, default=800, help="orçamento de tokens do histórico")
+    parser.add_argument("--llm-ms", type=float, default=150.0, help="latência fixa do LLM falso")
+    parser.add_argument("--prompt-ms-per-kchar", type=float, default=20.0)
+    parser.add_argument("--every", type=int, default=5, help="imprime um turno a cada N")
+    args = parser.parse_args()
+
+    server = FakeProviderServer(latencies={"llm": LatencyModel("fixed", args.llm_ms)}, reply=REPLY,
+                                prompt_ms_per_kchar=args.prompt_ms_per_kchar).start()
+    try:
+        configure_environment(server.root_url)
+        with tempfile.TemporaryDirectory(prefix="bench-memory-") as work_dir:
+            build_demo_index(Path(work_dir))
+            import backend.main as main_module
+            from backend import memory
+
+            full, budgeted = asyncio.run(compare(main_module, memory, args.turns, args.budget, server))
+    finally:
+        server.stop()
+
+    print(f"{'turno':>5} | {'tokens (lista)':>14} {'LLM ms':>7} | {'tokens (memória)':>16} {'LLM ms':>7}")
+    for (turn, tokens_full, _, ms_full), (_, tokens_mem, _, ms_mem) in zip(full, budgeted):
+        if turn == 1 or turn % args.every == 0:
+            print(f"{turn:>5} | {tokens_full:>14} {ms_full:>7.0f} | {tokens_mem:>16} {ms_mem:>7.0f}")
+    last_full, last_mem = full[-1], budgeted[-1]
+    print(f"Último turno: prompt {last_full[1]} -> {last_mem[1]} tokens "
+          f"({1 - last_mem[1] / last_full[1]:.0%} menor), LLM {last_full[3]:.0f} -> {last_mem[3]:.0f} ms.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Custo da instrumentação por turno (backend.metrics): mede um turno "vazio"
+com o mesmo número de spans/observações de um turno real em modo stream e
+compara com o orçamento fixo. Sai com código 1 se passar do orçamento.
+
+    python -m benchmarks.bench_metrics [--segments 5] [--chunks 8] [--turns 20000]
+"""
+import argparse
+import contextvars
+import sys
+import timeit
+
+from backend import metrics
+
+# Orçamento de overhead por turno (µs). Um turno real leva centenas de ms.
+OVERHEAD_BUDGET_US = 200.0
+
+
+def instrumented_turn(segments: int = 5, chunks_per_segment: int = 8):
+    """Mesmas chamadas que handle_user_turn_logic/stream_reply fazem num turno, sem o trabalho em si."""
+    trace = metrics.start_turn_trace()
+    trace.audio_bytes = 64000
+    metrics.turn_audio_bytes.labels("stream").observe(64000)
+    with metrics.span("wav"):
+        pass
+    with metrics.span("stt"):
+        pass
+    with metrics.span("rag"):
+        pass
+    metrics.observe_first("llm_first_token", 0.2)
+    for _ in range(segments):
+        metrics.observe_first("tts_first_byte", 0.15)
+        for _ in range(chunks_per_segment):
+            metrics.observe_first("first_audio", 0.5)
+            with metrics.span("ws_send"):
+                pass
+        metrics.observe("tts", 0.4)
+    metrics.observe("llm", 1.2)
+    trace.finish()
+    return trace.format()
+
+
+def measure_turn_overhead_us(segments: int = 5, chunks_per_segment: int = 8, turns: int = 20000) -> float:
+    session_context = contextvars.copy_context()
+    session_context.run(metrics.start_session, "bench")
+
+    def one_turn():
+        # cada turno roda numa task própria no servidor: contexto novo herdando a sessão
+        session_context.copy().run(instrumented_turn, segments, chunks_per_segment)
+
+    per_turn = min(timeit.repeat(one_turn, number=turns, repeat=3)) / turns
+    return per_turn * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=5)
+    parser.add_argument("--chunks", type=int, default=8, help="chunks de áudio enviados por segmento")
+    parser.add_argument("--turns", type=int, default=20000)
+    args = parser.parse_args()
+
+    overhead = measure_turn_overhead_us(args.segments, args.chunks, args.turns)
+    render_us = min(timeit.repeat(metrics.render_prometheus, number=200, repeat=3)) / 200 * 1e6
+    observations = 7 + args.segments * (2 + args.chunks * 2)
+    print(f"Turno com {args.segments} segmentos x {args.chunks} chunks ({observations} observações)")
+    print(f"Overhead da instrumentação: {overhead:.1f} µs/turno (orçamento {OVERHEAD_BUDGET_US:.0f} µs)")
+    print(f"Renderização de /metrics: {render_us:.1f} µs")
+    if overhead > OVERHEAD_BUDGET_US:
+        print("ACIMA DO ORÇAMENTO")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Latência do fim da fala até a transcrição: STT da fala inteira depois do fim
+(caminho atual) contra a transcrição incremental (backend/partial_stt.py),
+que transcreve janelas sobrepostas enquanto o usuário fala e, no fim, só a
+cauda.
+
+O STT é o FakeSTT, com latência fixa mais um custo por segundo de áudio, como
+o Whisper. O áudio é sintético: cada palavra vira 0,5 s de amostras
+constantes, e o fake "transcreve" decodificando essas amostras. Assim dá para
+conferir que a costura das janelas devolve o texto exato; uma palavra cortada
+na borda de uma janela volta truncada, como num STT real. O áudio chega em
+tempo real, comprimido por `--speed`; os tempos do relatório já estão
+convertidos de volta para tempo real.
+
+    python -m benchmarks.bench_partial_stt --utterances 3,8,15,30 --window 5 --overlap 1
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from backend.audio import PCM_BYTES_PER_SECOND, WAV_HEADER_SIZE, UtteranceBuffers, pcm_to_wav_stream
+from backend.partial_stt import IncrementalTranscriber
+from backend.providers.fake import FakeSTT, LatencyModel
+
+WORD_SECONDS = 0.5
+WORDS = ("quais", "implantes", "da", "linha", "zero", "vocês", "têm", "para", "rebordo", "fino", "e", "qual",
+         "o", "prazo", "de", "entrega", "em", "campinas")
+
+
+def reference_words(seconds: float) -> list:
+    return [WORDS[i % len(WORDS)] for i in range(int(seconds / WORD_SECONDS))]
+
+
+def encode_words(words: list, bytes_per_second: int = PCM_BYTES_PER_SECOND) -> bytes:
+    """Palavra i -> WORD_SECONDS de amostras com valor 100 * (índice em WORDS + 1)."""
+    samples_per_word = int(WORD_SECONDS * bytes_per_second // 2)
+    codes = np.repeat([100 * (WORDS.index(w) + 1) for w in words], samples_per_word).astype("<i2")
+    return codes.tobytes()
+
+
+class WordCodedSTT(FakeSTT):
+    """Decodifica o áudio de encode_words; palavras com menos da metade da duração voltam truncadas."""
+
+    def transcript_for(self, audio_file) -> str:
+        audio_file.seek(WAV_HEADER_SIZE)
+        samples = np.frombuffer(audio_file.read(), dtype="<i2")
+        if not samples.size:
+            return ""
+        boundaries = np.flatnonzero(np.diff(samples)) + 1
+        starts = np.concatenate(([0], boundaries))
+        lengths = np.diff(np.concatenate((starts, [samples.size])))
+        full = WORD_SECONDS * PCM_BYTES_PER_SECOND / 2
+        words = []
+        for start, length in zip(starts, lengths):
+            word = WORDS[samples[start] // 100 - 1]
+            words.append(word if length >= full / 2 else word[:max(1, len(word) // 2)] + "-")
+        return " ".join(words)
+
+
+def make_transcribe(stt: FakeSTT):
+    async def transcribe(data) -> str:
+        wav = pcm_to_wav_stream(data)
+        try:
+            return await stt.transcribe(wav)
+        finally:
+            wav.close()
+
+    return transcribe
+
+
+async def run_utterance(seconds: float, incremental: bool, args) -> dict:
+    stt = WordCodedSTT(latency=LatencyModel("fixed", args.stt_base_ms / args.speed),
+                       ms_per_audio_second=args.stt_ms_per_second / args.speed)
+    transcribe = make_transcribe(stt)
+    partials = []
+
+    async def on_partial(text):
+        partials.append(text)
+
+    buffers = UtteranceBuffers(max_seconds=seconds + 1, policy="reject")
+    transcriber = IncrementalTranscriber(transcribe, on_partial, window_seconds=args.window,
+                                         overlap_seconds=args.overlap, max_windows=args.max_windows) if incremental else None
+    words = reference_words(seconds)
+    audio = encode_words(words)
+    frame = PCM_BYTES_PER_SECOND * args.frame_ms // 1000
+    for start in range(0, len(audio), frame):
+        buffers.write(audio[start:start + frame])
+        if transcriber is not None:
+            transcriber.feed(buffers.active)
+        await asyncio.sleep(args.frame_ms / 1000 / args.speed)
+
+    # Fim da fala
+    turn_buffer = buffers.take()
+    started = time.perf_counter()
+    if transcriber is not None:
+        text = await transcriber.finish(turn_buffer)
+    else:
+        views = turn_buffer.views()
+        text = await transcribe(views)
+        for view in views:
+            view.release()
+    latency = (time.perf_counter() - started) * args.speed
+    return {
+        "latency_ms": latency * 1000,
+        "correct": text.split() == words,
+        "calls": stt.calls,
+        "audio_seconds": stt.audio_seconds,
+        "partials": len(partials),
+    }
+
+
+async def run_all(args) -> list:
+    rows = []
+    for seconds in (float(s) for s in args.utterances.split(",")):
+        batch = await run_utterance(seconds, False, args)
+        incremental = await run_utterance(seconds, True, args)
+        rows.append((seconds, batch, incremental))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--utterances", default="3,8,15,30", help="durações de fala em segundos (lista)")
+    parser.add_argument("--window", type=float, default=5.0)
+    parser.add_argument("--overlap", type=float, default=1.0)
+    parser.add_argument("--max-windows", type=int, default=12)
+    parser.add_argument("--stt-base-ms", type=float, default=350.0, help="latência fixa do STT por requisição")
+    parser.add_argument("--stt-ms-per-second", type=float, default=80.0, help="latência do STT por segundo de áudio")
+    parser.add_argument("--frame-ms", type=int, default=100)
+    parser.add_argument("--speed", type=float, default=10.0, help="compressão do tempo da simulação")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run_all(args))
+    print(f"janela {args.window:.1f}s, sobreposição {args.overlap:.1f}s, STT {args.stt_base_ms:.0f} ms "
+          f"+ {args.stt_ms_per_second:.0f} ms/s de áudio")
+    print(f"{'fala':>6} | {'lote: fim->texto':>16} | {'incremental: fim->texto':>23} {'chamadas':>9} "
+          f"{'áudio cobrado':>14} {'legendas':>9} | {'texto ok':>8}")
+    for seconds, batch, incremental in rows:
+        print(f"{seconds:>5.0f}s | {batch['latency_ms']:>14.0f}ms | {incremental['latency_ms']:>21.0f}ms "
+              f"{incremental['calls']:>9} {incremental['audio_seconds'] / seconds:>13.2f}x {incremental['partials']:>9} | "
+              f"{'sim' if batch['correct'] and incremental['correct'] else 'NÃO':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Overhead do próprio pipeline, separado da latência dos provedores: roda
+handle_user_turn_logic (WAV, STT, RAG com o índice FAISS + BM25, LLM,
+segmentação, TTS, cache, métricas e envio) com os provedores falsos de
+backend/providers, no mesmo processo e sem rede.
+
+Com latência 0 nos fakes, todo o tempo do turno é custo nosso. Com as
+latências configuradas, o relatório mostra quanto do turno é espera pelos
+provedores. `--concurrency` roda N sessões ao mesmo tempo, para ver o overhead
+quando o event loop é dividido.
+
+    python -m benchmarks.bench_pipeline --turns 200 --concurrency 1,20
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Antes de importar o backend: todas as etapas nos provedores falsos
+os.environ["STT_PROVIDER"] = "fake"
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ["TTS_PROVIDER"] = "fake"
+os.environ["EMBEDDINGS_PROVIDER"] = "fake"
+# Sem cache: cada turno sintetiza o áudio de novo, como com respostas variadas
+os.environ.setdefault("TTS_CACHE_MAX_BYTES", "0")
+
+from benchmarks.load_server import build_demo_index
+
+AUDIO = bytearray(32000)  # 1 s de PCM 16 kHz
+
+
+class SinkWebSocket:
+    def __init__(self):
+        from fastapi.websockets import WebSocketState
+        self.client_state = WebSocketState.CONNECTED
+        self.audio_bytes = 0
+
+    async def send_text(self, text):
+        pass
+
+    async def send_bytes(self, data):
+        self.audio_bytes += len(data)
+
+
+def configure_providers(main, rag, args, with_latency: bool):
+    from backend.providers import FakeLLM, FakeSTT, FakeTTS, LatencyModel
+
+    def ms(value):
+        return LatencyModel("fixed", value if with_latency else 0.0)
+
+    main.stt_provider = FakeSTT(latency=ms(args.stt_ms))
+    main.llm_provider = FakeLLM(first_token=ms(args.llm_first_token_ms),
+                                ms_per_token=args.llm_ms_per_token if with_latency else 0.0)
+    main.tts_provider = FakeTTS(first_byte=ms(args.tts_first_byte_ms),
+                                ms_per_char=args.tts_ms_per_char if with_latency else 0.0)
+    embeddings = rag.get_embeddings()
+    embeddings.latency = ms(args.embed_ms)
+    embeddings.busy_seconds = 0.0
+    return [main.stt_provider, main.llm_provider, main.tts_provider, embeddings]
+
+
+async def run_turns(main, turns: int, concurrency: int, mode: str) -> list:
+    durations = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_turn():
+        async with semaphore:
+            started = time.perf_counter()
+            await main.handle_user_turn_logic(bytearray(AUDIO), "bench", [], SinkWebSocket(), lambda value: None, mode)
+            durations.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one_turn() for _ in range(turns)))
+    return durations
+
+
+async def run_all(main, rag, args) -> list:
+    """Todas as combinações num único event loop (os limitadores de provedor ficam presos ao loop)."""
+    rows = []
+    for mode in ("batch", "stream"):
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            for with_latency in (False, True):
+                fakes = configure_providers(main, rag, args, with_latency)
+                turns = args.turns if not with_latency else max(concurrency, args.turns // 10)
+                durations = await run_turns(main, turns, concurrency, mode)
+                busy = sum(f.busy_seconds for f in fakes) / turns
+                rows.append((mode, concurrency, with_latency, durations, busy))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--concurrency", default="1,20", help="sessões simultâneas (lista separada por vírgulas)")
+    parser.add_argument("--stt-ms", type=float, default=300.0)
+    parser.add_argument("--embed-ms", type=float, default=120.0)
+    parser.add_argument("--llm-first-token-ms", type=float, default=250.0)
+    parser.add_argument("--llm-ms-per-token", type=float, default=15.0)
+    parser.add_argument("--tts-first-byte-ms", type=float, default=150.0)
+    parser.add_argument("--tts-ms-per-char", type=float, default=2.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-pipeline-") as work_dir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_demo_index(Path(work_dir))
+            import backend.main as main_module
+            from backend import rag
+
+            # Os logs por turno do backend custariam mais que o pipeline medido
+            rows = asyncio.run(run_all(main_module, rag, args))
+
+    print(f"{'modo':>6} {'sessões':>7} {'latência':>9} | {'turno p50':>9} {'p95':>7} | "
+          f"{'provedores/turno':>16} {'overhead/turno':>14}")
+    for mode, concurrency, with_latency, durations, busy in rows:
+        p50, p95 = np.percentile(durations, [50, 95]) * 1000
+        # No modo stream o TTS roda junto com o LLM: a soma dos provedores passa do turno
+        overhead = "-" if with_latency and mode == "stream" else f"{(np.mean(durations) - busy) * 1000:.2f} ms"
+        print(f"{mode:>6} {concurrency:>7} {'sim' if with_latency else '0 ms':>9} | {p50:>7.2f}ms "
+              f"{p95:>5.1f}ms | {busy * 1000:>14.1f}ms {overhead:>14}")
+
+
+if __name__ == "__main__":
+    main()
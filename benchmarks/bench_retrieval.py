@@ -0,0 +1,99 @@
+"""
+Relevância e latência da busca do RAG em três modos: só vetores, só BM25 e
+híbrido (RRF + atalho lexical). Offline: o catálogo é sintético (linhas,
+diâmetros, comprimentos e códigos, como o da MEDENS) e o "embedding" é um
+vetor de trigramas de caracteres calculado localmente, com `--embed-ms` de
+espera para simular a chamada remota.
+
+    python -m benchmarks.bench_retrieval --embed-ms 120
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from backend import rag
+from backend.providers import FakeEmbeddings, LatencyModel
+
+LINES = {"Zero": "MZ", "Slim": "MS", "Prime": "MP", "Curto": "MC"}
+DIAMETERS = ("2.9", "3.5", "4.0", "4.5", "5.0")
+LENGTHS = ("8", "10", "11.5", "13", "15")
+GENERIC = {
+    "Como faço a esterilização dos instrumentais?":
+        "Os instrumentais cirúrgicos e o estojo podem ser esterilizados em autoclave a 134 graus.",
+    "Vocês têm algum treinamento para dentistas?":
+        "A MEDENS oferece cursos práticos de cirurgia guiada e carga imediata para dentistas.",
+    "Quero falar sobre preço e condição de pagamento.":
+        "Condições comerciais e preços são tratados por um consultor da MEDENS, com parcelamento para clínicas.",
+}
+
+
+def build_catalog(seed: int = 0):
+    """(textos dos chunks, [(consulta, índice do chunk relevante)])."""
+    rng = random.Random(seed)
+    texts, queries = [], []
+    for line, prefix in LINES.items():
+        for diameter in DIAMETERS:
+            for length in LENGTHS:
+                sku = f"{prefix}-{diameter.replace('.', '')}{length.replace('.', '')}"
+                texts.append(f"Implante Linha {line} cone morse, diâmetro {diameter}mm e comprimento {length}mm. "
+                             f"Código {sku}. Superfície tratada e montador incluído na embalagem.")
+                index = len(texts) - 1
+                spoken_diameter = diameter.replace(".", ",")
+                queries.append((f"Vocês têm o implante da Linha {line} de {spoken_diameter} milímetros por {length}?", index))
+                if rng.random() < 0.3:
+                    queries.append((f"Qual o prazo do código {sku}?", index))
+    for question, answer in GENERIC.items():
+        texts.append(answer)
+        queries.append((question, len(texts) - 1))
+    return texts, queries
+
+
+def evaluate(retriever, texts, queries, embeddings, k: int) -> dict:
+    hits, reciprocal_ranks, latencies = 0, [], []
+    embeddings.calls = 0
+    for question, relevant in queries:
+        started = time.perf_counter()
+        docs = retriever.query(question, k=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        ranked = [d.page_content for d in docs]
+        rank = ranked.index(texts[relevant]) + 1 if texts[relevant] in ranked else None
+        hits += rank is not None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+    return {
+        "recall": hits / len(queries),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "embedding_calls": embeddings.calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embed-ms", type=float, default=120.0, help="latência simulada do embedding da consulta")
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts, queries = build_catalog(args.seed)
+    embeddings = FakeEmbeddings(latency=LatencyModel("fixed", args.embed_ms))
+    with tempfile.TemporaryDirectory(prefix="bench-retrieval-") as work_dir:
+        index_dir = Path(work_dir) / "idx"
+        rag.save_index(FAISS.from_texts(texts, embeddings), index_dir)
+        print(f"{len(texts)} chunks, {len(queries)} consultas, k={args.k}, embedding da consulta {args.embed_ms:.0f} ms")
+        print(f"{'modo':>8} | {'recall@k':>8} {'MRR':>6} | {'p50 ms':>7} {'p95 ms':>7} | embeddings")
+        for mode in ("vector", "lexical", "hybrid"):
+            retriever = rag.IndexRetriever(index_dir, reload_check_interval=3600, mode=mode)
+            retriever.get_store().embedding_function = embeddings
+            result = evaluate(retriever, texts, queries, embeddings, args.k)
+            print(f"{mode:>8} | {result['recall']:>8.2f} {result['mrr']:>6.2f} | {result['p50_ms']:>7.1f} "
+                  f"{result['p95_ms']:>7.1f} | {result['embedding_calls']}/{len(queries)}")
+
+
+if __name__ == "__main__":
+    main()
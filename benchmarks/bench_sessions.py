@@ -0,0 +1,110 @@
+"""
+Custo de tornar a sessão retomável (backend/sessions.py). Para conversas de
+vários tamanhos, mede:
+
+  - o tamanho serializado e o tempo de dump/load do formato compacto (só o que
+    vai ao prompt, zlib acima de SESSION_COMPRESS_MIN_BYTES), comparado com o
+    JSON e o pickle do histórico completo;
+  - a memória por sessão, tanto a da ConversationMemory viva no worker
+    (tracemalloc) quanto a da entrada na store em memória;
+  - o custo de gravar uma sessão (o que cada fim de turno faz). Com a
+    InMemorySessionStore mede-se só o overhead nosso; com a store em Redis, a
+    ida e volta de rede vem por cima.
+
+    python -m benchmarks.bench_sessions [--turns 5,20,80] [--budget 2000] [--repeat 2000]
+"""
+import argparse
+import asyncio
+import json
+import pickle
+import timeit
+import tracemalloc
+
+from backend.memory import ConversationMemory, count_tokens
+from backend.sessions import (
+    InMemorySessionStore,
+    ResumableSession,
+    dump_session,
+    load_session,
+    state_from_memory,
+)
+
+QUESTION = "Quais implantes da Linha Zero vocês têm para rebordo fino, e em quais diâmetros? (pergunta {})"
+REPLY = ("A Linha Slim tem implantes de dois vírgula nove milímetros, indicados para rebordos finos e regiões "
+         "anteriores. Posso te enviar o catálogo completo e agendar uma conversa com um consultor? (resposta {})")
+SUMMARY = ("O cliente, dentista de uma clínica em Campinas, perguntou sobre implantes para rebordo fino, "
+           "diâmetros da Linha Zero, kit cirúrgico e condições comerciais para compra recorrente.")
+
+
+async def fixed_summary(previous_summary: str, messages: list) -> str:
+    return SUMMARY
+
+
+def build_memory(turns: int, budget: int) -> ConversationMemory:
+    """Histórico de `turns` turnos em que o que passou do orçamento já foi resumido, como em produção."""
+    memory = ConversationMemory(summarizer=fixed_summary, max_tokens=budget)
+    for turn in range(turns):
+        memory.append({"role": "user", "content": QUESTION.format(turn + 1)})
+        memory.append({"role": "assistant", "content": REPLY.format(turn + 1)})
+    if memory.needs_summary():
+        asyncio.run(memory.summarize())
+    return memory
+
+
+def live_bytes(turns: int, budget: int) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    memory = build_memory(turns, budget)
+    memory.prompt_history()  # preenche o cache de contagem de tokens, como num turno real
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del memory
+    return size
+
+
+def per_call_us(fn, repeat: int) -> float:
+    return min(timeit.repeat(fn, number=repeat, repeat=3)) / repeat * 1e6
+
+
+async def save_us(memory: ConversationMemory, repeat: int) -> float:
+    store = InMemorySessionStore()
+    session, _ = await ResumableSession.open(store, "new", "bench")
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for _ in range(repeat):
+        await session.save(memory, "stream")
+    return (loop.time() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", default="5,20,80", help="tamanhos de conversa (lista separada por vírgulas)")
+    parser.add_argument("--budget", type=int, default=2000, help="orçamento de tokens do histórico")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    count_tokens("")  # carrega o tokenizer fora das medições de memória
+    print(f"{'turnos':>6} | {'compacto':>9} {'json':>8} {'pickle':>8} | {'dump':>8} {'load':>8} "
+          f"{'json.dumps':>10} | {'gravar':>8} | {'worker':>9} {'store':>8}")
+    for turns in (int(t) for t in args.turns.split(",")):
+        memory = build_memory(turns, args.budget)
+        state = state_from_memory(memory, "bench", "stream")
+        compact = dump_session(state)
+        full = list(memory)
+        plain = json.dumps(full).encode("utf-8")
+        pickled = pickle.dumps(full, protocol=pickle.HIGHEST_PROTOCOL)
+        assert load_session(compact).messages == list(memory.recent_messages())
+
+        dump_us = per_call_us(lambda: dump_session(state_from_memory(memory, "bench", "stream")), args.repeat)
+        load_us = per_call_us(lambda: load_session(compact), args.repeat)
+        json_us = per_call_us(lambda: json.dumps(full), args.repeat)
+        save = asyncio.run(save_us(memory, args.repeat))
+        print(f"{turns:>6} | {len(compact):>7} B {len(plain):>6} B {len(pickled):>6} B | {dump_us:>6.1f}µs "
+              f"{load_us:>6.1f}µs {json_us:>8.1f}µs | {save:>6.1f}µs | {live_bytes(turns, args.budget) / 1024:>6.1f} KiB "
+              f"{len(compact) / 1024:>5.1f} KiB")
+    print("\ncompacto: formato de backend/sessions.py (resumo + mensagens não resumidas); json/pickle: histórico completo.")
+    print("gravar: ResumableSession.save na InMemorySessionStore (dump + compare_and_put da revisão).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Índice do RAG no formato do LangChain (FAISS.save_local, docstore em pickle)
+contra o formato nativo por mmap (backend/vector_store.py), em cada tipo de
+índice. O catálogo é sintético: chunks de texto com embeddings agrupados em
+tópicos, na dimensão do text-embedding-3-small.
+
+Cada formato é medido num processo novo, como um worker recém-iniciado:
+
+  - carga: rag.load_index (imports já feitos) e a primeira busca, que no
+    formato mapeado paga as faltas de página;
+  - RSS privado (RssAnon) depois das buscas: é o que cada worker soma. O
+    RssFile (páginas do índice mapeado) fica no page cache e é dividido entre
+    os workers;
+  - recall@k das buscas, contra a busca exata no índice do LangChain;
+  - tamanho em disco e latência média de uma busca.
+
+    python -m benchmarks.bench_vector_store --chunks 20000 --dim 1536 --kinds flat,sq8,ivf_sq8,ivf_pq
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+WORDS = ("implante", "linha", "zero", "slim", "cone", "morse", "rebordo", "fino", "diâmetro", "kit", "cirúrgico",
+         "broca", "chave", "torquímetro", "prótese", "componente", "pilar", "parafuso", "catálogo", "consultor")
+
+
+def rss_kib() -> dict:
+    """RssAnon/RssFile do processo (Linux); vazio onde /proc não existe."""
+    try:
+        with open("/proc/self/status") as f:
+            return {k: int(v.split()[0]) for k, v in (line.split(":", 1) for line in f if line.startswith("Rss"))}
+    except OSError:
+        return {}
+
+
+def synthetic_catalog(chunks: int, dim: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    topics = max(chunks // 50, 1)
+    centers = rng.normal(size=(topics, dim)).astype(np.float32)
+    assignment = rng.integers(0, topics, chunks)
+    vectors = centers[assignment] + 0.6 * rng.normal(size=(chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    words = np.array(WORDS)
+    texts = [" ".join(words[rng.integers(0, len(WORDS), 120)]) + f" (chunk {i})" for i in range(chunks)]
+    sources = [f"catalogo/{i // 8}.txt" for i in range(chunks)]
+    return vectors, texts, sources
+
+
+def build_langchain_store(vectors, texts, sources):
+    """FAISS do LangChain montado direto (sem reembeddar), igual ao que o index_builder salva."""
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    from backend.providers.embeddings import FakeEmbeddings
+
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    ids = [str(uuid.UUID(int=i)) for i in range(len(texts))]
+    docstore = InMemoryDocstore({key: Document(id=key, page_content=text, metadata={"source": source})
+                                 for key, text, source in zip(ids, texts, sources)})
+    return FAISS(FakeEmbeddings(vectors.shape[1]), index, docstore, dict(enumerate(ids)))
+
+
+def run_worker(index_dir: str, queries_path: str, k: int):
+    """Processo medido: carrega o índice, faz as buscas e imprime um JSON."""
+    import faiss  # noqa: F401  (imports fora da medição de carga)
+    from langchain_community.vectorstores import FAISS  # noqa: F401
+
+    from backend import rag
+
+    queries = np.load(queries_path)
+    before = rss_kib()
+    started = time.perf_counter()
+    store = rag.load_index(Path(index_dir))
+    load_seconds = time.perf_counter() - started
+    after_load = rss_kib()
+
+    started = time.perf_counter()
+    results = [[doc.id for doc in store.similarity_search_by_vector(queries[0], k=k)]]
+    first_query_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for query in queries[1:]:
+        results.append([doc.id for doc in store.similarity_search_by_vector(query, k=k)])
+    query_seconds = (time.perf_counter() - started) / max(len(queries) - 1, 1)
+    after_queries = rss_kib()
+    print(json.dumps({
+        "load_ms": load_seconds * 1000,
+        "first_query_ms": first_query_seconds * 1000,
+        "query_ms": query_seconds * 1000,
+        "anon_load_kib": after_load.get("RssAnon", 0) - before.get("RssAnon", 0),
+        "anon_kib": after_queries.get("RssAnon", 0) - before.get("RssAnon", 0),
+        "file_kib": after_queries.get("RssFile", 0) - before.get("RssFile", 0),
+        "results": results,
+    }))
+
+
+def measure(index_dir: Path, queries_path: Path, k: int) -> dict:
+    env = dict(os.environ, EMBEDDINGS_PROVIDER="fake")
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_vector_store", "--worker", str(index_dir), "--queries-file", str(queries_path),
+         "--k", str(k)],
+        check=True, capture_output=True, text=True, env=env,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def recall(results, truth) -> float:
+    return float(np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--kinds", default="flat,sq8,ivf_sq8,ivf_pq", help="tipos do formato nativo (lista)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--queries-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        run_worker(args.worker, args.queries_file, args.k)
+        return
+
+    from backend import rag
+
+    vectors, texts, sources = synthetic_catalog(args.chunks, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)] + 0.02 * rng.normal(size=(args.queries, args.dim))
+    store = build_langchain_store(vectors, texts, sources)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        queries_path = tmp / "queries.npy"
+        np.save(queries_path, queries.astype(np.float32))
+        directories = {"langchain": tmp / "langchain"}
+        started = time.perf_counter()
+        rag.save_index(store, directories["langchain"], index_format="langchain")
+        print(f"{args.chunks} chunks de dimensão {args.dim}; índice do LangChain salvo em {time.perf_counter() - started:.1f}s")
+        for kind in args.kinds.split(","):
+            directories[kind] = tmp / kind
+            started = time.perf_counter()
+            rag.save_index(store, directories[kind], index_format="mapped", kind=kind)
+            print(f"  conversão para {kind}: {time.perf_counter() - started:.1f}s")
+        del store
+
+        rows = {name: measure(path, queries_path, args.k) for name, path in directories.items()}
+        truth = rows["langchain"]["results"]
+        print(f"\n{'formato':>10} | {'disco':>9} | {'carga':>9} {'1ª busca':>9} | {'RSS privado':>11} {'páginas mmap':>12} | "
+              f"{'recall@' + str(args.k):>9} {'busca':>8}")
+        for name, row in rows.items():
+            disk = sum(f.stat().st_size for f in rag.published_dir(directories[name]).iterdir() if f.is_file())
+            print(f"{name:>10} | {disk / 2 ** 20:>5.1f} MiB | {row['load_ms']:>7.1f}ms {row['first_query_ms']:>7.1f}ms | "
+                  f"{row['anon_kib'] / 1024:>7.1f} MiB {row['file_kib'] / 1024:>8.1f} MiB | {recall(row['results'], truth):>9.3f} "
+                  f"{row['query_ms']:>6.2f}ms")
+        print("\nRSS privado: memória só daquele worker. Páginas mmap: page cache do índice, compartilhado entre workers.")
+
+
+if __name__ == "__main__":
+    main()
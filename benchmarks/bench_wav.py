@@ -0,0 +1,67 @@
+"""
+Micro-benchmark: enquadramento PCM -> WAV em memória (backend.audio) contra o
+caminho antigo com pydub (AudioSegment.export).
+
+    python -m benchmarks.bench_wav [--seconds 10] [--repeat 200]
+"""
+import argparse
+import os
+import timeit
+from io import BytesIO
+
+from backend.audio import pcm_to_wav_stream
+
+
+def pydub_path(pcm: bytes) -> bytes:
+    from pydub import AudioSegment
+
+    audio = AudioSegment(data=pcm, sample_width=2, frame_rate=16000, channels=1)
+    wav_io = BytesIO()
+    audio.export(wav_io, format="wav")
+    wav_io.seek(0)
+    return wav_io.read()
+
+
+def framing_path(pcm: bytearray) -> int:
+    view = memoryview(pcm)
+    wav = pcm_to_wav_stream(view)
+    size = len(wav)
+    wav.close()
+    view.release()
+    return size
+
+
+def framing_path_with_upload_read(pcm: bytearray) -> bytes:
+    """Inclui a única cópia feita quando o cliente HTTP lê o arquivo."""
+    view = memoryview(pcm)
+    wav = pcm_to_wav_stream(view)
+    data = wav.read()
+    wav.close()
+    view.release()
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0, help="duração do áudio de teste (16 kHz mono int16)")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    pcm = bytearray(os.urandom(int(args.seconds * 16000) * 2))
+    assert pydub_path(bytes(pcm)) == framing_path_with_upload_read(pcm)
+
+    cases = [
+        ("pydub AudioSegment.export", lambda: pydub_path(bytes(pcm))),
+        ("WavStream (só enquadramento)", lambda: framing_path(pcm)),
+        ("WavStream + leitura completa", lambda: framing_path_with_upload_read(pcm)),
+    ]
+    print(f"Áudio: {args.seconds:.1f}s ({len(pcm)} bytes), {args.repeat} repetições")
+    baseline = None
+    for label, fn in cases:
+        per_call = min(timeit.repeat(fn, number=args.repeat, repeat=3)) / args.repeat
+        baseline = baseline or per_call
+        print(f"{label:32s} {per_call * 1e6:10.1f} µs/turno  ({baseline / per_call:6.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
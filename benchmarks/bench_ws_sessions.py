@@ -0,0 +1,177 @@
+"""
+Custo de manter sessões do /ws/voice abertas: lag do event loop e CPU por
+sessão, com as sessões ociosas (--fps 0) ou ouvindo (--fps 50, um frame de
+20 ms por sessão a cada 20 ms).
+
+Três versões do loop da sessão, com a mesma WebSocket em memória:
+
+  polling  o loop original: receive() dentro de wait_for(timeout=0.1), que
+           acorda cada sessão 10 vezes por segundo e cria um timer e uma task
+           por frame;
+  direct   receive() sem timeout, processando e enviando na mesma task;
+  tasks    o ws_voice atual: leitor, processador e escritor ligados por filas
+           (backend/session_io.py), com keepalive e timeout de ociosidade.
+
+O lag é medido por uma task que dorme 5 ms em loop e anota o atraso de cada
+volta. A CPU é o process_time do período, dividido por sessão e por minuto.
+
+    python -m benchmarks.bench_ws_sessions --sessions 500 --seconds 10 --fps 0
+    python -m benchmarks.bench_ws_sessions --sessions 200 --seconds 10 --fps 50
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from starlette.websockets import WebSocketState
+
+# Antes de importar o backend: o áudio que sobra no buffer ao desconectar vira um turno nos provedores falsos
+os.environ["STT_PROVIDER"] = "fake"
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ["TTS_PROVIDER"] = "fake"
+os.environ["EMBEDDINGS_PROVIDER"] = "fake"
+
+from benchmarks.load_server import build_demo_index  # noqa: E402
+
+PROBE_INTERVAL_SECONDS = 0.005
+FRAME = bytes(640)  # 20 ms de PCM 16 kHz
+
+
+class MemoryWebSocket:
+    """A interface da WebSocket do Starlette usada pelo ws_voice, sobre uma fila."""
+
+    def __init__(self):
+        self.client_state = WebSocketState.CONNECTING
+        self.incoming = asyncio.Queue()
+        self.sent = 0
+
+    async def accept(self):
+        self.client_state = WebSocketState.CONNECTED
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send_text(self, text):
+        self.sent += 1
+
+    async def send_bytes(self, data):
+        self.sent += 1
+
+    async def close(self, code: int = 1000, reason: str = None):
+        self.client_state = WebSocketState.DISCONNECTED
+
+
+async def polling_session(ws: MemoryWebSocket):
+    await ws.accept()
+    buffer = bytearray()
+    while True:
+        try:
+            message = await asyncio.wait_for(ws.receive(), timeout=0.1)
+        except asyncio.TimeoutError:
+            continue
+        if message["type"] == "websocket.disconnect":
+            return
+        if "bytes" in message:
+            buffer.extend(message["bytes"])
+
+
+async def direct_session(ws: MemoryWebSocket):
+    await ws.accept()
+    buffer = bytearray()
+    while True:
+        message = await ws.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        if "bytes" in message:
+            buffer.extend(message["bytes"])
+
+
+def tasks_session(ws: MemoryWebSocket, index: int):
+    from backend import main
+
+    return main.ws_voice(ws, username=f"bench{index}", tts_mode=None, server_vad=None, protocol=None, codecs=None,
+                         session=None, partial_stt=None)
+
+
+async def probe_lag(stop: asyncio.Event, lags: list):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(PROBE_INTERVAL_SECONDS)
+        lags.append(loop.time() - started - PROBE_INTERVAL_SECONDS)
+
+
+async def feed(sockets, fps: int, stop: asyncio.Event):
+    interval = 1 / fps
+    message = {"type": "websocket.receive", "bytes": FRAME}
+    while not stop.is_set():
+        for ws in sockets:
+            ws.incoming.put_nowait(message)
+        await asyncio.sleep(interval)
+
+
+async def run(mode: str, sessions: int, seconds: float, fps: int, warmup: float) -> dict:
+    sockets = [MemoryWebSocket() for _ in range(sessions)]
+    if mode == "polling":
+        tasks = [asyncio.create_task(polling_session(ws)) for ws in sockets]
+    elif mode == "direct":
+        tasks = [asyncio.create_task(direct_session(ws)) for ws in sockets]
+    else:
+        tasks = [asyncio.create_task(tasks_session(ws, i)) for i, ws in enumerate(sockets)]
+    stop = asyncio.Event()
+    feeder = asyncio.create_task(feed(sockets, fps, stop)) if fps else None
+    await asyncio.sleep(warmup)
+
+    lags = []
+    probe = asyncio.create_task(probe_lag(stop, lags))
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    await asyncio.sleep(seconds)
+    cpu = time.process_time() - cpu_started
+    wall = time.perf_counter() - wall_started
+    stop.set()
+    await probe
+    if feeder is not None:
+        await feeder
+
+    for ws in sockets:
+        ws.incoming.put_nowait({"type": "websocket.disconnect", "code": 1000})
+    await asyncio.gather(*tasks)
+    lags_ms = np.array(lags) * 1000
+    return {
+        "cpu_ms_per_session_minute": cpu / sessions / wall * 60 * 1000,
+        "cpu_fraction": cpu / wall,
+        "lag_p50_ms": float(np.percentile(lags_ms, 50)),
+        "lag_p99_ms": float(np.percentile(lags_ms, 99)),
+        "lag_max_ms": float(lags_ms.max()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--fps", type=int, default=0, help="frames de áudio por segundo por sessão (0: ociosas)")
+    parser.add_argument("--modes", default="polling,direct,tasks")
+    parser.add_argument("--warmup", type=float, default=1.0)
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessões, {args.fps} frames/s cada, {args.seconds:.0f}s medidos")
+    print(f"{'loop':>8} | {'CPU/sessão/min':>14} {'CPU total':>9} | {'lag p50':>8} {'p99':>8} {'máx':>8}")
+    with tempfile.TemporaryDirectory(prefix="bench-ws-") as work_dir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_demo_index(Path(work_dir))
+        for mode in args.modes.split(","):
+            # Os logs por sessão do ws_voice não interessam aqui
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = asyncio.run(run(mode, args.sessions, args.seconds, args.fps, args.warmup))
+            print(f"{mode:>8} | {result['cpu_ms_per_session_minute']:>11.1f} ms {result['cpu_fraction'] * 100:>8.1f}% | "
+                  f"{result['lag_p50_ms']:>6.2f}ms {result['lag_p99_ms']:>6.2f}ms {result['lag_max_ms']:>6.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
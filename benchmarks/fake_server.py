@@ -0,0 +1,233 @@
+"""
+Servidor HTTP local que imita os endpoints dos provedores usados pelo agente
+(OpenAI: transcrição, chat completions com e sem streaming e embeddings;
+ElevenLabs: text-to-speech em streaming), com latência e taxa de erro
+configuráveis. Serve para testar o comportamento sob muitos turnos
+simultâneos sem rede nem custo.
+
+    with FakeProviderServer(latency=LatencyModel("uniform", 50, 20)) as server:
+        client = create_openai_client("sk-fake", base_url=server.base_url)
+        tts = AsyncElevenLabs(api_key="fake", base_url=server.root_url)
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from backend.providers.fake import LatencyModel
+
+
+class FakeProviderServer:
+    """
+    Sobe o servidor falso numa thread própria (uvicorn) numa porta livre.
+    `latencies` sobrescreve a latência padrão por provedor: "stt", "llm",
+    "tts" ou "embeddings" (para o TTS, é o tempo até o primeiro byte).
+    `prompt_ms_per_kchar` soma ao LLM um custo proporcional ao tamanho do
+    prompt, como o prefill de um modelo real.
+    """
+
+    def __init__(self, latency: LatencyModel = None, failure_rate: float = 0.0,
+                 transcript: str = "Quais implantes vocês têm?",
+                 reply: str = "Temos a Linha Zero e a Linha Slim. Posso te enviar o catálogo?",
+                 stream_chunk_delay_ms: float = 5.0, latencies: dict = None,
+                 tts_bytes_per_char: int = 400, tts_chunk_bytes: int = 4096, tts_chunk_delay_ms: float = 10.0,
+                 embedding_dim: int = 64, prompt_ms_per_kchar: float = 0.0):
+        self.latency = latency or LatencyModel()
+        self.latencies = latencies or {}
+        self.failure_rate = failure_rate
+        self.transcript = transcript
+        self.reply = reply
+        self.stream_chunk_delay_ms = stream_chunk_delay_ms
+        self.tts_bytes_per_char = tts_bytes_per_char
+        self.tts_chunk_bytes = tts_chunk_bytes
+        self.tts_chunk_delay_ms = tts_chunk_delay_ms
+        self.embedding_dim = embedding_dim
+        self.prompt_ms_per_kchar = prompt_ms_per_kchar
+        self.prompt_chars = []  # tamanho do prompt de cada chat completion recebido
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.port = None
+
+    @property
+    def base_url(self) -> str:
+        """Base URL no formato do SDK da OpenAI."""
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    @property
+    def root_url(self) -> str:
+        """Base URL no formato do SDK da ElevenLabs (o SDK acrescenta "v1/...")."""
+        return f"http://127.0.0.1:{self.port}/"
+
+    def _delay(self, provider: str) -> float:
+        return self.latencies.get(provider, self.latency).sample_seconds()
+
+    def _enter(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _should_fail(self) -> bool:
+        if self.failure_rate and random.random() < self.failure_rate:
+            with self._lock:
+                self.failures += 1
+            return True
+        return False
+
+    async def _transcriptions(self, request: Request):
+        self._enter()
+        try:
+            await request.body()
+            await asyncio.sleep(self._delay("stt"))
+            if self._should_fail():
+                return JSONResponse({"error": {"message": "falha simulada"}}, status_code=500)
+            return PlainTextResponse(self.transcript)
+        finally:
+            self._exit()
+
+    async def _chat_completions(self, request: Request):
+        body = await request.json()
+        prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+        self.prompt_chars.append(prompt_chars)
+        self._enter()
+        try:
+            await asyncio.sleep(self._delay("llm") + prompt_chars / 1000.0 * self.prompt_ms_per_kchar / 1000.0)
+            if self._should_fail():
+                self._exit()
+                return JSONResponse({"error": {"message": "falha simulada"}}, status_code=500)
+        except BaseException:
+            self._exit()
+            raise
+        created = int(time.time())
+        if not body.get("stream"):
+            self._exit()
+            return JSONResponse({
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": body.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": self.reply}}],
+            })
+
+        async def events():
+            try:
+                for word in self.reply.split(" "):
+                    chunk = {
+                        "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                        "model": body.get("model"),
+                        "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(self.stream_chunk_delay_ms / 1000.0)
+                yield "data: [DONE]\n\n"
+            finally:
+                self._exit()
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    def fake_embedding(self, text: str) -> np.ndarray:
+        """Vetor determinístico e normalizado a partir do hash do texto."""
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.embedding_dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    async def _embeddings(self, request: Request):
+        body = await request.json()
+        self._enter()
+        try:
+            await asyncio.sleep(self._delay("embeddings"))
+            if self._should_fail():
+                return JSONResponse({"error": {"message": "falha simulada"}}, status_code=500)
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            data = []
+            for i, item in enumerate(inputs):
+                vector = self.fake_embedding(item if isinstance(item, str) else json.dumps(item))
+                if body.get("encoding_format") == "base64":
+                    embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+                else:
+                    embedding = vector.tolist()
+                data.append({"object": "embedding", "index": i, "embedding": embedding})
+            return JSONResponse({"object": "list", "data": data, "model": body.get("model"),
+                                 "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+        finally:
+            self._exit()
+
+    async def _text_to_speech(self, request: Request):
+        body = await request.json()
+        self._enter()
+        try:
+            await asyncio.sleep(self._delay("tts"))
+            if self._should_fail():
+                self._exit()
+                return JSONResponse({"detail": {"message": "falha simulada"}}, status_code=500)
+        except BaseException:
+            self._exit()
+            raise
+        total = max(1, len(body.get("text", ""))) * self.tts_bytes_per_char
+
+        async def audio():
+            try:
+                sent = 0
+                while sent < total:
+                    size = min(self.tts_chunk_bytes, total - sent)
+                    yield b"\xff" * size  # "MP3" falso: só o tamanho importa
+                    sent += size
+                    await asyncio.sleep(self.tts_chunk_delay_ms / 1000.0)
+            finally:
+                self._exit()
+
+        return StreamingResponse(audio(), media_type="audio/mpeg")
+
+    def routes(self):
+        return [
+            Route("/v1/audio/transcriptions", self._transcriptions, methods=["POST"]),
+            Route("/v1/chat/completions", self._chat_completions, methods=["POST"]),
+            Route("/v1/embeddings", self._embeddings, methods=["POST"]),
+            Route("/v1/text-to-speech/{voice_id}", self._text_to_speech, methods=["POST"]),
+            Route("/v1/text-to-speech/{voice_id}/stream", self._text_to_speech, methods=["POST"]),
+        ]
+
+    def start(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("127.0.0.1", 0))
+        self.port = sock.getsockname()[1]
+        config = uvicorn.Config(Starlette(routes=self.routes()), log_level="warning", backlog=2048, lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [sock]}, daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Servidor falso não iniciou a tempo")
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=10)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,131 @@
+"""
+Sobe o `tapp` para o teste de carga (benchmarks/load_test.py) com todos os
+provedores (Whisper, chat, embeddings, ElevenLabs) apontando para um
+FakeProviderServer, um índice FAISS pequeno construído com os embeddings
+falsos e um monitor de atraso do event loop. Expõe, além das rotas do agente:
+
+  GET  /loadtest/stats  -> atraso do loop (amostras desde o último reset) e memória (RSS)
+  POST /loadtest/reset  -> zera as amostras e o pico de RSS
+
+    python -m benchmarks.load_server --port 8765 --providers-url http://127.0.0.1:9000/
+"""
+import argparse
+import asyncio
+import os
+import resource
+import tempfile
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+import uvicorn
+
+CATALOG = """
+A MEDENS fabrica implantes dentários e instrumentais cirúrgicos.
+Linha Zero: implantes cone morse com diâmetros de 3.5mm, 4.0mm e 5.0mm e comprimentos de 8 a 15mm.
+Linha Slim: implantes de 2.9mm para rebordos finos e regiões anteriores.
+Kits cirúrgicos: brocas, chaves e torquímetro, com estojo autoclavável.
+Componentes protéticos para a Linha Zero: pilares retos, angulados e munhões universais.
+Para preços e condições comerciais, o cliente deve falar com um consultor da MEDENS.
+"""
+
+
+def configure_environment(providers_root: str):
+    """Precisa rodar antes de importar backend.main (os clientes são criados no import)."""
+    os.environ["OPENAI_KEY"] = "sk-loadtest"
+    os.environ["OPENAI_BASE_URL"] = providers_root.rstrip("/") + "/v1"
+    os.environ["ELEVENLABS_API_KEY"] = "loadtest"
+    os.environ["ELEVENLABS_BASE_URL"] = providers_root
+    # Respostas repetidas sairiam do cache de TTS e mascarariam a carga no provedor
+    os.environ.setdefault("TTS_CACHE_MAX_BYTES", "0")
+
+
+def build_demo_index(work_dir: Path):
+    from backend import rag
+
+    data_dir = work_dir / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    (data_dir / "catalogo.txt").write_text(CATALOG * 20, encoding="utf-8")
+    # tiktoken baixaria o vocabulário pela rede; o servidor falso aceita qualquer texto
+    rag.get_embeddings().check_embedding_ctx_length = False
+    rag.INDEX_PATH = work_dir / "faiss_index"
+    rag.build_index(data_dir=str(data_dir), index_path=rag.INDEX_PATH)
+
+
+def read_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class LoadStats:
+    def __init__(self):
+        self.lag_samples = deque(maxlen=200_000)
+        self.rss_samples = 0
+        self.peak_rss = read_rss_bytes()
+
+    def on_lag_sample(self, lag: float):
+        self.lag_samples.append(lag)
+        self.rss_samples += 1
+        if self.rss_samples % 10 == 0:
+            self.peak_rss = max(self.peak_rss, read_rss_bytes())
+
+    def reset(self):
+        self.lag_samples.clear()
+        self.peak_rss = read_rss_bytes()
+
+    def snapshot(self) -> dict:
+        lags = np.fromiter(self.lag_samples, dtype=np.float64)
+        quantiles = np.percentile(lags, [50, 95, 99]) if lags.size else [0.0, 0.0, 0.0]
+        rss = read_rss_bytes()
+        return {
+            "rss_bytes": rss,
+            "peak_rss_bytes": max(self.peak_rss, rss),
+            "loop_lag_samples": int(lags.size),
+            "loop_lag_ms": {
+                "p50": quantiles[0] * 1000, "p95": quantiles[1] * 1000, "p99": quantiles[2] * 1000,
+                "max": float(lags.max()) * 1000 if lags.size else 0.0,
+            },
+        }
+
+
+async def serve(port: int, lag_interval: float):
+    from backend import metrics
+    from backend.main import tapp
+
+    stats = LoadStats()
+
+    @tapp.get("/loadtest/stats")
+    async def loadtest_stats():
+        return stats.snapshot()
+
+    @tapp.post("/loadtest/reset")
+    async def loadtest_reset():
+        stats.reset()
+        return {"ok": True}
+
+    monitor = asyncio.create_task(metrics.monitor_event_loop_lag(lag_interval, stats.on_lag_sample))
+    config = uvicorn.Config(tapp, host="127.0.0.1", port=port, log_level="warning", lifespan="off", backlog=4096)
+    try:
+        await uvicorn.Server(config).serve()
+    finally:
+        monitor.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--providers-url", required=True, help="root_url do FakeProviderServer")
+    parser.add_argument("--lag-interval-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    configure_environment(args.providers_url)
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as work_dir:
+        build_demo_index(Path(work_dir))
+        asyncio.run(serve(args.port, args.lag_interval_ms / 1000.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Teste de carga offline do /ws/voice: abre N sessões WebSocket simultâneas
+contra um worker uvicorn com o `tapp` (benchmarks/load_server.py, num processo
+próprio) cujos provedores (STT, LLM, TTS, embeddings) são o FakeProviderServer
+com latências configuráveis. Cada sessão envia PCM 16 kHz em ritmo de tempo
+real (sintético ou de um arquivo), manda `end_of_speech` e mede:
+
+  - latência do turno: do end_of_speech até o fim da resposta (áudio no modo
+    batch, `audio_end` no modo stream);
+  - TTFA (time to first audio): do end_of_speech até o primeiro frame binário;
+  - atraso do event loop do servidor (p50/p95/p99/máx) e do cliente;
+  - memória por sessão (RSS do servidor no pico da etapa, menos o RSS ocioso);
+  - vazão (turnos/s) e taxa de erro.
+
+O teto é o maior N cuja etapa fica com p95 de TTFA abaixo do SLO e taxa de
+erro abaixo do limite.
+
+    python -m benchmarks.load_test --sessions 10,50,100,200 --turns 2 --stt-ms 300 --llm-ms 400 --tts-ms 150
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import wave
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+from websockets.asyncio.client import connect
+
+from backend import metrics
+from benchmarks.fake_server import FakeProviderServer, LatencyModel
+from benchmarks.vad_corpus import SAMPLE_RATE, make_utterance_signal
+
+# Respostas de texto do agente que indicam que o turno falhou
+FAILURE_PREFIXES = ("Agente: Desculpe", "Agente: Não entendi")
+
+
+@dataclass
+class TurnResult:
+    ok: bool
+    turn_ms: Optional[float] = None
+    ttfa_ms: Optional[float] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class StepResult:
+    sessions: int
+    duration_s: float
+    turns: List[TurnResult] = field(default_factory=list)
+    server: dict = field(default_factory=dict)
+    client_lag_ms: dict = field(default_factory=dict)
+    idle_rss_bytes: int = 0
+
+    @property
+    def error_rate(self) -> float:
+        return sum(not t.ok for t in self.turns) / len(self.turns) if self.turns else 1.0
+
+    def report(self) -> dict:
+        ok = [t for t in self.turns if t.ok]
+        errors = {}
+        for t in self.turns:
+            if not t.ok:
+                errors[t.error] = errors.get(t.error, 0) + 1
+        peak_rss = self.server.get("peak_rss_bytes", 0)
+        return {
+            "sessions": self.sessions,
+            "turns": len(self.turns),
+            "error_rate": round(self.error_rate, 4),
+            "errors": errors,
+            "turns_per_second": round(len(ok) / self.duration_s, 2) if self.duration_s else 0.0,
+            "turn_ms": summarize([t.turn_ms for t in ok]),
+            "ttfa_ms": summarize([t.ttfa_ms for t in ok]),
+            "server_loop_lag_ms": {k: round(v, 2) for k, v in self.server.get("loop_lag_ms", {}).items()},
+            "client_loop_lag_ms": self.client_lag_ms,
+            "server_peak_rss_mb": round(peak_rss / 2**20, 1),
+            "memory_per_session_kb": round(max(0, peak_rss - self.idle_rss_bytes) / self.sessions / 1024, 1),
+        }
+
+
+def summarize(values) -> dict:
+    values = [v for v in values if v is not None]
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(float(p50), 1), "p95": round(float(p95), 1), "p99": round(float(p99), 1),
+            "max": round(float(max(values)), 1)}
+
+
+def find_ceiling(reports: List[dict], slo_ttfa_ms: float, max_error_rate: float) -> Optional[int]:
+    """Maior número de sessões de uma etapa dentro do SLO (as etapas seguintes não contam se uma falhar)."""
+    ceiling = None
+    for report in sorted(reports, key=lambda r: r["sessions"]):
+        p95 = report["ttfa_ms"]["p95"]
+        if p95 is None or p95 > slo_ttfa_ms or report["error_rate"] > max_error_rate:
+            break
+        ceiling = report["sessions"]
+    return ceiling
+
+
+def load_pcm(path: str) -> bytes:
+    """PCM 16 kHz mono int16: .wav (validado) ou bruto."""
+    if path.lower().endswith(".wav"):
+        with wave.open(path, "rb") as wav_file:
+            if (wav_file.getframerate(), wav_file.getnchannels(), wav_file.getsampwidth()) != (SAMPLE_RATE, 1, 2):
+                raise ValueError(f"{path}: esperado WAV 16 kHz mono 16 bits")
+            return wav_file.readframes(wav_file.getnframes())
+    with open(path, "rb") as raw:
+        return raw.read()
+
+
+def synthetic_pcm(seed: int = 0) -> bytes:
+    signal = make_utterance_signal(np.random.default_rng(seed), n_utterances=1, lead_s=0.3, tail_s=0.3)
+    return signal.pcm.tobytes()
+
+
+class LagCollector:
+    def __init__(self):
+        self.samples = []
+
+    def __call__(self, lag: float):
+        self.samples.append(lag * 1000)
+
+
+async def run_session(url: str, pcm: bytes, index: int, args, turns_out: List[TurnResult]):
+    chunk_bytes = int(SAMPLE_RATE * args.chunk_ms / 1000) * 2
+    chunk_seconds = args.chunk_ms / 1000
+    try:
+        async with connect(f"{url}&username=carga{index}", max_size=None, open_timeout=args.turn_timeout,
+                           ping_interval=None) as ws:
+            for turn in range(args.turns):
+                if turn:
+                    await asyncio.sleep(args.think_s)
+                # Ritmo de tempo real: cada chunk sai no instante em que teria sido gravado
+                start = time.perf_counter()
+                for offset in range(0, len(pcm), chunk_bytes):
+                    await ws.send(pcm[offset:offset + chunk_bytes])
+                    delay = start + (offset // chunk_bytes + 1) * chunk_seconds - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await ws.send(json.dumps({"type": "end_of_speech"}))
+                turns_out.append(await asyncio.wait_for(wait_for_reply(ws, args.tts_mode), args.turn_timeout))
+            await ws.send(json.dumps({"type": "end_of_session"}))
+    except asyncio.TimeoutError:
+        turns_out.append(TurnResult(False, error="timeout"))
+    except Exception as e:  # conexão recusada/derrubada: conta como falha do turno
+        turns_out.append(TurnResult(False, error=type(e).__name__))
+
+
+async def wait_for_reply(ws, tts_mode: str) -> TurnResult:
+    sent_at = time.perf_counter()
+    ttfa_ms = None
+    async for message in ws:
+        elapsed_ms = (time.perf_counter() - sent_at) * 1000
+        if isinstance(message, bytes):
+            if ttfa_ms is None:
+                ttfa_ms = elapsed_ms
+            if tts_mode == "batch":
+                return TurnResult(True, elapsed_ms, ttfa_ms)
+        elif message.startswith(FAILURE_PREFIXES):
+            return TurnResult(False, error="resposta de erro")
+        elif message.startswith("{") and json.loads(message).get("type") == "audio_end":
+            return TurnResult(True, elapsed_ms, ttfa_ms)
+    return TurnResult(False, error="conexão encerrada")
+
+
+def http_json(url: str, method: str = "GET") -> dict:
+    with urllib.request.urlopen(urllib.request.Request(url, method=method), timeout=10) as response:
+        return json.loads(response.read())
+
+
+async def run_step(base_url: str, ws_url: str, pcm: bytes, sessions: int, args) -> StepResult:
+    await asyncio.to_thread(http_json, f"{base_url}/loadtest/reset", "POST")
+    idle_rss = (await asyncio.to_thread(http_json, f"{base_url}/loadtest/stats"))["rss_bytes"]
+    lags = LagCollector()
+    monitor = asyncio.create_task(metrics.monitor_event_loop_lag(0.02, lags, loop_name="client"))
+    turns: List[TurnResult] = []
+
+    async def ramped(index: int):
+        await asyncio.sleep(args.ramp_s * index / sessions)
+        await run_session(ws_url, pcm, index, args, turns)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(ramped(i) for i in range(sessions)))
+    duration = time.perf_counter() - started
+    monitor.cancel()
+    server = await asyncio.to_thread(http_json, f"{base_url}/loadtest/stats")
+    return StepResult(sessions, duration, turns, server, summarize(lags.samples), idle_rss)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_agent_server(providers_url: str, log_path: str):
+    port = free_port()
+    log = open(log_path, "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.load_server", "--port", str(port), "--providers-url", providers_url],
+        stdout=log, stderr=subprocess.STDOUT, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120  # inclui a construção do índice de demonstração
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Servidor de carga saiu com código {process.returncode}; veja {log_path}")
+        try:
+            http_json(f"{base_url}/loadtest/stats")
+            return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Servidor de carga não respondeu a tempo; veja {log_path}")
+
+
+def print_report(report: dict):
+    def fmt(stats):
+        return "/".join("-" if stats[k] is None else f"{stats[k]:.0f}" for k in ("p50", "p95", "p99"))
+
+    lag = report["server_loop_lag_ms"]
+    print(f"{report['sessions']:>5} sessões | turno p50/95/99 {fmt(report['turn_ms'])} ms"
+          f" | TTFA {fmt(report['ttfa_ms'])} ms"
+          f" | lag loop p99 {lag.get('p99', 0):.1f} ms (máx {lag.get('max', 0):.0f})"
+          f" | {report['memory_per_session_kb']:.0f} KB/sessão"
+          f" | {report['turns_per_second']:.1f} turnos/s | erros {report['error_rate']:.1%}")
+
+
+async def run(args) -> dict:
+    pcm = load_pcm(args.pcm_file) if args.pcm_file else synthetic_pcm(args.seed)
+    providers = FakeProviderServer(
+        latencies={
+            "stt": LatencyModel(args.latency_kind, args.stt_ms, args.spread_ms),
+            "llm": LatencyModel(args.latency_kind, args.llm_ms, args.spread_ms),
+            "tts": LatencyModel(args.latency_kind, args.tts_ms, args.spread_ms),
+            "embeddings": LatencyModel(args.latency_kind, args.embeddings_ms, args.spread_ms),
+        },
+        failure_rate=args.failure_rate,
+    ).start()
+    process, port = await asyncio.to_thread(start_agent_server, providers.root_url, args.server_log)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        ws_url = f"ws://127.0.0.1:{port}/ws/voice?tts_mode={args.tts_mode}"
+        print(f"INFO: {len(pcm) / (2 * SAMPLE_RATE):.1f}s de áudio por turno, {args.turns} turno(s) por sessão, modo {args.tts_mode}.")
+        reports = []
+        for sessions in args.sessions:
+            step = await run_step(base_url, ws_url, pcm, sessions, args)
+            reports.append(step.report())
+            print_report(reports[-1])
+    finally:
+        process.terminate()
+        await asyncio.to_thread(process.wait, 10)
+        providers.stop()
+
+    ceiling = find_ceiling(reports, args.slo_ttfa_ms, args.max_error_rate)
+    print(f"Teto: {ceiling if ceiling is not None else 'nenhuma etapa'} sessões simultâneas "
+          f"(p95 TTFA <= {args.slo_ttfa_ms:.0f} ms, erros <= {args.max_error_rate:.0%}).")
+    return {"config": {k: v for k, v in vars(args).items() if k != "json"}, "steps": reports, "ceiling_sessions": ceiling}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=lambda s: [int(n) for n in s.split(",")], default=[10, 50, 100, 200],
+                        help="etapas de sessões simultâneas, separadas por vírgula")
+    parser.add_argument("--turns", type=int, default=2, help="turnos por sessão")
+    parser.add_argument("--think-s", type=float, default=0.5, help="pausa entre o fim de uma resposta e a próxima fala")
+    parser.add_argument("--ramp-s", type=float, default=1.0, help="janela em que as sessões de uma etapa se conectam")
+    parser.add_argument("--chunk-ms", type=int, default=100, help="duração de cada frame de PCM enviado")
+    parser.add_argument("--pcm-file", help="WAV 16 kHz mono ou PCM int16 bruto (padrão: fala sintética)")
+    parser.add_argument("--tts-mode", choices=("batch", "stream"), default="stream")
+    parser.add_argument("--turn-timeout", type=float, default=30.0)
+    parser.add_argument("--stt-ms", type=float, default=300.0)
+    parser.add_argument("--llm-ms", type=float, default=400.0)
+    parser.add_argument("--tts-ms", type=float, default=150.0, help="tempo até o primeiro byte do TTS")
+    parser.add_argument("--embeddings-ms", type=float, default=50.0)
+    parser.add_argument("--spread-ms", type=float, default=50.0)
+    parser.add_argument("--latency-kind", choices=("fixed", "uniform", "lognormal"), default="lognormal")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fração de requisições aos provedores que falham")
+    parser.add_argument("--slo-ttfa-ms", type=float, default=1500.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--server-log", default=os.devnull, help="arquivo para o stdout/stderr do servidor")
+    parser.add_argument("--json", help="grava o relatório completo neste arquivo")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(result, output, indent=2, ensure_ascii=False)
+    return result
+
+
+if __name__ == "__main__":
+    main()
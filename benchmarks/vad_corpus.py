@@ -0,0 +1,169 @@
+"""
+Corpus sintético de PCM 16 kHz para avaliar o endpointer do servidor
+(backend.vad.StreamingEndpointer): latência de fim de fala e taxa de disparos
+falsos (em ruído puro, estalos curtos e falas partidas ao meio).
+
+    python -m benchmarks.vad_corpus [--trailing-ms 300] [--seeds 20]
+"""
+import argparse
+from dataclasses import dataclass, field
+from typing import List
+
+import numpy as np
+
+from backend.vad import END_OF_SPEECH, StreamingEndpointer
+
+SAMPLE_RATE = 16000
+
+
+@dataclass
+class Signal:
+    name: str
+    pcm: np.ndarray  # int16
+    # instantes (ms) em que cada fala realmente termina; vazio para ruído puro
+    speech_ends_ms: List[float] = field(default_factory=list)
+
+
+def _noise(rng, n, level_db, kind="white"):
+    amplitude = 10 ** (level_db / 20.0)
+    if kind == "white":
+        return rng.normal(0, amplitude, n)
+    if kind == "fan":
+        # ruído grave (passa-baixas simples) + zumbido de 60 Hz
+        white = rng.normal(0, 1, n)
+        low = np.convolve(white, np.ones(32) / 32, mode="same")
+        low *= amplitude / (low.std() + 1e-12)
+        t = np.arange(n) / SAMPLE_RATE
+        return low + amplitude * 0.5 * np.sin(2 * np.pi * 60 * t)
+    raise ValueError(kind)
+
+
+def _syllable(rng, duration_s, level_db):
+    n = int(duration_s * SAMPLE_RATE)
+    t = np.arange(n) / SAMPLE_RATE
+    f0 = rng.uniform(110, 230)
+    vibrato = 1 + 0.02 * np.sin(2 * np.pi * 5 * t)
+    wave = np.zeros(n)
+    for harmonic in range(1, 12):
+        # envelope espectral grosseiro, com mais energia perto de um formante
+        formant = np.exp(-((harmonic * f0 - 700) ** 2) / (2 * 400 ** 2)) + 0.3 / harmonic
+        wave += formant * np.sin(2 * np.pi * harmonic * f0 * vibrato * t)
+    wave /= np.abs(wave).max() + 1e-12
+    envelope = np.hanning(n) ** 0.5
+    return wave * envelope * 10 ** (level_db / 20.0)
+
+
+def make_utterance_signal(rng, n_utterances=2, speech_db=-18, noise_db=-60, noise_kind="white",
+                          lead_s=0.6, gap_s=1.2, tail_s=1.0) -> Signal:
+    """Fala sintética (sílabas vozeadas com pausas curtas internas) sobre ruído de fundo."""
+    pieces = [np.zeros(int(lead_s * SAMPLE_RATE))]
+    cursor = len(pieces[0])
+    ends = []
+    for u in range(n_utterances):
+        for _ in range(rng.integers(4, 9)):
+            syllable = _syllable(rng, rng.uniform(0.12, 0.25), speech_db + rng.uniform(-4, 2))
+            pause = np.zeros(int(rng.uniform(0.02, 0.12) * SAMPLE_RATE))
+            pieces += [syllable, pause]
+            cursor += len(syllable) + len(pause)
+        ends.append((cursor - len(pause)) * 1000 / SAMPLE_RATE)
+        silence = np.zeros(int((gap_s if u < n_utterances - 1 else tail_s) * SAMPLE_RATE))
+        pieces.append(silence)
+        cursor += len(silence)
+    clean = np.concatenate(pieces)
+    mixed = clean + _noise(rng, len(clean), noise_db, noise_kind)
+    pcm = np.clip(mixed * 32767, -32768, 32767).astype(np.int16)
+    return Signal(f"fala_{noise_kind}_{noise_db}dB", pcm, ends)
+
+
+def make_noise_signal(rng, duration_s=6.0, noise_db=-35, noise_kind="white") -> Signal:
+    """Só ruído (com uma variação lenta de nível): não deve disparar fim de fala."""
+    n = int(duration_s * SAMPLE_RATE)
+    noise = _noise(rng, n, noise_db, noise_kind)
+    noise *= 1 + 0.3 * np.sin(2 * np.pi * 0.2 * np.arange(n) / SAMPLE_RATE)
+    pcm = np.clip(noise * 32767, -32768, 32767).astype(np.int16)
+    return Signal(f"ruido_{noise_kind}_{noise_db}dB", pcm)
+
+
+def make_click_signal(rng, duration_s=4.0, noise_db=-60, clicks=6) -> Signal:
+    """Estalos/batidas curtas (< min_utterance_ms) sobre silêncio: não devem virar turno."""
+    n = int(duration_s * SAMPLE_RATE)
+    signal = _noise(rng, n, noise_db)
+    for start in rng.integers(int(0.4 * SAMPLE_RATE), n - SAMPLE_RATE // 10, clicks):
+        click = _syllable(rng, rng.uniform(0.02, 0.08), -12)
+        signal[start:start + len(click)] += click
+    pcm = np.clip(signal * 32767, -32768, 32767).astype(np.int16)
+    return Signal("estalos", pcm)
+
+
+def build_corpus(seed: int = 0) -> List[Signal]:
+    rng = np.random.default_rng(seed)
+    return [
+        make_utterance_signal(rng, noise_db=-70),
+        make_utterance_signal(rng, noise_db=-45, noise_kind="white"),
+        make_utterance_signal(rng, noise_db=-40, noise_kind="fan"),
+        make_noise_signal(rng, noise_db=-35, noise_kind="white"),
+        make_noise_signal(rng, noise_db=-30, noise_kind="fan"),
+        make_click_signal(rng),
+    ]
+
+
+def run_signal(signal: Signal, endpointer: StreamingEndpointer, chunk_samples: int = 2048) -> List[float]:
+    """Alimenta o sinal em chunks (como chegam pelo WebSocket) e retorna os instantes de END_OF_SPEECH."""
+    data = signal.pcm.tobytes()
+    step = chunk_samples * 2
+    triggers = []
+    for i in range(0, len(data), step):
+        for event, at_ms in endpointer.feed(data[i:i + step]):
+            if event == END_OF_SPEECH:
+                triggers.append(at_ms)
+    return triggers
+
+
+def evaluate(corpus: List[Signal], **endpointer_kwargs) -> dict:
+    """
+    Latência: do fim real da fala até o END_OF_SPEECH correspondente.
+    Disparo falso: END_OF_SPEECH sem fala correspondente (ruído, ou fala quebrada em duas).
+    """
+    latencies, false_triggers, missed, expected = [], 0, 0, 0
+    for signal in corpus:
+        triggers = run_signal(signal, StreamingEndpointer(**endpointer_kwargs))
+        expected += len(signal.speech_ends_ms)
+        remaining = list(triggers)
+        for end_ms in signal.speech_ends_ms:
+            match = next((t for t in remaining if t >= end_ms - 100), None)
+            if match is None:
+                missed += 1
+                continue
+            # disparos antes deste casamento partiram a fala ao meio
+            false_triggers += remaining.index(match)
+            remaining = remaining[remaining.index(match) + 1:]
+            latencies.append(match - end_ms)
+        false_triggers += len(remaining)
+    return {
+        "utterances": expected,
+        "missed": missed,
+        "false_triggers": false_triggers,
+        "false_trigger_rate": false_triggers / max(1, expected),
+        "latency_ms_mean": float(np.mean(latencies)) if latencies else float("nan"),
+        "latency_ms_p95": float(np.percentile(latencies, 95)) if latencies else float("nan"),
+        "latency_ms_max": float(np.max(latencies)) if latencies else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trailing-ms", type=int, default=300)
+    parser.add_argument("--seeds", type=int, default=20)
+    args = parser.parse_args()
+
+    corpus = [signal for seed in range(args.seeds) for signal in build_corpus(seed)]
+    result = evaluate(corpus, trailing_silence_ms=args.trailing_ms)
+    print(f"Sinais: {len(corpus)}  falas: {result['utterances']}  perdidas: {result['missed']}")
+    print(f"Disparos falsos: {result['false_triggers']} ({result['false_trigger_rate']:.1%})")
+    print(f"Latência fim de fala -> endpoint: média {result['latency_ms_mean']:.0f} ms, "
+          f"p95 {result['latency_ms_p95']:.0f} ms, máx {result['latency_ms_max']:.0f} ms")
+    print("Referência: endpointing do navegador = 1000 ms (SILENCE_DURATION_MS) + VAD do worklet")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,71 +1,189 @@
-class AudioProcessor extends AudioWorkletProcessor {
-    constructor() {
-      super();
-      this.sampleRate = 48000;
-      this.volumeThreshold = 0.09; // Limiar de volume para detectar voz (0.0 a 1.0)
-      
-      // O worklet apenas reporta atividade/inatividade. A temporização é no main thread.
-      this.isTalking = false;
-      this.silenceFrameCount = 0;
-      this.silenceFrameThreshold = 5;
-  
-      this.port.onmessage = (event) => {
-        if (event.data.type === 'init') {
-          this.sampleRate = event.data.sampleRate;
-          console.log(`AudioProcessor: Initialized with sampleRate: ${this.sampleRate}`);
-        } else if (event.data.type === 'start_recording') {
-          this.isTalking = false;
-          this.silenceFrameCount = 0;
-          this.port.postMessage({ type: 'vad_status', status: 'ready' });
-          console.log(`AudioProcessor: Starting recording, ready for VAD.`);
-        } else if (event.data.type === 'stop_recording') {
-          this.isTalking = false;
-          this.silenceFrameCount = 0;
-          this.port.postMessage({ type: 'vad_status', status: 'stopped' });
-          console.log(`AudioProcessor: Stopping recording.`);
-        }
-      };
-    }
-  
-    process(inputs, outputs, parameters) {
-      const input = inputs[0];
-      const channelData = input[0];
-  
-      if (!channelData) {
-        return true;
-      }
-  
+// Tudo que roda por amostra fica aqui, fora do main thread: reamostragem com
+// filtro, conversão para int16 e montagem dos pacotes de FRAME_MS. O main thread
+// recebe um pacote pronto para enviar a cada FRAME_MS e o volume a cada VOLUME_INTERVAL_MS.
+const TARGET_SAMPLE_RATE = 16000;
+const FRAME_MS = 20;
+const VOLUME_INTERVAL_MS = 50;
+
+// Reamostrador com passa-baixa (sinc com janela de Blackman, tabela polifásica).
+// Corta em 90% do Nyquist de saída antes de decimar: a interpolação linear
+// deixava a energia acima de 8 kHz (sibilantes) dobrar de volta para a banda da fala.
+class SincResampler {
+  constructor(inputRate, outputRate, zeroCrossings = 8, phases = 256) {
+    this.step = inputRate / outputRate;
+    const cutoff = 0.9 * Math.min(1, outputRate / inputRate); // fração do Nyquist de entrada
+    this.half = Math.ceil(zeroCrossings / cutoff); // meia largura do filtro, em amostras de entrada
+    this.taps = 2 * this.half;
+    this.phases = phases;
+    this.table = new Float32Array((phases + 1) * this.taps);
+    for (let p = 0; p <= phases; p++) {
+      const frac = p / phases;
+      const base = p * this.taps;
       let sum = 0;
-      for (let i = 0; i < channelData.length; i++) {
-        sum += Math.abs(channelData[i]);
+      for (let k = 0; k < this.taps; k++) {
+        const x = k - this.half + 1 - frac; // distância (em amostras de entrada) até o instante de saída
+        const arg = Math.PI * cutoff * x;
+        const sinc = x === 0 ? 1 : Math.sin(arg) / arg;
+        const taper = Math.abs(x) >= this.half ? 0
+          : 0.42 + 0.5 * Math.cos(Math.PI * x / this.half) + 0.08 * Math.cos(2 * Math.PI * x / this.half);
+        this.table[base + k] = sinc * taper;
+        sum += sinc * taper;
+      }
+      // Ganho 1 em DC em todas as fases
+      for (let k = 0; k < this.taps; k++) {
+        this.table[base + k] /= sum;
+      }
+    }
+    // Histórico de entrada: começa com half - 1 zeros, a primeira saída é a amostra 0
+    this.buffer = new Float32Array(this.taps + 1024);
+    this.length = this.half - 1;
+    this.pos = this.half - 1;
+    this.output = new Float32Array(1024);
+  }
+
+  // Reamostra um bloco; a saída (subarray reutilizado) vale até a próxima chamada
+  process(input) {
+    if (this.length + input.length > this.buffer.length) {
+      const grown = new Float32Array(2 * (this.length + input.length));
+      grown.set(this.buffer.subarray(0, this.length));
+      this.buffer = grown;
+    }
+    const maxOut = Math.ceil(input.length / this.step) + 2;
+    if (this.output.length < maxOut) {
+      this.output = new Float32Array(maxOut);
+    }
+    this.buffer.set(input, this.length);
+    this.length += input.length;
+
+    let n = 0;
+    while (true) {
+      const i = Math.floor(this.pos);
+      if (i + this.half >= this.length) break;
+      const base = Math.round((this.pos - i) * this.phases) * this.taps;
+      const start = i - this.half + 1;
+      let acc = 0;
+      for (let k = 0; k < this.taps; k++) {
+        acc += this.buffer[start + k] * this.table[base + k];
       }
-      let averageVolume = sum / channelData.length;
-      this.port.postMessage({ type: 'volume', volume: averageVolume });
-  
-      // Lógica de Detecção de Atividade de Voz (VAD)
-      const hasVoiceActivity = averageVolume > this.volumeThreshold;
-  
-      if (hasVoiceActivity) {
+      this.output[n++] = acc;
+      this.pos += this.step;
+    }
+
+    // Descarta a entrada que nenhuma saída futura usa
+    const drop = Math.floor(this.pos) - this.half + 1;
+    if (drop > 0) {
+      this.buffer.copyWithin(0, drop, this.length);
+      this.length -= drop;
+      this.pos -= drop;
+    }
+    return this.output.subarray(0, n);
+  }
+}
+
+class AudioProcessor extends AudioWorkletProcessor {
+  constructor() {
+    super();
+    this.volumeThreshold = 0.09; // Limiar de volume para detectar voz (0.0 a 1.0)
+
+    // O worklet apenas reporta atividade/inatividade. A temporização é no main thread.
+    this.isTalking = false;
+    this.silenceFrameCount = 0;
+    this.silenceFrameThreshold = 5;
+
+    this.configure(sampleRate, TARGET_SAMPLE_RATE, FRAME_MS);
+
+    this.port.onmessage = (event) => {
+      if (event.data.type === 'init') {
+        this.configure(event.data.sampleRate || sampleRate, event.data.targetSampleRate || TARGET_SAMPLE_RATE,
+                       event.data.frameMs || FRAME_MS);
+        console.log(`AudioProcessor: Initialized with sampleRate: ${this.sampleRate} -> ${this.targetSampleRate}, ${this.packet.length} samples per packet`);
+      } else if (event.data.type === 'start_recording') {
+        this.isTalking = false;
         this.silenceFrameCount = 0;
-        if (!this.isTalking) {
-          this.isTalking = true;
-          this.port.postMessage({ type: 'vad_status', status: 'voice_activity' }); // Manda 'voice_activity' (início de fala)
-        }
-      } else {
-        this.silenceFrameCount++;
-        if (this.isTalking && this.silenceFrameCount >= this.silenceFrameThreshold) {
-          // Se estava falando e atingiu o limite de frames de silêncio
-          this.isTalking = false;
-          this.silenceFrameCount = 0;
-          this.port.postMessage({ type: 'vad_status', status: 'no_voice_activity' }); // Manda 'no_voice_activity' (fim de fala)
-        }
+        this.packetLength = 0;
+        this.port.postMessage({ type: 'vad_status', status: 'ready' });
+        console.log(`AudioProcessor: Starting recording, ready for VAD.`);
+      } else if (event.data.type === 'stop_recording') {
+        this.isTalking = false;
+        this.silenceFrameCount = 0;
+        this.packetLength = 0;
+        this.port.postMessage({ type: 'vad_status', status: 'stopped' });
+        console.log(`AudioProcessor: Stopping recording.`);
+      }
+    };
+  }
+
+  configure(inputRate, targetRate, frameMs) {
+    this.sampleRate = inputRate;
+    this.targetSampleRate = targetRate;
+    this.resampler = inputRate === targetRate ? null : new SincResampler(inputRate, targetRate);
+    this.packet = new Int16Array(Math.round(targetRate * frameMs / 1000));
+    this.packetLength = 0;
+    this.volumeSum = 0;
+    this.volumeSamples = 0;
+    this.volumeIntervalSamples = Math.round(inputRate * VOLUME_INTERVAL_MS / 1000);
+  }
+
+  // Converte para int16 e posta um pacote a cada FRAME_MS (buffer transferido, sem cópia)
+  pushSamples(samples) {
+    for (let i = 0; i < samples.length; i++) {
+      const s = Math.max(-1, Math.min(1, samples[i]));
+      this.packet[this.packetLength++] = s < 0 ? s * 0x8000 : s * 0x7FFF;
+      if (this.packetLength === this.packet.length) {
+        this.port.postMessage({ type: 'audio', pcm: this.packet.buffer }, [this.packet.buffer]);
+        this.packet = new Int16Array(this.packet.length);
+        this.packetLength = 0;
       }
-  
-      // Envia os Dados PCM (Float32) para o main thread
-      this.port.postMessage({ type: 'audio', audioData: channelData.buffer }, [channelData.buffer]);
-  
+    }
+  }
+
+  process(inputs, outputs, parameters) {
+    const input = inputs[0];
+    const channelData = input[0];
+
+    if (!channelData) {
       return true;
     }
+
+    let sum = 0;
+    for (let i = 0; i < channelData.length; i++) {
+      sum += Math.abs(channelData[i]);
+    }
+    let averageVolume = sum / channelData.length;
+
+    // Volume para o visualizador: média de VOLUME_INTERVAL_MS, não um postMessage por bloco de 128 amostras
+    this.volumeSum += sum;
+    this.volumeSamples += channelData.length;
+    if (this.volumeSamples >= this.volumeIntervalSamples) {
+      this.port.postMessage({ type: 'volume', volume: this.volumeSum / this.volumeSamples });
+      this.volumeSum = 0;
+      this.volumeSamples = 0;
+    }
+
+    // Lógica de Detecção de Atividade de Voz (VAD)
+    const hasVoiceActivity = averageVolume > this.volumeThreshold;
+
+    if (hasVoiceActivity) {
+      this.silenceFrameCount = 0;
+      if (!this.isTalking) {
+        this.isTalking = true;
+        this.port.postMessage({ type: 'vad_status', status: 'voice_activity' }); // Manda 'voice_activity' (início de fala)
+      }
+    } else {
+      this.silenceFrameCount++;
+      if (this.isTalking && this.silenceFrameCount >= this.silenceFrameThreshold) {
+        // Se estava falando e atingiu o limite de frames de silêncio
+        this.isTalking = false;
+        this.silenceFrameCount = 0;
+        this.port.postMessage({ type: 'vad_status', status: 'no_voice_activity' }); // Manda 'no_voice_activity' (fim de fala)
+      }
+    }
+
+    // PCM 16 kHz int16 em pacotes de FRAME_MS para o main thread
+    this.pushSamples(this.resampler ? this.resampler.process(channelData) : channelData);
+
+    return true;
   }
-  
-  registerProcessor('audio-processor', AudioProcessor);
\ No newline at end of file
+}
+
+registerProcessor('audio-processor', AudioProcessor);
@@ -1,6 +1,10 @@
 const startBtn = document.getElementById('startBtn');
 const stopBtn = document.getElementById('stopBtn');
 const usernameInput = document.getElementById('username');
+const ttsModeSelect = document.getElementById('ttsMode');
+const serverVadCheckbox = document.getElementById('serverVad');
+const compactProtocolCheckbox = document.getElementById('compactProtocol');
+const partialSttCheckbox = document.getElementById('partialStt');
 const messagesDiv = document.getElementById('messages');
 const statusDiv = document.getElementById('statusDiv');
 const audioVisualizer = document.getElementById('audioVisualizer');
@@ -18,10 +22,53 @@ let isUserTalking = false;
 let silenceTimeoutId = null;
 const SILENCE_DURATION_MS = 1000;
 
+// Com VAD no servidor, o fim de fala é decidido pelo backend (sem o timer acima)
+let useServerVad = false;
+
 let audioQueue = [];
 let isPlayingQueue = false;
+// Resposta em modo "stream" tocando por MediaSource (StreamingAudioPlayer), se o navegador suporta
+let streamingPlayer = null;
+
+// Modo "stream": os chunks MP3 de cada sentença chegam aos poucos e são
+// agrupados aqui até o servidor sinalizar 'audio_segment_end'.
+let ttsMode = 'batch';
+let pendingSegmentChunks = [];
+let isAwaitingMoreAudio = false;
+
+// Barge-in: se o usuário falar por BARGE_IN_CONFIRM_MS enquanto o agente
+// responde, a resposta é interrompida e o servidor cancela o turno.
+const BARGE_IN_CONFIRM_MS = 250;
+let bargeInTimeoutId = null;
+let currentSource = null;
+let isAwaitingReply = false;
+let isDiscardingAgentAudio = false;
+let playedSegmentsInReply = 0; // trechos da resposta atual que começaram a tocar
 
 const SAMPLE_RATE_TARGET = 16000; // Taxa de amostragem alvo para o backend (Whisper)
+const UPLINK_FRAME_MS = 20; // O worklet reamostra e entrega PCM int16 em pacotes deste tamanho
+
+// Protocolo binário (backend/protocol.py): cabeçalho de 14 bytes big-endian
+// (versão, tipo, flags, codec, seq u32, turno u16, ms u32) + payload.
+// O uplink vai em mu-law (8 bits por amostra, metade do PCM 16 bits).
+const PROTOCOL_VERSION = 1;
+const HEADER_SIZE = 14;
+const FRAME_AUDIO = 1;
+const FRAME_CONTROL = 2;
+const FRAME_TRANSCRIPT = 3;
+const FRAME_REPLY = 4;
+const CODEC_PCM16 = 1;
+const CODEC_MULAW = 2;
+let useCompactProtocol = false;
+let uplinkCodec = CODEC_PCM16;
+let uplinkSeq = 0;
+let sessionStartedAt = 0;
+// Sessão retomável: o token fica no sessionStorage (por usuário) até o fim da sessão pelo botão Parar
+let sessionStorageKey = null;
+// Legenda provisória da fala em andamento (transcrição incremental); some quando chega o 'Você:'
+let partialTranscriptEl = null;
+const textEncoder = new TextEncoder();
+const textDecoder = new TextDecoder();
 
 // Função para adicionar mensagens ao chat
 function addMessage(sender, text) {
@@ -30,6 +77,24 @@ function addMessage(sender, text) {
   el.textContent = text;
   messagesDiv.appendChild(el);
   messagesDiv.scrollTop = messagesDiv.scrollHeight;
+  return el;
+}
+
+function showPartialTranscript(text) {
+  if (!partialTranscriptEl) {
+    partialTranscriptEl = addMessage('user', text);
+    partialTranscriptEl.style.opacity = '0.6';
+  } else {
+    partialTranscriptEl.textContent = text;
+    messagesDiv.scrollTop = messagesDiv.scrollHeight;
+  }
+}
+
+function clearPartialTranscript() {
+  if (partialTranscriptEl) {
+    partialTranscriptEl.remove();
+    partialTranscriptEl = null;
+  }
 }
 
 // Funções do Visualizador de Áudio
@@ -51,28 +116,177 @@ function updateVisualizerVolume(volume) {
 }
 
 // Funções de Processamento de Áudio
-function float32ToInt16(buffer) {
-  const l = buffer.length;
-  const result = new Int16Array(l);
-  for (let i = 0; i < l; i++) {
-    result[i] = Math.min(1, buffer[i]) * 0x7FFF;
+// G.711 mu-law, igual ao mulaw_encode do backend
+function int16ToMulaw(samples) {
+  const result = new Uint8Array(samples.length);
+  for (let i = 0; i < samples.length; i++) {
+    let sample = samples[i];
+    const sign = sample < 0 ? 0x80 : 0;
+    const magnitude = Math.min(Math.abs(sample), 32635) + 0x84;
+    const exponent = Math.max(0, Math.min(7, Math.floor(Math.log2(magnitude)) - 7));
+    const mantissa = (magnitude >> (exponent + 3)) & 0x0F;
+    result[i] = ~(sign | (exponent << 4) | mantissa) & 0xFF;
   }
   return result;
 }
 
-function resampleAudio(buffer, originalRate, targetRate) {
-  if (originalRate === targetRate) return buffer;
-  const ratio = originalRate / targetRate;
-  const newLen = Math.round(buffer.length / ratio);
-  const result = new Float32Array(newLen);
-  for (let i = 0; i < newLen; i++) {
-    const idx = i * ratio;
-    const low = Math.floor(idx);
-    const high = Math.min(buffer.length - 1, Math.ceil(idx));
-    const frac = idx - low;
-    result[i] = buffer[low] + frac * (buffer[high] - buffer[low]);
+function encodeFrame(type, codec, payload) {
+  const frame = new Uint8Array(HEADER_SIZE + payload.byteLength);
+  const view = new DataView(frame.buffer);
+  view.setUint8(0, PROTOCOL_VERSION);
+  view.setUint8(1, type);
+  view.setUint8(2, 0);
+  view.setUint8(3, codec);
+  view.setUint32(4, uplinkSeq++ >>> 0);
+  view.setUint16(8, 0); // o turno é numerado pelo servidor
+  view.setUint32(10, Math.round(performance.now() - sessionStartedAt) >>> 0);
+  frame.set(new Uint8Array(payload.buffer || payload, payload.byteOffset || 0, payload.byteLength), HEADER_SIZE);
+  return frame.buffer;
+}
+
+function sendControl(control) {
+  if (!socket || socket.readyState !== WebSocket.OPEN) return;
+  if (useCompactProtocol) {
+    socket.send(encodeFrame(FRAME_CONTROL, 0, textEncoder.encode(JSON.stringify(control))));
+  } else {
+    socket.send(JSON.stringify(control));
+  }
+}
+
+function sendAudio(pcm16) {
+  if (!useCompactProtocol) {
+    socket.send(pcm16.buffer); // Envia ArrayBuffer
+  } else if (uplinkCodec === CODEC_MULAW) {
+    socket.send(encodeFrame(FRAME_AUDIO, CODEC_MULAW, int16ToMulaw(pcm16)));
+  } else {
+    socket.send(encodeFrame(FRAME_AUDIO, CODEC_PCM16, pcm16));
+  }
+}
+
+// Modo "stream" com MediaSource: os chunks MP3 vão direto para um SourceBuffer e o
+// <audio> começa a tocar com o primeiro, sem esperar a sentença inteira nem o decodeAudioData.
+// Sem suporte a audio/mpeg no MediaSource (ex.: Safari no iOS), fica a fila de Blobs por sentença.
+const STREAM_MIME = 'audio/mpeg';
+const canStreamPlayback = typeof MediaSource !== 'undefined' && MediaSource.isTypeSupported(STREAM_MIME);
+const SEGMENT_END = Symbol('segment_end');
+
+class StreamingAudioPlayer {
+  constructor(onEnded, onError) {
+    this.onEnded = onEnded;
+    this.onError = onError;
+    this.queue = []; // chunks (ArrayBuffer) e marcadores de fim de sentença, na ordem de chegada
+    this.segmentEnds = []; // instante (s) do áudio em que cada sentença termina
+    this.finished = false;
+    this.closed = false;
+    this.sourceBuffer = null;
+    this.mediaSource = new MediaSource();
+    this.url = URL.createObjectURL(this.mediaSource);
+    this.audio = new Audio(this.url);
+
+    this.mediaSource.addEventListener('sourceopen', () => {
+      if (this.closed) return;
+      this.sourceBuffer = this.mediaSource.addSourceBuffer(STREAM_MIME);
+      this.sourceBuffer.mode = 'sequence'; // sentenças emendadas, sem depender dos timestamps do MP3
+      this.sourceBuffer.addEventListener('updateend', () => this.pump());
+      this.pump();
+    }, { once: true });
+    this.audio.addEventListener('ended', () => {
+      if (this.closed) return;
+      const played = this.playedSegments();
+      this.close();
+      this.onEnded(played);
+    });
+    this.audio.addEventListener('error', () => this.fail(this.audio.error));
+    // Sem dados ainda: o play() só resolve quando o primeiro chunk estiver no buffer
+    this.audio.play().catch(e => this.fail(e));
+  }
+
+  push(chunk) {
+    this.queue.push(chunk);
+    this.pump();
+  }
+
+  endSegment() {
+    this.queue.push(SEGMENT_END);
+    this.pump();
+  }
+
+  // Último chunk da resposta: fecha o stream e o 'ended' do <audio> avisa quando terminar de tocar
+  finish() {
+    this.finished = true;
+    this.pump();
+  }
+
+  pump() {
+    if (this.closed || !this.sourceBuffer || this.sourceBuffer.updating) return;
+    while (this.queue[0] === SEGMENT_END) {
+      this.queue.shift();
+      this.segmentEnds.push(this.bufferedEnd());
+    }
+    if (this.queue.length > 0) {
+      try {
+        this.sourceBuffer.appendBuffer(this.queue.shift());
+      } catch (e) {
+        this.fail(e);
+      }
+    } else if (this.finished && this.mediaSource.readyState === 'open') {
+      this.mediaSource.endOfStream();
+    }
+  }
+
+  bufferedEnd() {
+    const buffered = this.sourceBuffer ? this.sourceBuffer.buffered : null;
+    return buffered && buffered.length > 0 ? buffered.end(buffered.length - 1) : 0;
+  }
+
+  // Sentenças que já começaram a tocar (o barge-in informa isso ao servidor)
+  playedSegments() {
+    const now = this.audio.currentTime;
+    if (now <= 0) return 0;
+    const lastEnd = this.segmentEnds.length > 0 ? this.segmentEnds[this.segmentEnds.length - 1] : 0;
+    const segmentsWithAudio = this.segmentEnds.length + (this.bufferedEnd() > lastEnd ? 1 : 0);
+    return Math.min(segmentsWithAudio, 1 + this.segmentEnds.filter(end => end <= now).length);
+  }
+
+  fail(error) {
+    if (this.closed) return;
+    this.close();
+    this.onError(error);
+  }
+
+  close() {
+    if (this.closed) return;
+    this.closed = true;
+    this.audio.pause();
+    this.audio.removeAttribute('src');
+    this.audio.load();
+    URL.revokeObjectURL(this.url);
+  }
+}
+
+// Trechos da resposta atual que começaram a tocar, em qualquer dos dois modos de reprodução
+function currentPlayedSegments() {
+  return streamingPlayer ? streamingPlayer.playedSegments() : playedSegmentsInReply;
+}
+
+function onStreamingPlaybackEnded(played) {
+  streamingPlayer = null;
+  playedSegmentsInReply = played;
+  onAgentAudioFinished();
+}
+
+function onStreamingPlaybackError(error) {
+  console.error('Error playing streamed audio (from agent):', error);
+  streamingPlayer = null;
+  isAwaitingMoreAudio = false;
+  isAgentSpeaking = false;
+  isAwaitingReply = false;
+  statusDiv.textContent = 'Status: Erro na reprodução do áudio do agente.';
+  if (socket && socket.readyState === WebSocket.OPEN && !isUserTalking) {
+    statusDiv.textContent = 'Status: Erro na reprodução. Pronto para nova fala.';
+    isRecordingActive = true;
+    startAudioVisualizerAnimation();
   }
-  return result;
 }
 
 // Função para tocar áudio da fila
@@ -95,32 +309,21 @@ async function playNextAudio() {
       source.buffer = buffer;
       source.connect(audioContext.destination);
       source.start(0);
+      currentSource = source;
+      playedSegmentsInReply++;
       
       source.onended = () => {
+        currentSource = null;
         isPlayingQueue = false;
         
         // Se há mais áudios na fila, toca o próximo
         if (audioQueue.length > 0) {
           playNextAudio();
+        } else if (isAwaitingMoreAudio) {
+          // Modo stream: a próxima sentença ainda está sendo sintetizada
+          console.log('DEBUG JS: Aguardando próxima sentença do agente.');
         } else {
-          // Acabou de falar, volta a gravar (se o socket ainda estiver aberto)
-          isAgentSpeaking = false;
-          if (socket && socket.readyState === WebSocket.OPEN) {
-              statusDiv.textContent = 'Status: Pronto para nova fala.';
-              // Se o usuário já estiver falando (isUserTalking true do VAD), continua enviando. Caso contrário, prepara para receber a próxima fala.
-              if (!isUserTalking) {
-                  isRecordingActive = true;
-                  startAudioVisualizerAnimation();
-                  console.log('DEBUG JS: Agente terminou de falar, microfone reativado.');
-              } else {
-                  console.log("DEBUG JS: Agente terminou de falar, usuário já estava falando. Mantendo gravação ativa.");
-                  isRecordingActive = true; // Continua o envio.
-              }
-          } else {
-              // Socket pode ter sido fechado durante a fala do agente
-              console.log('DEBUG JS: Agente terminou de falar, mas socket não está OPEN. Sessão encerrada.');
-              resetFrontendState(false);
-          }
+          onAgentAudioFinished();
         }
       };
     } catch (e) {
@@ -143,11 +346,191 @@ async function playNextAudio() {
   }
 }
 
+// Acabou de falar, volta a gravar (se o socket ainda estiver aberto)
+function onAgentAudioFinished() {
+  isAgentSpeaking = false;
+  isAwaitingReply = false;
+  if (socket && socket.readyState === WebSocket.OPEN) {
+      statusDiv.textContent = 'Status: Pronto para nova fala.';
+      // Se o usuário já estiver falando (isUserTalking true do VAD), continua enviando. Caso contrário, prepara para receber a próxima fala.
+      if (!isUserTalking) {
+          isRecordingActive = true;
+          startAudioVisualizerAnimation();
+          console.log('DEBUG JS: Agente terminou de falar, microfone reativado.');
+      } else {
+          console.log("DEBUG JS: Agente terminou de falar, usuário já estava falando. Mantendo gravação ativa.");
+          isRecordingActive = true; // Continua o envio.
+      }
+  } else {
+      // Socket pode ter sido fechado durante a fala do agente
+      console.log('DEBUG JS: Agente terminou de falar, mas socket não está OPEN. Sessão encerrada.');
+      resetFrontendState(false);
+  }
+}
+
+// Para o áudio do agente e descarta o que estava na fila
+function flushAgentAudio() {
+  if (streamingPlayer) {
+    playedSegmentsInReply = streamingPlayer.playedSegments();
+    streamingPlayer.close();
+    streamingPlayer = null;
+  }
+  if (currentSource) {
+    currentSource.onended = null;
+    try {
+      currentSource.stop();
+    } catch (e) {
+      console.log('DEBUG JS: Fonte de áudio já parada.');
+    }
+    currentSource = null;
+  }
+  audioQueue = [];
+  pendingSegmentChunks = [];
+  isPlayingQueue = false;
+  isAwaitingMoreAudio = false;
+  isAgentSpeaking = false;
+  isAwaitingReply = false;
+}
+
+// O usuário interrompeu o agente: avisa o servidor (quanto foi tocado) e volta a ouvir
+function sendBargeIn() {
+  console.log('DEBUG JS: Barge-in, trechos tocados:', currentPlayedSegments());
+  sendControl({ type: 'barge_in', played_segments: currentPlayedSegments() });
+  flushAgentAudio();
+  isDiscardingAgentAudio = true;
+  isRecordingActive = true;
+  startAudioVisualizerAnimation();
+  statusDiv.textContent = 'Status: Ouvindo...';
+}
+
+// Mensagens de controle (JSON) do servidor
+function handleControlMessage(control) {
+  if (control.type === 'cancel') {
+    if (isDiscardingAgentAudio) {
+      // Confirmação do barge-in enviado por nós
+      isDiscardingAgentAudio = false;
+    } else {
+      // Barge-in detectado pelo servidor (VAD no servidor)
+      console.log('DEBUG JS: Turno cancelado pelo servidor, trechos tocados:', currentPlayedSegments());
+      sendControl({ type: 'playback_stopped', played_segments: currentPlayedSegments() });
+      flushAgentAudio();
+      isRecordingActive = true;
+      statusDiv.textContent = 'Status: Ouvindo...';
+    }
+  } else if (control.type === 'audio_segment_end') {
+    if (streamingPlayer) {
+      streamingPlayer.endSegment();
+    } else if (pendingSegmentChunks.length > 0) {
+      audioQueue.push(new Blob(pendingSegmentChunks, { type: 'audio/mpeg' }));
+      pendingSegmentChunks = [];
+      if (!isPlayingQueue) {
+        playNextAudio();
+      }
+    }
+  } else if (control.type === 'end_of_speech_detected') {
+    console.log('DEBUG JS: Fim de fala detectado pelo servidor');
+    isAwaitingReply = true;
+    statusDiv.textContent = 'Status: Processando...';
+  } else if (control.type === 'hello') {
+    // Protocolo binário aceito: o servidor confirma o codec do uplink
+    console.log('DEBUG JS: Protocolo binário v' + control.version + ', uplink ' + control.codec);
+    uplinkCodec = control.codec === 'mulaw' ? CODEC_MULAW : CODEC_PCM16;
+  } else if (control.type === 'keepalive') {
+    // Mantém a conexão ativa em proxies; nada a fazer
+  } else if (control.type === 'partial_transcript') {
+    showPartialTranscript(control.text);
+  } else if (control.type === 'audio_overflow') {
+    // A fala passou do limite do servidor; o excesso é descartado (ou o início, com drop_oldest)
+    console.log('DEBUG JS: Fala acima do limite do servidor:', control);
+    addMessage('system', `Fala muito longa (máximo de ${control.max_seconds} s). Finalize a fala para o agente responder.`);
+  } else if (control.type === 'session') {
+    sessionStorage.setItem(sessionStorageKey, control.token);
+    if (control.resumed) {
+      addMessage('system', `Conversa retomada (${control.messages} mensagens anteriores).`);
+    }
+  } else if (control.type === 'audio_end') {
+    console.log('DEBUG JS: Fim do áudio da resposta (stream).');
+    isAwaitingMoreAudio = false;
+    if (streamingPlayer) {
+      streamingPlayer.finish(); // o 'ended' do <audio> chama onAgentAudioFinished
+    } else if (!isPlayingQueue && audioQueue.length === 0 && isAgentSpeaking) {
+      onAgentAudioFinished();
+    }
+  } else {
+    console.log('DEBUG JS: Mensagem de controle desconhecida:', control);
+  }
+}
+
+// Chunk de áudio (MP3, ArrayBuffer) da resposta do agente
+function handleAgentAudio(data) {
+  if (isDiscardingAgentAudio) {
+    // Resposta interrompida: chunks que já estavam a caminho antes do 'cancel'
+    return;
+  }
+  console.log('DEBUG JS: Áudio recebido do agente');
+  isAgentSpeaking = true;
+
+  if (ttsMode === 'stream' && canStreamPlayback) {
+    // Chunk parcial: toca assim que entra no SourceBuffer
+    isAwaitingMoreAudio = true;
+    if (!streamingPlayer) {
+      streamingPlayer = new StreamingAudioPlayer(onStreamingPlaybackEnded, onStreamingPlaybackError);
+    }
+    streamingPlayer.push(data);
+  } else if (ttsMode === 'stream') {
+    // Chunk parcial: só vai para a fila quando a sentença terminar
+    isAwaitingMoreAudio = true;
+    pendingSegmentChunks.push(data);
+  } else {
+    audioQueue.push(new Blob([data], { type: 'audio/mpeg' }));
+    if (!isPlayingQueue) {
+      playNextAudio();
+    }
+  }
+
+  isRecordingActive = false;
+  stopAudioVisualizerAnimation();
+  statusDiv.textContent = 'Status: Agente falando...';
+}
+
+// Texto do servidor: controle (JSON), transcrição ou resposta
+function handleTextMessage(text) {
+  console.log('DEBUG JS: Texto recebido:', text);
+
+  if (text.startsWith('{')) {
+    let control = null;
+    try {
+      control = JSON.parse(text);
+    } catch (e) {
+      console.log('DEBUG JS: Texto com "{" mas não é JSON:', text);
+    }
+    if (control) {
+      handleControlMessage(control);
+      return;
+    }
+  }
+
+  if (text.startsWith('Você:')) {
+    playedSegmentsInReply = 0;
+    clearPartialTranscript();
+    addMessage('user', text.substring(5));
+  } else if (text.startsWith('Agente:')) {
+    addMessage('assistant', text.substring(7));
+  } else {
+    addMessage('system', text);
+  }
+}
+
 // Função para resetar o estado do frontend completamente
 function resetFrontendState(closeSocketExplicitly = true) {
     startBtn.disabled = false;
     stopBtn.disabled = true;
     usernameInput.disabled = false;
+    ttsModeSelect.disabled = false;
+    serverVadCheckbox.disabled = false;
+    compactProtocolCheckbox.disabled = false;
+    partialSttCheckbox.disabled = false;
+    clearPartialTranscript();
     statusDiv.textContent = 'Status: Aguardando.';
     messagesDiv.innerHTML = '';
     
@@ -185,11 +568,25 @@ function resetFrontendState(closeSocketExplicitly = true) {
     isUserTalking = false;
     audioQueue = [];
     isPlayingQueue = false;
+    if (streamingPlayer) {
+      streamingPlayer.close();
+      streamingPlayer = null;
+    }
+    pendingSegmentChunks = [];
+    isAwaitingMoreAudio = false;
+    currentSource = null;
+    isAwaitingReply = false;
+    isDiscardingAgentAudio = false;
+    playedSegmentsInReply = 0;
     
     if (silenceTimeoutId !== null) {
       clearTimeout(silenceTimeoutId);
       silenceTimeoutId = null;
     }
+    if (bargeInTimeoutId !== null) {
+      clearTimeout(bargeInTimeoutId);
+      bargeInTimeoutId = null;
+    }
     
     if (closeSocketExplicitly && socket && (socket.readyState === WebSocket.OPEN || socket.readyState === WebSocket.CONNECTING)) {
       socket.close();
@@ -203,6 +600,10 @@ startBtn.addEventListener('click', async () => {
   startBtn.disabled = true;
   stopBtn.disabled = true;
   usernameInput.disabled = true;
+  ttsModeSelect.disabled = true;
+  serverVadCheckbox.disabled = true;
+  compactProtocolCheckbox.disabled = true;
+  partialSttCheckbox.disabled = true;
 
   statusDiv.textContent = 'Status: Conectando...';
   addMessage('system', 'Conectando ao agente...');
@@ -215,7 +616,18 @@ startBtn.addEventListener('click', async () => {
   }
 
   // Inicializa o socket
-  socket = new WebSocket(`ws://localhost:8000/ws/voice?username=${encodeURIComponent(username)}`);
+  ttsMode = ttsModeSelect.value;
+  useServerVad = serverVadCheckbox.checked;
+  useCompactProtocol = compactProtocolCheckbox.checked;
+  uplinkCodec = CODEC_PCM16;
+  uplinkSeq = 0;
+  sessionStartedAt = performance.now();
+  const protocolParams = useCompactProtocol ? `&protocol=${PROTOCOL_VERSION}&codecs=mulaw,pcm16` : '';
+  sessionStorageKey = `voiceSession:${username}`;
+  const sessionToken = sessionStorage.getItem(sessionStorageKey) || 'new';
+  socket = new WebSocket(`ws://localhost:8000/ws/voice?username=${encodeURIComponent(username)}&tts_mode=${ttsMode}&server_vad=${useServerVad ? 1 : 0}${protocolParams}&partial_stt=${partialSttCheckbox.checked ? 1 : 0}&session=${encodeURIComponent(sessionToken)}`);
+  // Áudio como ArrayBuffer nos dois protocolos: vai direto para o SourceBuffer, na ordem de chegada
+  socket.binaryType = 'arraybuffer';
 
   socket.onopen = async () => {
     console.log('WebSocket conectado');
@@ -239,26 +651,21 @@ startBtn.addEventListener('click', async () => {
       audioInputNode = audioContext.createMediaStreamSource(microphoneStream);
       audioWorkletNode = new AudioWorkletNode(audioContext, 'audio-processor');
       
-      // Envia a taxa de amostragem original para o worklet
-      audioWorkletNode.port.postMessage({ type: 'init', sampleRate: audioContext.sampleRate });
+      // O worklet reamostra da taxa do AudioContext para SAMPLE_RATE_TARGET e monta os pacotes
+      audioWorkletNode.port.postMessage({ type: 'init', sampleRate: audioContext.sampleRate,
+                                          targetSampleRate: SAMPLE_RATE_TARGET, frameMs: UPLINK_FRAME_MS });
 
       audioWorkletNode.port.onmessage = event => {
         if (event.data.type === 'volume') {
           updateVisualizerVolume(event.data.volume);
         } else if (event.data.type === 'audio') {
-          const floatData = new Float32Array(event.data.audioData);
-          let resampled = floatData;
+          // PCM 16 kHz int16, UPLINK_FRAME_MS por mensagem, já reamostrado no worklet
+          const pcm16 = new Int16Array(event.data.pcm);
           
-          // Reamostragem no main thread
-          if (audioContext.sampleRate !== SAMPLE_RATE_TARGET) {
-            resampled = resampleAudio(floatData, audioContext.sampleRate, SAMPLE_RATE_TARGET);
-          }
-          
-          const pcm16 = float32ToInt16(resampled);
-          
-          // isRecordingActive controla se o áudio do mic é enviado
-          if (isRecordingActive && !isAgentSpeaking && socket.readyState === WebSocket.OPEN) {
-            socket.send(pcm16.buffer); // Envia ArrayBuffer
+          // isRecordingActive controla se o áudio do mic é enviado; com o usuário
+          // falando, envia mesmo durante a resposta do agente (barge-in)
+          if (((isRecordingActive && !isAgentSpeaking) || isUserTalking) && socket.readyState === WebSocket.OPEN) {
+            sendAudio(pcm16);
           }
           
         } else if (event.data.type === 'vad_status') {
@@ -284,12 +691,31 @@ startBtn.addEventListener('click', async () => {
                 console.log("DEBUG JS: Voz detectada, mas agente está falando. Microfone pausado temporariamente.");
                 isRecordingActive = false;
             }
+
+            // Fala durante a resposta do agente: confirma por BARGE_IN_CONFIRM_MS antes de interromper
+            if ((isAgentSpeaking || isAwaitingReply) && bargeInTimeoutId === null) {
+              bargeInTimeoutId = setTimeout(() => {
+                bargeInTimeoutId = null;
+                if (isUserTalking && (isAgentSpeaking || isAwaitingReply)) {
+                  sendBargeIn();
+                }
+              }, BARGE_IN_CONFIRM_MS);
+            }
             
           } else if (event.data.status === 'no_voice_activity') {
             console.log('DEBUG JS: Silêncio detectado');
+
+            if (bargeInTimeoutId !== null) {
+              clearTimeout(bargeInTimeoutId);
+              bargeInTimeoutId = null;
+            }
             
+            if (useServerVad) {
+                // O servidor decide o fim de fala; o áudio continua sendo enviado
+                isUserTalking = false;
+                stopAudioVisualizerAnimation();
             // Se o usuário estava falando E não há timer de silêncio ativo E agente não está falando
-            if (isUserTalking && silenceTimeoutId === null && !isAgentSpeaking) {
+            } else if (isUserTalking && silenceTimeoutId === null && !isAgentSpeaking) {
                 console.log('DEBUG JS: Agendando end_of_speech');
                 
                 silenceTimeoutId = setTimeout(() => {
@@ -300,7 +726,8 @@ startBtn.addEventListener('click', async () => {
                   
                   if (socket && socket.readyState === WebSocket.OPEN) {
                     console.log('DEBUG JS: readyState é OPEN. Enviando sinal...');
-                    socket.send(JSON.stringify({ type: 'end_of_speech' }));
+                    sendControl({ type: 'end_of_speech' });
+                    isAwaitingReply = true;
                     statusDiv.textContent = 'Status: Processando...';
                   } else {
                     console.log('DEBUG JS: NÃO foi possível enviar end_of_speech. Socket estado:', 
@@ -346,30 +773,29 @@ startBtn.addEventListener('click', async () => {
   };
 
   socket.onmessage = async event => {
-    if (event.data instanceof Blob) {
-      console.log('DEBUG JS: Áudio recebido do agente');
-      isAgentSpeaking = true;
-      audioQueue.push(event.data);
-      
-      if (!isPlayingQueue) {
-        playNextAudio();
-      }
-      
-      isRecordingActive = false;
-      stopAudioVisualizerAnimation();
-      statusDiv.textContent = 'Status: Agente falando...';
-      
-    } else {
-      const text = event.data;
-      console.log('DEBUG JS: Texto recebido:', text);
-      
-      if (text.startsWith('Você:')) {
-        addMessage('user', text.substring(5));
-      } else if (text.startsWith('Agente:')) {
-        addMessage('assistant', text.substring(7));
+    if (!useCompactProtocol) {
+      if (event.data instanceof ArrayBuffer) {
+        handleAgentAudio(event.data);
       } else {
-        addMessage('system', text);
+        handleTextMessage(event.data);
       }
+      return;
+    }
+    const view = new DataView(event.data);
+    if (event.data.byteLength < HEADER_SIZE || view.getUint8(0) !== PROTOCOL_VERSION) {
+      console.log('DEBUG JS: Frame inválido descartado:', event.data.byteLength, 'bytes');
+      return;
+    }
+    const type = view.getUint8(1);
+    const payload = event.data.slice(HEADER_SIZE);
+    if (type === FRAME_AUDIO) {
+      handleAgentAudio(payload);
+    } else if (type === FRAME_TRANSCRIPT) {
+      handleTextMessage('Você: ' + textDecoder.decode(payload));
+    } else if (type === FRAME_REPLY) {
+      handleTextMessage('Agente: ' + textDecoder.decode(payload));
+    } else {
+      handleTextMessage(textDecoder.decode(payload));
     }
   };
 
@@ -383,7 +809,7 @@ startBtn.addEventListener('click', async () => {
   socket.onclose = event => {
     console.log('WebSocket fechado:', event.code, event.reason);
     statusDiv.textContent = 'Status: Desconectado.';
-    addMessage('system', 'Conexão encerrada.');
+    addMessage('system', event.reason === 'idle' ? 'Conexão encerrada por inatividade.' : 'Conexão encerrada.');
     resetFrontendState();
   };
 });
@@ -392,7 +818,11 @@ stopBtn.addEventListener('click', () => {
   console.log('Botão parar clicado');
   
   if (socket && socket.readyState === WebSocket.OPEN) {
-    socket.send(JSON.stringify({ type: 'end_of_session' }));
+    sendControl({ type: 'end_of_session' });
+  }
+  // Fim de sessão pedido pelo usuário: a próxima conversa começa do zero
+  if (sessionStorageKey) {
+    sessionStorage.removeItem(sessionStorageKey);
   }
   
   resetFrontendState();
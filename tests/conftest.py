@@ -1,9 +1,43 @@
+import hashlib
 import os
+os.environ.setdefault("OPENAI_KEY", "sk-test")  # backend.* exige a chave no import
+
 import pytest
 from fastapi.testclient import TestClient
+from langchain.embeddings.base import Embeddings
+
+import backend.rag as rag
 from backend.main import tapp
 
 @pytest.fixture(scope="session")
 def client():
     os.environ["OPENAI_KEY"] = "sk-test"  # se você fizer mocks
     return TestClient(tapp)
+
+
+class HashEmbeddings(Embeddings):
+    """Embeddings determinísticos (hash do texto), sem rede; guardam os textos embeddados."""
+
+    model = "fake-embedding"
+
+    def __init__(self):
+        self.embedded = []
+
+    def _embed(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [b / 255.0 for b in digest[:16]]
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    """HashEmbeddings novo por teste, também no lugar dos embeddings do RAG (backend.rag.embeddings)."""
+    fake = HashEmbeddings()
+    monkeypatch.setattr(rag, "embeddings", fake)
+    return fake
@@ -0,0 +1,172 @@
+import io
+import itertools
+import json
+import os
+import tracemalloc
+import wave
+from functools import partial
+
+import pytest
+
+from backend.audio import (
+    PCM_BYTES_PER_SECOND,
+    DebugAudioRecorder,
+    PcmRingBuffer,
+    UtteranceBuffers,
+    WAV_HEADER_SIZE,
+    pcm_to_wav_stream,
+    wav_header,
+)
+
+
+def test_wav_stream_is_valid_wav_and_matches_pcm():
+    pcm = bytearray(os.urandom(16000 * 2))
+    view = memoryview(pcm)
+    wav = pcm_to_wav_stream(view)
+    assert len(wav) == WAV_HEADER_SIZE + len(pcm)
+
+    with wave.open(io.BytesIO(wav.read())) as reader:
+        assert reader.getframerate() == 16000
+        assert reader.getnchannels() == 1
+        assert reader.getsampwidth() == 2
+        assert reader.readframes(reader.getnframes()) == bytes(pcm)
+    wav.close()
+    view.release()
+    pcm.clear()  # nenhuma view pendente sobre o buffer da sessão
+
+
+def test_wav_stream_over_multiple_parts_reads_in_small_chunks():
+    parts = [b"\x01\x00" * 10, bytearray(b"\x02\x00" * 7)]
+    wav = pcm_to_wav_stream(parts)
+    chunks = []
+    while True:
+        chunk = wav.read(5)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    data = b"".join(chunks)
+    assert data[:WAV_HEADER_SIZE] == wav_header(34)
+    assert data[WAV_HEADER_SIZE:] == b"\x01\x00" * 10 + b"\x02\x00" * 7
+    wav.seek(WAV_HEADER_SIZE)
+    assert wav.read(2) == b"\x01\x00"
+
+
+def test_convert_pcm_to_wav_writes_no_files(tmp_path, monkeypatch):
+    import backend.main as main_module
+
+    monkeypatch.chdir(tmp_path)
+    wav = main_module.convert_pcm_to_wav(memoryview(bytearray(3200)))
+    assert wav.read(4) == b"RIFF"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_debug_recorder_disabled_by_default(tmp_path):
+    recorder = DebugAudioRecorder(tmp_path / "dbg")
+    assert not recorder.enabled
+    assert not any(recorder.should_record() for _ in range(100))
+
+
+def test_debug_recorder_rotates_by_size(tmp_path):
+    recorder = DebugAudioRecorder(tmp_path / "dbg", sample_rate=1.0, max_bytes=3 * (WAV_HEADER_SIZE + 1000))
+    paths = [recorder.record(pcm_to_wav_stream(bytes(1000))) for _ in range(5)]
+    remaining = sorted(p.name for p in (tmp_path / "dbg").iterdir())
+    assert remaining == sorted(p.name for p in paths[-3:])
+
+
+@pytest.mark.parametrize("rate", [0.25])
+def test_debug_recorder_samples_fraction_of_turns(tmp_path, rate):
+    recorder = DebugAudioRecorder(tmp_path, sample_rate=rate)
+    hits = sum(recorder.should_record() for _ in range(4000))
+    assert 0.15 * 4000 < hits < 0.35 * 4000
+
+
+def test_ring_buffer_wraps_and_hands_out_zero_copy_views():
+    ring = PcmRingBuffer(10, "drop_oldest")
+    assert ring.write(b"\x01\x01\x02\x02\x03\x03") == (6, 0)
+    # Passa da capacidade: descarta só a amostra mais antiga, não o chunk inteiro
+    assert ring.write(b"\x04\x04\x05\x05\x06\x06") == (6, 2)
+    views = ring.views()
+    assert len(views) == 2 and all(v.obj is ring._data for v in views)
+    assert b"".join(views) == bytes(ring) == b"\x02\x02\x03\x03\x04\x04\x05\x05\x06\x06"
+    wav = pcm_to_wav_stream(views)
+    assert wav.read()[WAV_HEADER_SIZE:] == bytes(ring)
+    wav.close()
+    for view in views:
+        view.release()
+    assert ring.dropped_bytes == 2 and ring.overflowed
+    ring.clear()
+    assert len(ring) == 0 and not ring.overflowed and ring.reserved_bytes == 10
+
+
+def test_ring_buffer_reject_keeps_start_of_utterance():
+    ring = PcmRingBuffer(8, "reject")
+    assert ring.write(b"\x01" * 6) == (6, 0)
+    assert ring.write(b"\x02" * 6) == (2, 4)
+    assert bytes(ring) == b"\x01" * 6 + b"\x02" * 2 and ring.rejected_bytes == 4
+    with pytest.raises(ValueError):
+        PcmRingBuffer(8, "grow")
+
+
+def test_utterance_buffers_reuse_spare_after_turn_finishes():
+    reserved = []
+    buffers = UtteranceBuffers(max_seconds=1, policy="endpoint", on_reserve=reserved.append)
+    buffers.write(b"\x01\x00" * 100)
+    first_turn = buffers.take()
+    buffers.write(b"\x02\x00" * 50)  # fala nova enquanto o turno processa
+    assert len(first_turn) == 200 and len(buffers) == 100
+    first_turn.clear()  # o turno terminou
+    second_turn = buffers.take()
+    assert buffers.active is first_turn and len(second_turn) == 100
+    assert buffers.stats()["buffers"] == 2 and sum(reserved) == buffers.reserved_bytes == 2 * PCM_BYTES_PER_SECOND
+    buffers.close()
+    assert sum(reserved) == 0
+
+
+def test_memory_stays_flat_with_500_sessions_streaming_10_minutes():
+    """500 clientes que nunca mandam end_of_speech, 10 min de áudio cada (mensagens de 1 s, fala máxima de 2 s)."""
+    chunk = bytes(PCM_BYTES_PER_SECOND)
+    tracemalloc.start()
+    try:
+        sessions = [UtteranceBuffers(max_seconds=2, policy=policy)
+                    for policy in itertools.islice(itertools.cycle(("endpoint", "drop_oldest", "reject")), 500)]
+        samples = []
+        for second in range(600):
+            for buffers in sessions:
+                accepted, _ = buffers.write(chunk)
+                if buffers.active.overflowed and buffers.policy == "endpoint":
+                    # Como o ws_voice: encerra a fala, o turno roda e devolve o buffer
+                    turn = buffers.take()
+                    buffers.write(memoryview(chunk)[accepted:])
+                    turn.clear()
+            if second % 60 == 59:
+                samples.append(tracemalloc.get_traced_memory()[0])
+    finally:
+        tracemalloc.stop()
+    reserved = sum(b.reserved_bytes for b in sessions)
+    assert reserved <= 500 * 2 * 2 * PCM_BYTES_PER_SECOND
+    # Do 1º ao 10º minuto a memória não cresce (a tolerância cobre objetos pequenos do interpretador)
+    assert max(samples) - samples[0] < 64 * 1024
+    assert samples[0] < reserved + 1024 * 1024
+    assert all(b.stats()["high_water_bytes"] <= b.capacity for b in sessions)
+
+
+def test_ws_voice_auto_endpoints_utterance_at_max_length(client, monkeypatch):
+    import backend.main as main_module
+
+    turns = []
+
+    async def fake_turn(audio_buffer, user_id, history, ws, set_processing, tts_mode, turn_state=None):
+        turns.append(len(audio_buffer))
+        audio_buffer.clear()
+        set_processing(False)
+
+    monkeypatch.setattr(main_module, "handle_user_turn_logic", fake_turn)
+    monkeypatch.setattr(main_module, "UtteranceBuffers", partial(UtteranceBuffers, max_seconds=0.5, policy="endpoint"))
+    with client.websocket_connect("/ws/voice?username=ana") as ws:
+        for _ in range(3):
+            ws.send_bytes(bytes(6400))  # 200 ms por mensagem
+        assert json.loads(ws.receive_text()) == {"type": "end_of_speech_detected", "reason": "max_utterance"}
+        ws.send_text(json.dumps({"type": "end_of_speech_button"}))
+        ws.send_text(json.dumps({"type": "end_of_session"}))
+    # 0,5 s de fala no primeiro turno; o resto da mensagem que estourou vai para o próximo
+    assert turns == [16000, 3200]
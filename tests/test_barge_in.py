@@ -0,0 +1,124 @@
+import asyncio
+import json
+
+import pytest
+
+import backend.main as main_module
+from backend.main import trim_reply_to_played
+
+from tests.test_streaming import FakeWebSocket
+
+
+def _patch_stream_turn(monkeypatch, closed):
+    second_segment_started = asyncio.Event()
+
+    async def fake_transcribe(data):
+        return "Quais linhas vocês têm?"
+
+    async def fake_chat_stream(username, messages):
+        try:
+            for delta in ["Temos a Linha Zero. ", "E também a Slim, ", "que é mais curta."]:
+                yield delta
+        finally:
+            closed.append("llm")
+
+    async def fake_tts_stream(text):
+        try:
+            if not text.startswith("Temos"):
+                second_segment_started.set()
+                await asyncio.sleep(30)  # o usuário interrompe antes desta síntese terminar
+            yield text.encode()
+        finally:
+            closed.append("tts")
+
+    monkeypatch.setattr(main_module, "transcribe_bytes", fake_transcribe)
+    monkeypatch.setattr(main_module, "chat_rag_stream", fake_chat_stream)
+    monkeypatch.setattr(main_module, "synthesize_tts_stream", fake_tts_stream)
+    return second_segment_started
+
+
+@pytest.mark.asyncio
+async def test_cancelled_stream_turn_keeps_only_spoken_segments(monkeypatch):
+    closed = []
+    second_segment_started = _patch_stream_turn(monkeypatch, closed)
+    ws, history, flags, turn_state = FakeWebSocket(), [], [], {}
+
+    task = asyncio.create_task(main_module.handle_user_turn_logic(
+        bytearray(32000), "ana", history, ws, flags.append, "stream", turn_state=turn_state))
+    await asyncio.wait_for(second_segment_started.wait(), 1)
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert history == [
+        {"role": "user", "content": "Quais linhas vocês têm?"},
+        {"role": "assistant", "content": "Temos a Linha Zero."},
+    ]
+    assert [payload for kind, payload in ws.sent if kind == "bytes"] == [b"Temos a Linha Zero."]
+    assert "llm" in closed and closed.count("tts") == 2
+    assert turn_state["reply_history_index"] == 1
+    assert flags == [False]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_turn_respects_played_segments(monkeypatch):
+    second_segment_started = _patch_stream_turn(monkeypatch, [])
+    history, turn_state = [], {}
+
+    task = asyncio.create_task(main_module.handle_user_turn_logic(
+        bytearray(32000), "ana", history, FakeWebSocket(), lambda value: None, "stream", turn_state=turn_state))
+    await asyncio.wait_for(second_segment_started.wait(), 1)
+    await asyncio.sleep(0.01)
+    # o cliente recebeu o primeiro trecho, mas ainda não tinha começado a tocá-lo
+    turn_state["played_segments"] = 0
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert history == [{"role": "user", "content": "Quais linhas vocês têm?"}]
+
+
+def test_trim_reply_to_played():
+    history = [{"role": "user", "content": "oi"}, {"role": "assistant", "content": "Olá. Tudo bem? Posso ajudar?"}]
+    turn_state = {"reply_history_index": 1, "spoken_segments": ["Olá.", "Tudo bem?", "Posso ajudar?"]}
+
+    assert trim_reply_to_played(history, turn_state, 2)
+    assert history[-1] == {"role": "assistant", "content": "Olá. Tudo bem?"}
+    assert not trim_reply_to_played(history, turn_state, 1)  # só vale uma vez por resposta
+
+    turn_state = {"reply_history_index": 1, "spoken_segments": ["Olá. Tudo bem?"]}
+    assert trim_reply_to_played(history, turn_state, 0)
+    assert history == [{"role": "user", "content": "oi"}]
+
+
+def test_ws_barge_in_cancels_turn_and_buffers_new_audio(client, monkeypatch):
+    turns, cancelled = [], []
+
+    async def fake_turn(audio_buffer_ref, user_id_ref, history, ws_ref, set_flag, tts_mode="batch", turn_state=None):
+        turns.append(len(audio_buffer_ref))
+        try:
+            if len(turns) == 1:
+                await asyncio.sleep(30)
+            await ws_ref.send_text("Agente: ok")
+        except asyncio.CancelledError:
+            cancelled.append(turn_state.get("played_segments"))
+            raise
+        finally:
+            set_flag(False)
+
+    monkeypatch.setattr(main_module, "handle_user_turn_logic", fake_turn)
+
+    with client.websocket_connect("/ws/voice?username=teste") as ws:
+        ws.send_bytes(b"\x01\x00" * 16000)
+        ws.send_text(json.dumps({"type": "end_of_speech_button"}))
+        ws.send_bytes(b"\x02\x00" * 3000)  # usuário volta a falar durante o turno
+        ws.send_text(json.dumps({"type": "barge_in", "played_segments": 1}))
+        assert json.loads(ws.receive_text()) == {"type": "cancel"}
+        ws.send_bytes(b"\x02\x00" * 1000)
+        ws.send_text(json.dumps({"type": "end_of_speech_button"}))
+        assert ws.receive_text() == "Agente: ok"
+        ws.send_text(json.dumps({"type": "end_of_session"}))
+
+    assert cancelled == [1]
+    assert turns == [32000, 8000]
@@ -0,0 +1,160 @@
+import threading
+
+import numpy as np
+import pytest
+
+import backend.main as main_module
+from backend.cache import SemanticAnswerCache, TTSCache, document_id, tts_cache_key
+from backend.providers.elevenlabs_api import ElevenLabsTTS
+from backend.providers.openai_api import OpenAIChat
+
+
+def test_tts_cache_key_normalizes_whitespace_only():
+    key = tts_cache_key("Olá,  tudo bem?\n", "voz", "modelo", "mp3")
+    assert key == tts_cache_key(" Olá, tudo bem?", "voz", "modelo", "mp3")
+    assert key != tts_cache_key("olá, tudo bem?", "voz", "modelo", "mp3")
+    assert key != tts_cache_key("Olá, tudo bem?", "outra_voz", "modelo", "mp3")
+
+
+def test_tts_cache_evicts_least_recently_used_by_bytes():
+    cache = TTSCache(max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"5678")
+    assert cache.get("a") == b"1234"  # "a" passa a ser a mais recente
+    cache.put("c", b"90ab")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234" and cache.get("c") == b"90ab"
+    stats = cache.stats()
+    assert stats["bytes"] == 8 and stats["evictions"] == 1
+    assert stats["hits"] == 3 and stats["misses"] == 1 and stats["bytes_served"] == 12
+
+
+def test_tts_cache_persists_to_disk(tmp_path):
+    cache = TTSCache(max_bytes=100, directory=tmp_path)
+    cache.put("k", b"audio")
+    cache.persist("k", b"audio")
+
+    restarted = TTSCache(max_bytes=100, directory=tmp_path)
+    assert restarted.get("k") is None
+    assert restarted.load("k") == b"audio"
+    assert restarted.get("k") == b"audio"  # promovida para a memória
+    assert restarted.load("outra") is None
+    assert restarted.stats()["disk_hits"] == 1 and restarted.stats()["misses"] == 1
+
+
+def test_tts_cache_disk_is_bounded(tmp_path):
+    cache = TTSCache(max_bytes=100, directory=tmp_path, max_disk_bytes=10)
+    for key in ("a", "b", "c"):
+        cache.persist(key, b"12345")
+    assert sum(f.stat().st_size for f in tmp_path.glob("*.audio")) <= 10
+
+
+def test_tts_cache_is_thread_safe():
+    cache = TTSCache(max_bytes=1000)
+
+    def worker(seed):
+        for i in range(2000):
+            key = str((seed * 7 + i) % 50)
+            if cache.get(key) is None:
+                cache.put(key, b"x" * 30)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = cache.stats()
+    assert stats["bytes"] <= 1000 and stats["bytes"] == stats["entries"] * 30
+
+
+def test_semantic_cache_threshold_and_doc_ids():
+    cache = SemanticAnswerCache(threshold=0.95, ttl_seconds=60)
+    cache.store([1.0, 0.0, 0.0], ["d1", "d2"], "Temos a Linha Zero.")
+
+    assert cache.lookup([0.99, 0.05, 0.0], ["d1", "d2"]) == "Temos a Linha Zero."
+    assert cache.lookup([0.6, 0.8, 0.0], ["d1", "d2"]) is None  # pergunta diferente
+    assert cache.lookup([1.0, 0.0, 0.0], ["d3"]) is None  # outros documentos
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_semantic_cache_ttl_and_max_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("backend.cache.time.monotonic", lambda: now[0])
+    cache = SemanticAnswerCache(threshold=0.9, ttl_seconds=10, max_entries=2)
+    cache.store([1, 0], ["d"], "um")
+    now[0] += 11
+    assert cache.lookup([1, 0], ["d"]) is None
+    assert cache.stats()["expired"] == 1
+
+    for i, vector in enumerate(([1, 0], [0, 1], [1, 1])):
+        cache.store(vector, ["d"], str(i))
+    assert cache.stats()["entries"] == 2 and cache.stats()["evictions"] == 1
+    assert cache.lookup([1, 0], ["d"]) is None
+
+
+def test_document_id_falls_back_to_content_hash():
+    class Doc:
+        id = None
+        page_content = "Linha Zero"
+        metadata = {"source": "catalogo.txt"}
+
+    assert document_id(Doc()) == document_id(Doc())
+    Doc.id = "abc"
+    assert document_id(Doc()) == "abc"
+
+
+@pytest.mark.asyncio
+async def test_synthesize_tts_uses_cache(monkeypatch):
+    renders = []
+
+    class FakeTTS:
+        def convert(self, voice_id, output_format, text, model_id):
+            renders.append(text)
+
+            async def chunks():
+                yield b"mp3-"
+                yield text.encode()
+            return chunks()
+
+    class FakeElevenLabs:
+        text_to_speech = FakeTTS()
+
+    monkeypatch.setattr(main_module, "tts_provider", ElevenLabsTTS(FakeElevenLabs(), voice_id="voz"))
+    monkeypatch.setattr(main_module, "tts_cache", TTSCache(max_bytes=1000))
+
+    first = await main_module.synthesize_tts("Olá!")
+    second = await main_module.synthesize_tts(" Olá! ")
+    assert first == second == "mp3-Olá!".encode()
+    assert renders == ["Olá!"]
+    assert main_module.tts_cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_chat_rag_uses_semantic_cache(monkeypatch):
+    calls = []
+
+    class Doc:
+        id = "doc-1"
+        page_content = "Linha Zero: implantes cone morse."
+        metadata = {}
+
+    monkeypatch.setattr(main_module, "query_index_with_embedding", lambda text: ([Doc()], np.array([1.0, 0.0])))
+    monkeypatch.setattr(main_module, "answer_cache", SemanticAnswerCache(threshold=0.95, ttl_seconds=60))
+
+    class DummyClient:
+        class chat:
+            class completions:
+                @staticmethod
+                async def create(*args, **kwargs):
+                    calls.append(kwargs)
+                    message = type("M", (), {"content": "Temos a Linha Zero."})
+                    return type("R", (), {"choices": [type("C", (), {"message": message})]})
+
+    monkeypatch.setattr(main_module, "llm_provider", OpenAIChat(DummyClient()))
+
+    question = [{"role": "user", "content": "Quais implantes vocês têm?"}]
+    assert await main_module.chat_rag("ana", question) == "Temos a Linha Zero."
+    assert await main_module.chat_rag("bia", question) == "Temos a Linha Zero."
+    assert len(calls) == 1
+    streamed = [delta async for delta in main_module.chat_rag_stream("caio", question)]
+    assert streamed == ["Temos a Linha Zero."] and len(calls) == 1
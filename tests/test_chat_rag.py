@@ -2,6 +2,7 @@ import pytest
 import asyncio
 from backend.main import chat_rag
 import backend.main as main_module
+from backend.providers.openai_api import OpenAIChat
 
 class DummyDoc:
     page_content = "conteúdo de teste"
@@ -10,20 +11,20 @@ class DummyDoc:
 def mock_query_and_client(monkeypatch):
     # Mocka a função query_index usada em backend.main
     monkeypatch.setattr(main_module, "query_index", lambda text: [DummyDoc()])
-    # Mocka o cliente OpenAI presente em backend.main
+    # Mocka o cliente OpenAI (assíncrono) presente em backend.main
     class DummyClient:
         class chat:
             class completions:
                 @staticmethod
-                def create(*args, **kwargs):
+                async def create(*args, **kwargs):
                     class Resp:
                         def __init__(self):
                             self.choices = [type("C", (), {"message": type("M", (), {"content": "resposta teste"})})()]
                     return Resp()
-    monkeypatch.setattr(main_module, "client", DummyClient())
+    monkeypatch.setattr(main_module, "llm_provider", OpenAIChat(DummyClient()))
 
 @pytest.mark.asyncio
 async def test_chat_rag_returns_mock():
     # Executa a função chat_rag com dados mockados
-    result = await chat_rag("pergunta qualquer")
+    result = await chat_rag("usuario", [{"role": "user", "content": "pergunta qualquer"}])
     assert "resposta teste" in result, f"Esperado 'resposta teste', mas obteve: {result}"
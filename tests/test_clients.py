@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+import backend.main as main_module
+from backend.clients import ProviderLimiter, backoff_delay, create_http_client, create_openai_client
+from backend.providers.openai_api import OpenAIChat, OpenAISTT
+from benchmarks.fake_server import FakeProviderServer, LatencyModel
+
+CONCURRENT_TURNS = 120
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    def setup(concurrency=16, timeout=5.0, max_retries=2, **server_kwargs):
+        server = FakeProviderServer(**server_kwargs).start()
+        client = create_openai_client("sk-fake", base_url=server.base_url,
+                                      http_client=create_http_client(max_connections=200, max_keepalive_connections=200))
+        stt = ProviderLimiter("stt", concurrency, timeout, max_retries=max_retries, base_delay=0.01, max_delay=0.05)
+        llm = ProviderLimiter("llm", concurrency, timeout, max_retries=max_retries, base_delay=0.01, max_delay=0.05)
+        monkeypatch.setattr(main_module, "stt_provider", OpenAISTT(client))
+        monkeypatch.setattr(main_module, "llm_provider", OpenAIChat(client))
+        monkeypatch.setattr(main_module, "stt_limiter", stt)
+        monkeypatch.setattr(main_module, "llm_limiter", llm)
+        monkeypatch.setattr(main_module, "query_index", lambda text: [])
+        servers.append(server)
+        return server, stt, llm
+
+    servers = []
+    yield setup
+    for server in servers:
+        server.stop()
+
+
+async def _turn(i):
+    text = await main_module.transcribe_bytes(bytearray(32000))
+    reply = await main_module.chat_rag(f"user{i}", [{"role": "user", "content": text}])
+    return text, reply
+
+
+@pytest.mark.asyncio
+async def test_many_concurrent_turns_are_bounded_by_config(fake_openai):
+    server, stt, llm = fake_openai(concurrency=16, latency=LatencyModel("uniform", 30, 10))
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(_turn(i) for i in range(CONCURRENT_TURNS)))
+    elapsed = time.perf_counter() - start
+
+    assert all(text.strip() == server.transcript and reply == server.reply for text, reply in results)
+    assert stt.max_in_flight == 16 and llm.max_in_flight == 16
+    assert server.max_in_flight <= 32
+    assert stt.failures == llm.failures == 0
+    # 120 turnos em lotes de 16 (~40 ms por etapa): bem abaixo do serial (~120 * 80 ms)
+    assert elapsed < CONCURRENT_TURNS * 0.08 / 3
+
+
+@pytest.mark.asyncio
+async def test_streaming_chat_holds_llm_slot_until_done(fake_openai):
+    server, stt, llm = fake_openai(concurrency=4, latency=LatencyModel("fixed", 10))
+
+    async def stream_turn(i):
+        return "".join([d async for d in main_module.chat_rag_stream("u", [{"role": "user", "content": "oi"}])])
+
+    replies = await asyncio.gather(*(stream_turn(i) for i in range(20)))
+    assert all(r.strip() == server.reply for r in replies)
+    assert llm.max_in_flight == 4 and llm.in_flight == 0
+    assert server.max_in_flight <= 4
+
+
+@pytest.mark.asyncio
+async def test_transient_server_errors_are_retried(fake_openai):
+    server, stt, llm = fake_openai(concurrency=8, max_retries=6, failure_rate=0.3)
+    results = await asyncio.gather(*(_turn(i) for i in range(40)))
+    assert len(results) == 40
+    assert server.failures > 0
+    assert stt.retries + llm.retries == server.failures
+
+
+@pytest.mark.asyncio
+async def test_call_timeout_is_enforced(fake_openai):
+    server, stt, llm = fake_openai(concurrency=2, timeout=0.05, max_retries=1, latency=LatencyModel("fixed", 500))
+    with pytest.raises(asyncio.TimeoutError):
+        await main_module.chat_rag("u", [{"role": "user", "content": "oi"}])
+    assert llm.timeouts == 2 and llm.retries == 1 and llm.failures == 1
+
+
+@pytest.mark.asyncio
+async def test_non_retryable_errors_fail_fast():
+    limiter = ProviderLimiter("llm", 1, 1.0, max_retries=3, base_delay=0.01)
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        raise ValueError("erro de programação")
+
+    with pytest.raises(ValueError):
+        await limiter.call(request)
+    assert len(attempts) == 1 and limiter.retries == 0
+
+
+def test_backoff_delay_has_jitter_and_cap():
+    delays = [backoff_delay(5, 0.25, 1.0) for _ in range(200)]
+    assert all(0 <= d <= 1.0 for d in delays)
+    assert len(set(delays)) > 100
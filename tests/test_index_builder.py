@@ -0,0 +1,148 @@
+import asyncio
+import threading
+
+import pytest
+from langchain_community.vectorstores import FAISS
+
+from backend import index_builder, rag
+
+
+def _build(data_dir, index_dir, embeddings, **kwargs):
+    return asyncio.run(index_builder.build_index_incremental(data_dir, index_dir, embeddings, **kwargs))
+
+
+def _load(index_dir, embeddings):
+    return FAISS.load_local(str(rag.published_dir(index_dir)), embeddings, allow_dangerous_deserialization=True)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    data_dir = tmp_path / "data"
+    (data_dir / "linhas").mkdir(parents=True)
+    (data_dir / "linhas" / "zero.txt").write_text("Linha Zero: implantes cone morse de 3.5mm a 5mm.", encoding="utf-8")
+    (data_dir / "slim.txt").write_text("Linha Slim: implantes curtos para rebordos finos.", encoding="utf-8")
+    (data_dir / "kits.txt").write_text("Kits cirúrgicos com brocas e chaves.", encoding="utf-8")
+    return data_dir
+
+
+def test_second_build_without_changes_embeds_nothing(tmp_path, corpus, embeddings):
+    index_dir = tmp_path / "idx"
+    plan = _build(corpus, index_dir, embeddings)
+    assert plan.summary()["added_files"] == 3 and len(embeddings.embedded) == 3
+    version = (index_dir / rag.VERSION_FILENAME).read_text()
+
+    plan = _build(corpus, index_dir, embeddings)
+    assert not plan.has_changes and len(embeddings.embedded) == 3
+    assert (index_dir / rag.VERSION_FILENAME).read_text() == version  # nada republicado
+
+
+def test_incremental_build_updates_only_changed_files(tmp_path, corpus, embeddings):
+    index_dir = tmp_path / "idx"
+    _build(corpus, index_dir, embeddings)
+    embeddings.embedded.clear()
+
+    (corpus / "slim.txt").write_text("Linha Slim: agora também em 2.9mm.", encoding="utf-8")
+    (corpus / "kits.txt").unlink()
+    (corpus / "proteses.txt").write_text("Componentes protéticos para a Linha Zero.", encoding="utf-8")
+    plan = _build(corpus, index_dir, embeddings)
+
+    summary = plan.summary()
+    assert (summary["added_files"], summary["changed_files"], summary["removed_files"]) == (1, 1, 1)
+    assert summary["stale_vectors"] == 2
+    assert sorted(embeddings.embedded) == ["Componentes protéticos para a Linha Zero.", "Linha Slim: agora também em 2.9mm."]
+
+    store = _load(index_dir, embeddings)
+    contents = sorted(doc.page_content for doc in store.docstore._dict.values())
+    assert store.index.ntotal == 3
+    assert contents == sorted([
+        "Linha Zero: implantes cone morse de 3.5mm a 5mm.",
+        "Linha Slim: agora também em 2.9mm.",
+        "Componentes protéticos para a Linha Zero.",
+    ])
+    manifest = index_builder.load_manifest(index_dir)
+    assert set(manifest["files"]) == {"linhas/zero.txt", "slim.txt", "proteses.txt"}
+
+
+def test_dry_run_reports_without_embedding_or_writing(tmp_path, corpus, embeddings):
+    index_dir = tmp_path / "idx"
+    _build(corpus, index_dir, embeddings)
+    embeddings.embedded.clear()
+    (corpus / "kits.txt").write_text("Kits cirúrgicos com brocas, chaves e torquímetro.", encoding="utf-8")
+    manifest_path = rag.published_dir(index_dir) / index_builder.MANIFEST_FILENAME
+    manifest_before = manifest_path.read_text()
+
+    plan = _build(corpus, index_dir, embeddings, dry_run=True)
+    assert plan.summary()["chunks_to_embed"] == 1 and plan.summary()["stale_vectors"] == 1
+    assert embeddings.embedded == []
+    assert manifest_path.read_text() == manifest_before
+
+
+def test_crash_before_publishing_keeps_manifest_and_index_together(tmp_path, corpus, embeddings, monkeypatch):
+    index_dir = tmp_path / "idx"
+    _build(corpus, index_dir, embeddings)
+    (corpus / "proteses.txt").write_text("Componentes protéticos para a Linha Zero.", encoding="utf-8")
+
+    def crash(index_dir, version):
+        raise RuntimeError("processo morto antes do VERSION")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(rag, "_write_version_file", crash)
+        with pytest.raises(RuntimeError):
+            _build(corpus, index_dir, embeddings)
+    assert "proteses.txt" not in index_builder.load_manifest(index_dir)["files"]
+
+    # O build seguinte parte do par publicado (índice + manifesto), sem IDs duplicados
+    plan = _build(corpus, index_dir, embeddings)
+    assert plan.summary()["added_files"] == 1
+    store = _load(index_dir, embeddings)
+    assert store.index.ntotal == 4 and len(set(store.index_to_docstore_id.values())) == 4
+    assert set(index_builder.load_manifest(index_dir)["files"]) == {"linhas/zero.txt", "slim.txt", "kits.txt",
+                                                                   "proteses.txt"}
+
+
+def test_full_rebuild_reuses_embedding_cache(tmp_path, corpus, embeddings):
+    index_dir = tmp_path / "idx"
+    _build(corpus, index_dir, embeddings)
+    embeddings.embedded.clear()
+
+    (rag.published_dir(index_dir) / "index.faiss").unlink()
+    plan = _build(corpus, index_dir, embeddings)
+    assert plan.summary()["chunks_from_cache"] == 3 and embeddings.embedded == []
+    assert _load(index_dir, embeddings).index.ntotal == 3
+
+
+def test_embed_in_batches_backs_off_on_rate_limit():
+    class RateLimited(Exception):
+        status_code = 429
+
+    calls, in_flight, max_in_flight = [], [0], [0]
+    lock = threading.Lock()
+
+    def embed(batch):
+        with lock:
+            calls.append(list(batch))
+            in_flight[0] += 1
+            max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            fail = len(calls) <= 2
+        try:
+            if fail:
+                raise RateLimited("429")
+            return [[float(len(text))] for text in batch]
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    texts = [str(i) * (i % 5 + 1) for i in range(25)]
+    vectors = asyncio.run(index_builder.embed_in_batches(
+        texts, embed, batch_size=4, concurrency=3, base_delay=0.001, max_delay=0.01))
+
+    assert vectors == [[float(len(text))] for text in texts]
+    assert len(calls) == 7 + 2 and max_in_flight[0] <= 3
+
+
+def test_embed_in_batches_raises_non_retryable_errors():
+    def embed(batch):
+        raise ValueError("entrada inválida")
+
+    with pytest.raises(ValueError):
+        asyncio.run(index_builder.embed_in_batches(["a", "b"], embed, batch_size=1))
@@ -0,0 +1,93 @@
+import pytest
+from langchain_community.vectorstores import FAISS
+
+import backend.rag as rag
+from backend.lexical import LEXICAL_INDEX_FILENAME, LexicalIndex, reciprocal_rank_fusion, tokenize
+
+CATALOG = [
+    "Implante Linha Zero cone morse 3.5mm x 10mm, código MZ-3510.",
+    "Implante Linha Zero cone morse 4.0mm x 10mm, código MZ-4010.",
+    "Implante Linha Slim 2.9mm x 10mm para rebordos finos, código MS-2910.",
+    "Kit cirúrgico com brocas, chaves e torquímetro em estojo autoclavável.",
+    "Condições comerciais são tratadas por um consultor da MEDENS.",
+]
+
+
+@pytest.fixture
+def index_dir(tmp_path, embeddings):
+    rag.save_index(FAISS.from_texts(CATALOG, embeddings), tmp_path / "idx")
+    return tmp_path / "idx"
+
+
+def test_tokenize_normalizes_spoken_and_written_measures():
+    assert tokenize("Implante de 3,5 milímetros da Linha Zero") == ["implante", "3.5", "milimetros", "linha", "zero"]
+    assert tokenize("3.5mm") == ["3.5", "mm"]
+    assert tokenize("código MZ-3510") == ["codigo", "mz", "3510"]
+
+
+def test_index_round_trips_through_arrays_only(tmp_path):
+    index = LexicalIndex.build(enumerate(CATALOG))
+    index.save(tmp_path)
+    loaded = LexicalIndex.load(tmp_path)
+    assert loaded.search("torquímetro", k=2).hits == index.search("torquímetro", k=2).hits
+    assert loaded.search("torquímetro", k=2).hits[0][0] == "3"
+    assert LexicalIndex.load(tmp_path / "vazio") is None
+
+
+def test_exact_terms_rank_and_trigger_fast_path():
+    index = LexicalIndex.build(enumerate(CATALOG))
+    result = index.search("Tem o implante da Linha Zero de 4,0 por 10?", k=4)
+    assert result.hits[0][0] == "1" and result.confident
+    # Termos que vários chunks contêm: sem vencedor claro, sem atalho
+    assert not index.search("implante linha 10", k=4).confident
+    assert index.search("quanto custa o frete?", k=4).hits == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]]) == ["b", "a", "d", "c"]
+
+
+def test_save_index_publishes_lexical_index_with_faiss(index_dir):
+    assert (rag.published_dir(index_dir) / LEXICAL_INDEX_FILENAME).exists()
+    retriever = rag.IndexRetriever(index_dir, reload_check_interval=0)
+    retriever.get_store()
+    assert retriever.stats()["lexical_terms"] > 0
+
+
+def test_hybrid_fast_path_skips_embedding_call(index_dir):
+    retriever = rag.IndexRetriever(index_dir, reload_check_interval=0, mode="hybrid")
+    docs = retriever.query("Vocês têm o código MS-2910?", k=2)
+    assert docs[0].page_content == CATALOG[2]
+    assert retriever.stats()["embedding_calls"] == 0 and retriever.stats()["lexical_fast_path"] == 1
+
+    docs = retriever.query("Quero falar sobre implante", k=2)
+    assert len(docs) == 2 and retriever.stats()["embedding_calls"] == 1
+
+
+def test_query_with_embedding_always_embeds_for_the_answer_cache(index_dir):
+    retriever = rag.IndexRetriever(index_dir, reload_check_interval=0, mode="hybrid")
+    docs, embedding = retriever.query_with_embedding("código MS-2910", k=1)
+    assert docs[0].page_content == CATALOG[2] and embedding is not None
+
+
+def test_vector_mode_ignores_lexical_index(index_dir):
+    retriever = rag.IndexRetriever(index_dir, reload_check_interval=0, mode="vector")
+    retriever.query("código MS-2910", k=1)
+    assert retriever.stats()["embedding_calls"] == 1
+    with pytest.raises(ValueError):
+        rag.IndexRetriever(index_dir, mode="semantico")
+
+
+def test_ids_missing_from_the_docstore_are_skipped(index_dir):
+    # Índice lexical de outro build: um chunk que o docstore publicado não tem
+    store = rag.IndexRetriever(index_dir, reload_check_interval=0).get_store()
+    chunks = [(key, store.docstore.search(key).page_content) for key in store.index_to_docstore_id.values()]
+    stale = LexicalIndex.build(chunks + [("removido", "Implante Linha Slim 2.9mm código MS-2910 descontinuado.")])
+    stale.save(rag.published_dir(index_dir))
+
+    retriever = rag.IndexRetriever(index_dir, reload_check_interval=0, mode="hybrid")
+    docs, _ = retriever.query_with_embedding("código MS-2910", k=len(CATALOG) + 1)
+    assert docs[0].page_content == CATALOG[2] and sorted(doc.page_content for doc in docs) == sorted(CATALOG)
+    lexical_only = rag.IndexRetriever(index_dir, reload_check_interval=0, mode="lexical")
+    assert [doc.page_content for doc in lexical_only.query("código MS-2910 descontinuado", k=1)] == []
+    assert retriever.stats()["missing_docs"] == 1 and lexical_only.stats()["missing_docs"] == 1
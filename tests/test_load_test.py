@@ -0,0 +1,36 @@
+from benchmarks import load_test
+
+
+def _report(sessions, p95, error_rate=0.0):
+    return {"sessions": sessions, "error_rate": error_rate, "ttfa_ms": {"p95": p95}}
+
+
+def test_ceiling_stops_at_first_step_outside_slo():
+    reports = [_report(10, 500), _report(50, 900), _report(100, 2000), _report(200, 1000)]
+    assert load_test.find_ceiling(reports, slo_ttfa_ms=1500, max_error_rate=0.01) == 50
+    assert load_test.find_ceiling([_report(10, 500, error_rate=0.2)], 1500, 0.01) is None
+
+
+def test_step_report_separates_failures_and_memory_per_session():
+    step = load_test.StepResult(
+        sessions=2, duration_s=2.0,
+        turns=[load_test.TurnResult(True, 900.0, 400.0), load_test.TurnResult(True, 1100.0, 600.0),
+               load_test.TurnResult(False, error="timeout")],
+        server={"peak_rss_bytes": 10 * 2**20, "loop_lag_ms": {"p99": 3.0}},
+        idle_rss_bytes=9 * 2**20,
+    )
+    report = step.report()
+    assert report["errors"] == {"timeout": 1} and report["error_rate"] == round(1 / 3, 4)
+    assert report["turn_ms"]["p50"] == 1000.0 and report["turns_per_second"] == 1.0
+    assert report["memory_per_session_kb"] == 512.0
+
+
+def test_end_to_end_run_with_fake_providers(tmp_path):
+    result = load_test.main([
+        "--sessions", "2", "--turns", "1", "--ramp-s", "0", "--stt-ms", "10", "--llm-ms", "10", "--tts-ms", "10",
+        "--embeddings-ms", "0", "--latency-kind", "fixed", "--json", str(tmp_path / "report.json"),
+    ])
+    step = result["steps"][0]
+    assert step["turns"] == 2 and step["error_rate"] == 0.0
+    assert step["ttfa_ms"]["p50"] <= step["turn_ms"]["p50"]
+    assert result["ceiling_sessions"] == 2 and (tmp_path / "report.json").exists()
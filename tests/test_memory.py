@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+import backend.main as main_module
+from backend import memory
+from backend.memory import ConversationMemory
+
+
+@pytest.fixture(autouse=True)
+def heuristic_tokens(monkeypatch):
+    # Sem rede nos testes: contagem por caracteres (4 por token)
+    monkeypatch.setattr(memory, "_encoding", None)
+    monkeypatch.setattr(memory, "_encoding_loaded", True)
+
+
+def _turns(n, size=40):
+    messages = []
+    for i in range(n):
+        messages.append({"role": "user", "content": f"p{i} " + "x" * size})
+        messages.append({"role": "assistant", "content": f"r{i} " + "y" * size})
+    return messages
+
+
+def test_tokens_are_counted_once_per_message(monkeypatch):
+    calls = []
+    original = memory.message_tokens
+    monkeypatch.setattr(memory, "message_tokens", lambda m: calls.append(m) or original(m))
+    history = ConversationMemory(_turns(3))
+    first = history.history_tokens()
+    history.append({"role": "user", "content": "nova pergunta"})
+    assert history.history_tokens() == first + memory.count_tokens("nova pergunta") + memory.MESSAGE_OVERHEAD_TOKENS
+    assert len(calls) == 7
+
+
+@pytest.mark.asyncio
+async def test_background_summary_folds_old_turns_and_keeps_recent_verbatim():
+    seen = []
+
+    async def summarizer(previous, messages):
+        seen.append((previous, [m["content"][:2] for m in messages]))
+        return f"resumo de {len(messages)} mensagens"
+
+    history = ConversationMemory(_turns(10), summarizer=summarizer, max_tokens=100, min_recent_messages=4)
+    task = history.schedule_summary()
+    assert task is not None and history.schedule_summary() is task  # um resumo por vez
+    await task
+
+    assert history.summarized_count == 16 and len(history) == 20
+    assert seen == [("", [f"{role}{i}" for i in range(8) for role in ("p", "r")])]
+    prompt = history.prompt_history()
+    assert prompt[0] == memory.summary_message("resumo de 16 mensagens")
+    assert prompt[1:] == history[16:]
+    assert history.history_tokens() <= history.max_tokens
+
+
+def test_prompt_drops_oldest_messages_while_summary_is_pending():
+    history = ConversationMemory(_turns(10), max_tokens=60)
+    prompt = history.prompt_history()
+    assert prompt == history[-4:]
+    assert sum(history.tokens_of(m) for m in prompt) <= 60
+
+
+@pytest.mark.asyncio
+async def test_summary_failure_keeps_history_usable():
+    async def failing(previous, messages):
+        raise RuntimeError("provedor fora")
+
+    history = ConversationMemory(_turns(10), summarizer=failing, max_tokens=100)
+    await history.schedule_summary()
+    assert history.summarized_count == 0 and history.summary == ""
+    assert history.prompt_history()[-1] == history[-1]
+
+
+@pytest.mark.asyncio
+async def test_chat_messages_keep_stable_prefix_and_put_rag_context_last(monkeypatch):
+    class Doc:
+        def __init__(self, text):
+            self.page_content = text
+
+    contexts = iter(["Linha Zero", "Linha Slim"])
+
+    async def fake_retrieve(query):
+        return [Doc(next(contexts))], None
+
+    monkeypatch.setattr(main_module, "retrieve_context", fake_retrieve)
+    history = ConversationMemory([{"role": "user", "content": "Quais implantes?"}])
+    first = await main_module.build_chat_messages("ana", history)
+    history += [{"role": "assistant", "content": "Temos a Linha Zero."}, {"role": "user", "content": "E a Slim?"}]
+    second = await main_module.build_chat_messages("ana", history)
+
+    assert first[0] == second[0] == {"role": "system", "content": main_module.SYSTEM_PROMPT}
+    assert second[:len(first) - 1] == first[:-1]  # só o contexto do RAG (no fim) muda
+    assert "Linha Slim" in second[-1]["content"] and second[-2] == history[-1]
@@ -0,0 +1,136 @@
+import asyncio
+import json
+from functools import partial
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.main as main_module
+from backend.audio import PCM_BYTES_PER_SECOND, UtteranceBuffers, pcm_to_wav_stream
+from backend.partial_stt import IncrementalTranscriber, stitch_transcripts
+from benchmarks.bench_partial_stt import WordCodedSTT, encode_words, reference_words
+
+
+def test_stitch_removes_overlap_ignoring_case_punctuation_and_cut_words():
+    assert stitch_transcripts("quais implantes da linha", "Linha zero, vocês têm") == "quais implantes da linha zero, vocês têm"
+    # Palavra cortada na borda: "ze-" no fim da janela anterior, "im-" no começo da nova
+    assert stitch_transcripts("quais implantes da linha ze-", "da linha zero vocês") == "quais implantes da linha zero vocês"
+    assert stitch_transcripts("quais implantes da linha", "im- da linha zero") == "quais implantes da linha zero"
+    assert stitch_transcripts("quais implantes da", "nha zero da linha") == "quais implantes da nha zero da linha"
+    assert stitch_transcripts("", "linha zero") == "linha zero"
+    assert stitch_transcripts("linha zero", "") == "linha zero"
+
+
+def _word_coded_transcriber(stt, **kwargs):
+    async def transcribe(data):
+        wav = pcm_to_wav_stream(data)
+        try:
+            return await stt.transcribe(wav)
+        finally:
+            wav.close()
+
+    partials = []
+
+    async def on_partial(text):
+        partials.append(text)
+
+    return IncrementalTranscriber(transcribe, on_partial, **kwargs), partials
+
+
+async def _stream(buffers, transcriber, audio, frame=PCM_BYTES_PER_SECOND // 10):
+    for start in range(0, len(audio), frame):
+        buffers.write(audio[start:start + frame])
+        transcriber.feed(buffers.active)
+        await asyncio.sleep(0.001)
+
+
+@pytest.mark.asyncio
+async def test_incremental_transcript_matches_full_and_sends_only_tail_at_end():
+    stt = WordCodedSTT()
+    transcriber, partials = _word_coded_transcriber(stt, window_seconds=2, overlap_seconds=0.5, max_in_flight=2)
+    words = reference_words(10)
+    buffers = UtteranceBuffers(max_seconds=12, policy="reject")
+    await _stream(buffers, transcriber, encode_words(words))
+    windows_before_end = stt.calls
+
+    text = await transcriber.finish(buffers.take())
+    assert text.split() == words
+    assert windows_before_end == transcriber.windows >= 5
+    assert partials and partials[-1].split() == words[:len(partials[-1].split())]
+    # No fim só a cauda (o resto depois da última janela mais a sobreposição) foi ao STT
+    assert stt.calls == transcriber.windows + 1
+    assert transcriber.stats()["tail_seconds"] <= 2.5
+
+
+@pytest.mark.asyncio
+async def test_window_cap_sends_the_rest_in_the_tail():
+    stt = WordCodedSTT()
+    transcriber, _ = _word_coded_transcriber(stt, window_seconds=2, overlap_seconds=0.5, max_windows=2)
+    words = reference_words(8)
+    buffers = UtteranceBuffers(max_seconds=10, policy="reject")
+    await _stream(buffers, transcriber, encode_words(words))
+
+    assert (await transcriber.finish(buffers.take())).split() == words
+    assert transcriber.windows == 2 and transcriber.stats()["tail_seconds"] == 5.0
+
+
+@pytest.mark.asyncio
+async def test_short_utterance_and_failed_window_fall_back_to_full_transcription():
+    stt = WordCodedSTT()
+    transcriber, partials = _word_coded_transcriber(stt, window_seconds=2, overlap_seconds=0.5)
+    buffers = UtteranceBuffers(max_seconds=8, policy="reject")
+    await _stream(buffers, transcriber, encode_words(reference_words(1.5)))
+    assert (await transcriber.finish(buffers.take())).split() == reference_words(1.5)
+    assert stt.calls == 1 and not partials
+
+    calls = []
+
+    async def flaky(data):
+        calls.append(data)
+        if len(calls) == 2:
+            raise RuntimeError("timeout")
+        return await WordCodedSTT().transcribe(pcm_to_wav_stream(data))
+
+    transcriber = IncrementalTranscriber(flaky, window_seconds=2, overlap_seconds=0.5)
+    words = reference_words(6)
+    await _stream(buffers, transcriber, encode_words(words))
+    assert (await transcriber.finish(buffers.take())).split() == words
+    assert transcriber.failed and transcriber.stats()["tail_seconds"] == 6.0
+
+
+def test_ws_voice_sends_partial_transcripts_before_the_turn(monkeypatch):
+    stt = WordCodedSTT()
+
+    async def transcribe(data):
+        return await stt.transcribe(pcm_to_wav_stream(data))
+
+    async def fake_turn(audio_buffer, user_id, history, ws, set_processing, tts_mode, turn_state=None):
+        text = await turn_state["transcriber"].finish(audio_buffer, transcribe)
+        audio_buffer.clear()
+        await ws.send_text(f"Você: {text}")
+        set_processing(False)
+
+    monkeypatch.setattr(main_module, "handle_user_turn_logic", fake_turn)
+    monkeypatch.setattr(main_module, "transcribe_partial", transcribe)
+    monkeypatch.setattr(main_module, "IncrementalTranscriber",
+                        partial(IncrementalTranscriber, window_seconds=1, overlap_seconds=0.5))
+    client = TestClient(main_module.tapp)
+
+    words = reference_words(4)
+    audio = encode_words(words)
+    with client.websocket_connect("/ws/voice?username=ana&partial_stt=1") as ws:
+        frame = PCM_BYTES_PER_SECOND // 2
+        for start in range(0, len(audio), frame):
+            ws.send_bytes(audio[start:start + frame])
+        captions = []
+        # Cada janela de 1 s volta como legenda provisória (a costura de tudo o que já voltou)
+        while len(captions) < 3:
+            message = json.loads(ws.receive_text())
+            assert message["type"] == "partial_transcript"
+            captions.append(message["text"])
+        ws.send_text(json.dumps({"type": "end_of_speech_button"}))
+        final = ws.receive_text()
+        while final.startswith("{"):
+            final = ws.receive_text()
+        assert final == "Você: " + " ".join(words)
+    assert captions[-1].split() == words[:len(captions[-1].split())]
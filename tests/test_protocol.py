@@ -0,0 +1,138 @@
+import json
+
+import numpy as np
+import pytest
+
+import backend.main as main_module
+from backend import protocol
+from backend.protocol import (
+    CODEC_MP3, CODEC_MULAW, FRAME_AUDIO, FRAME_CONTROL, FRAME_REPLY, FRAME_TRANSCRIPT, HEADER_SIZE, Frame,
+    FramedWebSocket, FrameSequence, ProtocolError, decode_frame, encode_frame, mulaw_decode, mulaw_encode,
+)
+
+from tests.test_streaming import FakeWebSocket
+
+
+def _speech(seconds: float) -> bytes:
+    t = np.arange(int(16000 * seconds)) / 16000
+    wave = 8000 * np.sin(2 * np.pi * 220 * t) + 3000 * np.sin(2 * np.pi * 1300 * t)
+    return wave.astype("<i2").tobytes()
+
+
+def test_frame_header_round_trip():
+    frame = Frame(FRAME_AUDIO, b"\x01\x02", codec=CODEC_MULAW, seq=2**32 - 1, turn_id=7, timestamp_ms=123456)
+    data = encode_frame(frame)
+    assert len(data) == HEADER_SIZE + 2
+    decoded = decode_frame(data)
+    assert (decoded.type, decoded.codec, decoded.seq, decoded.turn_id, decoded.timestamp_ms) == \
+        (FRAME_AUDIO, CODEC_MULAW, 2**32 - 1, 7, 123456)
+    assert bytes(decoded.payload) == b"\x01\x02"
+
+
+def test_decode_rejects_unknown_version_and_short_frames():
+    data = bytearray(encode_frame(Frame(FRAME_CONTROL, b"{}")))
+    data[0] = 9
+    with pytest.raises(ProtocolError):
+        decode_frame(bytes(data))
+    with pytest.raises(ProtocolError):
+        decode_frame(b"\x01\x02")
+
+
+def test_mulaw_round_trip_error_is_bounded_and_halves_bandwidth():
+    pcm = _speech(1.0)
+    decoded = np.frombuffer(mulaw_decode(mulaw_encode(pcm)), dtype="<i2").astype(np.int32)
+    original = np.frombuffer(pcm, dtype="<i2").astype(np.int32)
+    # Erro do G.711 cresce com a amplitude: no máximo ~1/32 do valor (+ passo mínimo)
+    assert np.all(np.abs(decoded - original) <= np.abs(original) / 32 + 8)
+
+    # Frames de 20 ms como o navegador envia, com o cabeçalho incluído
+    raw_bytes = framed_bytes = 0
+    sequence = FrameSequence()
+    for start in range(0, len(pcm), 640):
+        chunk = pcm[start:start + 640]
+        raw_bytes += len(chunk)
+        framed_bytes += len(sequence.frame(FRAME_AUDIO, mulaw_encode(chunk), CODEC_MULAW))
+    assert framed_bytes < 0.55 * raw_bytes
+
+
+def test_opus_round_trip_when_available():
+    pytest.importorskip("opuslib")
+    encoder, decoder = protocol.OpusEncoder(), protocol.OpusDecoder()
+    pcm = _speech(0.2)
+    packets = encoder.encode(pcm)
+    assert len(packets) == 10 and sum(map(len, packets)) < len(pcm) / 4
+    assert sum(len(decoder.decode(p)) for p in packets) == len(pcm)
+
+
+def test_negotiation_falls_back_to_pcm():
+    assert protocol.negotiate_codec("flac,mulaw") == "mulaw"
+    assert protocol.negotiate_codec(None) == "pcm16"
+    if protocol.opuslib is None:
+        assert protocol.negotiate_codec("opus") == "pcm16"
+
+
+@pytest.mark.asyncio
+async def test_framed_websocket_maps_sends_and_counts_lost_frames():
+    raw = FakeWebSocket()
+    framed = FramedWebSocket(raw, "mulaw")
+    framed.next_turn()
+    await framed.send_text("Você: ana: oi")
+    await framed.send_text("Agente: Olá!")
+    await framed.send_text(json.dumps({"type": "audio_end"}))
+    await framed.send_bytes(b"mp3")
+    frames = [decode_frame(payload) for _, payload in raw.sent]
+    assert [(f.type, bytes(f.payload)) for f in frames] == [
+        (FRAME_TRANSCRIPT, "ana: oi".encode()), (FRAME_REPLY, "Olá!".encode()),
+        (FRAME_CONTROL, b'{"type": "audio_end"}'), (FRAME_AUDIO, b"mp3"),
+    ]
+    assert [f.seq for f in frames] == [0, 1, 2, 3] and {f.turn_id for f in frames} == {1}
+    assert frames[3].codec == CODEC_MP3
+
+    client = FrameSequence()
+    pcm = _speech(0.02)
+    assert len(framed.decode_incoming(client.frame(FRAME_AUDIO, mulaw_encode(pcm), CODEC_MULAW))["bytes"]) == len(pcm)
+    client.next_seq += 2  # dois frames perdidos no caminho
+    assert framed.decode_incoming(client.frame(FRAME_CONTROL, b'{"type": "cancel"}')) == {"text": '{"type": "cancel"}'}
+    assert framed.stats()["frames_lost"] == 2
+
+    # Payload corrompido vira ProtocolError (o leitor da sessão descarta o frame e segue)
+    with pytest.raises(ProtocolError):
+        framed.decode_incoming(client.frame(FRAME_CONTROL, b'{"type": "\xff\xfe"}'))
+    if protocol.opuslib is not None:
+        opus = FramedWebSocket(FakeWebSocket(), "opus")
+        with pytest.raises(ProtocolError):
+            opus.decode_incoming(client.frame(FRAME_AUDIO, b"\xff" * 7, protocol.CODEC_OPUS))
+
+
+def test_ws_voice_binary_protocol_end_to_end(client, monkeypatch):
+    received = {}
+
+    async def fake_turn(audio_buffer, user_id, history, ws, set_processing, tts_mode, turn_state=None):
+        received["pcm"] = bytes(audio_buffer)
+        await ws.send_text("Agente: Temos a Linha Zero.")
+        await ws.send_bytes(b"ID3-mp3")
+        set_processing(False)
+
+    monkeypatch.setattr(main_module, "handle_user_turn_logic", fake_turn)
+    pcm = _speech(0.1)
+    sequence = FrameSequence()
+    with client.websocket_connect("/ws/voice?username=ana&protocol=1&codecs=opus,mulaw") as ws:
+        hello = decode_frame(ws.receive_bytes())
+        assert hello.type == FRAME_CONTROL
+        codec = json.loads(bytes(hello.payload))["codec"]
+        assert codec in ("opus", "mulaw")
+        encoder = protocol.make_encoder(codec)
+        # Frame de controle com UTF-8 inválido: descartado, a sessão continua
+        ws.send_bytes(sequence.frame(FRAME_CONTROL, b'{"type": "\xff"}'))
+        for start in range(0, len(pcm), 640):
+            for packet in encoder.encode(pcm[start:start + 640]):
+                ws.send_bytes(sequence.frame(FRAME_AUDIO, packet, encoder.codec))
+        ws.send_bytes(sequence.frame(FRAME_CONTROL, json.dumps({"type": "end_of_speech"}).encode()))
+
+        reply, audio = decode_frame(ws.receive_bytes()), decode_frame(ws.receive_bytes())
+        assert (reply.type, bytes(reply.payload).decode()) == (FRAME_REPLY, "Temos a Linha Zero.")
+        assert (audio.type, audio.codec, bytes(audio.payload)) == (FRAME_AUDIO, CODEC_MP3, b"ID3-mp3")
+        assert reply.turn_id == audio.turn_id == 1
+        ws.send_bytes(sequence.frame(FRAME_CONTROL, json.dumps({"type": "end_of_session"}).encode()))
+
+    assert len(received["pcm"]) == len(pcm)
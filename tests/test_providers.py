@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import backend.main as main_module
+from backend import providers
+from backend.clients import ProviderLimiter
+from backend.providers import FakeEmbeddings, FakeLLM, FakeSTT, FakeTTS, LatencyModel
+
+from tests.test_streaming import FakeWebSocket
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.mark.asyncio
+async def test_fake_llm_streams_the_same_reply_with_configured_latency():
+    llm = FakeLLM(reply="Temos a Linha Zero. E a Slim.", first_token=LatencyModel("fixed", 30), ms_per_token=5)
+    started = time.perf_counter()
+    deltas = [delta async for delta in await llm.open_stream([{"role": "user", "content": "oi"}])]
+    elapsed = time.perf_counter() - started
+    assert "".join(deltas) == await llm.complete([]) == "Temos a Linha Zero. E a Slim."
+    assert len(deltas) == 7 and elapsed >= 0.03 + 6 * 0.005
+    assert llm.calls == 2 and llm.busy_seconds == pytest.approx((0.03 + 6 * 0.005) + (0.03 + 7 * 0.005))
+
+
+@pytest.mark.asyncio
+async def test_fake_tts_is_deterministic_and_chunked():
+    tts = FakeTTS(chunk_bytes=1000)
+    first = [chunk async for chunk in tts.synthesize_stream("Olá, tudo bem?")]
+    second = b"".join([chunk async for chunk in tts.synthesize_stream("Olá, tudo bem?")])
+    assert b"".join(first) == second and second.startswith(b"ID3")
+    assert len(first) == 14 and len(second) == 14 * 1000
+
+
+def test_seeded_latency_and_fake_embeddings_repeat():
+    assert [LatencyModel("uniform", 50, 20, seed=3).sample_seconds() for _ in range(2)] == \
+        [LatencyModel("uniform", 50, 20, seed=3).sample_seconds() for _ in range(2)]
+    embeddings = FakeEmbeddings(dim=64)
+    assert embeddings.embed_query("Linha Zero") == embeddings.embed_documents(["Linha Zero"])[0]
+
+
+def test_factories_select_by_name():
+    assert isinstance(providers.create_stt_provider("fake"), FakeSTT)
+    assert providers.create_llm_provider("fake", model="barato").model == "barato"
+    assert isinstance(providers.create_embeddings("fake"), FakeEmbeddings)
+    with pytest.raises(ValueError):
+        providers.create_tts_provider("polly")
+
+
+def test_rag_imports_without_openai_key():
+    env = {k: v for k, v in os.environ.items() if k not in ("OPENAI_KEY", "OPENAI_API_KEY")}
+    code = (
+        "import backend.rag as rag\n"
+        "try:\n"
+        "    rag.get_embeddings().embed_query('oi')\n"
+        "except ValueError as e:\n"
+        "    print('erro no uso:', e)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True,
+                            timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert "erro no uso: Defina OPENAI_KEY" in result.stdout
+
+
+@pytest.mark.asyncio
+async def test_standalone_tts_creates_its_provider_on_first_synthesis(monkeypatch):
+    from backend import tts
+
+    created = []
+
+    def create():
+        created.append(FakeTTS())
+        return created[-1]
+
+    monkeypatch.setattr(tts, "tts_provider", None)
+    monkeypatch.setattr(tts, "create_tts_provider", create)
+    assert created == []
+    first = await tts.synthesize_tts("Olá, tudo bem?")
+    assert await tts.synthesize_tts("Olá, tudo bem?") == first and first.startswith(b"ID3")
+    assert len(created) == 1
+
+
+@pytest.mark.asyncio
+async def test_turn_runs_end_to_end_on_fake_providers(monkeypatch):
+    llm = FakeLLM(reply="Temos a Linha Zero. Posso ajudar em algo mais?")
+    monkeypatch.setattr(main_module, "stt_provider", FakeSTT("Quais implantes vocês têm?"))
+    monkeypatch.setattr(main_module, "llm_provider", llm)
+    monkeypatch.setattr(main_module, "tts_provider", FakeTTS())
+    monkeypatch.setattr(main_module, "llm_limiter", ProviderLimiter("llm", 4, 5.0))
+    monkeypatch.setattr(main_module, "query_index", lambda text: [])
+    monkeypatch.setattr(main_module, "tts_cache", main_module.TTSCache(max_bytes=0))
+    ws, history = FakeWebSocket(), []
+
+    await main_module.handle_user_turn_logic(bytearray(32000), "ana", history, ws, lambda value: None, "stream")
+
+    texts = [payload for kind, payload in ws.sent if kind == "text"]
+    audio = [payload for kind, payload in ws.sent if kind == "bytes"]
+    assert texts[0] == "Você: ana: Quais implantes vocês têm?"
+    assert "Agente: Temos a Linha Zero. Posso ajudar em algo mais?" in texts
+    assert b"".join(audio).startswith(b"ID3")
+    assert history[-1] == {"role": "assistant", "content": "Temos a Linha Zero. Posso ajudar em algo mais?"}
+    assert llm.last_messages[-1] == {"role": "user", "content": "Quais implantes vocês têm?"}
@@ -0,0 +1,91 @@
+import pytest
+from langchain_community.vectorstores import FAISS
+
+import backend.rag as rag
+
+
+def _publish(index_dir, texts, embeddings):
+    store = FAISS.from_texts(texts, embeddings)
+    return rag.save_index(store, index_dir)
+
+
+def test_retriever_loads_index_once(tmp_path, embeddings, monkeypatch):
+    index_dir = tmp_path / "idx"
+    _publish(index_dir, ["Linha Zero", "Linha Slim"], embeddings)
+
+    calls = []
+    original_load = rag.load_index
+    monkeypatch.setattr(rag, "load_index", lambda path=None: calls.append(path) or original_load(path))
+
+    retriever = rag.IndexRetriever(index_path=index_dir, reload_check_interval=0)
+    for _ in range(5):
+        assert retriever.query("Linha Zero", k=1)[0].page_content == "Linha Zero"
+
+    assert len(calls) == 1
+    stats = retriever.stats()
+    assert stats["loads"] == 1
+    assert stats["queries"] == 5
+    assert stats["vectors"] == 2
+    assert stats["index_size_bytes"] > 0
+
+
+def test_retriever_hot_reloads_new_version(tmp_path, embeddings):
+    index_dir = tmp_path / "idx"
+    first_version = _publish(index_dir, ["Linha Zero"], embeddings)
+    retriever = rag.IndexRetriever(index_path=index_dir, reload_check_interval=0)
+    old_store = retriever.get_store()
+    assert retriever.stats()["version"] == first_version
+
+    second_version = _publish(index_dir, ["Linha Zero", "Chave de torque"], embeddings)
+    new_store = retriever.get_store()
+
+    assert new_store is not old_store
+    # Quem já tinha a referência antiga continua consultando normalmente.
+    assert old_store.similarity_search("Linha Zero", k=1)[0].page_content == "Linha Zero"
+    stats = retriever.stats()
+    assert stats["version"] == second_version
+    assert stats["vectors"] == 2
+    assert stats["loads"] == 2
+
+
+def test_retriever_keeps_old_store_while_reload_in_progress(tmp_path, embeddings):
+    index_dir = tmp_path / "idx"
+    _publish(index_dir, ["Linha Zero"], embeddings)
+    retriever = rag.IndexRetriever(index_path=index_dir, reload_check_interval=0)
+    old_store = retriever.get_store()
+    _publish(index_dir, ["Linha Zero", "Linha Slim"], embeddings)
+
+    with retriever._reload_lock:  # simula outra thread recarregando
+        assert retriever.get_store() is old_store
+    assert retriever.get_store() is not old_store
+
+
+def test_get_retriever_is_shared_per_path(tmp_path):
+    assert rag.get_retriever(tmp_path / "a") is rag.get_retriever(tmp_path / "a")
+    assert rag.get_retriever(tmp_path / "a") is not rag.get_retriever(tmp_path / "b")
+
+
+def test_query_with_embedding_returns_query_vector(tmp_path, embeddings):
+    index_dir = tmp_path / "idx"
+    _publish(index_dir, ["Linha Zero", "Linha Slim"], embeddings)
+    retriever = rag.IndexRetriever(index_path=index_dir, reload_check_interval=0)
+
+    docs, embedding = retriever.query_with_embedding("Linha Slim", k=1)
+    assert docs[0].page_content == "Linha Slim"
+    assert embedding == embeddings.embed_query("Linha Slim")
+
+
+def test_each_version_is_published_whole_and_old_ones_are_pruned(tmp_path, embeddings):
+    index_dir = tmp_path / "idx"
+    first = _publish(index_dir, ["Linha Zero"], embeddings)
+    # Índice do layout antigo (arquivos soltos) ao lado: sai quando já há uma versão anterior no layout novo
+    (index_dir / "index.faiss").write_bytes(b"antigo")
+    second = _publish(index_dir, ["Linha Zero", "Linha Slim"], embeddings)
+    # Quem resolveu o VERSION antes da troca ainda lê a versão anterior inteira
+    assert rag.load_index(rag.version_dir(index_dir, first)).index.ntotal == 1
+    assert not (index_dir / "index.faiss").exists()
+
+    third = _publish(index_dir, ["Linha Zero", "Linha Slim", "Kit cirúrgico"], embeddings)
+    assert sorted(d.name for d in (index_dir / rag.VERSIONS_DIRNAME).iterdir()) == sorted([second, third])
+    assert rag.published_dir(index_dir) == index_dir / rag.VERSIONS_DIRNAME / third
+    assert rag.load_index(index_dir).index.ntotal == 3
@@ -0,0 +1,163 @@
+import asyncio
+import json
+from functools import partial
+
+import pytest
+from fastapi import WebSocketDisconnect
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketState
+
+import backend.main as main_module
+from backend import metrics
+from backend.clients import ProviderLimiter
+from backend.providers import FakeLLM, FakeSTT, FakeTTS
+from backend.session_io import SessionIdle, SessionIO
+
+
+class FakeWebSocket:
+    """WebSocket em memória: o teste empurra mensagens do cliente e lê o que foi enviado."""
+
+    def __init__(self, send_delay: float = 0.0, fail_after: int = None):
+        self.client_state = WebSocketState.CONNECTED
+        self.incoming = asyncio.Queue()
+        self.sent = []
+        self.send_delay = send_delay
+        self.fail_after = fail_after
+        self.sending = 0
+        self.max_concurrent_sends = 0
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def _send(self, data):
+        if self.fail_after is not None and len(self.sent) >= self.fail_after:
+            raise RuntimeError("conexão perdida")
+        self.sending += 1
+        self.max_concurrent_sends = max(self.max_concurrent_sends, self.sending)
+        try:
+            await self.release.wait()
+            await asyncio.sleep(self.send_delay)
+            self.sent.append(data)
+        finally:
+            self.sending -= 1
+
+    async def send_text(self, text):
+        await self._send(text)
+
+    async def send_bytes(self, data):
+        await self._send(data)
+
+
+@pytest.mark.asyncio
+async def test_sends_from_concurrent_tasks_are_serialized_in_order():
+    ws = FakeWebSocket(send_delay=0.001)
+    io = SessionIO(ws, idle_timeout=0, keepalive=0).start()
+
+    async def producer(name):
+        for i in range(20):
+            await io.send_text(f"{name}{i}")
+
+    await asyncio.gather(producer("a"), producer("b"))
+    await io.aclose()
+    assert ws.max_concurrent_sends == 1 and len(ws.sent) == 40
+    for name in "ab":
+        assert [m for m in ws.sent if m[0] == name] == [f"{name}{i}" for i in range(20)]
+
+
+@pytest.mark.asyncio
+async def test_full_send_queue_applies_backpressure_and_failure_releases_senders():
+    ws = FakeWebSocket()
+    ws.release.clear()
+    io = SessionIO(ws, send_queue_size=2, idle_timeout=0, keepalive=0).start()
+    for i in range(3):
+        await io.send_bytes(b"x")  # 1 no escritor + 2 na fila
+    blocked = asyncio.create_task(io.send_bytes(b"y"))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    ws.fail_after = 0
+    ws.release.set()
+    await asyncio.wait_for(blocked, 1)
+    with pytest.raises(RuntimeError):
+        await io.send_text("depois da falha")
+    assert io.client_state == WebSocketState.DISCONNECTED and io.stats()["send_error"] == "conexão perdida"
+    await io.aclose()
+
+
+@pytest.mark.asyncio
+async def test_reply_audio_send_time_is_measured_at_the_socket_write():
+    ws = FakeWebSocket(send_delay=0.05)
+    io = SessionIO(ws, idle_timeout=0, keepalive=0).start()
+    trace = metrics.start_turn_trace()
+    await main_module.send_reply_audio(io, b"mp3", trace.started_at)
+    # Só enfileirado: a escrita ainda não aconteceu
+    assert "ws_send" not in trace.stages
+    await io.aclose()
+    assert trace.stages["ws_send"] >= 0.045
+    assert trace.stages["first_audio"] >= trace.stages["ws_send"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tts_mode", ["batch", "stream"])
+async def test_session_summary_keeps_audio_send_of_a_turn_behind_the_writer(monkeypatch, tts_mode):
+    monkeypatch.setattr(main_module, "stt_provider", FakeSTT("Quais implantes vocês têm?"))
+    monkeypatch.setattr(main_module, "llm_provider", FakeLLM(reply="Temos a Linha Zero."))
+    monkeypatch.setattr(main_module, "tts_provider", FakeTTS())
+    monkeypatch.setattr(main_module, "llm_limiter", ProviderLimiter("llm", 4, 5.0))
+    monkeypatch.setattr(main_module, "query_index", lambda text: [])
+    monkeypatch.setattr(main_module, "tts_cache", main_module.TTSCache(max_bytes=0))
+    ws = FakeWebSocket(send_delay=0.03)
+    io = SessionIO(ws, idle_timeout=0, keepalive=0).start()
+    session = metrics.start_session("ana")
+
+    # Como no ws_voice: o turno roda numa task própria e termina com o áudio ainda na fila do escritor
+    turn = asyncio.create_task(main_module.handle_user_turn_logic(bytearray(32000), "ana", [], io, lambda value: None,
+                                                                  tts_mode))
+    await turn
+    stages = session.summary()["stages_ms"]
+    assert "ws_send" in stages and "first_audio" in stages
+    assert stages["ws_send"]["max"] >= 25
+    await io.aclose()
+
+
+@pytest.mark.asyncio
+async def test_reader_queues_client_messages_and_disconnect():
+    ws = FakeWebSocket()
+    io = SessionIO(ws, idle_timeout=0, keepalive=0).start()
+    await ws.incoming.put({"type": "websocket.receive", "bytes": b"\x00\x01"})
+    await ws.incoming.put({"type": "websocket.disconnect", "code": 1001})
+    assert (await io.receive())["bytes"] == b"\x00\x01"
+    with pytest.raises(WebSocketDisconnect):
+        await io.receive()
+    await io.aclose()
+
+
+@pytest.mark.asyncio
+async def test_keepalive_then_idle_timeout_unless_a_turn_is_running():
+    ws = FakeWebSocket()
+    busy = [True]
+    io = SessionIO(ws, is_busy=lambda: busy[0], idle_timeout=0.15, keepalive=0.04).start()
+    receive = asyncio.create_task(io.receive())
+    await asyncio.sleep(0.3)
+    # Turno em andamento: o cliente está só ouvindo, a sessão não expira
+    assert not receive.done() and io.keepalives >= 3
+    assert json.loads(ws.sent[0]) == {"type": "keepalive"}
+
+    busy[0] = False
+    with pytest.raises(SessionIdle):
+        await asyncio.wait_for(receive, 1)
+    assert io.stats()["idle_closed"]
+    await io.aclose()
+
+
+def test_ws_voice_closes_idle_session(monkeypatch):
+    monkeypatch.setattr(main_module, "SessionIO", partial(SessionIO, idle_timeout=0.2, keepalive=0.05))
+    client = TestClient(main_module.tapp)
+    with client.websocket_connect("/ws/voice?username=ana") as ws:
+        assert json.loads(ws.receive_text()) == {"type": "keepalive"}
+        with pytest.raises(WebSocketDisconnect) as closed:
+            while True:
+                assert json.loads(ws.receive_text())["type"] == "keepalive"
+        assert closed.value.reason == "idle"
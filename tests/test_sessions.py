@@ -0,0 +1,189 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.main as main_module
+from backend.memory import ConversationMemory
+from backend.sessions import (
+    InMemorySessionStore,
+    RedisSessionStore,
+    ResumableSession,
+    SessionFormatError,
+    dump_session,
+    load_session,
+    restore_memory,
+    state_from_memory,
+)
+
+
+class FakeRedis:
+    """
+    Mesma interface do redis.asyncio.Redis usada pela store (get, set com ex,
+    delete, eval), com relógio manual. O eval só conhece o script de
+    compare_and_put da store e o executa sem ceder o event loop, como o Redis.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.data = {}
+        self.closed = False
+
+    async def get(self, key):
+        value = self.data.get(key)
+        if value is None or value[1] <= self.now:
+            self.data.pop(key, None)
+            return None
+        return value[0]
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = (bytes(value), self.now + ex if ex else float("inf"))
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def eval(self, script, numkeys, *args):
+        assert script == RedisSessionStore.COMPARE_AND_PUT_SCRIPT and numkeys == 2
+        key, revision_key, value, revision, ex = args
+        current = await self.get(revision_key)
+        if current is not None and int(current) >= int(revision):
+            return 0
+        await self.set(key, value, ex=ex)
+        await self.set(revision_key, str(revision).encode(), ex=ex)
+        return 1
+
+    async def aclose(self):
+        self.closed = True
+
+
+def _history(turns: int) -> ConversationMemory:
+    memory = ConversationMemory()
+    for i in range(turns):
+        memory.append({"role": "user", "content": f"Pergunta {i} sobre o implante Linha Zero 3.5 x 10 mm?"})
+        memory.append({"role": "assistant", "content": f"Resposta {i}: temos a Linha Zero em estoque, com ação."})
+    return memory
+
+
+def test_dump_keeps_only_prompt_state_and_round_trips():
+    memory = _history(3)
+    memory.summary = "O cliente perguntou sobre a Linha Zero."
+    memory.summarized_count = 2
+    small = dump_session(state_from_memory(memory, "ana", "stream", revision=4))
+    large = dump_session(state_from_memory(_history(40), "ana", "batch"))
+    assert small[:1] == b"j" and large[:1] == b"z"
+
+    state = load_session(small)
+    assert (state.user_id, state.tts_mode, state.revision) == ("ana", "stream", 4)
+    assert state.messages == list(memory[2:])
+    restored = restore_memory(ConversationMemory(), state)
+    assert restored.prompt_history() == memory.prompt_history()
+    assert load_session(large).messages == list(_history(40))
+
+    with pytest.raises(SessionFormatError):
+        load_session(b"z" + b"lixo")
+    with pytest.raises(SessionFormatError):
+        load_session(b"?{}")
+
+
+@pytest.mark.asyncio
+async def test_in_memory_store_expires_and_evicts_oldest():
+    now = [0.0]
+    store = InMemorySessionStore(max_sessions=2, clock=lambda: now[0])
+    await store.put("a", b"1", ttl_seconds=10)
+    await store.put("b", b"22", ttl_seconds=100)
+    await store.put("c", b"333", ttl_seconds=100)
+    assert await store.get("a") is None and store.evictions == 1
+    now[0] = 150.0
+    assert await store.get("b") is None and store.expired == 1
+    assert store.stats()["sessions"] == 1 and store.bytes == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("make_store", [InMemorySessionStore, lambda: RedisSessionStore(FakeRedis())])
+async def test_concurrent_writers_of_the_same_revision_only_one_wins(make_store):
+    store = make_store()
+    first, _ = await ResumableSession.open(store, "new", "ana")
+    assert await first.save(_history(1), "batch")
+    resumed, _ = await ResumableSession.open(store, first.token, "ana")
+    assert resumed.revision == first.revision + 1
+
+    # Duas conexões (em processos diferentes) que leram a mesma revisão: só uma grava
+    writers = [ResumableSession(store, first.token, "ana", resumed.revision) for _ in range(2)]
+    results = await asyncio.gather(writers[0].save(_history(2), "batch"), writers[1].save(_history(3), "stream"))
+    assert sorted(results) == [False, True] and sum(w.superseded for w in writers) == 1
+    assert load_session(await store.get(first.token)).revision == resumed.revision + 1
+    assert not await first.save(_history(1), "batch") and first.superseded
+
+    assert not await store.compare_and_put(first.token, b"x", revision=1)
+    await store.delete(first.token)
+    assert await store.compare_and_put(first.token, b"x", revision=1)
+
+
+@pytest.mark.asyncio
+async def test_reconnect_on_another_worker_resumes_and_old_connection_stops_writing():
+    redis = FakeRedis()
+    store = RedisSessionStore(redis)
+    first, state = await ResumableSession.open(store, "new", "ana")
+    assert state is None and not first.resumed
+    memory = _history(2)
+    assert await first.save(memory, "stream")
+
+    # Outro worker, mesma store: a conexão nova assume a sessão
+    second, state = await ResumableSession.open(RedisSessionStore(redis), first.token, "ana")
+    assert second.resumed and state.tts_mode == "stream" and state.messages == list(memory)
+    # A conexão antiga só percebe a queda agora: o estado final dela não sobrescreve o da nova
+    memory.append({"role": "user", "content": "mensagem que não foi respondida"})
+    assert not await first.save(memory, "stream") and first.superseded
+    assert load_session(await store.get(first.token)).revision == second.revision
+
+    # Outro usuário com o mesmo token não herda a conversa; token expirado abre uma sessão nova
+    other, state = await ResumableSession.open(store, first.token, "bruno")
+    assert state is None and other.token != first.token
+    redis.now += 10_000
+    expired, state = await ResumableSession.open(store, first.token, "ana")
+    assert state is None and expired.token != first.token
+
+    await second.end()
+    assert await store.get(first.token) is None
+    await store.aclose()
+    assert redis.closed
+
+
+def test_ws_voice_resumes_conversation_after_disconnect(monkeypatch):
+    histories, modes = [], []
+
+    async def fake_turn(audio_buffer, user_id, history, ws, set_processing, tts_mode, turn_state=None):
+        histories.append(list(history))
+        modes.append(tts_mode)
+        history.append({"role": "user", "content": f"pergunta {len(histories)}"})
+        history.append({"role": "assistant", "content": f"resposta {len(histories)}"})
+        await ws.send_text("Agente: ok")
+        set_processing(False)
+
+    monkeypatch.setattr(main_module, "handle_user_turn_logic", fake_turn)
+    monkeypatch.setattr(main_module, "session_store", RedisSessionStore(FakeRedis()))
+    client = TestClient(main_module.tapp)
+
+    with client.websocket_connect("/ws/voice?username=ana&tts_mode=stream&session=new") as ws:
+        announced = json.loads(ws.receive_text())
+        assert announced["type"] == "session" and announced["resumed"] is False
+        ws.send_bytes(b"\x01\x00" * 16000)
+        ws.send_text(json.dumps({"type": "end_of_speech_button"}))
+        assert ws.receive_text() == "Agente: ok"
+    # Queda da conexão (sem end_of_session): o estado fica na store
+
+    token = announced["token"]
+    with client.websocket_connect(f"/ws/voice?username=ana&session={token}") as ws:
+        resumed = json.loads(ws.receive_text())
+        assert resumed == {"type": "session", "token": token, "resumed": True, "messages": 2, "has_summary": False}
+        ws.send_bytes(b"\x01\x00" * 16000)
+        ws.send_text(json.dumps({"type": "end_of_speech_button"}))
+        assert ws.receive_text() == "Agente: ok"
+        ws.send_text(json.dumps({"type": "end_of_session"}))
+
+    assert modes == ["stream", "stream"]
+    assert histories[1] == [{"role": "user", "content": "pergunta 1"}, {"role": "assistant", "content": "resposta 1"}]
+    # Fim de sessão pedido pelo cliente: nada para retomar
+    assert asyncio.run(main_module.session_store.get(token)) is None
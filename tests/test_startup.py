@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+import backend.main as main_module
+from backend.providers import FakeLLM, FakeSTT, FakeTTS
+from benchmarks.bench_importtime import HEAVY_MODULES, parse_importtime
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class FakeRetriever:
+    def __init__(self, error=None):
+        self.error = error
+        self.loads = 0
+
+    def get_store(self):
+        self.loads += 1
+        if self.error:
+            raise self.error
+        return object()
+
+
+def use_fakes(monkeypatch, retriever):
+    monkeypatch.setattr(main_module, "readiness", {"providers": False, "tokenizer": False, "index": False, "errors": {}})
+    tokenizer_loads = []
+    monkeypatch.setattr(main_module, "warm_up_tokenizer", lambda: tokenizer_loads.append(1))
+    monkeypatch.setattr(main_module, "stt_provider", FakeSTT())
+    monkeypatch.setattr(main_module, "llm_provider", FakeLLM())
+    monkeypatch.setattr(main_module, "summary_llm_provider", FakeLLM())
+    monkeypatch.setattr(main_module, "tts_provider", FakeTTS())
+    monkeypatch.setattr(main_module, "get_retriever", lambda: retriever)
+    return tokenizer_loads
+
+
+def wait_ready(client, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get("/ready")
+        if response.status_code == 200 or main_module.readiness["errors"] or time.monotonic() > deadline:
+            return response
+        time.sleep(0.01)
+
+
+def test_importing_the_server_does_not_load_provider_sdks():
+    code = (
+        "import sys, backend.main\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    env = dict(os.environ, OPENAI_KEY="teste")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True,
+                            timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+def test_ready_reports_503_until_lifespan_warm_up_finishes(monkeypatch):
+    retriever = FakeRetriever()
+    tokenizer_loads = use_fakes(monkeypatch, retriever)
+    # Sem o lifespan (TestClient fora do `with`) nada é aquecido
+    assert TestClient(main_module.tapp).get("/ready").status_code == 503
+
+    with TestClient(main_module.tapp) as client:
+        response = wait_ready(client)
+    assert response.status_code == 200
+    assert response.json() == {"ready": True, "providers": True, "tokenizer": True, "index": True, "errors": {}}
+    assert retriever.loads == 1 and tokenizer_loads == [1]
+
+
+def test_warm_up_failure_keeps_server_up_and_not_ready(monkeypatch):
+    use_fakes(monkeypatch, FakeRetriever(error=FileNotFoundError("índice não encontrado")))
+    with TestClient(main_module.tapp) as client:
+        response = wait_ready(client)
+        assert client.get("/cache/stats").status_code == 200
+    assert response.status_code == 503
+    body = response.json()
+    assert body["providers"] is True and body["tokenizer"] is True and body["index"] is False
+    assert "índice não encontrado" in body["errors"]["index"]
+
+
+def test_parse_importtime_reads_self_cumulative_and_depth():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     numpy.core\n"
+        "import time:      3000 |       3120 |   numpy\n"
+        "import time:        50 |       3170 | backend.cache\n"
+    )
+    assert parse_importtime(stderr) == [("numpy.core", 120, 120, 2), ("numpy", 3000, 3120, 1),
+                                        ("backend.cache", 50, 3170, 0)]
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from backend.streaming import SentenceSegmenter, segment_text_stream, stream_segments_audio
+
+
+async def _deltas(text, size=3):
+    for i in range(0, len(text), size):
+        await asyncio.sleep(0)
+        yield text[i:i + size]
+
+
+def test_segmenter_splits_sentences_without_breaking_decimals():
+    segmenter = SentenceSegmenter(min_chars=5)
+    segments = segmenter.feed("Temos o implante de 3.5mm na Linha Zero. Quer saber mais? ")
+    assert segments == ["Temos o implante de 3.5mm na Linha Zero.", "Quer saber mais?"]
+    assert segmenter.flush() is None
+
+
+def test_segmenter_cuts_long_clause_and_flushes_tail():
+    segmenter = SentenceSegmenter(min_chars=5, max_chars=40)
+    segments = segmenter.feed("Trabalhamos com implantes, instrumentais cirúrgicos, acessórios e kits")
+    assert segments and all(len(s) <= 40 for s in segments)
+    assert segmenter.flush()
+
+
+@pytest.mark.asyncio
+async def test_segment_text_stream_reassembles_text():
+    text = "Olá, tudo bem? A MEDENS tem a Linha Zero. Posso te ajudar"
+    segments = [s async for s in segment_text_stream(_deltas(text), SentenceSegmenter(min_chars=5))]
+    assert segments == ["Olá, tudo bem?", "A MEDENS tem a Linha Zero.", "Posso te ajudar"]
+
+
+@pytest.mark.asyncio
+async def test_stream_segments_audio_preserves_order_with_parallel_tts():
+    # O primeiro segmento é o mais lento: os outros terminam antes, mas o áudio sai em ordem.
+    delays = {"um.": 0.05, "dois.": 0.0, "tres.": 0.01}
+    started = []
+
+    async def segments():
+        for text in delays:
+            yield text
+
+    async def synthesize(text):
+        started.append(text)
+        await asyncio.sleep(delays[text])
+        yield f"{text}-a".encode()
+        yield f"{text}-b".encode()
+
+    received = []
+    ended = []
+
+    async def on_audio(index, chunk):
+        received.append((index, chunk))
+
+    async def on_segment_end(index, text):
+        ended.append(index)
+
+    delivered = await stream_segments_audio(segments(), synthesize, on_audio, on_segment_end, max_parallel_segments=3)
+
+    assert delivered == ["um.", "dois.", "tres."]
+    assert ended == [0, 1, 2]
+    assert [c for _, c in received] == [b"um.-a", b"um.-b", b"dois.-a", b"dois.-b", b"tres.-a", b"tres.-b"]
+    assert started == ["um.", "dois.", "tres."]
+
+
+@pytest.mark.asyncio
+async def test_stream_segments_audio_first_chunk_before_llm_finishes():
+    llm_finished = asyncio.Event()
+    first_audio_before_llm_end = []
+
+    async def segments():
+        yield "Primeira frase."
+        await asyncio.sleep(0.05)
+        yield "Segunda frase."
+        llm_finished.set()
+
+    async def synthesize(text):
+        yield text.encode()
+
+    async def on_audio(index, chunk):
+        if index == 0:
+            first_audio_before_llm_end.append(not llm_finished.is_set())
+
+    await stream_segments_audio(segments(), synthesize, on_audio)
+    assert first_audio_before_llm_end == [True]
+
+
+class FakeWebSocket:
+    def __init__(self):
+        from fastapi.websockets import WebSocketState
+        self.client_state = WebSocketState.CONNECTED
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(("text", text))
+
+    async def send_bytes(self, data):
+        self.sent.append(("bytes", data))
+
+
+@pytest.mark.asyncio
+async def test_handle_user_turn_logic_stream_mode(monkeypatch):
+    import backend.main as main_module
+
+    async def fake_transcribe(data):
+        return "Quais linhas vocês têm?"
+
+    async def fake_chat_stream(username, messages):
+        for delta in ["Temos a Linha", " Zero. E tam", "bém a Slim."]:
+            yield delta
+
+    async def fake_tts_stream(text):
+        yield text.encode()
+
+    monkeypatch.setattr(main_module, "transcribe_bytes", fake_transcribe)
+    monkeypatch.setattr(main_module, "chat_rag_stream", fake_chat_stream)
+    monkeypatch.setattr(main_module, "synthesize_tts_stream", fake_tts_stream)
+
+    ws = FakeWebSocket()
+    history = []
+    flags = []
+    await main_module.handle_user_turn_logic(bytearray(32000), "ana", history, ws, flags.append, "stream")
+
+    audio = [payload for kind, payload in ws.sent if kind == "bytes"]
+    assert audio == [b"Temos a Linha Zero.", "E também a Slim.".encode()]
+    assert ('text', 'Agente: Temos a Linha Zero. E também a Slim.') in ws.sent
+    assert ws.sent[-1] == ("text", '{"type": "audio_end"}')
+    assert history[-1] == {"role": "assistant", "content": "Temos a Linha Zero. E também a Slim."}
+    assert flags == [False]
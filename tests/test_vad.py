@@ -0,0 +1,72 @@
+import json
+
+import numpy as np
+
+import backend.main as main_module
+from backend.vad import END_OF_SPEECH, SPEECH_START, StreamingEndpointer
+from benchmarks.vad_corpus import build_corpus, evaluate, make_utterance_signal, run_signal
+
+
+def test_endpointing_latency_and_false_triggers_on_synthetic_corpus():
+    corpus = [signal for seed in range(10) for signal in build_corpus(seed)]
+    result = evaluate(corpus, trailing_silence_ms=300)
+
+    assert result["missed"] == 0
+    assert result["false_trigger_rate"] <= 0.02
+    # ~300 ms de silêncio final + no máximo alguns frames (antes: 1000 ms no navegador)
+    assert result["latency_ms_p95"] <= 350
+
+
+def test_silence_and_digital_zero_never_trigger():
+    endpointer = StreamingEndpointer()
+    assert endpointer.feed(bytes(16000 * 2 * 5)) == []
+
+
+def test_events_do_not_depend_on_chunk_boundaries():
+    signal = make_utterance_signal(np.random.default_rng(3), noise_db=-50)
+    reference = run_signal(signal, StreamingEndpointer(), chunk_samples=2048)
+    odd_sizes = []
+    endpointer = StreamingEndpointer()
+    data = signal.pcm.tobytes()
+    i = 0
+    for size in [7, 333, 1001, 4096, 17] * 1000:
+        if i >= len(data):
+            break
+        for event, at_ms in endpointer.feed(data[i:i + size]):
+            if event == END_OF_SPEECH:
+                odd_sizes.append(at_ms)
+        i += size
+    assert reference == odd_sizes == [round(t) for t in reference]
+    assert len(reference) == len(signal.speech_ends_ms)
+
+
+def test_speech_start_precedes_end_of_speech():
+    signal = make_utterance_signal(np.random.default_rng(1), n_utterances=1)
+    events = StreamingEndpointer().feed(signal.pcm.tobytes())
+    assert [e for e, _ in events] == [SPEECH_START, END_OF_SPEECH]
+
+
+def test_ws_voice_server_vad_triggers_turn(client, monkeypatch):
+    turns = []
+
+    async def fake_turn(audio_buffer_ref, user_id_ref, history, ws_ref, set_flag, tts_mode="batch", turn_state=None):
+        turns.append(len(audio_buffer_ref))
+        await ws_ref.send_text("Agente: ok")
+        set_flag(False)
+
+    monkeypatch.setattr(main_module, "handle_user_turn_logic", fake_turn)
+    signal = make_utterance_signal(np.random.default_rng(7), n_utterances=1, noise_db=-60)
+    data = signal.pcm.tobytes()
+
+    with client.websocket_connect("/ws/voice?username=teste&server_vad=1") as ws:
+        ws.send_text(json.dumps({"type": "end_of_speech"}))  # ignorado com VAD no servidor
+        for i in range(0, len(data), 4096):
+            ws.send_bytes(data[i:i + 4096])
+        assert json.loads(ws.receive_text()) == {"type": "end_of_speech_detected"}
+        assert ws.receive_text() == "Agente: ok"  # o turno roda antes de a sessão terminar
+        ws.send_text(json.dumps({"type": "end_of_session"}))
+
+    # o turno recebe o áudio até o endpoint (fala + ~300 ms); o silêncio que
+    # sobra no buffer é tratado no fechamento da conexão, como antes
+    assert len(turns) == 2
+    assert turns[0] < len(data) and sum(turns) == len(data)
@@ -0,0 +1,85 @@
+import asyncio
+
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+
+import backend.rag as rag
+from backend import index_builder
+from backend.vector_store import MappedVectorStore, build_faiss_index, is_mapped_store
+
+CATALOG = [
+    "Implante Linha Zero cone morse 3.5mm x 10mm, código MZ-3510.",
+    "Implante Linha Zero cone morse 4.0mm x 10mm, código MZ-4010.",
+    "Implante Linha Slim 2.9mm x 10mm para rebordos finos, código MS-2910.",
+    "Kit cirúrgico com brocas, chaves e torquímetro em estojo autoclavável.",
+    "Condições comerciais são tratadas por um consultor da MEDENS.",
+]
+SOURCES = ["zero.txt", "zero.txt", "slim.txt", "kits.txt", "comercial.txt"]
+
+
+def test_converted_store_answers_like_the_langchain_store_without_pickle(tmp_path, embeddings):
+    index_dir = tmp_path / "idx"
+    store = FAISS.from_texts(CATALOG, embeddings, metadatas=[{"source": s} for s in SOURCES])
+    rag.save_index(store, index_dir)
+    rag.save_index(store, index_dir, index_format="mapped", kind="flat")
+    published = rag.published_dir(index_dir)
+    assert is_mapped_store(published) and not (published / "index.pkl").exists()
+
+    mapped = rag.load_index(index_dir)
+    assert isinstance(mapped, MappedVectorStore) and mapped.index.ntotal == len(CATALOG)
+    for text in CATALOG:
+        query = embeddings.embed_query(text + " ?")
+        expected = store.similarity_search_by_vector(query, k=3)
+        got = mapped.similarity_search_by_vector(query, k=3)
+        assert [(d.id, d.page_content, d.metadata) for d in got] == [(d.id, d.page_content, d.metadata) for d in expected]
+    key = store.index_to_docstore_id[2]
+    assert mapped.docstore.search(key).page_content == CATALOG[2]
+    assert isinstance(mapped.docstore.search("nao-existe"), str)
+
+    # O retriever (busca híbrida, hot-reload) usa o formato nativo sem mudança
+    retriever = rag.IndexRetriever(index_dir, reload_check_interval=0, mode="hybrid")
+    assert retriever.query("Vocês têm o código MS-2910?", k=1)[0].page_content == CATALOG[2]
+    assert retriever.stats()["index_format"] == "mapped:flat"
+
+
+def test_quantized_kinds_keep_recall():
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(50, 64)).astype(np.float32)
+    vectors = (centers[rng.integers(0, 50, 3000)] + 0.3 * rng.normal(size=(3000, 64))).astype(np.float32)
+    queries = vectors[:100] + 0.05 * rng.normal(size=(100, 64)).astype(np.float32)
+    exact, _ = build_faiss_index(vectors, "flat", "l2")
+    _, truth = exact.search(queries, 5)
+
+    sq8, kind = build_faiss_index(vectors, "sq8", "l2")
+    _, found = sq8.search(queries, 5)
+    recall = np.mean([len(set(t) & set(f)) / 5 for t, f in zip(truth, found)])
+    assert kind == "sq8" and recall >= 0.9
+    # Poucos vetores para treinar listas invertidas: fica sq8
+    _, kind = build_faiss_index(vectors, "ivf_pq", "l2")
+    assert kind == "sq8"
+
+
+def test_incremental_build_keeps_the_mapped_format(tmp_path, embeddings, monkeypatch):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for source, text in zip(("zero.txt", "slim.txt", "kits.txt"), CATALOG[1:4]):
+        (data_dir / source).write_text(text, encoding="utf-8")
+    index_dir = tmp_path / "idx"
+    monkeypatch.setattr(rag, "RAG_INDEX_FORMAT", "mapped")
+    asyncio.run(index_builder.build_index_incremental(data_dir, index_dir, embeddings))
+    version = (index_dir / rag.VERSION_FILENAME).read_text()
+
+    # Sem RAG_INDEX_FORMAT, o rebuild mantém o formato publicado e não reembedda nada
+    monkeypatch.setattr(rag, "RAG_INDEX_FORMAT", None)
+    embeddings.embedded.clear()
+    plan = asyncio.run(index_builder.build_index_incremental(data_dir, index_dir, embeddings))
+    assert not plan.has_changes and (index_dir / rag.VERSION_FILENAME).read_text() == version
+
+    (data_dir / "slim.txt").write_text(CATALOG[4], encoding="utf-8")
+    asyncio.run(index_builder.build_index_incremental(data_dir, index_dir, embeddings))
+    assert embeddings.embedded == [CATALOG[4]]
+    published = rag.published_dir(index_dir)
+    assert is_mapped_store(published) and not (published / "index.faiss").exists()
+    contents = sorted(text for _, text in rag.load_index(index_dir).iter_documents())
+    assert contents == sorted([CATALOG[1], CATALOG[4], CATALOG[3]])